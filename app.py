@@ -1,6 +1,7 @@
 import streamlit as st
 import base64
 import os
+from services.warmup_service import start_warmup
 
 # 페이지 설정
 st.set_page_config(
@@ -449,6 +450,9 @@ def render_main_content():
 
 def main():
     """메인 애플리케이션 함수"""
+    # 모델/인덱스 백그라운드 워밍업 (프로세스당 한 번만 시작)
+    start_warmup()
+    
     # 세션 상태 초기화
     if "page_view" not in st.session_state:
         st.session_state["page_view"] = "home"
@@ -18,4 +18,92 @@ SUPPORTED_FORMATS = ["jpg", "jpeg", "png", "pdf"]
 
 # OCR 처리 관련 설정
 OCR_TIMEOUT_SECONDS = 30
-AUTO_PROCESS_ENABLED = True 
\ No newline at end of file
+AUTO_PROCESS_ENABLED = True 
+
+# ===================================================================
+# RAG 검색 설정
+# ===================================================================
+# 쿼리 임베딩 캐시 (같은 질문 반복 시 인코딩 생략)
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_PATH = "./state/query_cache.db"  # None이면 메모리 전용
+
+# 벡터 검색 백엔드: "auto"(코퍼스 크기로 선택), "exact", "flat", "hnsw", "ivfpq"
+ANN_BACKEND = "auto"
+ANN_HNSW_MIN_CHUNKS = 20000     # 이 이상이면 HNSW
+ANN_IVFPQ_MIN_CHUNKS = 200000   # 이 이상이면 IVF-PQ
+
+# PDF 텍스트 추출
+PDF_EXTRACT_WORKERS = None      # None이면 CPU 코어 수
+PDF_PARALLEL_MIN_PAGES = 16     # 이보다 적은 페이지는 현재 프로세스에서 추출
+PDF_PAGE_CACHE_PATH = "./state/pdf_page_cache.db"  # None이면 페이지 캐시 비활성
+
+# Kiwi 배치 분석 스레드 수 (0이면 모든 코어 사용)
+KIWI_NUM_WORKERS = 0
+
+# 임베딩 양자화: None(float32 그대로), "int8", "pq"
+# 설정 시 1차 검색은 압축 코드로 하고 상위 후보만 mmap float 벡터로 재정렬
+EMBEDDING_QUANTIZATION = None
+QUANTIZATION_RERANK_CANDIDATES = 200
+
+# 문장 인코더 백엔드: "torch", "onnx", "onnx-int8" (CPU 서버는 onnx-int8 권장)
+ENCODER_BACKEND = "torch"
+ENCODER_ONNX_THREADS = None      # None이면 코어 수의 절반
+ENCODER_ONNX_MIN_COSINE = 0.99   # torch 임베딩 대비 최소 코사인 유사도 (미달 시 torch 사용)
+
+# 청크 임베딩 캐시 (모델/리비전/청크 sha256 기준, 모든 수집 경로가 공유)
+EMBEDDING_CACHE_PATH = "./state/embedding_cache.db"  # None이면 비활성
+
+# 다중 문서 코퍼스 (문서별 샤드)
+CORPUS_DATA_DIR = "./data"               # 수집할 문서 디렉터리
+CORPUS_SHARD_DIR = "./state/shards"      # 문서별 샤드 저장 위치
+CORPUS_EXTENSIONS = (".pdf",)
+CORPUS_SEARCH_WORKERS = 4                # 샤드 병렬 검색 스레드 수
+
+# 등록 도면 검색 인덱스 (domyun OCR/태그/탐지 요약)
+DRAWING_INDEX_ENABLED = True
+DRAWING_INDEX_PATH = "./state/drawing_index"
+DRAWING_INDEX_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'  # 챗봇 쿼리 임베딩을 그대로 재사용
+DRAWING_NEIGHBORS = 8            # 태그 주변 청크에 넣을 인접 요소 수
+DRAWING_INDEX_SAVE_DELAY_S = 30  # 도면 갱신 후 저장까지 모으는 시간 (저장 전 종료분은 다음 동기화 때 복구)
+
+# 크로스 인코더 재정렬 (넓은 후보를 다시 채점해 LLM에 보낼 청크를 줄임)
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 다국어(한국어 포함) CPU 모델
+RERANK_CANDIDATES = 50           # 빠른 인덱스에서 가져올 후보 수
+RERANK_LATENCY_BUDGET_MS = 150   # 채점 시간 예산 (초과 시 남은 후보는 원래 순위)
+RERANK_MIN_SCORE = 0.3           # 이 점수 이상인 청크만 LLM 컨텍스트로 사용
+RERANK_CACHE_SIZE = 4096         # (쿼리, 청크) 점수 캐시
+
+# 의미 기반 답변 캐시 (유사 질문 + 같은 컨텍스트면 LLM 호출 생략)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_SIMILARITY = 0.95   # 쿼리 임베딩 코사인 유사도 기준
+
+# 앱 시작 시 백그라운드 모델/인덱스 워밍업
+WARMUP_ENABLED = True
+
+# LLM 컨텍스트 토큰 예산 (RAG 청크 + 도면 탐지 데이터)
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_PACKER_MODEL = "gpt-4o-mini"   # 토큰 계산용 토크나이저 (tiktoken 미설치 시 근사)
+
+# 선택 도면 다건 요약 (도면별 요약을 동시에 만든 뒤 한 번에 종합)
+MAP_REDUCE_MIN_FILES = 4              # 이 개수 이상 선택하면 map-reduce 요약 사용
+MAP_REDUCE_CONCURRENCY = 5            # 동시에 진행할 도면 요약 LLM 호출 수
+MAP_REDUCE_DRAWING_TOKEN_BUDGET = 3000  # 도면 한 장의 탐지 데이터 토큰 예산
+MAP_REDUCE_SUMMARY_MAX_TOKENS = 600   # 도면별 요약 최대 토큰 (도면이 많으면 종합 예산에 맞춰 줄임)
+MAP_REDUCE_CACHE_SIZE = 256           # d_id별 요약 캐시 크기
+
+# LLM 게이트웨이 (공용 HTTP 커넥션 풀 + 재시도/헤징/호출 마감시간)
+LLM_MODEL = "gpt-4o-mini"
+LLM_BASE_URL = None              # OpenAI 호환 서버 주소 (예: 로컬 스텁 "http://127.0.0.1:8765/v1"), None이면 OpenAI
+LLM_MAX_CONNECTIONS = 20         # 커넥션 풀 최대 연결 수
+LLM_MAX_KEEPALIVE = 10           # 유지할 유휴 연결 수
+LLM_CONNECT_TIMEOUT_S = 5.0
+LLM_REQUEST_TIMEOUT_S = 60.0     # 시도 1회 제한 (스트리밍은 토큰 사이 대기 제한)
+LLM_DEADLINE_S = 90.0            # 재시도를 포함한 호출 전체 마감시간
+LLM_MAX_RETRIES = 3              # 연결 오류/타임아웃/429/5xx 재시도 횟수
+LLM_BACKOFF_BASE_S = 0.5         # 지수 백오프 시작 값 (full jitter)
+LLM_BACKOFF_MAX_S = 8.0
+LLM_HEDGE_AFTER_S = None         # 이 시간 안에 응답이 없으면 같은 요청을 한 번 더 보냄 (None이면 헤징 안 함)
+LLM_MAX_SYNC_HEDGES = 2          # 동기 호출의 동시 헤징 요청 상한 (진 요청은 취소되지 않고 끝까지 토큰/연결을 씀)
@@ -5,16 +5,35 @@ P&ID 전문가 챗봇 모델 - Streamlit 연동용
 
 import os
 import pickle
+import threading
 import torch
 import json
-from sentence_transformers import SentenceTransformer
+import time
 from utils.rag_system_kiwi import RAGSystemWithKiwi
-from openai import OpenAI
+from utils.model_registry import get_registry, get_sentence_encoder
+from utils.corpus_manager import CorpusManager
+from utils.query_cache import get_query_cache
+from utils.embedding_cache import encode_chunks
+from services.llm_gateway import get_llm_gateway
 from loguru import logger
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
 from config.database_config import get_db_connection
+from config.user_config import (
+    CORPUS_DATA_DIR, CORPUS_SHARD_DIR, DRAWING_INDEX_ENABLED,
+    RERANK_ENABLED, RERANK_CANDIDATES, RERANK_MIN_SCORE, ANSWER_CACHE_ENABLED
+)
+from utils.answer_cache import context_fingerprint, get_answer_cache
+from utils.bm25_index import extract_tags
+from utils.context_packer import (
+    ContextItem, ContextPacker, PRIORITY_QUERY_TAG, PRIORITY_RAG_TOP, count_tokens, drawing_context_items
+)
+from utils.tracing import Trace, span, traced
+from utils.reranker import get_reranker
+from utils.drawing_fields import extract_detections, extract_ocr_fields
+from utils.drawing_index import get_drawing_index
+from services.drawing_summary_service import summarize_drawings
 # 이미지 처리를 위한 import 추가
 from PIL import Image, ImageDraw, ImageFont
 import io
@@ -25,29 +44,41 @@ from io import BytesIO
 # .env 파일 로드
 load_dotenv()
 
+# 공용 RAG 인덱스에 대한 문서 수집은 한 세션씩만 수행
+_RAG_INGEST_LOCK = threading.Lock()
+
+# 토큰 예산으로 패킹하는 컨텍스트 섹션
+RAG_CONTEXT_SECTION = "rag"
+DRAWING_CONTEXT_SECTION = "selected_drawings"
+DRAWING_SEARCH_SECTION = "drawing_search"
+
 class PIDExpertChatbot:
     """P&ID 도면 분석 전문가 챗봇"""
     
+    EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+    
     def __init__(self):
         """챗봇 초기화"""
         
-        # OpenAI 클라이언트 초기화
+        # 공용 LLM 게이트웨이 (커넥션 풀 + 재시도/헤징/마감시간)
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
-        if self.openai_api_key:
-            self.client = OpenAI(api_key=self.openai_api_key)
-        else:
-            self.client = None
+        self.client = get_llm_gateway()
+        if self.client is None:
             logger.warning("OpenAI API 키가 설정되지 않았습니다.")
         
         # 임베딩 모델 초기화
-        self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.embedding_model_name = self.EMBEDDING_MODEL_NAME
+        self.embedder = get_sentence_encoder(self.embedding_model_name)  # 프로세스 공용
+        self.query_cache = get_query_cache()
+        self.reranker = get_reranker() if RERANK_ENABLED else None
+        self.answer_cache = get_answer_cache() if ANSWER_CACHE_ENABLED else None
+        self.context_packer = ContextPacker()
         
         # RAG 시스템 초기화
         self.kiwi_rag = RAGSystemWithKiwi()
         
-        # 벡터 데이터베이스 상태
-        self.chunks = None
-        self.embeddings = None
+        # 문서별 샤드 코퍼스
+        self.corpus = None
         
         # 대화 기록
         self.conversation_history = []
@@ -76,72 +107,94 @@ class PIDExpertChatbot:
 3. 안전 고려사항 (해당되는 경우)
 4. 추가 권장사항 (필요한 경우)"""
 
-    def save_state(self, chunks, embeddings):
-        """청크와 임베딩을 pickle로 저장"""
-        os.makedirs(self.STATE_PATH, exist_ok=True)
-        try:
-            with open(os.path.join(self.STATE_PATH, "state.pkl"), "wb") as f:
-                pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)
-            logger.info("벡터 데이터베이스 저장 완료")
-        except Exception as e:
-            logger.error(f"상태 저장 실패: {e}")
+    def create_embeddings(self, chunks):
+        """청크들을 임베딩하여 텐서로 변환 (이미 계산된 청크는 임베딩 캐시에서 재사용)"""
+        embeddings = encode_chunks(self.embedder, self.embedding_model_name, chunks)
+        return torch.from_numpy(embeddings)
+
+    def _chunk_document(self, pdf_path: str, file_hash: str) -> List[Dict]:
+        """페이지 추출 스트림을 청킹에 바로 연결 (변경 없는 페이지는 캐시에서 읽음)"""
+        documents = self.kiwi_rag.iter_pdf_documents(pdf_path, file_hash=file_hash)
+        return self.kiwi_rag.chunk_documents_with_kiwi(documents)
+
+    def ingest_pdf(self, pdf_path: str) -> Dict:
+        """
+        PDF 하나를 해당 문서 샤드에 증분 반영
 
-    def load_state(self):
-        """저장된 청크와 임베딩을 pickle로 로드"""
-        state_file = os.path.join(self.STATE_PATH, "state.pkl")
-        if os.path.exists(state_file):
+        파일 해시가 마지막 수집과 같으면 건너뛰고, 바뀐 경우에도
+        새로 생기거나 바뀐 청크만 임베딩한다. 다른 문서의 샤드는 건드리지 않는다.
+
+        Returns:
+            {'added', 'removed', 'unchanged'} 청크 수 (건너뛴 경우 'skipped': True)
+        """
+        return self.corpus.add_document(pdf_path)
+
+    def _load_corpus(self) -> CorpusManager:
+        """저장된 문서별 샤드 로드 (없으면 빈 코퍼스)"""
+        corpus = CorpusManager(CORPUS_SHARD_DIR, model_name=self.embedding_model_name,
+                               encode_fn=self.create_embeddings, chunk_fn=self._chunk_document,
+                               tokenizer=self.kiwi_rag.tokenize_for_bm25)
+        if corpus.load():
+            logger.info("기존 문서 샤드 로드 완료")
+        else:
+            logger.info("새로운 문서 코퍼스 구축 중...")
+        return corpus
+
+    def load_persisted_indexes(self) -> bool:
+        """
+        저장된 코퍼스 샤드와 도면 검색 인덱스만 공용 레지스트리에 로드 (문서 수집/DB 동기화 없음)
+
+        Returns:
+            코퍼스에 검색할 청크가 있으면 True
+        """
+        self.corpus = get_registry().get_or_load(
+            f"corpus:{os.path.abspath(CORPUS_SHARD_DIR)}:{self.embedding_model_name}",
+            self._load_corpus
+        )
+        if DRAWING_INDEX_ENABLED:
             try:
-                with open(state_file, "rb") as f:
-                    data = pickle.load(f)
-                    return data["chunks"], data["embeddings"]
+                get_drawing_index()
             except Exception as e:
-                logger.error(f"상태 로드 실패: {e}")
-        return None, None
+                logger.warning(f"도면 검색 인덱스 로드 실패: {e}")
+        return len(self.corpus) > 0
 
-    def create_embeddings(self, chunks):
-        """청크들을 임베딩하여 텐서로 변환"""
-        embeddings = self.embedder.encode(chunks, convert_to_tensor=True)
-        return embeddings
+    def initialize_rag_system(self, data_path=CORPUS_DATA_DIR) -> bool:
+        """
+        RAG 시스템 초기화
 
-    def initialize_rag_system(self, pdf_path: str) -> bool:
-        """RAG 시스템 초기화"""
+        Args:
+            data_path: 문서 디렉터리, 또는 PDF 경로/경로 목록.
+                       디렉터리면 새로 추가되거나 바뀐 문서만 수집하고 사라진 문서의 샤드는 삭제하며,
+                       경로를 주면 해당 문서만 수집한다.
+        """
         try:
             logger.info("RAG 시스템 초기화 중...")
             
-            # 기존 상태 로드 시도
-            chunks, embeddings = self.load_state()
-            
-            if chunks is None or embeddings is None:
-                logger.info("새로운 벡터 데이터베이스 구축 중...")
-                
-                # PDF 로드 및 청킹
-                if not os.path.exists(pdf_path):
-                    logger.error(f"PDF 파일을 찾을 수 없습니다: {pdf_path}")
-                    return False
-                
-                documents = self.kiwi_rag.extract_text_from_pdf(pdf_path)
-                
-                if not documents:
-                    logger.error("PDF 문서 추출 실패")
-                    return False
-                
-                # 청킹
-                chunks_metadata = self.kiwi_rag.chunk_documents_with_kiwi(documents)
-                chunks = [chunk['content'] for chunk in chunks_metadata]
-                
-                # 임베딩 생성
-                logger.info("임베딩 생성 중...")
-                embeddings = self.create_embeddings(chunks)
-                
-                # 상태 저장
-                self.save_state(chunks, embeddings)
-            else:
-                logger.info("기존 벡터 데이터베이스 로드 완료")
-            
-            self.chunks = chunks
-            self.embeddings = embeddings
+            # 저장된 샤드 로드 (모든 세션이 같은 코퍼스를 공유)
+            self.load_persisted_indexes()
             
-            logger.info(f"RAG 시스템 준비 완료: {len(chunks)}개 청크, {embeddings.shape} 임베딩")
+            with _RAG_INGEST_LOCK:
+                if isinstance(data_path, str) and os.path.isdir(data_path):
+                    self.corpus.sync(data_path)
+                else:
+                    for path in ([data_path] if isinstance(data_path, str) else list(data_path)):
+                        if not os.path.exists(path):
+                            logger.error(f"PDF 파일을 찾을 수 없습니다: {path}")
+                            continue
+                        self.ingest_pdf(path)
+            
+                # 등록 도면 검색 인덱스는 프로세스당 한 번 데이터베이스와 동기화
+                if DRAWING_INDEX_ENABLED:
+                    try:
+                        get_drawing_index().ensure_synced()
+                    except Exception as e:
+                        logger.warning(f"도면 검색 인덱스 동기화 실패: {e}")
+            
+            if len(self.corpus) == 0:
+                logger.error("코퍼스에 청크가 없습니다")
+                return False
+            
+            logger.info(f"RAG 시스템 준비 완료: 문서 {len(self.corpus.shards)}개, {len(self.corpus)}개 청크")
             return True
             
         except Exception as e:
@@ -150,32 +203,34 @@ class PIDExpertChatbot:
 
     def retrieve_relevant_chunks(self, query, top_k=3):
         """RAG 검색 - 관련 청크 추출"""
-        if self.chunks is None or self.embeddings is None:
+        if self.corpus is None:
             return []
         
         try:
             # 쿼리 임베딩 생성
-            query_embedding = self.embedder.encode(query, convert_to_tensor=True)
-            query_embedding = query_embedding / torch.norm(query_embedding)
-            
-            # 임베딩 정규화
-            embeddings_norm = self.embeddings / torch.norm(self.embeddings, dim=1, keepdim=True)
-            
-            # 유사도 계산
-            similarities = torch.matmul(embeddings_norm, query_embedding)
-            
-            # 상위 k개 추출
-            top_k_indices = torch.topk(similarities, min(top_k, len(similarities))).indices.tolist()
-            top_k_scores = torch.topk(similarities, min(top_k, len(similarities))).values.tolist()
+            query_embedding = self.query_cache.encode(self.embedder, self.embedding_model_name, query)
+            
+            # 밀집 검색 + Kiwi BM25 결과를 RRF로 결합해 상위 k개 추출
+            if self.reranker is not None:
+                # 넓은 후보를 가져와 크로스 인코더로 다시 채점 (예산 초과 시 남은 후보는 RRF 순위)
+                candidates = self.corpus.hybrid_search(query, query_embedding, RERANK_CANDIDATES,
+                                                       candidates=RERANK_CANDIDATES)
+                hits = self.reranker.rerank(query, candidates, top_k)
+            else:
+                hits = self.corpus.hybrid_search(query, query_embedding, top_k)
             
             # 관련 청크와 점수 반환
             relevant_chunks = []
-            for i, (idx, score) in enumerate(zip(top_k_indices, top_k_scores)):
+            for i, hit in enumerate(hits):
                 relevant_chunks.append({
-                    'content': self.chunks[idx],
-                    'score': score,
+                    'content': hit['content'],
+                    'score': hit['score'],
                     'rank': i + 1,
-                    'page': i + 1  # Streamlit 호환성을 위해 페이지 번호 추가
+                    'page': hit['page'] or i + 1,  # 페이지 정보가 없는 구버전 인덱스는 순위로 대체
+                    'source': hit['source'],
+                    'hash': hit['hash'],
+                    'tag_match': hit['tag_match'],
+                    'rerank_score': hit.get('rerank_score')
                 })
             
             return relevant_chunks
@@ -184,6 +239,19 @@ class PIDExpertChatbot:
             logger.error(f"RAG 검색 실패: {e}")
             return []
 
+    def retrieve_relevant_drawings(self, query, top_k=3):
+        """등록 도면 검색 - OCR/태그/탐지 요약 인덱스에서 관련 도면 추출"""
+        if not DRAWING_INDEX_ENABLED:
+            return []
+        
+        try:
+            drawing_index = get_drawing_index()
+            query_embedding = self.query_cache.encode(self.embedder, self.embedding_model_name, query)
+            return drawing_index.search(query, query_embedding, top_k)
+        except Exception as e:
+            logger.error(f"도면 검색 실패: {e}")
+            return []
+
     def build_rag_context(self, relevant_chunks):
         """RAG 검색 결과를 컨텍스트로 구성"""
         context = ""
@@ -205,6 +273,7 @@ class PIDExpertChatbot:
 
         return system_prompt
 
+    @traced("query_type")
     def _detect_query_type(self, query: str) -> str:
         """쿼리 유형 감지 - 변경 분석만 지원"""
         
@@ -387,32 +456,34 @@ class PIDExpertChatbot:
 
     def retrieve_change_analysis_chunks(self, query, top_k=5):
         """변경 분석을 위한 확장된 검색"""
-        if self.chunks is None or self.embeddings is None:
+        if self.corpus is None:
             return []
         
         try:
-            # 기본 검색
-            basic_chunks = self.retrieve_relevant_chunks(query, top_k=3)
-            
-            # 변경 관련 키워드로 추가 검색
+            # 기본 쿼리 + 변경 관련 키워드 확장 쿼리
             change_terms = ['변경', '수정', '개선', '교체', '업그레이드', '조정']
-            additional_chunks = []
+            queries = [query] + [f"{query} {term}" for term in change_terms if term not in query]  # 이미 포함된 용어는 제외
             
-            for term in change_terms:
-                if term not in query:  # 이미 포함된 용어는 제외
-                    expanded_query = f"{query} {term}"
-                    extra_chunks = self.retrieve_relevant_chunks(expanded_query, top_k=2)
-                    additional_chunks.extend(extra_chunks)
+            # 한 번의 인코딩 배치로 모든 쿼리를 샤드별 병렬 검색
+            query_embeddings = self.query_cache.encode(self.embedder, self.embedding_model_name, queries)
+            results = self.corpus.search(query_embeddings, top_k=3)
             
-            # 중복 제거 및 통합
-            all_chunks = basic_chunks + additional_chunks
-            seen_contents = set()
+            # 기본 쿼리는 상위 3개, 확장 쿼리는 상위 2개씩 (문서, 청크 인덱스) 기준으로 중복 제거
+            seen_indices = set()
             unique_chunks = []
             
-            for chunk in all_chunks:
-                if chunk['content'] not in seen_contents:
-                    seen_contents.add(chunk['content'])
-                    unique_chunks.append(chunk)
+            for q, hits in enumerate(results):
+                for i, hit in enumerate(hits[:3 if q == 0 else 2]):
+                    if (hit['source'], hit['index']) in seen_indices:
+                        continue
+                    seen_indices.add((hit['source'], hit['index']))
+                    unique_chunks.append({
+                        'content': hit['content'],
+                        'score': hit['score'],
+                        'rank': len(unique_chunks) + 1,
+                        'page': hit['page'] or i + 1,
+                        'source': hit['source']
+                    })
             
             # 상위 top_k개 반환
             return unique_chunks[:top_k]
@@ -640,64 +711,160 @@ class PIDExpertChatbot:
             selected_files: 선택된 파일 목록
             
         Returns:
-            응답 데이터
+            응답 데이터 (trace에 단계별 소요 시간)
         """
-        selected_drawing = '../uploads/uploaded_images/stream_dose_ai_1.png'
+        trace = Trace("generate_response")
         try:
-            # 시각화 요청 감지
-            if "시각화" in user_query and selected_drawing:
-                # 시각화 수행
-                print( '시각화 수행')
-                viz_result = self.visualize_drawing_analysis(selected_drawing)
-                print(viz_result)
-                if not viz_result:
-                    return {
-                        'response': f"❌ '{selected_drawing}' 도면의 시각화에 실패했습니다.",
-                        'sources': [],
-                        'query_type': 'drawing_visualization',
-                        'context_quality': 'none',
-                        'web_search_used': False,
-                        'visualization': None
-                    }
+            with trace.activate():
+                result, prepared = self._prepare_response(user_query, use_web_search, selected_drawing, selected_files)
+                if result is not None:
+                    return self._attach_trace(result, trace)
+                
+                llm_succeeded = False
+                with span("llm", model="gpt-4o-mini", stream=False, prompt_tokens=prepared['prompt_tokens']) as llm_span:
+                    try:
+                        # 항상 gpt-4o-mini 사용 (Vision API 사용하지 않음)
+                        response = self.client.chat(
+                            prepared['messages'],
+                            model="gpt-4o-mini",
+                            temperature=0.3,
+                            max_tokens=2000
+                        )
+                        ai_response = response.choices[0].message.content
+                        if getattr(response, 'usage', None):
+                            llm_span.attrs.update(prompt_tokens=response.usage.prompt_tokens,
+                                                  completion_tokens=response.usage.completion_tokens)
+                        llm_succeeded = True
+                        
+                    except Exception as e:
+                        logger.error(f"OpenAI API 호출 실패: {e}")
+                        ai_response = f"OpenAI API 오류: {e}"
+                
+                with span("finalize"):
+                    result = self._finalize_response(prepared, ai_response, llm_succeeded)
+                return self._attach_trace(result, trace)
+            
+        except Exception as e:
+            logger.error(f"응답 생성 실패: {e}")
+            return self._attach_trace(self._error_response(e, selected_drawing, selected_files), trace)
+
+    def generate_response_stream(self, user_query: str, use_web_search: bool = False, selected_drawing: str = None, selected_files: List[Dict] = None) -> Iterator[Dict]:
+        """
+        사용자 질문에 대한 응답을 토큰 단위로 스트리밍 생성
+        
+        검색/컨텍스트 구성은 generate_response와 같고, LLM 응답만 도착하는 대로 내보낸다.
+        스트림이 끝나면 파일 정보와 소스 요약을 붙인 전체 응답을 대화 기록과 답변 캐시에 저장한다.
+        
+        Yields:
+            {'type': 'token', 'content': 응답 조각} - LLM 토큰이 도착할 때마다
+            {'type': 'final', 'data': 응답 데이터} - 마지막에 한 번 (generate_response 반환값과 같은 형태)
+        """
+        # 제너레이터는 호출자 컨텍스트에서 재개되므로 현재 Trace 활성화는 yield 없는 준비 단계에만 적용
+        trace = Trace("generate_response_stream")
+        try:
+            with trace.activate():
+                result, prepared = self._prepare_response(user_query, use_web_search, selected_drawing, selected_files)
+        except Exception as e:
+            logger.error(f"응답 생성 실패: {e}")
+            yield {'type': 'final', 'data': self._attach_trace(self._error_response(e, selected_drawing, selected_files), trace)}
+            return
+        
+        # 시각화/변경 분석/캐시 적중 등 LLM을 부르지 않는 응답은 한 번에 전달
+        if result is not None:
+            yield {'type': 'final', 'data': self._attach_trace(result, trace)}
+            return
+        
+        parts = []
+        llm_succeeded = False
+        with trace.span("llm", model="gpt-4o-mini", stream=True, prompt_tokens=prepared['prompt_tokens']) as llm_span:
+            llm_start = time.perf_counter()
+            try:
+                for delta in self.client.stream_chat(
+                    prepared['messages'],
+                    model="gpt-4o-mini",
+                    temperature=0.3,
+                    max_tokens=2000
+                ):
+                    if not parts:
+                        llm_span.attrs['first_token_ms'] = round((time.perf_counter() - llm_start) * 1000, 1)
+                    parts.append(delta)
+                    yield {'type': 'token', 'content': delta}
+                llm_span.attrs['completion_tokens'] = count_tokens("".join(parts))
+                llm_succeeded = True
                 
+            except Exception as e:
+                # 도중에 끊기면 받은 부분까지 보여주고 오류를 덧붙임 (캐시에는 저장하지 않음)
+                logger.error(f"OpenAI 스트리밍 호출 실패: {e}")
+                parts.append(f"\n\nOpenAI API 오류: {e}" if parts else f"OpenAI API 오류: {e}")
+        
+        try:
+            with trace.span("finalize"):
+                result = self._finalize_response(prepared, "".join(parts), llm_succeeded)
+            yield {'type': 'final', 'data': self._attach_trace(result, trace)}
+        except Exception as e:
+            logger.error(f"응답 생성 실패: {e}")
+            yield {'type': 'final', 'data': self._attach_trace(self._error_response(e, selected_drawing, selected_files), trace)}
+
+    def _prepare_response(self, user_query: str, use_web_search: bool, selected_drawing: Optional[str],
+                          selected_files: Optional[List[Dict]]) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        검색과 컨텍스트 패킹까지 수행하고 LLM 메시지 준비
+        
+        Returns:
+            (바로 반환할 응답, None) - 시각화/변경 분석/캐시 적중/API 키 없음
+            (None, 준비 상태) - LLM 호출이 필요한 경우 (_finalize_response에 전달)
+        """
+        # 시각화 요청 감지
+        if "시각화" in user_query and selected_drawing:
+            logger.debug(f"도면 시각화 요청: {selected_drawing}")
+            viz_result = self.visualize_drawing_analysis(selected_drawing)
+            logger.debug(f"도면 시각화 결과: {'성공' if viz_result else '실패'}")
+            if not viz_result:
                 return {
-                    'response': viz_result['analysis_summary'],
-                    'sources': [{
-                        'type': 'visualization',
-                        'icon': '🎨',
-                        'source': f'도면 시각화 - {selected_drawing}',
-                        'score': None,
-                        'page': None,
-                        'content_preview': f"OCR {viz_result['ocr_count']}개, Detection {viz_result['detection_count']}개 시각화",
-                        'quality': 'high'
-                    }],
+                    'response': f"❌ '{selected_drawing}' 도면의 시각화에 실패했습니다.",
+                    'sources': [],
                     'query_type': 'drawing_visualization',
-                    'context_quality': 'high',
+                    'context_quality': 'none',
                     'web_search_used': False,
-                    'visualization': viz_result
-                }
-
-            # 선택된 파일들 처리 및 디버그 정보 수집
-            selected_files_context = ""
-            file_details = []
-            ocr_data_included = False
-            detection_data_included = False
-            total_context_length = 0
+                    'visualization': None
+                }, None
             
+            return {
+                'response': viz_result['analysis_summary'],
+                'sources': [{
+                    'type': 'visualization',
+                    'icon': '🎨',
+                    'source': f'도면 시각화 - {selected_drawing}',
+                    'score': None,
+                    'page': None,
+                    'content_preview': f"OCR {viz_result['ocr_count']}개, Detection {viz_result['detection_count']}개 시각화",
+                    'quality': 'high'
+                }],
+                'query_type': 'drawing_visualization',
+                'context_quality': 'high',
+                'web_search_used': False,
+                'visualization': viz_result
+            }, None
+
+        # 선택된 파일들 처리 및 디버그 정보 수집 (컨텍스트는 토큰 예산 안에서 나중에 패킹)
+        selected_files_context = ""
+        context_items = []
+        query_tags = extract_tags(user_query)
+        file_details = []
+        ocr_data_included = False
+        detection_data_included = False
+        total_context_length = 0
+        
+        with span("file_context", files=len(selected_files or [])) as file_span:
             if selected_files and len(selected_files) > 0:
                 logger.info(f"📁 선택된 파일 {len(selected_files)}개 처리 중...")
-                
-                selected_files_context = "\n\n=== 선택된 P&ID 도면 기호 및 텍스트 탐지 결과 ===\n"
-                selected_files_context += "※ 다음 데이터는 P&ID 도면에서 AI가 자동으로 탐지한 계측기기 기호, 배관 기호, 텍스트 라벨 등을 포함합니다.\n\n"
-                
+            
                 for i, file_data in enumerate(selected_files):
                     file_name = file_data.get('name', f'파일_{i+1}')
                     file_id = file_data.get('id', 'unknown')
                     image_path = file_data.get('image_path')
                     json_data = file_data.get('json_data')
-                    
-                    selected_files_context += f"\n**📋 P&ID 도면 {i+1}: {file_name} (ID: {file_id})**\n"
-                    
+                
                     # 파일별 상세 정보 초기화
                     file_detail = {
                         'name': file_name,
@@ -708,151 +875,199 @@ class PIDExpertChatbot:
                         'ocr_preview': '',
                         'detection_preview': ''
                     }
-                    
-                    # 이미지 정보
-                    if image_path and os.path.exists(image_path):
-                        selected_files_context += f"- 📷 도면 이미지 경로: {image_path}\n"
-                    else:
-                        selected_files_context += f"- 📷 도면 이미지: 없음\n"
-                    
-                    # JSON 데이터 상세 처리
+                
                     if json_data:
                         file_detail['json_size'] = len(str(json_data))
-                        
-                        # OCR 텍스트 완전 추출 및 상세 포함
-                        ocr_texts = self._extract_ocr_texts(json_data)
+                    
+                        ocr_texts = [text for text, _ in extract_ocr_fields(json_data)]
                         if ocr_texts:
                             ocr_data_included = True
                             file_detail['ocr_count'] = len(ocr_texts)
                             file_detail['ocr_preview'] = ', '.join(ocr_texts[:10])
-                            
-                            selected_files_context += f"- 📝 **OCR 탐지 텍스트** (계측기 태그명, 라벨, 설비명 등 {len(ocr_texts)}개):\n"
-                            for j, text in enumerate(ocr_texts):
-                                selected_files_context += f"  {j+1}. \"{text}\"\n"
-                            selected_files_context += "\n"
-                        
-                        # Detection 정보 완전 추출 및 상세 포함
-                        detection_info = self._extract_detection_info(json_data)
-                        if detection_info:
+                    
+                        labels = [label for label, _ in extract_detections(json_data)]
+                        if labels:
                             detection_data_included = True
-                            file_detail['detection_count'] = len(detection_info)
-                            labels = [d.get('label', 'Unknown') for d in detection_info]
+                            file_detail['detection_count'] = len(labels)
                             file_detail['detection_preview'] = ', '.join(labels[:10])
-                            
-                            selected_files_context += f"- 🎯 **객체 탐지 결과** (P&ID 기호, 계측기기, 밸브, 배관 등 {len(detection_info)}개):\n"
-                            for j, obj in enumerate(detection_info):
-                                label = obj.get('label', obj.get('id', f'객체{j+1}'))
-                                
-                                # 위치 정보 추출
-                                if 'boundingBox' in obj:
-                                    bbox = obj['boundingBox']
-                                    pos = f"({bbox.get('x', 0):.1f}, {bbox.get('y', 0):.1f})"
-                                elif all(k in obj for k in ['x', 'y']):
-                                    pos = f"({obj['x']}, {obj['y']})"
-                                else:
-                                    pos = "위치정보없음"
-                                
-                                selected_files_context += f"  {j+1}. 🔧 {label} (도면좌표: {pos})\n"
-                            selected_files_context += "\n"
-                        
-                        # JSON 원시 데이터 구조 정보 추가
-                        selected_files_context += f"- 📊 **AI 탐지 데이터 구조:**\n"
-                        if isinstance(json_data, dict):
-                            for key in json_data.keys():
-                                if key == 'ocr' or key == 'ocr_data':
-                                    selected_files_context += f"  • {key} (문자 인식 데이터)\n"
-                                elif key == 'detecting' or key == 'detection_data':
-                                    selected_files_context += f"  • {key} (기호/객체 탐지 데이터)\n"
-                                else:
-                                    selected_files_context += f"  • {key}\n"
-                        selected_files_context += "\n"
-                        
-                    else:
-                        selected_files_context += f"- 📊 AI 탐지 데이터: 없음\n\n"
-                    
-                    file_details.append(file_detail)
                 
-                total_context_length = len(selected_files_context)
+                    # OCR 중복은 개수로 합치고 탐지 결과는 라벨별로 묶은 항목
+                    context_items.extend(drawing_context_items(
+                        DRAWING_CONTEXT_SECTION, i + 1, file_name, file_id, json_data, query_tags,
+                        image_path=image_path if image_path and os.path.exists(image_path) else None
+                    ))
+                    file_details.append(file_detail)
+            
                 logger.info(f"✅ P&ID 도면 탐지 데이터 처리 완료: {len(selected_files)}개 파일")
+            file_span.attrs['context_items'] = len(context_items)
 
-            # 쿼리 유형 감지
-            query_type = self._detect_query_type(user_query)
+        # 쿼리 유형 감지
+        query_type = self._detect_query_type(user_query)
+        
+        # 변경 분석 처리 (최우선)
+        if query_type == "change_analysis":
+            logger.info(f"🔄 변경 분석 모드로 처리: {user_query}")
             
-            # 변경 분석 처리 (최우선)
-            if query_type == "change_analysis":
-                logger.info(f"🔄 변경 분석 모드로 처리: {user_query}")
-                
-                # 직접 변경 분석 수행 (도면 이름 상관없이 stream_dose_ai_1과 stream_dose_ai_3 비교)
-                change_result = self.analyze_drawing_changes(user_query)
-                
-                # 변경 분석이 성공한 경우 바로 반환
-                if change_result and change_result.get('visualization'):
-                    return change_result
-                else:
-                    logger.warning("⚠️ 변경 분석이 실패했습니다.")
-                    return {
-                        'response': "변경 분석 중 오류가 발생했습니다. stream_dose_ai_1.json과 stream_dose_ai_3.json 파일을 확인해주세요.",
-                        'sources': [],
-                        'query_type': 'change_analysis',
-                        'context_quality': 'none',
-                        'web_search_used': False,
-                        'visualization': None
-                    }
+            # 직접 변경 분석 수행 (도면 이름 상관없이 stream_dose_ai_1과 stream_dose_ai_3 비교)
+            change_result = self.analyze_drawing_changes(user_query)
             
-            # RAG 검색 수행 (일반 질문의 경우)
+            # 변경 분석이 성공한 경우 바로 반환
+            if change_result and change_result.get('visualization'):
+                return change_result, None
+            else:
+                logger.warning("⚠️ 변경 분석이 실패했습니다.")
+                return {
+                    'response': "변경 분석 중 오류가 발생했습니다. stream_dose_ai_1.json과 stream_dose_ai_3.json 파일을 확인해주세요.",
+                    'sources': [],
+                    'query_type': 'change_analysis',
+                    'context_quality': 'none',
+                    'web_search_used': False,
+                    'visualization': None
+                }, None
+        
+        # RAG 검색 수행 (일반 질문의 경우)
+        with span("rag_retrieval") as retrieval_span:
             relevant_chunks = self.retrieve_relevant_chunks(user_query, top_k=3)
-            
+        
             # 유사도 기반 소스 선택 로직
             SIMILARITY_THRESHOLD = 0.4
             high_quality_chunks = []
             low_quality_chunks = []
-            
+        
             for chunk in relevant_chunks:
-                if chunk['score'] >= SIMILARITY_THRESHOLD:
+                # 재정렬된 청크는 크로스 인코더 점수로, 아니면 코사인 유사도로 판정
+                if chunk.get('rerank_score') is not None:
+                    relevant = chunk['rerank_score'] >= RERANK_MIN_SCORE
+                else:
+                    relevant = chunk['score'] >= SIMILARITY_THRESHOLD
+                # 질문의 계측기 태그(FIC-101 등)가 정확히 포함된 청크는 점수와 무관하게 채택
+                if relevant or chunk.get('tag_match'):
                     high_quality_chunks.append(chunk)
                 else:
                     low_quality_chunks.append(chunk)
-            
-            # 소스 정보 구성
-            sources = []
-            rag_context = ""
-            web_search_used = False
-            web_search_results = ""
-            
-            # 고품질 RAG 데이터가 있는 경우
-            if high_quality_chunks:
-                logger.info(f"📖 고품질 RAG 데이터 {len(high_quality_chunks)}개 발견 (유사도 ≥ {SIMILARITY_THRESHOLD})")
-                
-                rag_context = self.build_rag_context(high_quality_chunks)
-                
-                # RAG 소스 정보 추가
-                for chunk in high_quality_chunks:
-                    sources.append({
-                        'type': 'rag',
-                        'icon': '📖',
-                        'source': 'RAG 데이터베이스',
-                        'score': chunk['score'],
-                        'page': chunk['page'],
-                        'content_preview': chunk['content'][:200] + "..." if len(chunk['content']) > 200 else chunk['content'],
-                        'quality': 'high'
-                    })
-            
-            # 선택된 파일이 있는 경우 소스에 추가
-            if selected_files:
-                for file_data in selected_files:
-                    sources.append({
-                        'type': 'file',
-                        'icon': '📄',
-                        'source': f"선택된 파일: {file_data.get('name', 'Unknown')}",
-                        'score': None,
-                        'page': None,
-                        'content_preview': f"파일 ID: {file_data.get('id')}, 등록일: {file_data.get('create_date')}",
-                        'quality': 'high'
+            retrieval_span.attrs.update(chunks=len(relevant_chunks), high_quality=len(high_quality_chunks),
+                                         reranked=any(chunk.get('rerank_score') is not None for chunk in relevant_chunks))
+        
+        # 선택된 파일이 없으면 등록 도면 인덱스에서 관련 도면 검색
+        relevant_drawings = []
+        if not selected_files:
+            with span("drawing_search") as drawing_span:
+                relevant_drawings = [
+                    drawing for drawing in self.retrieve_relevant_drawings(user_query, top_k=3)
+                    if drawing['score'] >= SIMILARITY_THRESHOLD or drawing['tag_match']
+                ]
+                for i, drawing in enumerate(relevant_drawings):
+                    context_items.append(ContextItem(
+                        DRAWING_SEARCH_SECTION,
+                        f"[관련 도면 {i + 1}] {drawing['d_name']} (ID: {drawing['d_id']}, 유사도: {drawing['score']:.3f})\n{drawing['content']}",
+                        PRIORITY_RAG_TOP + i * 0.1,
+                        f"drawing:{drawing['d_id']}"
+                    ))
+                drawing_span.attrs['drawings'] = len(relevant_drawings)
+        
+        # 소스 정보 구성
+        sources = []
+        web_search_used = False
+        web_search_results = ""
+        
+        # 고품질 RAG 데이터가 있는 경우
+        if high_quality_chunks:
+            logger.info(f"📖 고품질 RAG 데이터 {len(high_quality_chunks)}개 발견 (유사도 ≥ {SIMILARITY_THRESHOLD})")
+            
+            for chunk in high_quality_chunks:
+                context_items.append(ContextItem(
+                    RAG_CONTEXT_SECTION,
+                    f"[참고자료 {chunk['rank']}] (유사도: {chunk['score']:.3f})\n{chunk['content']}\n",
+                    PRIORITY_QUERY_TAG if chunk.get('tag_match') else PRIORITY_RAG_TOP + chunk['rank'] * 0.1,
+                    f"{chunk.get('source')}:p{chunk['page']}"
+                ))
+            
+            # RAG 소스 정보 추가
+            for chunk in high_quality_chunks:
+                sources.append({
+                    'type': 'rag',
+                    'icon': '📖',
+                    'source': chunk.get('source') or 'RAG 데이터베이스',
+                    'score': chunk['score'],
+                    'page': chunk['page'],
+                    'content_preview': chunk['content'][:200] + "..." if len(chunk['content']) > 200 else chunk['content'],
+                    'quality': 'high'
+                })
+        
+        # 선택된 파일이 있는 경우 소스에 추가
+        if selected_files:
+            for file_data in selected_files:
+                sources.append({
+                    'type': 'file',
+                    'icon': '📄',
+                    'source': f"선택된 파일: {file_data.get('name', 'Unknown')}",
+                    'score': None,
+                    'page': None,
+                    'content_preview': f"파일 ID: {file_data.get('id')}, 등록일: {file_data.get('create_date')}",
+                    'quality': 'high'
+                })
+        
+        # 검색된 등록 도면 소스 추가
+        for drawing in relevant_drawings:
+            sources.append({
+                'type': 'drawing_search',
+                'icon': '🔍',
+                'source': f"등록 도면: {drawing['d_name']} (ID: {drawing['d_id']})",
+                'score': drawing['score'],
+                'page': None,
+                'content_preview': drawing['content'][:200] + "..." if len(drawing['content']) > 200 else drawing['content'],
+                'quality': 'high'
+            })
+        
+        # 같은 컨텍스트로 답한 유사 질문이면 LLM 호출 없이 캐시된 답변 반환
+        answer_fingerprint = None
+        query_embedding = None
+        referenced_drawings = [f.get('name') for f in selected_files or []] + [d['d_name'] for d in relevant_drawings]
+        with span("answer_cache") as cache_span:
+            if self.answer_cache is not None:
+                query_embedding = self.query_cache.encode(self.embedder, self.embedding_model_name, user_query)
+                answer_fingerprint = context_fingerprint(
+                    chunk_hashes=[chunk.get('hash') for chunk in high_quality_chunks],
+                    drawing_ids=[f.get('id') for f in selected_files or []] + [d['d_id'] for d in relevant_drawings],
+                    web_search=use_web_search
+                )
+                cached_response = self.answer_cache.get(user_query, query_embedding, answer_fingerprint)
+                cache_span.attrs['hit'] = cached_response is not None
+                if cached_response:
+                    logger.info(f"⚡ 캐시된 답변 사용 (유사도 {cached_response['cache_similarity']:.3f})")
+                    self.conversation_history.append({
+                        'timestamp': datetime.now(),
+                        'user_query': user_query,
+                        'response': cached_response['response'],
+                        'query_type': cached_response['query_type'],
+                        'context_quality': cached_response['context_quality'],
+                        'sources_count': len(cached_response['sources']),
+                        'web_search_used': cached_response['web_search_used'],
+                        'similarity_threshold': SIMILARITY_THRESHOLD,
+                        'selected_drawing': selected_drawing,
+                        'selected_files_count': len(selected_files) if selected_files else 0,
+                        'images_processed': 0,
+                        'cache_hit': True
                     })
-            
+                    return cached_response, None
+        
+        with span("context_packing") as packing_span:
+            # 질문 태그 → 상위 RAG 청크 → 도면 태그/탐지/OCR 순으로 토큰 예산 채우기
+            packed_context = self.context_packer.pack(context_items, headers={
+                DRAWING_CONTEXT_SECTION: "\n\n=== 선택된 P&ID 도면 기호 및 텍스트 탐지 결과 ===\n"
+                                         "※ 다음 데이터는 P&ID 도면에서 AI가 자동으로 탐지한 계측기기 기호, 배관 기호, 텍스트 라벨 등을 포함합니다.",
+                DRAWING_SEARCH_SECTION: "\n\n=== 질문과 관련된 등록 도면 검색 결과 ==="
+            })
+            rag_context = packed_context.section(RAG_CONTEXT_SECTION).strip()
+            selected_files_context = packed_context.section(DRAWING_CONTEXT_SECTION) + packed_context.section(DRAWING_SEARCH_SECTION)
+            total_context_length = len(selected_files_context)
+            packing_span.attrs.update(used_tokens=packed_context.used_tokens, budget_tokens=packed_context.budget_tokens,
+                                       dropped_items=len(packed_context.dropped))
+        
+        with span("prompt_assembly") as prompt_span:
             # OpenAI API 호출을 위한 메시지 구성
             messages = []
-            
+        
             # 시스템 프롬프트 (선택된 파일 데이터를 상세히 포함)
             system_prompt = f"""{self.expert_persona}
 
@@ -871,93 +1086,124 @@ class PIDExpertChatbot:
 이러한 구체적인 P&ID 요소들을 활용하여 정확하고 상세한 도면 해석과 공정 분석을 제공해주세요."""
 
             messages.append({"role": "system", "content": system_prompt})
-            
+        
             # 사용자 메시지 (텍스트만)
             messages.append({"role": "user", "content": user_query})
-            
-            # OpenAI API 호출
-            if not self.client:
-                return {
-                    'response': "OpenAI API 키가 설정되지 않았습니다. .env 파일을 확인해주세요.",
-                    'sources': sources,
-                    'query_type': query_type,
-                    'context_quality': 'none',
-                    'web_search_used': web_search_used,
-                    'similarity_threshold': SIMILARITY_THRESHOLD,
-                    'selected_drawing': selected_drawing,
-                    'selected_files_count': len(selected_files) if selected_files else 0
-                }
-            
-            try:
-                # 항상 gpt-4o-mini 사용 (Vision API 사용하지 않음)
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.3,
-                    max_tokens=2000
-                )
-                
-                ai_response = response.choices[0].message.content
-                
-                # 응답에 파일 정보 추가
-                if selected_files:
-                    file_info = f"\n\n📁 **분석된 파일 ({len(selected_files)}개):**\n"
-                    for file_data in selected_files:
-                        file_info += f"• {file_data.get('name', 'Unknown')} (ID: {file_data.get('id')})\n"
-                    ai_response += file_info
-                
-                # 응답에 소스 정보 표시 추가
-                source_info = self._build_source_summary(sources, SIMILARITY_THRESHOLD)
-                if source_info:
-                    ai_response += f"\n\n{source_info}"
-                
-            except Exception as e:
-                logger.error(f"OpenAI API 호출 실패: {e}")
-                ai_response = f"OpenAI API 오류: {e}"
-            
-            # 대화 기록 저장
-            self.conversation_history.append({
-                'timestamp': datetime.now(),
-                'user_query': user_query,
-                'response': ai_response,
-                'query_type': query_type,
-                'context_quality': 'high' if high_quality_chunks or selected_files else 'medium',
-                'sources_count': len(sources),
-                'web_search_used': web_search_used,
-                'similarity_threshold': SIMILARITY_THRESHOLD,
-                'selected_drawing': selected_drawing,
-                'selected_files_count': len(selected_files) if selected_files else 0,
-                'images_processed': 0  # 이미지 처리하지 않으므로 0
-            })
-            
+            prompt_tokens = count_tokens(system_prompt + "\n" + user_query)
+            prompt_span.attrs['prompt_tokens'] = prompt_tokens
+        
+        # OpenAI API 호출
+        if not self.client:
             return {
-                'response': ai_response,
+                'response': "OpenAI API 키가 설정되지 않았습니다. .env 파일을 확인해주세요.",
                 'sources': sources,
                 'query_type': query_type,
-                'context_quality': 'high' if high_quality_chunks or selected_files else 'medium',
+                'context_quality': 'none',
                 'web_search_used': web_search_used,
                 'similarity_threshold': SIMILARITY_THRESHOLD,
                 'selected_drawing': selected_drawing,
-                'selected_files_count': len(selected_files) if selected_files else 0,
-                # 디버그 정보에 파일 상세 정보 추가
-                'ocr_data_included': ocr_data_included,
-                'detection_data_included': detection_data_included,
-                'total_context_length': total_context_length,
-                'file_details': file_details
-            }
-            
-        except Exception as e:
-            logger.error(f"응답 생성 실패: {e}")
-            return {
-                'response': f"죄송합니다. 응답 생성 중 오류가 발생했습니다: {str(e)}",
-                'sources': [],
-                'query_type': 'error',
-                'context_quality': 'none',
-                'web_search_used': False,
-                'similarity_threshold': 0.4,
-                'selected_drawing': selected_drawing,
                 'selected_files_count': len(selected_files) if selected_files else 0
-            }
+            }, None
+
+        return None, {
+            'user_query': user_query,
+            'messages': messages,
+            'sources': sources,
+            'query_type': query_type,
+            'context_quality': 'high' if high_quality_chunks or selected_files or relevant_drawings else 'medium',
+            'web_search_used': web_search_used,
+            'similarity_threshold': SIMILARITY_THRESHOLD,
+            'selected_drawing': selected_drawing,
+            'selected_files': selected_files or [],
+            'ocr_data_included': ocr_data_included,
+            'detection_data_included': detection_data_included,
+            'total_context_length': total_context_length,
+            'file_details': file_details,
+            'packed_context': packed_context,
+            'prompt_tokens': prompt_tokens,
+            'answer_fingerprint': answer_fingerprint,
+            'query_embedding': query_embedding,
+            'referenced_drawings': referenced_drawings,
+            'referenced_sources': [chunk.get('source') for chunk in high_quality_chunks]
+        }
+
+    def _finalize_response(self, prepared: Dict, ai_response: str, llm_succeeded: bool) -> Dict:
+        """LLM 응답에 파일/소스 정보를 붙이고 대화 기록과 답변 캐시에 저장"""
+        selected_files = prepared['selected_files']
+        sources = prepared['sources']
+        
+        if llm_succeeded:
+            # 응답에 파일 정보 추가
+            if selected_files:
+                file_info = f"\n\n📁 **분석된 파일 ({len(selected_files)}개):**\n"
+                for file_data in selected_files:
+                    file_info += f"• {file_data.get('name', 'Unknown')} (ID: {file_data.get('id')})\n"
+                ai_response += file_info
+            
+            # 응답에 소스 정보 표시 추가
+            source_info = self._build_source_summary(sources, prepared['similarity_threshold'])
+            if source_info:
+                ai_response += f"\n\n{source_info}"
+        
+        # 대화 기록 저장
+        self.conversation_history.append({
+            'timestamp': datetime.now(),
+            'user_query': prepared['user_query'],
+            'response': ai_response,
+            'query_type': prepared['query_type'],
+            'context_quality': prepared['context_quality'],
+            'sources_count': len(sources),
+            'web_search_used': prepared['web_search_used'],
+            'similarity_threshold': prepared['similarity_threshold'],
+            'selected_drawing': prepared['selected_drawing'],
+            'selected_files_count': len(selected_files),
+            'images_processed': 0  # 이미지 처리하지 않으므로 0
+        })
+        
+        result = {
+            'response': ai_response,
+            'sources': sources,
+            'query_type': prepared['query_type'],
+            'context_quality': prepared['context_quality'],
+            'web_search_used': prepared['web_search_used'],
+            'similarity_threshold': prepared['similarity_threshold'],
+            'selected_drawing': prepared['selected_drawing'],
+            'selected_files_count': len(selected_files),
+            # 디버그 정보에 파일 상세 정보 추가
+            'ocr_data_included': prepared['ocr_data_included'],
+            'detection_data_included': prepared['detection_data_included'],
+            'total_context_length': prepared['total_context_length'],
+            'file_details': prepared['file_details'],
+            'context_packing': prepared['packed_context'].report(),
+            'cache_hit': False
+        }
+        
+        # 정상 응답만 캐시 (API 오류 메시지는 저장하지 않음)
+        if prepared['answer_fingerprint'] and llm_succeeded:
+            self.answer_cache.put(prepared['user_query'], prepared['query_embedding'], prepared['answer_fingerprint'],
+                                  result, drawings=prepared['referenced_drawings'],
+                                  sources=prepared['referenced_sources'])
+        
+        return result
+
+    @staticmethod
+    def _attach_trace(result: Dict, trace: Trace) -> Dict:
+        """응답 데이터에 단계별 소요 시간 추가 (전체 시간은 지표 저장소에도 기록)"""
+        result['trace'] = trace.finish()
+        return result
+
+    def _error_response(self, error: Exception, selected_drawing: Optional[str], selected_files: Optional[List[Dict]]) -> Dict:
+        """응답 생성 실패 시 반환할 응답 데이터"""
+        return {
+            'response': f"죄송합니다. 응답 생성 중 오류가 발생했습니다: {str(error)}",
+            'sources': [],
+            'query_type': 'error',
+            'context_quality': 'none',
+            'web_search_used': False,
+            'similarity_threshold': 0.4,
+            'selected_drawing': selected_drawing,
+            'selected_files_count': len(selected_files) if selected_files else 0
+        }
 
     def _build_source_summary(self, sources: List[Dict], threshold: float) -> str:
         """소스 요약 정보 생성"""
@@ -970,6 +1216,12 @@ class PIDExpertChatbot:
         
         rag_sources = [s for s in sources if s['type'] == 'rag']
         web_sources = [s for s in sources if s['type'] == 'web']
+        drawing_sources = [s for s in sources if s['type'] == 'drawing_search']
+        
+        if drawing_sources:
+            summary_parts.append(f"🔍 **등록 도면 검색**: {len(drawing_sources)}개")
+            for source in drawing_sources:
+                summary_parts.append(f"  • {source['source']}, 유사도: {source['score']:.3f}")
         
         if rag_sources:
             high_quality = [s for s in rag_sources if s.get('quality') == 'high']
@@ -1236,9 +1488,8 @@ class PIDExpertChatbot:
                 }
             
             try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
+                response = self.client.chat(
+                    [
                         {"role": "system", "content": "당신은 20년 경력의 P&ID 전문가입니다. 정확하고 실용적인 도면 분석을 제공합니다."},
                         {"role": "user", "content": summary_prompt}
                     ],
@@ -1311,6 +1562,87 @@ class PIDExpertChatbot:
                 'drawing_data': None
             }
 
+    def summarize_selected_files(self, user_query: str, selected_files: List[Dict]) -> Dict:
+        """
+        선택된 여러 도면을 map-reduce로 종합 요약
+        
+        도면별 요약을 동시에 생성(d_id별 캐시)한 뒤 요약들만 모아 한 번에 종합하므로
+        도면이 많아도 프롬프트가 컨텍스트 한도 안에 머문다.
+        
+        Args:
+            user_query: 사용자 요청 (종합 단계에 전달)
+            selected_files: 선택된 파일 목록
+        
+        Returns:
+            응답 데이터 (map_reduce에 단계별 시간/캐시 통계)
+        """
+        if not self.client:
+            return {
+                'response': "OpenAI API 키가 설정되지 않았습니다.",
+                'sources': [],
+                'query_type': 'multi_drawing_summary',
+                'context_quality': 'none',
+                'web_search_used': False,
+                'selected_files_count': len(selected_files)
+            }
+        
+        try:
+            result = summarize_drawings(self.client, selected_files, user_query)
+            
+            sources = []
+            for drawing in result['drawings']:
+                summary = drawing['summary'] or f"요약 실패: {drawing['error']}"
+                sources.append({
+                    'type': 'file',
+                    'icon': '📄',
+                    'source': f"선택된 파일: {drawing['name']} (ID: {drawing['id']})",
+                    'score': None,
+                    'page': None,
+                    'content_preview': summary[:200] + "..." if len(summary) > 200 else summary,
+                    'quality': 'high' if drawing['summary'] else 'low'
+                })
+            
+            stats = result['stats']
+            ai_response = result['response']
+            ai_response += f"\n\n📁 **분석된 파일 ({stats['files']}개, 요약 캐시 {stats['cached']}개):**\n"
+            for drawing in result['drawings']:
+                status = "" if drawing['summary'] else " ⚠️ 요약 실패"
+                ai_response += f"• {drawing['name']} (ID: {drawing['id']}){status}\n"
+            
+            self.conversation_history.append({
+                'timestamp': datetime.now(),
+                'user_query': user_query,
+                'response': ai_response,
+                'query_type': 'multi_drawing_summary',
+                'context_quality': 'high',
+                'sources_count': len(sources),
+                'web_search_used': False,
+                'selected_files_count': len(selected_files),
+                'images_processed': 0
+            })
+            
+            return {
+                'response': ai_response,
+                'sources': sources,
+                'query_type': 'multi_drawing_summary',
+                'context_quality': 'high',
+                'web_search_used': False,
+                'selected_files_count': len(selected_files),
+                'context_packing': stats['reduce_packing'],
+                'map_reduce': stats
+            }
+            
+        except Exception as e:
+            logger.error(f"다건 도면 요약 실패: {e}")
+            return {
+                'response': f"선택된 도면 요약 중 오류가 발생했습니다: {str(e)}",
+                'sources': [],
+                'query_type': 'multi_drawing_summary',
+                'context_quality': 'none',
+                'web_search_used': False,
+                'selected_files_count': len(selected_files)
+            }
+
     def get_drawing_data_by_id(self, d_id: int) -> Optional[Dict]:
         """
         d_id로 특정 도면 데이터를 조회
@@ -2236,9 +2568,8 @@ class PIDExpertChatbot:
                 ai_response = "OpenAI API 키가 설정되지 않았습니다."
             else:
                 try:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
+                    response = self.client.chat(
+                        [
                             {"role": "system", "content": "당신은 20년 경력의 P&ID 전문가입니다. 도면 변경사항을 전문적으로 분석하고 안전성을 최우선으로 검토합니다."},
                             {"role": "user", "content": analysis_prompt}
                         ],
@@ -2306,105 +2637,3 @@ class PIDExpertChatbot:
                 'web_search_used': False,
                 'visualization': None
             }
-
-    def _extract_ocr_texts(self, json_data: Dict) -> List[str]:
-        """JSON 데이터에서 OCR 텍스트 추출"""
-        ocr_texts = []
-        
-        try:
-            # 새로운 구조 ('ocr')
-            if 'ocr' in json_data and json_data['ocr']:
-                ocr_data = json_data['ocr']
-                if 'images' in ocr_data:
-                    for image in ocr_data['images']:
-                        if 'fields' in image:
-                            for field in image['fields']:
-                                if 'inferText' in field and field['inferText']:
-                                    ocr_texts.append(field['inferText'])
-            # 이전 구조 ('ocr_data')
-            elif 'ocr_data' in json_data and json_data['ocr_data']:
-                ocr_data = json_data['ocr_data']
-                if 'images' in ocr_data:
-                    for image in ocr_data['images']:
-                        if 'fields' in image:
-                            for field in image['fields']:
-                                if 'inferText' in field and field['inferText']:
-                                    ocr_texts.append(field['inferText'])
-        except Exception as e:
-            logger.error(f"OCR 텍스트 추출 실패: {e}")
-        
-        return ocr_texts
-
-    def _extract_detection_info(self, json_data: Dict) -> List[Dict]:
-        """Detection 정보 추출"""
-        detection_info = []
-        
-        # 새로운 형식 (detection_data)
-        if 'detection_data' in json_data and isinstance(json_data['detection_data'], dict):
-            detections = json_data['detection_data'].get('detections', [])
-            if isinstance(detections, list):
-                for detection in detections:
-                    if isinstance(detection, dict):
-                        info = {
-                            'label': detection.get('label', 'Unknown'),
-                            'id': detection.get('id', ''),
-                        }
-                        
-                        # 위치 정보 추출
-                        if 'boundingBox' in detection:
-                            bbox = detection['boundingBox']
-                            info['x'] = bbox.get('x', 0)
-                            info['y'] = bbox.get('y', 0)
-                            info['width'] = bbox.get('width', 0)
-                            info['height'] = bbox.get('height', 0)
-                        elif all(k in detection for k in ['x', 'y', 'width', 'height']):
-                            info['x'] = detection['x']
-                            info['y'] = detection['y']
-                            info['width'] = detection['width']
-                            info['height'] = detection['height']
-                        
-                        detection_info.append(info)
-        
-        # 이전 형식 (detecting)
-        elif 'detecting' in json_data and isinstance(json_data['detecting'], dict):
-            data = json_data['detecting'].get('data', {})
-            if isinstance(data, dict) and 'boxes' in data:
-                boxes = data['boxes']
-                if isinstance(boxes, list):
-                    for box in boxes:
-                        if isinstance(box, dict):
-                            info = {
-                                'label': box.get('label', 'Unknown'),
-                                'id': box.get('id', ''),
-                            }
-                            
-                            # 위치 정보 추출
-                            if all(k in box for k in ['x', 'y', 'width', 'height']):
-                                info['x'] = box['x']
-                                info['y'] = box['y']
-                                info['width'] = box['width']
-                                info['height'] = box['height']
-                            
-                            detection_info.append(info)
-        
-        # 직접 boxes 배열이 있는 경우
-        elif isinstance(json_data, dict) and 'boxes' in json_data:
-            boxes = json_data['boxes']
-            if isinstance(boxes, list):
-                for box in boxes:
-                    if isinstance(box, dict):
-                        info = {
-                            'label': box.get('label', 'Unknown'),
-                            'id': box.get('id', ''),
-                        }
-                        
-                        # 위치 정보 추출
-                        if all(k in box for k in ['x', 'y', 'width', 'height']):
-                            info['x'] = box['x']
-                            info['y'] = box['y']
-                            info['width'] = box['width']
-                            info['height'] = box['height']
-                        
-                        detection_info.append(info)
-        
-        return detection_info
\ No newline at end of file
@@ -6,38 +6,60 @@
 import torch
 import numpy as np
 import os
-import pickle
-from sentence_transformers import SentenceTransformer
+from utils.model_registry import get_sentence_encoder
+from utils.embedding_cache import encode_chunks
 from utils.rag_system_kiwi import RAGSystemWithKiwi
+from utils.vector_index import VectorIndex, as_vector_index
+from utils.ann_index import benchmark_backends
+from utils.quantized_index import quantization_report
+from utils.onnx_encoder import OnnxSentenceEncoder, benchmark_encoders
+from utils.retrieval_benchmark import format_report, load_labelled_queries, run_benchmark
+from utils.embedding_store import (
+    save_embedding_store, load_embedding_store, migrate_pickle_state,
+    remove_embedding_store, get_store_info
+)
 
 # 사용자 제공 코드 기반
-embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+embedder = get_sentence_encoder(EMBEDDING_MODEL_NAME)
 
 STATE_PATH = "./state/"
 
+BENCHMARK_QUERIES = [
+    "FT101은 무엇인가요?",
+    "시약 주입 방법",
+    "비상상황 대응절차",
+    "유량 제어 시스템",
+    "온도 측정 방법",
+    "압력 제어 방식",
+    "안전장치 작동원리",
+    "배관 설계 특징",
+    "제어루프 구성",
+    "계측기기 종류"
+]
+
 def save_state(chunks, embeddings):
-    """청크와 임베딩을 pickle로 저장"""
-    os.makedirs(STATE_PATH, exist_ok=True)  # state 디렉토리 생성
-    with open(os.path.join(STATE_PATH, "state.pkl"), "wb") as f:  # 'state.pkl' 파일을 쓰기 모드로 엽니다.
-        pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)  # 청크와 임베딩을 파일에 저장합니다.
-    print(f"💾 상태 저장 완료: {STATE_PATH}state.pkl")
+    """청크와 임베딩을 mmap 저장소로 저장"""
+    save_embedding_store(STATE_PATH, chunks, embeddings, model_name=EMBEDDING_MODEL_NAME)
+    print(f"💾 상태 저장 완료: {STATE_PATH}")
 
 def load_state():
-    """저장된 청크와 임베딩을 pickle로 로드"""
-    state_file = os.path.join(STATE_PATH, "state.pkl")
-    if os.path.exists(state_file):
-        with open(state_file, "rb") as f:
-            data = pickle.load(f)
-            print(f"📂 상태 로드 완료: {len(data['chunks'])}개 청크, {data['embeddings'].shape} 임베딩")
-            return data["chunks"], data["embeddings"]
+    """저장된 청크와 임베딩을 mmap으로 로드 (구버전 state.pkl은 자동 변환)"""
+    store = load_embedding_store(STATE_PATH)
+    if store is None:
+        store = migrate_pickle_state(os.path.join(STATE_PATH, "state.pkl"), STATE_PATH,
+                                     model_name=EMBEDDING_MODEL_NAME)
+    if store is not None:
+        print(f"📂 상태 로드 완료: {len(store.chunks)}개 청크, {store.embeddings.shape} 임베딩")
+        return store.chunks, store.embeddings
     else:
-        print(f"❌ 저장된 상태 파일이 없습니다: {state_file}")
+        print(f"❌ 저장된 상태가 없습니다: {STATE_PATH}")
         return None, None
 
 def create_embeddings(chunks):
-    """청크들을 임베딩하여 텐서로 변환합니다."""
-    embeddings = embedder.encode(chunks, convert_to_tensor=True)  # 청크들을 임베딩하여 텐서로 변환합니다.
-    return embeddings  # 임베딩된 벡터들을 반환합니다.
+    """청크들을 임베딩하여 텐서로 변환합니다. (이미 계산된 청크는 임베딩 캐시에서 재사용)"""
+    embeddings = encode_chunks(embedder, EMBEDDING_MODEL_NAME, chunks)  # 청크들을 임베딩하여 배열로 변환합니다.
+    return torch.from_numpy(embeddings)  # 임베딩된 벡터들을 텐서로 반환합니다.
 
 def create_normalized_embeddings(chunks):
     """정규화된 임베딩 생성 (코사인 유사도 최적화)"""
@@ -49,19 +71,18 @@ def create_normalized_embeddings(chunks):
 def retrieve_relevant_chunks(query, chunks, embeddings, top_k=5):
     """
     사용자 요구사항에 따른 검색 함수
+
+    embeddings에는 원시 임베딩 또는 미리 구성한 VectorIndex를 넘길 수 있으며,
+    반복 검색 시에는 VectorIndex를 넘겨야 정규화를 매번 반복하지 않는다.
     """
+    index = as_vector_index(embeddings)
+    
     # 쿼리 임베딩 생성
     query_embedding = embedder.encode(query, convert_to_tensor=True)
-    query_embedding = query_embedding / torch.norm(query_embedding)
-    
-    # 임베딩 정규화 (이미 정규화된 경우 생략 가능)
-    embeddings = embeddings / torch.norm(embeddings, dim=1, keepdim=True)
-    
-    # 유사도 계산
-    similarities = torch.matmul(embeddings, query_embedding.T).squeeze()
     
     # 상위 k개 추출
-    top_k_indices = torch.topk(similarities, top_k).indices.tolist()
+    _, top_k_indices = index.search(query_embedding, top_k)
+    top_k_indices = top_k_indices[0].tolist()
     
     # 관련 청크 반환
     relevant_chunks = [chunks[i] for i in top_k_indices]
@@ -69,7 +90,7 @@ def retrieve_relevant_chunks(query, chunks, embeddings, top_k=5):
     return '\n\n'.join(relevant_chunks)
 
 def build_complete_vector_db():
-    """완전한 벡터 데이터베이스 구축 (pickle 저장/로드 지원)"""
+    """완전한 벡터 데이터베이스 구축 (mmap 저장소 저장/로드 지원)"""
     
     print("🏗️ 완전한 벡터 데이터베이스 구축")
     print("=" * 60)
@@ -142,9 +163,7 @@ def interactive_search(chunks, embeddings):
             
             # 유사도 점수도 표시
             query_embedding = embedder.encode(query, convert_to_tensor=True)
-            query_embedding = query_embedding / torch.norm(query_embedding)
-            similarities = torch.matmul(embeddings, query_embedding.T).squeeze()
-            top_3_similarities = torch.topk(similarities, 3).values.tolist()
+            top_3_similarities = as_vector_index(embeddings).search(query_embedding, 3)[0][0].tolist()
             
             print(f"\n📊 유사도 점수: {[f'{s:.3f}' for s in top_3_similarities]}")
             
@@ -159,18 +178,7 @@ def benchmark_search_performance(chunks, embeddings):
     
     import time
     
-    test_queries = [
-        "FT101은 무엇인가요?",
-        "시약 주입 방법",
-        "비상상황 대응절차",
-        "유량 제어 시스템",
-        "온도 측정 방법",
-        "압력 제어 방식",
-        "안전장치 작동원리",
-        "배관 설계 특징",
-        "제어루프 구성",
-        "계측기기 종류"
-    ]
+    test_queries = BENCHMARK_QUERIES
     
     print(f"🔍 {len(test_queries)}개 쿼리로 성능 테스트")
     
@@ -191,36 +199,117 @@ def benchmark_search_performance(chunks, embeddings):
     print(f"  - 평균 시간: {avg_time:.3f}초/쿼리")
     print(f"  - 처리량: {1/avg_time:.1f} 쿼리/초")
 
+def benchmark_labelled_retrieval(chunks, embeddings, queries_path="benchmarks/queries.json"):
+    """라벨 쿼리셋으로 백엔드별 recall@k, MRR, p50/p95/p99, 구축 시간, 크기, 최대 RSS 측정 후 JSON 저장"""
+    
+    print("\n🧪 라벨 쿼리셋 검색 벤치마크")
+    print("=" * 60)
+    
+    if not os.path.exists(queries_path):
+        print(f"❌ 라벨 쿼리셋이 없습니다: {queries_path}")
+        print('   형식: [{"query": "...", "relevant": ["<청크 sha256>"], "relevant_contains": ["..."]}]')
+        return None
+    
+    report = run_benchmark(embeddings, chunks, load_labelled_queries(queries_path), embedder,
+                           model_name=EMBEDDING_MODEL_NAME)
+    print(format_report(report))
+    return report
+
+def benchmark_ann_backends(embeddings, scale_to=None, top_k=10, num_sample_queries=200):
+    """ANN 백엔드(Flat/HNSW/IVF-PQ)의 recall@k와 p50/p99 지연시간을 정확 검색과 비교"""
+    
+    print("\n🧭 ANN 백엔드 벤치마크")
+    print("=" * 60)
+    
+    corpus = torch.as_tensor(np.asarray(embeddings, dtype=np.float32))
+    
+    # 대규모 코퍼스 모의: 실제 임베딩 주변에 잡음을 더한 벡터로 확장
+    if scale_to and scale_to > len(corpus):
+        generator = torch.Generator().manual_seed(0)
+        picks = torch.randint(len(corpus), (scale_to - len(corpus),), generator=generator)
+        noise = torch.randn(len(picks), corpus.shape[1], generator=generator) * 0.05
+        corpus = torch.cat([corpus, corpus[picks] + noise])
+    
+    # 실제 질문 + 코퍼스에서 뽑은 벡터에 잡음을 더한 쿼리
+    generator = torch.Generator().manual_seed(1)
+    sample = corpus[torch.randint(len(corpus), (num_sample_queries,), generator=generator)]
+    queries = torch.cat([
+        embedder.encode(BENCHMARK_QUERIES, convert_to_tensor=True).cpu(),
+        sample + torch.randn(sample.shape, generator=generator) * 0.05
+    ])
+    
+    print(f"🔍 코퍼스 {len(corpus)}개, 쿼리 {len(queries)}개, top_k={top_k}")
+    report = benchmark_backends(corpus, queries, top_k=top_k)
+    
+    print(f"\n{'백엔드':<8} {'recall@k':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'구축(s)':>8}")
+    for backend, result in report.items():
+        print(f"{backend:<8} {result['recall@k']:>9.3f} {result['p50_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['build_s']:>8.2f}")
+    return report
+
+def benchmark_quantization(embeddings, top_k=10, rerank_candidates=200):
+    """int8/PQ 양자화의 메모리 절감량과 recall 손실 측정"""
+    
+    print("\n🗜️ 임베딩 양자화 벤치마크")
+    print("=" * 60)
+    
+    queries = embedder.encode(BENCHMARK_QUERIES, convert_to_tensor=True).cpu()
+    report = quantization_report(embeddings, queries, top_k=top_k, rerank_candidates=rerank_candidates)
+    
+    print(f"🔍 코퍼스 {len(embeddings)}개, 쿼리 {len(queries)}개, top_k={top_k}, 재정렬 후보 {rerank_candidates}개")
+    print(f"\n{'방식':<6} {'코드(MB)':>9} {'float(MB)':>10} {'절감':>6} {'1차 recall':>11} {'재정렬 recall':>13} {'p50(ms)':>8}")
+    for kind, result in report.items():
+        print(f"{kind:<6} {result['code_mb']:>9.2f} {result['float_mb']:>10.2f} {result['memory_saved']:>6.0%} "
+              f"{result['recall@k_first_pass']:>11.3f} {result['recall@k_reranked']:>13.3f} {result['p50_ms']:>8.2f}")
+    return report
+
+def benchmark_encoder_backends(model_names=(EMBEDDING_MODEL_NAME, "jhgan/ko-sroberta-multitask")):
+    """torch / ONNX fp32 / ONNX int8 인코더의 지연시간, 처리량, 임베딩 호환성 비교"""
+    
+    print("\n🏎️ 인코더 백엔드 벤치마크")
+    print("=" * 60)
+    
+    for model_name in model_names:
+        torch_encoder = get_sentence_encoder(model_name, backend="torch")
+        encoders = {
+            "torch": torch_encoder,
+            "onnx": OnnxSentenceEncoder(model_name, quantize=False, reference=torch_encoder),
+            "onnx-int8": OnnxSentenceEncoder(model_name, quantize=True, reference=torch_encoder)
+        }
+        report = benchmark_encoders(encoders, sentences=BENCHMARK_QUERIES)
+        
+        print(f"\n📦 {model_name}")
+        print(f"{'백엔드':<10} {'p50(ms)':>8} {'p95(ms)':>8} {'처리량(문장/s)':>14} {'최소 코사인':>10}")
+        for backend, result in report.items():
+            print(f"{backend:<10} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                  f"{result['throughput_per_s']:>14.1f} {result['min_cosine_vs_first']:>10.4f}")
+
 def clear_state():
     """저장된 상태 파일 삭제"""
-    state_file = os.path.join(STATE_PATH, "state.pkl")
-    if os.path.exists(state_file):
-        os.remove(state_file)
-        print(f"🗑️ 상태 파일 삭제 완료: {state_file}")
+    if remove_embedding_store(STATE_PATH):
+        print(f"🗑️ 상태 파일 삭제 완료: {STATE_PATH}")
     else:
-        print(f"❌ 삭제할 상태 파일이 없습니다: {state_file}")
+        print(f"❌ 삭제할 상태 파일이 없습니다: {STATE_PATH}")
+    
+    legacy_file = os.path.join(STATE_PATH, "state.pkl")
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+        print(f"🗑️ 구버전 상태 파일 삭제 완료: {legacy_file}")
 
 def get_state_info():
     """저장된 상태 파일 정보 확인"""
-    state_file = os.path.join(STATE_PATH, "state.pkl")
-    if os.path.exists(state_file):
-        file_size = os.path.getsize(state_file)
-        file_size_mb = file_size / 1024 / 1024
+    info = get_store_info(STATE_PATH)
+    if info:
+        total_size_mb = sum(info['file_sizes'].values()) / 1024 / 1024
         print(f"📊 상태 파일 정보:")
-        print(f"  - 파일 경로: {state_file}")
-        print(f"  - 파일 크기: {file_size_mb:.2f} MB")
-        
-        # 간단한 내용 확인
-        try:
-            with open(state_file, "rb") as f:
-                data = pickle.load(f)
-                print(f"  - 청크 수: {len(data['chunks'])}")
-                print(f"  - 임베딩 shape: {data['embeddings'].shape}")
-                print(f"  - 임베딩 타입: {type(data['embeddings'])}")
-        except Exception as e:
-            print(f"  - 파일 읽기 오류: {e}")
+        print(f"  - 저장 경로: {STATE_PATH}")
+        print(f"  - 전체 크기: {total_size_mb:.2f} MB")
+        print(f"  - 청크 수: {info['count']}")
+        print(f"  - 임베딩 shape: ({info['count']}, {info['dim']})")
+        print(f"  - 임베딩 타입: {info['dtype']} (mmap)")
+        print(f"  - 임베딩 모델: {info.get('model_name')}")
     else:
-        print(f"❌ 상태 파일이 없습니다: {state_file}")
+        print(f"❌ 상태 파일이 없습니다: {STATE_PATH}")
 
 def main():
     """메인 실행 함수"""
@@ -236,16 +325,23 @@ def main():
     print("1. 벡터 DB 구축 및 검색 시작")
     print("2. 상태 파일 삭제 후 새로 구축")
     print("3. 종료")
+    print("4. ANN 백엔드 벤치마크 (recall@k, p50/p99)")
+    print("5. 임베딩 양자화 벤치마크 (메모리 절감, recall)")
+    print("6. 인코더 백엔드 벤치마크 (torch vs ONNX)")
+    print("7. 라벨 쿼리셋 검색 벤치마크 (recall@k, MRR, 지연시간, 메모리 → JSON)")
     
-    choice = input("\n선택하세요 (1-3): ").strip()
+    choice = input("\n선택하세요 (1-7): ").strip()
     
-    if choice == "2":
+    if choice == "6":
+        benchmark_encoder_backends()
+        return
+    elif choice == "2":
         clear_state()
         print("새로운 벡터 DB를 구축합니다...")
     elif choice == "3":
         print("👋 프로그램을 종료합니다.")
         return
-    elif choice != "1":
+    elif choice not in ("1", "4", "5", "7"):
         print("기본값으로 벡터 DB 구축을 시작합니다...")
     
     try:
@@ -255,11 +351,28 @@ def main():
         if chunks is None:
             return
         
+        if choice == "4":
+            scale = input("모의 코퍼스 크기 (엔터: 실제 크기): ").strip()
+            benchmark_ann_backends(embeddings, scale_to=int(scale) if scale else None)
+            return
+        
+        if choice == "5":
+            benchmark_quantization(embeddings)
+            return
+        
+        if choice == "7":
+            queries_path = input("라벨 쿼리셋 경로 (엔터: benchmarks/queries.json): ").strip()
+            benchmark_labelled_retrieval(chunks, embeddings, queries_path or "benchmarks/queries.json")
+            return
+        
+        # 저장된 임베딩은 이미 정규화되어 있으므로 인덱스를 한 번만 구성
+        index = VectorIndex(embeddings, normalized=True)
+        
         # 성능 벤치마크
-        benchmark_search_performance(chunks, embeddings)
+        benchmark_search_performance(chunks, index)
         
         # 대화형 검색 시작
-        interactive_search(chunks, embeddings)
+        interactive_search(chunks, index)
         
     except KeyboardInterrupt:
         print("\n\n👋 사용자에 의해 중단되었습니다.")
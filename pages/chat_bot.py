@@ -1,7 +1,12 @@
 import streamlit as st
 import os
 import json
+import itertools
 from models.chatbotModel import PIDExpertChatbot
+from utils.model_registry import get_registry
+from utils.tracing import get_metrics_store
+from services.warmup_service import get_warmup_service
+from config.user_config import CORPUS_DATA_DIR, CORPUS_EXTENSIONS, MAP_REDUCE_MIN_FILES
 from loguru import logger
 import time
 from datetime import datetime
@@ -79,7 +84,12 @@ def show():
         
         with col_a:
             if st.button("📋 전체 파일 요약", use_container_width=True):
-                _add_test_question(f"선택된 {len(selected_files)}개 파일({', '.join([f['name'] for f in selected_files])})에 대한 종합적인 요약을 제공해주세요.")
+                summary_question = f"선택된 {len(selected_files)}개 파일({', '.join([f['name'] for f in selected_files])})에 대한 종합적인 요약을 제공해주세요."
+                # 도면이 많으면 도면별 요약을 동시에 만든 뒤 종합 (한 프롬프트에 모두 넣지 않음)
+                if len(selected_files) >= MAP_REDUCE_MIN_FILES:
+                    _add_multi_drawing_summary(summary_question, selected_files)
+                else:
+                    _add_test_question(summary_question)
         
         with col_b:
             if st.button("🔍 상세 분석", use_container_width=True):
@@ -235,28 +245,72 @@ def show():
             st.info("📄 도면 미선택")
             st.caption("FILE LIST에서 도면을 선택하세요")
         
-        # RAG 시스템 상태 확인
-        pdf_path = "data/공정 Description_글.pdf"
-        pdf_exists = os.path.exists(pdf_path)
+        # RAG 시스템 상태 확인 (데이터 디렉터리의 모든 문서를 문서별 샤드로 수집)
+        data_dir = CORPUS_DATA_DIR
+        corpus_files = sorted(
+            name for name in (os.listdir(data_dir) if os.path.isdir(data_dir) else [])
+            if name.lower().endswith(CORPUS_EXTENSIONS)
+        )
+        pdf_exists = bool(corpus_files)
         
         if pdf_exists:
-            st.success("✅ PDF 문서 발견")
-            st.info(f"📄 {os.path.basename(pdf_path)}")
+            st.success(f"✅ 문서 {len(corpus_files)}개 발견")
+            for name in corpus_files:
+                st.info(f"📄 {name}")
         else:
             st.error("❌ PDF 문서를 찾을 수 없습니다")
-            st.info(f"📂 예상 경로: {pdf_path}")
+            st.info(f"📂 문서 디렉터리: {data_dir}")
         
         # 고급 설정
         st.markdown("### 🎛️ 고급 설정")
         use_web_search = st.checkbox("웹 검색 보조 활용", help="RAG 정보가 부족할 때 웹 검색 결과를 보조적으로 활용")
         show_sources = st.checkbox("참고 문서 출처 표시", value=True)
         show_debug_info = st.checkbox("디버그 정보 표시", help="쿼리 유형, 컨텍스트 품질 등 기술 정보 표시")
+        
+        if show_debug_info:
+            cache_stats = st.session_state.chatbot.query_cache.stats()
+            st.caption(f"🧠 쿼리 임베딩 캐시: 적중 {cache_stats['hits']} / 미스 {cache_stats['misses']} "
+                       f"({cache_stats['hit_rate']:.0%}, {cache_stats['size']}개 보관)")
+            for model_info in get_registry().memory_report():
+                st.caption(f"📦 {model_info['key']}: RSS +{model_info['rss_delta_mb']}MB, "
+                           f"로드 {model_info['load_seconds']}초")
+            warmup_status = get_warmup_service().status()
+            st.caption(f"🔥 워밍업: {warmup_status['state']}"
+                       + (f" ({warmup_status['elapsed_s']}초)" if warmup_status['elapsed_s'] is not None else ""))
+            if st.session_state.chatbot.answer_cache is not None:
+                answer_stats = st.session_state.chatbot.answer_cache.stats()
+                st.caption(f"⚡ 답변 캐시: 적중 {answer_stats['hits']} / 미스 {answer_stats['misses']} "
+                           f"({answer_stats['hit_rate']:.0%}, {answer_stats['size']}개 보관, 무효화 {answer_stats['invalidated']}개)")
+            if st.session_state.chatbot.reranker is not None:
+                rerank_stats = st.session_state.chatbot.reranker.stats()
+                st.caption(f"🎯 재정렬: {rerank_stats['calls']}회, 채점 {rerank_stats['scored']}개, "
+                           f"캐시 적중 {rerank_stats['cache_hits']}개, 예산 초과 {rerank_stats['budget_exceeded']}회")
+            if st.session_state.chatbot.client is not None:
+                llm_stats = st.session_state.chatbot.client.stats()
+                latency = f", p50 {llm_stats['p50_ms']:.0f}ms / p95 {llm_stats['p95_ms']:.0f}ms" if 'p50_ms' in llm_stats else ""
+                st.caption(f"🌐 LLM 게이트웨이: {llm_stats['calls']}회, 재시도 {llm_stats['retries']}회, "
+                           f"헤징 {llm_stats['hedges']}회, 마감 초과 {llm_stats['deadline_exceeded']}회{latency}")
+            stage_metrics = get_metrics_store().report()
+            if stage_metrics:
+                st.caption("⏱️ 단계별 지연 (최근 요청 기준 p50 / p95)")
+                for stage, metrics in stage_metrics.items():
+                    st.caption(f"  - {stage}: {metrics['p50_ms']:.0f}ms / {metrics['p95_ms']:.0f}ms ({metrics['count']}회)")
+            if st.session_state.chatbot.corpus is not None:
+                for shard_info in st.session_state.chatbot.corpus.shard_report():
+                    st.caption(f"🗂️ {shard_info['source']}: {shard_info['chunks']}개 청크")
+    
+    # 백그라운드 워밍업이 진행 중이면 상태 표시 (초기화는 같은 공용 모델/인덱스를 기다렸다가 재사용)
+    warmup = get_warmup_service()
+    if warmup.state == "running":
+        warmup_status = warmup.status()
+        st.info(f"⏳ 모델 준비 중... ({warmup_status['completed']}/{warmup_status['total']}) "
+                f"{warmup_status['current_step'] or ''}")
     
     # RAG 시스템 초기화
     if pdf_exists:
         if 'rag_initialized' not in st.session_state:
             with st.spinner("🤖 RAG 시스템을 초기화하는 중..."):
-                success = st.session_state.chatbot.initialize_rag_system(pdf_path)
+                success = st.session_state.chatbot.initialize_rag_system(data_dir)
                 if success:
                     st.session_state.rag_initialized = True
                     st.success("✅ RAG 시스템이 성공적으로 초기화되었습니다!")
@@ -339,16 +393,27 @@ def show():
         
         # 봇 응답 생성
         with st.chat_message("assistant"):
+            events = st.session_state.chatbot.generate_response_stream(
+                prompt, 
+                use_web_search=use_web_search,
+                selected_drawing=st.session_state.get('selected_drawing_name'),
+                selected_files=st.session_state.get('selected_files_for_chat')
+            )
+            # 검색/컨텍스트 구성이 끝나 첫 이벤트가 올 때까지만 스피너 표시
             with st.spinner("🤔 분석 중..."):
-                response_data = st.session_state.chatbot.generate_response(
-                    prompt, 
-                    use_web_search=use_web_search,
-                    selected_drawing=st.session_state.get('selected_drawing_name'),
-                    selected_files=st.session_state.get('selected_files_for_chat')
-                )
+                first_event = next(events)
             
-            # 응답 표시
-            st.write(response_data['response'])
+            # 응답 표시 (토큰이 도착하는 대로 이어 붙이고, 끝나면 소스 요약이 붙은 전체 응답으로 교체)
+            response_placeholder = st.empty()
+            streamed_text = ""
+            response_data = None
+            for event in itertools.chain([first_event], events):
+                if event['type'] == 'token':
+                    streamed_text += event['content']
+                    response_placeholder.markdown(streamed_text + "▌")
+                else:
+                    response_data = event['data']
+            response_placeholder.markdown(response_data['response'])
             st.caption(f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             
             # 소스 정보 표시
@@ -378,7 +443,8 @@ def show():
                 "extracted_text_length": response_data.get('extracted_text_length', 0),
                 "rag_chunks_count": response_data.get('rag_chunks_count', 0),
                 "json_analysis": response_data.get('json_analysis'),
-                "similarity_threshold": response_data.get('similarity_threshold')
+                "similarity_threshold": response_data.get('similarity_threshold'),
+                "trace": response_data.get('trace')
             }
         }
         
@@ -427,7 +493,8 @@ def show():
         if st.button("🔄 RAG 시스템 재구축"):
             if pdf_exists:
                 with st.spinner("RAG 시스템을 재구축하는 중..."):
-                    success = st.session_state.chatbot.rag_system.build_vector_database(pdf_path)
+                    # 변경된 청크만 다시 임베딩하는 증분 갱신
+                    success = st.session_state.chatbot.initialize_rag_system(data_dir)
                     if success:
                         st.success("✅ RAG 시스템이 재구축되었습니다!")
                     else:
@@ -465,6 +532,39 @@ def show():
     st.markdown("---")
     st.caption("⚠️ 이 챗봇은 보조 도구이며, 중요한 안전 결정은 반드시 전문가와 상의하시기 바랍니다.")
 
+def _add_multi_drawing_summary(question_text, selected_files):
+    """선택된 여러 도면을 map-reduce로 요약해 대화에 추가"""
+    
+    if 'messages' not in st.session_state:
+        st.session_state.messages = []
+    
+    st.session_state.messages.append({
+        "role": "user",
+        "content": question_text,
+        "timestamp": datetime.now()
+    })
+    
+    with st.spinner(f"🤔 도면 {len(selected_files)}개를 나눠 요약하는 중..."):
+        response_data = st.session_state.chatbot.summarize_selected_files(question_text, selected_files)
+    
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": response_data['response'],
+        "timestamp": datetime.now(),
+        "sources": response_data.get('sources', []),
+        "debug_info": {
+            "query_type": response_data.get('query_type'),
+            "context_quality": response_data.get('context_quality'),
+            "web_search_used": response_data.get('web_search_used', False),
+            "selected_files_count": response_data.get('selected_files_count', 0),
+            "context_packing": response_data.get('context_packing'),
+            "map_reduce": response_data.get('map_reduce')
+        }
+    })
+    
+    st.rerun()
+
+
 def _add_test_question(question_text):
     """테스트 질문을 대화에 추가하고 자동 응답 생성"""
     
@@ -498,7 +598,8 @@ def _add_test_question(question_text):
             "context_quality": response_data.get('context_quality'),
             "web_search_used": response_data.get('web_search_used', False),
             "selected_files_count": response_data.get('selected_files_count', 0),
-            "files_processed": response_data.get('selected_files_count', 0)  # 이미지 처리 대신 파일 처리 수로 변경
+            "files_processed": response_data.get('selected_files_count', 0),  # 이미지 처리 대신 파일 처리 수로 변경
+            "trace": response_data.get('trace')
         }
     }
     
@@ -754,6 +855,12 @@ def _display_debug_info(debug_info):
     elif query_type == "drawing_visualization":
         type_display = "🎨 도면시각화"
         color = "teal"
+    elif query_type == "multi_drawing_summary":
+        type_display = "📋 다건 요약"
+        color = "blue"
+    else:
+        type_display = f"💬 {query_type}"
+        color = "gray"
     
     # 메트릭 표시
     col1, col2, col3, col4 = st.columns(4)
@@ -780,6 +887,33 @@ def _display_debug_info(debug_info):
             low_count = debug_info.get('low_quality_sources', 0)
             st.metric("📈 소스 품질", f"고품질: {high_count}, 참고: {low_count}")
     
+    # 컨텍스트 토큰 예산 사용량과 제외된 항목
+    packing = debug_info.get('context_packing')
+    if packing:
+        st.caption(f"🧮 컨텍스트 토큰: {packing['used_tokens']}/{packing['budget_tokens']} "
+                   f"(제외 {packing['dropped_items']}개, {packing['dropped_tokens']} 토큰)")
+        for item in packing['dropped'][:20]:
+            reason = "예산 초과" if item['reason'] == "budget" else "중복"
+            st.caption(f"  - [{reason}] {item['key']} ({item['tokens']} 토큰)")
+    
+    # 단계별 소요 시간 (span 깊이만큼 들여쓰기, 토큰 수/캐시 적중 등 속성 포함)
+    trace = debug_info.get('trace')
+    if trace:
+        st.caption(f"⏱️ 단계별 소요 시간 (전체 {trace['total_ms']:.0f}ms)")
+        for trace_span in trace['spans']:
+            attrs = ", ".join(f"{key}={value}" for key, value in trace_span['attrs'].items())
+            error = f" ❌ {trace_span['error']}" if trace_span['error'] else ""
+            st.caption(f"{'  ' * (trace_span['depth'] + 1)}- {trace_span['name']}: {trace_span['ms']:.0f}ms"
+                       + (f" ({attrs})" if attrs else "") + error)
+    
+    # 다건 도면 요약 단계별 시간 (map은 가장 느린 도면 기준, 순차 합과 비교)
+    map_reduce = debug_info.get('map_reduce')
+    if map_reduce:
+        st.caption(f"🗂️ map-reduce: 도면 {map_reduce['files']}개 (캐시 {map_reduce['cached']}개, 실패 {map_reduce['failed']}개, "
+                   f"동시 {map_reduce['concurrency']}개) | map {map_reduce['map_seconds']:.1f}초 "
+                   f"(순차 합 {map_reduce['map_sequential_seconds']:.1f}초, 최장 {map_reduce['slowest_drawing_seconds']:.1f}초) | "
+                   f"reduce {map_reduce['reduce_seconds']:.1f}초")
+    
     # 선택된 파일 정보 표시
     selected_files_count = debug_info.get('selected_files_count', 0)
     if selected_files_count > 0:
@@ -4,11 +4,13 @@ RAG + OpenAI P&ID 전문가 챗봇
 """
 
 import os
-import pickle
 import torch
-from sentence_transformers import SentenceTransformer
+from utils.model_registry import get_sentence_encoder
+from utils.embedding_cache import encode_chunks
 from utils.rag_system_kiwi import RAGSystemWithKiwi
-from openai import OpenAI
+from utils.vector_index import VectorIndex, as_vector_index
+from utils.embedding_store import save_embedding_store, load_embedding_store, migrate_pickle_state
+from services.llm_gateway import get_llm_gateway
 import json
 from datetime import datetime
 from dotenv import load_dotenv
@@ -16,49 +18,45 @@ from dotenv import load_dotenv
 # .env 파일 로드
 load_dotenv()
 
-# OpenAI 클라이언트 초기화
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# 공용 LLM 게이트웨이 (커넥션 풀 + 재시도/마감시간, API 키가 없으면 None)
+client = get_llm_gateway()
 
 # 임베딩 모델 초기화
-embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+embedder = get_sentence_encoder(EMBEDDING_MODEL_NAME)
 
 STATE_PATH = "./state/"
 
 def save_state(chunks, embeddings):
-    """청크와 임베딩을 pickle로 저장"""
-    os.makedirs(STATE_PATH, exist_ok=True)
-    with open(os.path.join(STATE_PATH, "state.pkl"), "wb") as f:
-        pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)
+    """청크와 임베딩을 mmap 저장소로 저장"""
+    save_embedding_store(STATE_PATH, chunks, embeddings, model_name=EMBEDDING_MODEL_NAME)
 
 def load_state():
-    """저장된 청크와 임베딩을 pickle로 로드"""
-    state_file = os.path.join(STATE_PATH, "state.pkl")
-    if os.path.exists(state_file):
-        with open(state_file, "rb") as f:
-            data = pickle.load(f)
-            return data["chunks"], data["embeddings"]
+    """저장된 청크와 임베딩을 mmap으로 로드 (구버전 state.pkl은 자동 변환)"""
+    store = load_embedding_store(STATE_PATH)
+    if store is None:
+        store = migrate_pickle_state(os.path.join(STATE_PATH, "state.pkl"), STATE_PATH,
+                                     model_name=EMBEDDING_MODEL_NAME)
+    if store is not None:
+        return store.chunks, store.embeddings
     return None, None
 
 def create_embeddings(chunks):
-    """청크들을 임베딩하여 텐서로 변환"""
-    embeddings = embedder.encode(chunks, convert_to_tensor=True)
-    return embeddings
+    """청크들을 임베딩하여 텐서로 변환 (이미 계산된 청크는 임베딩 캐시에서 재사용)"""
+    embeddings = encode_chunks(embedder, EMBEDDING_MODEL_NAME, chunks)
+    return torch.from_numpy(embeddings)
 
 def retrieve_relevant_chunks(query, chunks, embeddings, top_k=3):
-    """RAG 검색 - 관련 청크 추출"""
+    """RAG 검색 - 관련 청크 추출 (embeddings에 VectorIndex 전달 가능)"""
+    index = as_vector_index(embeddings)
+    
     # 쿼리 임베딩 생성
     query_embedding = embedder.encode(query, convert_to_tensor=True)
-    query_embedding = query_embedding / torch.norm(query_embedding)
-    
-    # 임베딩 정규화
-    embeddings_norm = embeddings / torch.norm(embeddings, dim=1, keepdim=True)
-    
-    # 유사도 계산
-    similarities = torch.matmul(embeddings_norm, query_embedding)
     
     # 상위 k개 추출
-    top_k_indices = torch.topk(similarities, min(top_k, len(similarities))).indices.tolist()
-    top_k_scores = torch.topk(similarities, min(top_k, len(similarities))).values.tolist()
+    top_k_scores, top_k_indices = index.search(query_embedding, top_k)
+    top_k_indices = top_k_indices[0].tolist()
+    top_k_scores = top_k_scores[0].tolist()
     
     # 관련 청크와 점수 반환
     relevant_chunks = []
@@ -118,12 +116,15 @@ def ask_openai_with_rag(user_question, rag_context, model="gpt-4o-mini", tempera
     try:
         system_prompt = create_pid_expert_prompt(user_question, rag_context)
         
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
+        if client is None:
+            return "❌ OpenAI API 키가 설정되지 않았습니다. .env 파일을 확인해주세요."
+        
+        response = client.chat(
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_question}
             ],
+            model=model,
             temperature=temperature,
             max_tokens=1500
         )
@@ -137,8 +138,9 @@ def setup_rag_system():
     """RAG 시스템 초기화"""
     print("🔧 RAG 시스템 초기화 중...")
     
-    # 기존 상태 로드 시도
+    # 기존 상태 로드 시도 (저장소의 임베딩은 이미 정규화되어 있음)
     chunks, embeddings = load_state()
+    normalized = embeddings is not None
     
     if chunks is None or embeddings is None:
         print("📄 새로운 벡터 데이터베이스 구축 중...")
@@ -167,7 +169,7 @@ def setup_rag_system():
         print("📂 기존 벡터 데이터베이스 로드 완료")
     
     print(f"✅ RAG 시스템 준비 완료: {len(chunks)}개 청크, {embeddings.shape} 임베딩")
-    return chunks, embeddings
+    return chunks, VectorIndex(embeddings, normalized=normalized)
 
 def interactive_pid_chatbot():
     """P&ID 전문가 챗봇 인터페이스"""
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+선택 도면 다건 요약 (map-reduce)
+
+파일 목록에서 도면을 여러 장 골라 '전체 파일 요약'을 누르면 모든 탐지 데이터가 한 프롬프트에
+들어가 컨텍스트 한도를 넘기 쉽다. 대신 도면별 요약(map)을 asyncio로 동시에 생성하고
+(동시 호출 수 제한, d_id별 캐시) 요약들만 모아 한 번의 호출(reduce)로 종합한다.
+전체 시간은 도면별 요약 시간의 합이 아니라 가장 느린 도면에 맞춰진다.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.user_config import (
+    CONTEXT_TOKEN_BUDGET, MAP_REDUCE_CACHE_SIZE, MAP_REDUCE_CONCURRENCY,
+    MAP_REDUCE_DRAWING_TOKEN_BUDGET, MAP_REDUCE_SUMMARY_MAX_TOKENS
+)
+from services.llm_gateway import AsyncLLMSession, LLMGateway
+from utils.context_packer import PRIORITY_RAG_TOP, ContextItem, ContextPacker, drawing_context_items
+
+MAP_SECTION = "drawing"
+REDUCE_SECTION = "summaries"
+MIN_SUMMARY_TOKENS = 150
+
+EXPERT_SYSTEM_PROMPT = "당신은 20년 경력의 P&ID 전문가입니다. 정확하고 실용적인 도면 분석을 제공합니다."
+
+
+def drawing_digest(json_data: Optional[Dict]) -> str:
+    """도면 탐지 JSON의 sha256 (같은 d_id라도 내용이 바뀌면 요약을 다시 만들기 위함)"""
+    payload = json.dumps(json_data or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DrawingSummaryCache:
+    """d_id별 도면 요약 캐시 (LRU, 스레드 안전)"""
+
+    def __init__(self, max_size: int = MAP_REDUCE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, d_id, digest: str) -> Optional[str]:
+        key = str(d_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != digest:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, d_id, digest: str, summary: str):
+        key = str(d_id)
+        with self._lock:
+            self._entries[key] = (digest, summary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, d_id) -> bool:
+        with self._lock:
+            return self._entries.pop(str(d_id), None) is not None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_summary_cache: Optional[DrawingSummaryCache] = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> DrawingSummaryCache:
+    """프로세스 공용 도면 요약 캐시 (세션 간 공유)"""
+    global _summary_cache
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = DrawingSummaryCache()
+        return _summary_cache
+
+
+def _map_prompt(index: int, file_data: Dict) -> Tuple[str, Dict]:
+    """도면 한 장의 요약 프롬프트 (탐지 데이터는 도면별 토큰 예산 안에서 압축)"""
+    packed = ContextPacker(MAP_REDUCE_DRAWING_TOKEN_BUDGET).pack(drawing_context_items(
+        MAP_SECTION, index, file_data.get('name', f'파일_{index}'), file_data.get('id', 'unknown'),
+        file_data.get('json_data'), query_tags=()
+    ))
+    prompt = f"""다음은 P&ID 도면 한 장에서 AI가 탐지한 OCR 텍스트와 기호입니다.
+여러 도면의 요약을 나중에 하나로 합칠 예정이므로, 이 도면만의 핵심을 간결하게 정리해주세요.
+{packed.section(MAP_SECTION)}
+
+**요약 항목:**
+1. 도면의 공정 목적
+2. 주요 계측기 태그와 설비 (탐지된 태그 번호를 그대로 사용)
+3. 제어 루프와 안전장치
+4. 특이사항 (다른 도면과 연결될 수 있는 배관/설비 등)"""
+    return prompt, packed.report()
+
+
+async def _summarize_drawing(llm: AsyncLLMSession, semaphore: asyncio.Semaphore, cache: DrawingSummaryCache,
+                             index: int, file_data: Dict, max_tokens: int) -> Dict:
+    """map 단계 - 도면 한 장 요약 (캐시에 있으면 LLM 호출 생략)"""
+    d_id = file_data.get('id')
+    result = {'id': d_id, 'name': file_data.get('name', f'파일_{index}'), 'summary': None,
+              'cached': False, 'seconds': 0.0, 'error': None}
+
+    digest = drawing_digest(file_data.get('json_data'))
+    cached = cache.get(d_id, digest)
+    if cached is not None:
+        result.update(summary=cached, cached=True)
+        return result
+
+    prompt, result['packing'] = _map_prompt(index, file_data)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await llm.chat(
+                [
+                    {"role": "system", "content": EXPERT_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2,
+                max_tokens=max_tokens
+            )
+            result['summary'] = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"도면 요약 실패 ({result['name']}): {e}")
+            result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - start
+
+    if result['summary']:
+        cache.put(d_id, digest, result['summary'])
+    return result
+
+
+async def _map_reduce(gateway: LLMGateway, selected_files: List[Dict], user_query: str, concurrency: int) -> Dict:
+    cache = get_summary_cache()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # 도면이 많을수록 요약을 짧게 해서 reduce 프롬프트가 컨텍스트 예산을 넘지 않게 함
+    max_tokens = max(MIN_SUMMARY_TOKENS, min(MAP_REDUCE_SUMMARY_MAX_TOKENS,
+                                             CONTEXT_TOKEN_BUDGET // max(len(selected_files), 1)))
+
+    async with gateway.async_session() as llm:
+        map_start = time.perf_counter()
+        drawings = await asyncio.gather(*(
+            _summarize_drawing(llm, semaphore, cache, i, file_data, max_tokens)
+            for i, file_data in enumerate(selected_files, 1)
+        ))
+        map_seconds = time.perf_counter() - map_start
+
+        summarized = [d for d in drawings if d['summary']]
+        if not summarized:
+            raise RuntimeError(f"모든 도면 요약에 실패했습니다: {drawings[0]['error'] if drawings else '선택된 도면 없음'}")
+
+        packed = ContextPacker(CONTEXT_TOKEN_BUDGET).pack([
+            ContextItem(REDUCE_SECTION, f"### 도면 {i}: {d['name']} (ID: {d['id']})\n{d['summary']}\n",
+                        PRIORITY_RAG_TOP, f"summary:{d['id']}")
+            for i, d in enumerate(summarized, 1)
+        ])
+        reduce_prompt = f"""다음은 P&ID 도면 {len(summarized)}개의 도면별 요약입니다.
+
+{packed.section(REDUCE_SECTION)}
+
+사용자 요청: {user_query}
+
+도면별 요약을 종합해 다음 구조로 답변해주세요.
+1. **전체 공정 개요** (도면들이 함께 구성하는 공정)
+2. **도면별 핵심 요약** (도면마다 2~3줄)
+3. **공통/연결 요소** (여러 도면에 걸친 계측기 태그, 배관, 설비)
+4. **제어 및 안전 시스템 종합**
+5. **검토가 필요한 사항**"""
+
+        reduce_start = time.perf_counter()
+        response = await llm.chat(
+            [
+                {"role": "system", "content": EXPERT_SYSTEM_PROMPT},
+                {"role": "user", "content": reduce_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=2000
+        )
+        reduce_seconds = time.perf_counter() - reduce_start
+
+    llm_seconds = [d['seconds'] for d in drawings if not d['cached']]
+    stats = {
+        'files': len(selected_files),
+        'summarized': len(summarized),
+        'failed': len(drawings) - len(summarized),
+        'cached': sum(1 for d in drawings if d['cached']),
+        'concurrency': concurrency,
+        'summary_max_tokens': max_tokens,
+        'map_seconds': map_seconds,
+        'map_sequential_seconds': sum(llm_seconds),
+        'slowest_drawing_seconds': max(llm_seconds, default=0.0),
+        'reduce_seconds': reduce_seconds,
+        'reduce_packing': packed.report()
+    }
+    logger.info(f"도면 {len(selected_files)}개 map-reduce 요약: map {map_seconds:.1f}초 "
+                f"(순차 합 {stats['map_sequential_seconds']:.1f}초, 캐시 {stats['cached']}개), "
+                f"reduce {reduce_seconds:.1f}초")
+    return {'response': response.choices[0].message.content, 'drawings': drawings, 'stats': stats}
+
+
+def summarize_drawings(gateway: LLMGateway, selected_files: List[Dict], user_query: str,
+                       concurrency: int = MAP_REDUCE_CONCURRENCY) -> Dict:
+    """
+    선택 도면들을 map-reduce로 요약 (Streamlit 스크립트 스레드에서 호출하는 동기 진입점)
+
+    Args:
+        gateway: 공용 LLM 게이트웨이 (재시도/헤징/마감시간 정책을 비동기 세션에도 적용)
+        selected_files: 파일 목록 페이지에서 선택한 도면 ({'id', 'name', 'json_data', ...})
+        user_query: 종합 단계에 전달할 사용자 요청
+        concurrency: 동시에 진행할 도면 요약 호출 수
+
+    Returns:
+        {'response': 종합 요약, 'drawings': 도면별 요약 결과, 'stats': 단계별 시간/캐시 통계}
+    """
+    return asyncio.run(_map_reduce(gateway, selected_files, user_query, concurrency))
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+공용 LLM 게이트웨이
+
+챗봇 응답, 도면 요약, 변경 분석, CLI 챗봇이 각자 타임아웃/재시도 없는 OpenAI 클라이언트를
+만들던 것을 하나로 모은다.
+    - httpx 커넥션 풀을 프로세스 전체가 공유 (세션마다 TLS 연결을 새로 맺지 않음)
+    - 연결 오류/타임아웃/429/5xx는 지수 백오프 + full jitter로 재시도 (Retry-After 우선)
+    - 호출별 마감시간(deadline) 안에서만 재시도하고, 넘기면 LLMDeadlineExceeded
+    - 선택적 헤징: hedge_after_s 안에 응답이 없으면 같은 요청을 한 번 더 보내 먼저 온 응답 사용
+      (비동기 세션은 진 요청을 취소하지만, 동기 호출은 진 요청을 취소할 수 없어 응답이 끝날 때까지
+      풀 스레드/연결/토큰을 계속 쓴다. 그래서 동기 헤징은 동시에 max_sync_hedges개까지만 보내고
+      상한에 걸리면 원래 요청을 그대로 기다린다 - 최악의 경우 LLM 비용이 그만큼 늘어남)
+    - asyncio 변형 (async_session) - map-reduce 요약 등 동시 호출용
+
+LLM_BASE_URL을 로컬 스텁 서버(services/llm_stub_server.py)로 바꾸면 오프라인에서
+처리량과 꼬리 지연을 측정할 수 있다.
+
+    python -m services.llm_stub_server --port 8765 --latency-ms 300 --tail-rate 0.05 --tail-ms 3000
+    python -m services.llm_gateway --base-url http://127.0.0.1:8765/v1 --requests 200 --concurrency 20 --hedge-after 0.8
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+from loguru import logger
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, OpenAI
+
+from config.user_config import (
+    LLM_BACKOFF_BASE_S, LLM_BACKOFF_MAX_S, LLM_BASE_URL, LLM_CONNECT_TIMEOUT_S, LLM_DEADLINE_S,
+    LLM_HEDGE_AFTER_S, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_MAX_RETRIES, LLM_MAX_SYNC_HEDGES,
+    LLM_MODEL, LLM_REQUEST_TIMEOUT_S
+)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+LATENCY_WINDOW = 512
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """재시도를 포함한 호출 마감시간 초과"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """재시도해도 되는 오류인지 (연결 오류/타임아웃/429/5xx)"""
+    if isinstance(error, APIConnectionError):  # APITimeoutError 포함
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """429/503 응답의 Retry-After 헤더 (초)"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMGateway:
+    """커넥션 풀을 공유하는 재시도/헤징/마감시간 LLM 클라이언트 (스레드 안전)"""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str] = LLM_BASE_URL,
+                 max_connections: int = LLM_MAX_CONNECTIONS, max_keepalive: int = LLM_MAX_KEEPALIVE,
+                 connect_timeout_s: float = LLM_CONNECT_TIMEOUT_S, request_timeout_s: float = LLM_REQUEST_TIMEOUT_S,
+                 deadline_s: float = LLM_DEADLINE_S, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base_s: float = LLM_BACKOFF_BASE_S, backoff_max_s: float = LLM_BACKOFF_MAX_S,
+                 hedge_after_s: Optional[float] = LLM_HEDGE_AFTER_S,
+                 max_sync_hedges: int = LLM_MAX_SYNC_HEDGES):
+        """
+        Args:
+            api_key: OpenAI API 키 (스텁 서버는 아무 값이나 허용)
+            base_url: OpenAI 호환 서버 주소 (None이면 OpenAI)
+            request_timeout_s: 시도 1회 제한
+            deadline_s: 재시도 포함 기본 호출 마감시간
+            hedge_after_s: 헤징 대기 시간 (None이면 헤징 안 함)
+            max_sync_hedges: 동기 호출에서 동시에 진행 중일 수 있는 헤징 요청 수
+        """
+        self.api_key = api_key or "stub-key"
+        self.base_url = base_url
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = httpx.Timeout(request_timeout_s, connect=connect_timeout_s)
+        self.request_timeout_s = request_timeout_s
+        self.deadline_s = deadline_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge_after_s = hedge_after_s
+
+        # SDK 자체 재시도는 끄고 게이트웨이 정책만 적용
+        self._http = httpx.Client(limits=self.limits, timeout=self.timeout)
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, http_client=self._http,
+                             max_retries=0, timeout=self.timeout)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm-hedge")
+        self.max_sync_hedges = max_sync_hedges
+        self._sync_hedge_slots = threading.BoundedSemaphore(max(1, max_sync_hedges))
+
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0,
+                          "failures": 0, "deadline_exceeded": 0}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # --- 공통 정책 ---
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """다음 재시도까지 대기 시간 - Retry-After가 있으면 우선, 없으면 지수 백오프 full jitter"""
+        retry_after = _retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_s)
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    def _deadline(self, deadline_s: Optional[float]) -> float:
+        return time.monotonic() + (deadline_s if deadline_s is not None else self.deadline_s)
+
+    def _attempt_timeout(self, deadline: float, attempt: int, last_error: Optional[Exception]) -> float:
+        """이번 시도에 쓸 타임아웃 (마감시간이 지났으면 LLMDeadlineExceeded)"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count("deadline_exceeded")
+            raise LLMDeadlineExceeded(f"LLM 호출 마감시간 초과 ({attempt}회 시도)") from last_error
+        return min(self.request_timeout_s, remaining)
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """재시도 대기 시간 - 재시도하지 않을 오류이거나 마감 전에 다시 보낼 수 없으면 None"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._count("failures")
+            return None
+        delay = self.backoff_delay(attempt, error)
+        if time.monotonic() + delay >= deadline:
+            self._count("deadline_exceeded")
+            return None
+        self._count("retries")
+        logger.warning(f"LLM 호출 재시도 {attempt + 1}/{self.max_retries} ({delay:.2f}초 후): {error}")
+        return delay
+
+    # --- 동기 호출 ---
+
+    def _call(self, send: Callable[[float], Any], deadline: float, hedge: bool) -> Any:
+        self._count("calls")
+        start = time.perf_counter()
+        attempt, last_error = 0, None
+        while True:
+            timeout = self._attempt_timeout(deadline, attempt, last_error)
+            try:
+                if hedge and self.hedge_after_s is not None and self.max_sync_hedges > 0 \
+                        and self.hedge_after_s < timeout:
+                    result = self._hedged(send, timeout)
+                else:
+                    result = send(timeout)
+                self._record_latency(time.perf_counter() - start)
+                return result
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt, last_error = attempt + 1, e
+
+    def _hedged(self, send: Callable[[float], Any], timeout: float) -> Any:
+        """
+        hedge_after_s 안에 끝나지 않으면 같은 요청을 하나 더 보내 먼저 성공한 응답 사용
+
+        동기 요청은 취소할 수 없어 진 쪽도 끝까지 실행되므로, 헤징 요청 슬롯은 헤징 요청이
+        끝날 때 반납하고 슬롯이 없으면 헤징 없이 원래 요청을 기다린다.
+        """
+        primary = self._hedge_pool.submit(send, timeout)
+        try:
+            return primary.result(timeout=self.hedge_after_s)
+        except FuturesTimeoutError:
+            pass
+
+        if not self._sync_hedge_slots.acquire(blocking=False):
+            self._count("hedges_skipped")
+            return primary.result()
+
+        self._count("hedges")
+        try:
+            backup = self._hedge_pool.submit(send, max(timeout - self.hedge_after_s, 0.1))
+        except BaseException:
+            self._sync_hedge_slots.release()
+            raise
+        backup.add_done_callback(lambda _: self._sync_hedge_slots.release())
+        error = None
+        for future in as_completed([primary, backup]):
+            if future.exception() is None:
+                if future is backup:
+                    self._count("hedge_wins")
+                return future.result()
+            error = future.exception()
+        raise error
+
+    def chat(self, messages: List[Dict], model: str = LLM_MODEL, deadline_s: Optional[float] = None,
+             hedge: bool = True, **params):
+        """
+        Chat Completions 호출 (OpenAI SDK와 같은 응답 객체 반환)
+
+        Args:
+            messages: 대화 메시지
+            model: 모델명
+            deadline_s: 재시도 포함 마감시간 (None이면 LLM_DEADLINE_S)
+            hedge: 헤징 허용 여부 (LLM_HEDGE_AFTER_S가 설정된 경우)
+            **params: temperature, max_tokens 등
+        """
+        return self._call(
+            lambda timeout: self.client.chat.completions.create(model=model, messages=messages,
+                                                                timeout=timeout, **params),
+            self._deadline(deadline_s), hedge
+        )
+
+    def stream_chat(self, messages: List[Dict], model: str = LLM_MODEL, deadline_s: Optional[float] = None,
+                    **params) -> Iterator[str]:
+        """
+        스트리밍 Chat Completions - 응답 조각(문자열)을 도착하는 대로 반환
+
+        재시도는 첫 토큰을 받기 전(연결/응답 헤더 단계)에만 하고, 이미 내보낸 토큰이 있으면
+        중복을 피하기 위해 오류를 그대로 올린다. 마감시간을 넘기면 스트림을 닫고 LLMDeadlineExceeded.
+        """
+        deadline = self._deadline(deadline_s)
+        stream = self._call(
+            lambda timeout: self.client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                                timeout=timeout, **params),
+            deadline, hedge=False
+        )
+        try:
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    self._count("deadline_exceeded")
+                    raise LLMDeadlineExceeded("LLM 스트리밍 마감시간 초과")
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    # --- 비동기 호출 ---
+
+    @asynccontextmanager
+    async def async_session(self) -> AsyncIterator["AsyncLLMSession"]:
+        """
+        현재 이벤트 루프 전용 비동기 세션 (httpx 비동기 풀은 루프에 묶이므로 루프마다 생성)
+
+            async with get_llm_gateway().async_session() as llm:
+                response = await llm.chat(messages, max_tokens=500)
+        """
+        http = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http,
+                             max_retries=0, timeout=self.timeout)
+        try:
+            yield AsyncLLMSession(self, client)
+        finally:
+            await client.close()
+
+    def stats(self) -> Dict:
+        """호출/재시도/헤징 횟수와 최근 성공 호출 지연시간"""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = list(self._latencies)
+        if latencies:
+            counters["p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+            counters["p95_ms"] = float(np.percentile(latencies, 95) * 1000)
+        counters["base_url"] = self.base_url or "openai"
+        counters["hedge_after_s"] = self.hedge_after_s
+        counters["max_sync_hedges"] = self.max_sync_hedges
+        return counters
+
+    def close(self):
+        self._hedge_pool.shutdown(wait=False)
+        self.client.close()
+
+
+class AsyncLLMSession:
+    """게이트웨이의 재시도/헤징/마감시간 정책을 공유하는 비동기 클라이언트"""
+
+    def __init__(self, gateway: LLMGateway, client: AsyncOpenAI):
+        self.gateway = gateway
+        self.client = client
+
+    async def chat(self, messages: List[Dict], model: str = LLM_MODEL, deadline_s: Optional[float] = None,
+                   hedge: bool = True, **params):
+        """LLMGateway.chat의 비동기 버전"""
+        gateway = self.gateway
+        deadline = gateway._deadline(deadline_s)
+
+        def send(timeout: float) -> Awaitable:
+            return self.client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params)
+
+        gateway._count("calls")
+        start = time.perf_counter()
+        attempt, last_error = 0, None
+        while True:
+            timeout = gateway._attempt_timeout(deadline, attempt, last_error)
+            try:
+                if hedge and gateway.hedge_after_s is not None and gateway.hedge_after_s < timeout:
+                    result = await self._hedged(send, timeout)
+                else:
+                    result = await send(timeout)
+                gateway._record_latency(time.perf_counter() - start)
+                return result
+            except Exception as e:
+                delay = gateway._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt, last_error = attempt + 1, e
+
+    async def _hedged(self, send: Callable[[float], Awaitable], timeout: float):
+        """먼저 성공한 요청을 쓰고 나머지는 취소"""
+        gateway = self.gateway
+        primary = asyncio.ensure_future(send(timeout))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=gateway.hedge_after_s)
+            if done:
+                return primary.result()
+
+            gateway._count("hedges")
+            backup = asyncio.ensure_future(send(max(timeout - gateway.hedge_after_s, 0.1)))
+            tasks.add(backup)
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            gateway._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> Optional[LLMGateway]:
+    """프로세스 공용 LLM 게이트웨이 (API 키와 LLM_BASE_URL이 모두 없으면 None)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key and not LLM_BASE_URL:
+                return None
+            _gateway = LLMGateway(api_key)
+        return _gateway
+
+
+def run_load_test(gateway: LLMGateway, num_requests: int = 100, concurrency: int = 10,
+                  max_tokens: int = 64) -> Dict:
+    """
+    동시 요청 부하 테스트 - 처리량과 지연시간 분위수 (스텁 서버와 함께 사용)
+
+    Returns:
+        {'requests', 'errors', 'throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'gateway'}
+    """
+    messages = [{"role": "user", "content": "FT-101의 역할은?"}]
+
+    def _one(_):
+        start = time.perf_counter()
+        try:
+            gateway.chat(messages, max_tokens=max_tokens)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_one, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds * 1000 for seconds, error in results if error is None]
+    report = {
+        "requests": num_requests,
+        "errors": sum(1 for _, error in results if error is not None),
+        "throughput_per_s": num_requests / elapsed if elapsed else 0.0,
+        "gateway": gateway.stats()
+    }
+    if latencies:
+        report.update({
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(max(latencies))
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 게이트웨이 부하 테스트")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8765/v1", help="OpenAI 호환 서버 주소")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--hedge-after", type=float, default=None, help="헤징 대기 시간(초)")
+    parser.add_argument("--deadline", type=float, default=LLM_DEADLINE_S)
+    args = parser.parse_args()
+
+    gateway = LLMGateway(os.getenv('OPENAI_API_KEY'), base_url=args.base_url,
+                         max_connections=max(args.concurrency * 2, LLM_MAX_CONNECTIONS),
+                         deadline_s=args.deadline, hedge_after_s=args.hedge_after)
+    report = run_load_test(gateway, args.requests, args.concurrency)
+    gateway.close()
+
+    print(f"요청 {report['requests']}개 (동시 {args.concurrency}), 오류 {report['errors']}개")
+    print(f"처리량: {report['throughput_per_s']:.1f} req/s")
+    if "p50_ms" in report:
+        print(f"지연시간: p50 {report['p50_ms']:.0f}ms, p95 {report['p95_ms']:.0f}ms, "
+              f"p99 {report['p99_ms']:.0f}ms, max {report['max_ms']:.0f}ms")
+    stats = report["gateway"]
+    print(f"재시도 {stats['retries']}회, 헤징 {stats['hedges']}회 (헤징 요청 승리 {stats['hedge_wins']}회, "
+          f"상한으로 생략 {stats['hedges_skipped']}회), 마감 초과 {stats['deadline_exceeded']}회")
+
+
+if __name__ == "__main__":
+    main()
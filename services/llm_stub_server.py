@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+OpenAI 호환 로컬 스텁 LLM 서버 (표준 라이브러리만 사용)
+
+API 키나 네트워크 없이 LLM 게이트웨이의 처리량, 꼬리 지연, 재시도/헤징 동작을 시험한다.
+    POST /v1/chat/completions  (stream=true면 SSE로 토큰 단위 전송)
+    GET  /v1/models, /health
+
+지연시간은 기본 지연 + 균등 지터에, tail_rate 확률로 tail_ms를 더해 꼬리 지연을 흉내 내고,
+error_rate 확률로 503(Retry-After 없음)을 돌려준다. disconnect_after_tokens를 주면 스트리밍 도중
+연결을 끊는다.
+
+    python -m services.llm_stub_server --port 8765 --latency-ms 300 --jitter-ms 100 --tail-rate 0.05 --tail-ms 3000
+    (config/user_config.py의 LLM_BASE_URL = "http://127.0.0.1:8765/v1")
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+STUB_ANSWER = ("[스텁 응답] P&ID 전문가 챗봇의 오프라인 테스트용 답변입니다. "
+               "FT-101은 원료 공급 라인의 유량을 측정하는 유량 전송기이며, "
+               "FIC-101 유량 제어기가 FV-101 제어 밸브를 조절해 설정 유량을 유지합니다. "
+               "고압 알람 발생 시 비상정지 시스템이 펌프를 트립시킵니다.")
+
+
+@dataclass
+class StubConfig:
+    """스텁 서버 지연/오류 설정"""
+    latency_ms: float = 200.0        # 첫 토큰(비스트리밍은 전체 응답)까지 기본 지연
+    jitter_ms: float = 50.0          # 균등 분포 지터
+    tail_rate: float = 0.0           # 꼬리 지연 확률
+    tail_ms: float = 2000.0          # 꼬리 지연 시 추가 지연
+    error_rate: float = 0.0          # 503 응답 확률
+    token_delay_ms: float = 10.0     # 스트리밍 토큰 사이 간격
+    disconnect_after_tokens: Optional[int] = None  # 스트리밍 중 이 수만큼 보낸 뒤 연결을 끊음
+
+    def sample_latency(self) -> float:
+        """이번 요청의 지연 (초)"""
+        latency = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if random.random() < self.tail_rate:
+            latency += self.tail_ms
+        return latency / 1000
+
+
+class StubStats:
+    """요청 수/오류 수 (스레드 안전)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.streams = 0
+
+    def record(self, error: bool = False, stream: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.streams += int(stream)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "streams": self.streams}
+
+
+def _answer_tokens(messages: List[Dict], max_tokens: Optional[int]) -> List[str]:
+    """질문을 앞에 붙인 고정 답변을 공백 단위 토큰으로 (max_tokens로 자름)"""
+    question = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+    if not isinstance(question, str):
+        question = ""
+    text = f"질문 '{question[:50]}'에 대한 {STUB_ANSWER}"
+    words = text.split(" ")
+    tokens = [word + " " for word in words[:-1]] + [words[-1]]
+    return tokens[:max_tokens] if max_tokens else tokens
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI Chat Completions 호환 핸들러 (HTTP/1.1 keep-alive)"""
+
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    stats = StubStats()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 헤징으로 취소된 요청 등 클라이언트가 먼저 끊은 경우
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        """chunked 전송 한 조각 (keep-alive를 유지하면서 스트리밍)"""
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "stub"}
+            ]})
+        elif self.path.rstrip("/") == "/health":
+            self._send_json(200, {"status": "ok", **self.stats.to_dict()})
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        stream = bool(request.get("stream"))
+        time.sleep(self.config.sample_latency())
+        if random.random() < self.config.error_rate:
+            self.stats.record(error=True, stream=stream)
+            self._send_json(503, {"error": {"message": "stub overloaded", "type": "server_error"}})
+            return
+
+        self.stats.record(stream=stream)
+        model = request.get("model", "gpt-4o-mini")
+        tokens = _answer_tokens(request.get("messages", []), request.get("max_tokens"))
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+        if stream:
+            self._stream(completion_id, model, tokens)
+        else:
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 2 for m in request.get("messages", []))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_tokens + len(tokens)}
+            })
+
+    def _stream(self, completion_id: str, model: str, tokens: List[str]):
+        """SSE로 토큰 전송 (첫 청크는 role, 마지막은 finish_reason과 [DONE])"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def _event(delta: Dict, finish_reason: Optional[str] = None) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        try:
+            self._write_chunk(_event({"role": "assistant", "content": ""}))
+            for i, token in enumerate(tokens):
+                if self.config.disconnect_after_tokens is not None and i >= self.config.disconnect_after_tokens:
+                    # 종료 청크 없이 연결을 닫아 스트림 도중 끊김을 재현
+                    self.close_connection = True
+                    return
+                time.sleep(self.config.token_delay_ms / 1000)
+                self._write_chunk(_event({"content": token}))
+            self._write_chunk(_event({}, "stop"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 헤징으로 취소된 요청 등 클라이언트가 먼저 끊은 경우
+            self.close_connection = True
+
+
+def start_stub_server(config: Optional[StubConfig] = None, host: str = "127.0.0.1",
+                      port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    백그라운드 스레드에서 스텁 서버 시작
+
+    Returns:
+        (서버, base_url) - port=0이면 빈 포트 자동 할당, 종료는 server.shutdown()
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig(), "stats": StubStats()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-stub-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 호환 로컬 스텁 LLM 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="꼬리 지연 확률 (0~1)")
+    parser.add_argument("--tail-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 응답 확률 (0~1)")
+    parser.add_argument("--token-delay-ms", type=float, default=10.0)
+    parser.add_argument("--disconnect-after-tokens", type=int, default=None, help="스트리밍 도중 끊을 토큰 수")
+    args = parser.parse_args()
+
+    config = StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tail_rate=args.tail_rate,
+                        tail_ms=args.tail_ms, error_rate=args.error_rate, token_delay_ms=args.token_delay_ms,
+                        disconnect_after_tokens=args.disconnect_after_tokens)
+    StubHandler.config = config
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"스텁 LLM 서버: http://{args.host}:{args.port}/v1 ({config})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+앱 시작 시 백그라운드 모델 워밍업
+
+배포 직후 첫 사용자가 채팅 페이지의 spinner 안에서 인코더/Kiwi/벡터 인덱스 로드와
+첫(콜드) 순전파 비용을 치르지 않도록, 백그라운드 스레드에서 미리 모델과 이미 저장된
+코퍼스 샤드/도면 인덱스를 공용 레지스트리에 올리고 더미 인코딩/검색을 한 번 수행한다.
+문서 수집, 인덱스 구축, DB 동기화는 하지 않는다 (채팅 페이지의 initialize_rag_system 몫).
+
+모든 페이지는 app.py의 main()을 거쳐 렌더링되므로 start_warmup()은 main()에서만 호출한다.
+스크립트 재실행마다 불리지만 이미 시작된 서비스는 다시 시작하지 않아 프로세스당 한 번만
+실행된다. UI는 is_ready()/status()로 준비 상태를 확인한다.
+"""
+
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.user_config import RERANK_ENABLED, WARMUP_ENABLED
+
+# 더미 입력 - 짧은/긴 문장과 배치 크기 1/8을 모두 거쳐 커널과 버퍼를 미리 할당
+WARMUP_QUERIES = [
+    "FT-101의 역할은?",
+    "압력 조절 밸브 PV-201은 반응기 압력을 일정하게 유지하며, 고압 알람 발생 시 비상정지 시스템이 펌프를 트립시킵니다.",
+    "시약 주입 방법",
+    "LIC-301 저장 탱크 액위 제어",
+    "안전장치 작동원리",
+    "What is the role of the flow controller FIC-101?",
+    "온도 측정 방법",
+    "배관 설계 특징"
+]
+
+
+class WarmupService:
+    """단계별 워밍업을 한 번만 실행하는 백그라운드 서비스 (스레드 안전)"""
+
+    def __init__(self, steps: Optional[List[Tuple[str, Callable[[], None]]]] = None):
+        self.steps = steps if steps is not None else self._default_steps()
+        self.state = "idle"  # idle → running → ready | failed
+        self.current_step: Optional[str] = None
+        self.step_results: Dict[str, Dict] = {}
+        self.started_at: Optional[str] = None
+        self.elapsed_s: Optional[float] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _default_steps(self) -> List[Tuple[str, Callable[[], None]]]:
+        steps = [
+            ("문장 인코더", self._warm_encoder),
+            ("Kiwi 형태소 분석기", self._warm_kiwi),
+            ("문서 코퍼스/도면 인덱스", self._warm_corpus)
+        ]
+        if RERANK_ENABLED:
+            steps.append(("크로스 인코더", self._warm_reranker))
+        return steps
+
+    @staticmethod
+    def _warm_encoder():
+        from models.chatbotModel import PIDExpertChatbot
+        from utils.model_registry import get_sentence_encoder
+        encoder = get_sentence_encoder(PIDExpertChatbot.EMBEDDING_MODEL_NAME)
+        encoder.encode(WARMUP_QUERIES[0])
+        encoder.encode(WARMUP_QUERIES, batch_size=len(WARMUP_QUERIES))
+
+    @staticmethod
+    def _warm_kiwi():
+        from utils.model_registry import get_registry
+        from utils.rag_system_kiwi import build_pid_kiwi
+        kiwi = get_registry().get_or_load("kiwi:pid", build_pid_kiwi)
+        kiwi.tokenize(WARMUP_QUERIES)
+        kiwi.split_into_sents(WARMUP_QUERIES[1])
+
+    @staticmethod
+    def _warm_corpus():
+        # 저장된 샤드/도면 인덱스만 채팅 페이지와 같은 레지스트리 키로 올리고 검색 경로를 한 번 실행
+        from models.chatbotModel import PIDExpertChatbot
+        chatbot = PIDExpertChatbot()
+        if chatbot.load_persisted_indexes():
+            for query in WARMUP_QUERIES[:2]:
+                chatbot.retrieve_relevant_chunks(query, top_k=3)
+                chatbot.retrieve_relevant_drawings(query, top_k=3)
+
+    @staticmethod
+    def _warm_reranker():
+        from utils.reranker import get_reranker
+        get_reranker().model.predict([(WARMUP_QUERIES[0], WARMUP_QUERIES[1])], show_progress_bar=False)
+
+    def start(self) -> "WarmupService":
+        """백그라운드 스레드 시작 (이미 시작했으면 무시)"""
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self.state = "running"
+            self.started_at = datetime.now().isoformat()
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        failed = False
+        for name, step in self.steps:
+            self.current_step = name
+            step_start = time.perf_counter()
+            try:
+                step()
+                self.step_results[name] = {"ok": True, "seconds": round(time.perf_counter() - step_start, 2)}
+                logger.info(f"워밍업 완료: {name} ({self.step_results[name]['seconds']}초)")
+            except Exception as e:
+                # 한 단계가 실패해도 나머지는 계속 진행 (실패한 부분은 첫 요청 때 다시 로드)
+                failed = True
+                self.step_results[name] = {"ok": False, "seconds": round(time.perf_counter() - step_start, 2),
+                                           "error": str(e)}
+                logger.error(f"워밍업 실패: {name} - {e}")
+
+        self.current_step = None
+        self.elapsed_s = round(time.perf_counter() - start, 2)
+        self.state = "failed" if failed else "ready"
+        self._ready.set()
+        logger.info(f"모델 워밍업 종료: {self.state} ({self.elapsed_s}초)")
+
+    def is_ready(self) -> bool:
+        """워밍업이 끝났는지 (일부 단계가 실패해도 끝났으면 True)"""
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """워밍업 종료까지 대기"""
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict:
+        """UI 표시용 상태"""
+        return {
+            "state": self.state,
+            "current_step": self.current_step,
+            "completed": len(self.step_results),
+            "total": len(self.steps),
+            "steps": dict(self.step_results),
+            "started_at": self.started_at,
+            "elapsed_s": self.elapsed_s
+        }
+
+
+_service: Optional[WarmupService] = None
+_service_lock = threading.Lock()
+
+
+def get_warmup_service() -> WarmupService:
+    """프로세스 공용 워밍업 서비스"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = WarmupService()
+        return _service
+
+
+def start_warmup() -> Optional[WarmupService]:
+    """프로세스당 한 번 워밍업 시작 (WARMUP_ENABLED가 False면 None)"""
+    if not WARMUP_ENABLED:
+        return None
+    return get_warmup_service().start()
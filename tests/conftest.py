@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 저장소 루트를 import 경로에 추가 (pytest를 어느 디렉터리에서 실행해도 utils/services를 찾도록)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_store import content_hash  # noqa: E402
+
+EMBED_DIM = 16
+
+
+@pytest.fixture
+def encode():
+    """텍스트마다 고정된 임의 벡터를 돌려주는 인코더 (같은 텍스트는 같은 벡터, 차원 EMBED_DIM)"""
+    def _encode(texts):
+        return np.stack([
+            np.random.default_rng(int(content_hash(text)[:8], 16)).normal(size=EMBED_DIM).astype(np.float32)
+            for text in texts
+        ])
+    return _encode
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import utils.ann_index as ann_index
+from utils.ann_index import ANN_INDEX_FILE, FaissIndex, load_vector_index, save_vector_index
+from utils.embedding_store import load_embedding_store, save_embedding_store
+from utils.rag_index import RAGIndex
+from utils.vector_index import VectorIndex
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.fixture
+def build_counter(monkeypatch):
+    """load_vector_index가 인덱스를 새로 구축한 횟수"""
+    calls = []
+    original = ann_index.create_vector_index
+
+    def _counting(*args, **kwargs):
+        calls.append(kwargs.get("backend"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(ann_index, "create_vector_index", _counting)
+    return calls
+
+
+def test_hnsw_index_is_built_once_per_store_version(tmp_path, build_counter):
+    save_embedding_store(str(tmp_path), [f"c{i}" for i in range(300)], _vectors(300))
+    store = load_embedding_store(str(tmp_path))
+
+    first = load_vector_index(store.path, store.embeddings, store.digest, backend="hnsw")
+    second = load_vector_index(store.path, store.embeddings, store.digest, backend="hnsw")
+
+    assert len(build_counter) == 1
+    assert isinstance(second, FaissIndex) and second.kind == "hnsw"
+    queries = _vectors(5, seed=1)
+    assert first.search(queries, 5)[1].tolist() == second.search(queries, 5)[1].tolist()
+
+
+def test_stale_index_is_rebuilt(tmp_path, build_counter):
+    save_embedding_store(str(tmp_path), [f"c{i}" for i in range(300)], _vectors(300))
+    store = load_embedding_store(str(tmp_path))
+    load_vector_index(store.path, store.embeddings, store.digest, backend="hnsw")
+
+    # manifest가 바뀌었거나 행 수가 다르면 저장된 인덱스를 쓰지 않음
+    load_vector_index(store.path, store.embeddings, "other-digest", backend="hnsw")
+    load_vector_index(store.path, store.embeddings[:200], "other-digest", backend="hnsw")
+    assert len(build_counter) == 3
+
+
+def test_exact_backend_writes_nothing(tmp_path):
+    save_embedding_store(str(tmp_path), ["a", "b"], _vectors(2))
+    store = load_embedding_store(str(tmp_path))
+    index = load_vector_index(store.path, store.embeddings, store.digest, backend="exact")
+    assert isinstance(index, VectorIndex)
+    assert not save_vector_index(store.path, index, store.digest, backend="exact")
+    assert not (tmp_path / ANN_INDEX_FILE).exists()
+
+
+def test_rag_index_save_persists_incremental_index(tmp_path, monkeypatch, build_counter):
+    monkeypatch.setattr(ann_index, "ANN_BACKEND", "hnsw")
+    vectors = {f"chunk {i}": v for i, v in enumerate(_vectors(400))}
+
+    def _encode(texts):
+        return np.stack([vectors[t] for t in texts])
+
+    index = RAGIndex(str(tmp_path), model_name="test-model")
+    index.upsert_source("a.pdf", [{"content": f"chunk {i}"} for i in range(300)], _encode)
+    index.save()
+    assert isinstance(index.vector_index, FaissIndex)
+    builds = len(build_counter)
+
+    # 증분 추가 후 저장/재시작 로드는 저장된 그래프를 그대로 사용
+    index.upsert_source("b.pdf", [{"content": f"chunk {i}"} for i in range(300, 400)], _encode)
+    index.save()
+    reloaded = RAGIndex(str(tmp_path), model_name="test-model")
+    assert reloaded.load()
+    assert len(build_counter) == builds
+    assert isinstance(reloaded.vector_index, FaissIndex) and len(reloaded.vector_index) == 400
+
+    hit = reloaded.search(vectors["chunk 350"][None, :], top_k=1)[0][0]
+    assert hit["content"] == "chunk 350" and hit["source"] == "b.pdf"
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivfpq"])
+def test_faiss_index_reads_rows_from_mmap(tmp_path, kind):
+    save_embedding_store(str(tmp_path), [f"c{i}" for i in range(2000)], _vectors(2000))
+    store = load_embedding_store(str(tmp_path))
+    index = load_vector_index(store.path, store.embeddings, store.digest, backend=kind)
+
+    # float 원본은 mmap을 그대로 참조하고 복사본을 따로 두지 않음
+    assert index._float_base is store.embeddings and not hasattr(index, "embeddings")
+
+    added = _vectors(3, seed=2)
+    index.add(added)
+    index.remove([1, 2])
+    scores, indices = index.search(added, 5)
+    assert indices[:, 0].tolist() == [2000, 2001, 2002]
+    assert not {1, 2} & set(indices.flatten().tolist())
+
+    # 반환 점수는 원본 행과의 정확한 코사인 유사도
+    queries = added / np.linalg.norm(added, axis=1, keepdims=True)
+    for q, (row_scores, row_ids) in enumerate(zip(scores.numpy(), indices.numpy())):
+        np.testing.assert_allclose(row_scores, index.rows(row_ids) @ queries[q], atol=1e-4)
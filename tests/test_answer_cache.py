@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import utils.answer_cache as answer_cache
+from utils.answer_cache import AnswerCache, context_fingerprint, invalidate_cached_answers
+
+RESPONSE = {"response": "FT-101은 유량 전송기입니다.", "query_type": "general", "context_quality": "high"}
+
+
+def _vector(seed, noise=0.0):
+    rng = np.random.default_rng(seed)
+    vector = rng.normal(size=16).astype(np.float32)
+    return vector + noise * rng.normal(size=16).astype(np.float32)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_similar_question_hits_and_different_context_misses():
+    cache = AnswerCache(similarity_threshold=0.95)
+    fingerprint = context_fingerprint(["a", "b"], [1])
+    cache.put("FT-101의 역할은?", _vector(0), fingerprint, RESPONSE)
+
+    hit = cache.get("FT-101 역할 알려줘", _vector(0, noise=0.01), fingerprint)
+    assert hit["cache_hit"] and hit["response"] == RESPONSE["response"]
+    assert cache.get("FT-101의 역할은?", _vector(0), context_fingerprint(["a", "c"], [1])) is None
+    assert cache.get("FT-101의 역할은?", _vector(1), fingerprint) is None
+    assert context_fingerprint(["b", "a"], [1]) == fingerprint
+
+
+def test_tag_mismatch_is_not_a_hit():
+    cache = AnswerCache(similarity_threshold=0.9)
+    fingerprint = context_fingerprint(["a"])
+    cache.put("FT-101의 역할은?", _vector(0), fingerprint, RESPONSE)
+    assert cache.get("FT-102의 역할은?", _vector(0), fingerprint) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_expiry(clock):
+    cache = AnswerCache(ttl_seconds=60)
+    fingerprint = context_fingerprint(["a"])
+    cache.put("FT-101의 역할은?", _vector(0), fingerprint, RESPONSE)
+    clock[0] += 59
+    assert cache.get("FT-101의 역할은?", _vector(0), fingerprint) is not None
+    clock[0] += 2
+    assert cache.get("FT-101의 역할은?", _vector(0), fingerprint) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = AnswerCache(max_size=2)
+    fingerprint = context_fingerprint(["a"])
+    for seed in range(2):
+        cache.put(f"질문 {seed}", _vector(seed), fingerprint, {**RESPONSE, "response": str(seed)})
+    assert cache.get("질문 0", _vector(0), fingerprint)["response"] == "0"
+
+    cache.put("질문 2", _vector(2), fingerprint, {**RESPONSE, "response": "2"})
+    assert cache.get("질문 1", _vector(1), fingerprint) is None
+    assert cache.get("질문 0", _vector(0), fingerprint) is not None
+    assert cache.get("질문 2", _vector(2), fingerprint) is not None
+
+
+def test_drawing_invalidation():
+    cache = AnswerCache()
+    fingerprint = context_fingerprint(drawing_ids=[7])
+    cache.put("도면 요약", _vector(0), fingerprint, RESPONSE, drawings=["공정1"])
+    cache.put("다른 질문", _vector(1), fingerprint, RESPONSE, drawings=["공정2"])
+    assert cache.invalidate_drawing("공정1") == 1
+    assert cache.get("도면 요약", _vector(0), fingerprint) is None
+    assert cache.get("다른 질문", _vector(1), fingerprint) is not None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_source_invalidation_keeps_unrelated_answers(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_answer_cache", None)
+    assert invalidate_cached_answers(source="a.pdf") == 0
+
+    cache = AnswerCache()
+    monkeypatch.setattr(answer_cache, "_answer_cache", cache)
+    fingerprint = context_fingerprint(["a", "b"])
+    cache.put("FT-101의 역할은?", _vector(0), fingerprint, RESPONSE, sources=["a.pdf", "b.pdf"])
+    cache.put("PT-201의 역할은?", _vector(1), fingerprint, RESPONSE, sources=["b.pdf"])
+    cache.put("도면 요약", _vector(2), fingerprint, RESPONSE, drawings=["공정1"])
+
+    # 재수집된 문서를 쓴 답변만 제거되고 나머지는 계속 적중
+    assert invalidate_cached_answers(source="a.pdf") == 1
+    assert cache.get("FT-101의 역할은?", _vector(0), fingerprint) is None
+    assert cache.get("PT-201의 역할은?", _vector(1), fingerprint) is not None
+    assert cache.get("도면 요약", _vector(2), fingerprint) is not None
+    assert context_fingerprint(["a", "b"]) == fingerprint
@@ -0,0 +1,42 @@
+import pytest
+
+from utils.bm25_index import extract_tags, normalize_tags
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("FIC-101 유량 제어기", ["FIC101"]),
+    ("FIC 101의 설정값", ["FIC101"]),
+    ("FIC_101", ["FIC101"]),
+    ("FT101은 무엇인가요?", ["FT101"]),
+    ("펌프 P-101A 트립", ["P101A"]),
+    ("LIC-301과 PV-201", ["LIC301", "PV201"]),
+    ("TT-12 온도", ["TT12"]),
+    ("(PSV-1001)", ["PSV1001"]),
+])
+def test_instrument_tags(text, expected):
+    assert extract_tags(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "see page 12",
+    "in 2023",
+    "up to 300 bar",
+    "at 100C",
+    "fic-101",               # 소문자 접두어는 태그로 보지 않음
+    "PAGE 12",
+    "DN 100 배관",
+    "DN100",
+    "ISO 9001 인증",
+    "API 610 펌프",
+    "FT 12",                 # 공백 표기는 숫자 3자리 이상
+    "F101",                  # 구분자 없는 표기는 접두어 2자 이상
+    "FIC-101234",
+    "ABCDE-101",
+    "CO2 농도",
+])
+def test_prose_is_not_tagged(text):
+    assert extract_tags(text) == []
+
+
+def test_normalize_tags_keeps_non_tags():
+    assert normalize_tags("FIC 101 and DN 100 on page 12") == "FIC101 and DN 100 on page 12"
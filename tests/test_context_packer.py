@@ -0,0 +1,67 @@
+from utils.context_packer import (
+    PRIORITY_DETECTION,
+    PRIORITY_QUERY_TAG,
+    PRIORITY_RAG_TOP,
+    PRIORITY_STRUCTURE,
+    PRIORITY_TAG,
+    PRIORITY_TEXT,
+    ContextItem,
+    ContextPacker,
+    count_tokens,
+    drawing_context_items
+)
+
+LONG = "반응기 압력 조절 루프 설명 " * 10
+
+
+def _items():
+    return [
+        ContextItem("drawing", "구조: ocr, detecting " + LONG, PRIORITY_STRUCTURE, "structure"),
+        ContextItem("drawing", "OCR 텍스트 " + LONG, PRIORITY_TEXT, "ocr"),
+        ContextItem("drawing", "탐지 요약 " + LONG, PRIORITY_DETECTION, "detections"),
+        ContextItem("drawing", "계측기 태그 PT-201 " + LONG, PRIORITY_TAG, "tags"),
+        ContextItem("rag", "RAG 청크 " + LONG, PRIORITY_RAG_TOP, "rag-1"),
+        ContextItem("drawing", "질문 태그 FT-101 " + LONG, PRIORITY_QUERY_TAG, "query-tags"),
+        ContextItem("rag", "RAG 청크 " + LONG, PRIORITY_RAG_TOP, "rag-dup"),
+    ]
+
+
+def test_drops_lowest_priority_first_within_budget():
+    headers = {"drawing": "## 도면", "rag": "## 문서"}
+    per_item = count_tokens("질문 태그 FT-101 " + LONG + "\n")
+    budget = 4 * per_item
+    packed = ContextPacker(budget_tokens=budget).pack(_items(), headers=headers)
+
+    assert packed.used_tokens <= budget
+    assert [item.key for item in packed.included] == ["query-tags", "rag-1", "tags"]
+    budget_drops = [d["key"] for d in packed.dropped if d["reason"] == "budget"]
+    assert budget_drops == ["detections", "ocr", "structure"]
+    assert [d["key"] for d in packed.dropped if d["reason"] == "duplicate"] == ["rag-dup"]
+
+    # 섹션 안에서는 입력 순서, 머리말은 항목이 들어간 섹션에만
+    drawing = packed.section("drawing").split("\n")
+    assert drawing[0] == "## 도면"
+    assert drawing[1].startswith("계측기 태그") and drawing[2].startswith("질문 태그")
+    assert packed.section("rag").startswith("## 문서\nRAG 청크")
+    assert packed.report()["dropped_items"] == 4
+
+
+def test_unlimited_budget_keeps_everything_but_duplicates():
+    packed = ContextPacker(budget_tokens=10 ** 6).pack(_items())
+    assert len(packed.included) == 6 and packed.used_tokens == sum(
+        count_tokens(item.text + "\n") for item in packed.included)
+
+
+def test_drawing_items_merge_repeated_ocr_and_group_detections():
+    fields = [{"inferText": text, "boundingPoly": {"vertices": [{"x": 10, "y": 20}]}}
+              for text in ["FT-101", "PT-201", "Feed", "Feed", "Feed"]]
+    boxes = [{"label": "valve", "x": 0, "y": 0, "width": 10, "height": 10}] * 4 + [{"label": "pump"}]
+    json_data = {"ocr": {"images": [{"fields": fields}]}, "detecting": {"data": {"boxes": boxes}}}
+
+    items = {item.key.split(":")[-1]: item for item in
+             drawing_context_items("drawing", 1, "공정1", 7, json_data, query_tags=["FT101"])}
+    assert items["query-tags"].priority == PRIORITY_QUERY_TAG and "FT-101" in items["query-tags"].text
+    assert "PT-201" in items["tags"].text and "FT-101" not in items["tags"].text
+    assert '"Feed" ×3' in items["ocr[0]"].text
+    assert "valve ×4 예: (5, 5)" in items["detections"].text and "pump ×1" in items["detections"].text
+    assert "OCR 텍스트 5개(고유 3개), 탐지 기호 5개" in items["header"].text
@@ -0,0 +1,83 @@
+from utils.corpus_manager import CorpusManager
+
+
+def _tokenize(texts):
+    return [text.lower().split() for text in texts]
+
+
+def _write(path, lines):
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return str(path)
+
+
+def _chunk_file(path, file_hash):
+    with open(path, encoding="utf-8") as f:
+        return [{"content": line, "page": 1} for line in f.read().splitlines() if line]
+
+
+def _corpus(tmp_path, encode):
+    return CorpusManager(str(tmp_path / "shards"), model_name="test-model", encode_fn=encode,
+                         chunk_fn=_chunk_file, tokenizer=_tokenize, max_workers=2)
+
+
+def test_add_document_swaps_in_new_shard_without_mutating_live_one(tmp_path, encode):
+    corpus = _corpus(tmp_path, encode)
+    doc = _write(tmp_path / "a.txt", ["flow transmitter ft-101", "pressure valve pv-201"])
+    corpus.add_document(doc)
+    live = corpus.shards["a.txt"]
+    live_chunks = list(live.chunks)
+    live_rows = len(live.vector_index)
+
+    _write(tmp_path / "a.txt", ["flow transmitter ft-101", "level controller lic-301"])
+    stats = corpus.add_document(doc)
+    assert stats == {"added": 1, "removed": 1, "unchanged": 1}
+
+    # 검색 중이던 이전 샤드는 그대로, 새 샤드가 교체되어 들어감
+    assert corpus.shards["a.txt"] is not live
+    assert live.chunks.closed
+    assert list(live.chunks) == live_chunks and len(live.vector_index) == live_rows
+    assert len(live) == 2 and len(corpus.shards["a.txt"]) == 2
+    hits = live.search(encode(["pressure valve pv-201"]), top_k=1)[0]
+    assert hits[0]["content"] == "pressure valve pv-201"
+
+    hits = corpus.search(encode(["level controller lic-301"]), top_k=1)[0]
+    assert hits[0]["content"] == "level controller lic-301"
+
+
+def test_unchanged_document_is_skipped_and_reloaded(tmp_path, encode):
+    corpus = _corpus(tmp_path, encode)
+    doc = _write(tmp_path / "a.txt", ["flow transmitter ft-101"])
+    corpus.add_document(doc)
+    shard = corpus.shards["a.txt"]
+    assert corpus.add_document(doc)["skipped"]
+    assert corpus.shards["a.txt"] is shard
+
+    reopened = _corpus(tmp_path, encode)
+    assert reopened.load() == 1
+    assert reopened.sources == ["a.txt"]
+
+
+def test_sync_drops_missing_documents(tmp_path, encode):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    _write(data_dir / "a.pdf", ["flow transmitter ft-101"])
+    _write(data_dir / "b.pdf", ["pressure valve pv-201"])
+    corpus = _corpus(tmp_path, encode)
+    corpus.sync(str(data_dir), extensions=(".pdf",))
+    assert corpus.sources == ["a.pdf", "b.pdf"]
+
+    (data_dir / "b.pdf").unlink()
+    results = corpus.sync(str(data_dir), extensions=(".pdf",))
+    assert results["b.pdf"] == {"dropped": True}
+    assert corpus.sources == ["a.pdf"]
+
+
+def test_hybrid_search_interleaves_bm25_ranks_across_shards(tmp_path, encode):
+    corpus = _corpus(tmp_path, encode)
+    # 'pump'가 흔한 샤드는 IDF가 낮아 원점수가 작지만, 그 샤드의 1위도 상위에 들어와야 함
+    corpus.add_document(_write(tmp_path / "common.txt", ["pump alpha", "pump beta", "pump gamma", "pump delta"]))
+    corpus.add_document(_write(tmp_path / "rare.txt", ["pump feed", "pump return"] + [f"valve v-{i}" for i in range(6)]))
+
+    hits = corpus.hybrid_search("pump", encode(["zzz"])[0], top_k=4, candidates=4)
+    best_per_shard = {hit["source"]: hit["content"] for hit in hits if hit["bm25_rank"] == 0}
+    assert best_per_shard == {"common.txt": "pump alpha", "rare.txt": "pump feed"}
@@ -0,0 +1,18 @@
+from utils.drawing_fields import extract_detections, extract_ocr_fields
+
+
+def test_extracts_ocr_fields_from_new_and_legacy_layouts():
+    image = {"fields": [{"inferText": " FT-101 ", "boundingPoly": {"vertices": [{"x": 0, "y": 0}, {"x": 10, "y": 20}]}},
+                        {"inferText": ""}]}
+    assert extract_ocr_fields({"ocr": {"images": [image]}}) == [("FT-101", (5.0, 10.0))]
+    assert extract_ocr_fields({"ocr_data": {"images": [image]}}) == [("FT-101", (5.0, 10.0))]
+    assert extract_ocr_fields({}) == []
+
+
+def test_extracts_detections_from_every_layout():
+    box = {"label": "valve", "x": 10, "y": 20, "width": 4, "height": 6}
+    expected = [("valve", (12.0, 23.0))]
+    assert extract_detections({"detection_data": {"detections": [{"label": "valve", "boundingBox": box}]}}) == expected
+    assert extract_detections({"detecting": {"data": {"boxes": [box]}}}) == expected
+    assert extract_detections({"boxes": [box, "잘못된 항목"]}) == expected
+
@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+import utils.drawing_index as drawing_index
+from utils.drawing_index import DrawingIndex
+from utils.rag_index import RAGIndex
+
+
+def _drawing(*texts):
+    fields = [{"inferText": text, "boundingPoly": {"vertices": [{"x": 10 * i, "y": 10 * i}]}}
+              for i, text in enumerate(texts)]
+    return {"ocr": {"images": [{"fields": fields}]}}
+
+
+@pytest.fixture
+def make_index(tmp_path, monkeypatch, encode):
+    monkeypatch.setattr(drawing_index, "get_sentence_encoder", lambda model_name: None)
+    monkeypatch.setattr(drawing_index, "encode_chunks", lambda encoder, model_name, texts: encode(texts))
+    monkeypatch.setattr(drawing_index, "_kiwi_tokenizer", lambda texts: [text.lower().split() for text in texts])
+    created = []
+
+    def _make(save_delay_s=60):
+        created.append(DrawingIndex(str(tmp_path / "drawing_index"), model_name="test-model",
+                                    save_delay_s=save_delay_s))
+        return created[-1]
+
+    yield _make
+    for index in created:
+        index.flush()
+
+
+@pytest.fixture
+def index(make_index):
+    return make_index()
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        self.pending = list(self.rows)
+
+    def fetchmany(self, size):
+        batch, self.pending = self.pending[:size], self.pending[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class _FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, name=None):
+        return _FakeCursor(self.rows)
+
+    def close(self):
+        pass
+
+
+def _query(index, text, encode):
+    return index.search(text, encode([text])[0], top_k=3)
+
+
+def test_updates_swap_in_new_index_without_mutating_live_one(index, encode):
+    index.upsert_drawing(1, "공정1", _drawing("FT-101", "원료 공급"))
+    live = index.index
+    live_rows = len(live.vector_index)
+
+    index.upsert_drawing(2, "공정2", _drawing("PT-201", "리보일러"))
+    assert index.index is not live
+    assert len(live.vector_index) == live_rows and live.sources.keys() == {"1"}
+    assert {hit["d_id"] for hit in _query(index, "PT-201", encode)} == {1, 2}
+
+    assert index.remove_drawing(1) > 0
+    assert index.index.sources.keys() == {"2"}
+    assert index.remove_drawing(1) == 0
+
+
+def test_search_during_updates(index, encode):
+    index.upsert_drawing(1, "공정1", _drawing("FT-101", "원료 공급"))
+    errors = []
+    done = threading.Event()
+
+    def _search():
+        while not done.is_set():
+            try:
+                assert _query(index, "FT-101", encode)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    searcher = threading.Thread(target=_search)
+    searcher.start()
+    try:
+        for d_id in range(2, 8):
+            index.upsert_drawing(d_id, f"공정{d_id}", _drawing(f"LIC-{300 + d_id}", "탱크 액위"))
+        index.remove_drawing(3)
+    finally:
+        done.set()
+        searcher.join()
+    assert not errors
+    assert len(index) == 6
+
+
+def test_updates_do_not_reload_or_rewrite_the_store(make_index, monkeypatch, encode):
+    index = make_index()
+    index.upsert_drawing(1, "공정1", _drawing("FT-101", "원료 공급"))
+    index.flush()
+
+    def _fail(self):
+        raise AssertionError("도면 하나를 올리면서 저장소 전체를 다시 읽거나 기록함")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(RAGIndex, "load", _fail)
+        patch.setattr(RAGIndex, "save", _fail)
+        for d_id in range(2, 5):
+            index.upsert_drawing(d_id, f"공정{d_id}", _drawing(f"PT-{200 + d_id}", "리보일러"))
+        index.remove_drawing(1)
+        assert {hit["d_id"] for hit in _query(index, "PT-203", encode)} >= {3}
+
+    # 모아둔 갱신은 flush 한 번으로 기록
+    index.flush()
+    assert make_index().index.sources.keys() == {"2", "3", "4"}
+
+
+def test_sync_reindexes_changed_json_data(make_index, monkeypatch, encode):
+    index = make_index(save_delay_s=0)
+    index.upsert_drawing(1, "공정1", _drawing("FT-101"))
+    index.upsert_drawing(2, "공정2", _drawing("PT-201"))
+    index.upsert_drawing(4, "공정4", _drawing("LIC-401"))
+
+    rows = [(1, "공정1", _drawing("FT-102")), (2, "공정2", _drawing("PT-201")), (3, "공정3", _drawing("TIC-301"))]
+    monkeypatch.setattr(drawing_index, "get_db_connection", lambda: _FakeConnection(rows))
+    invalidated = []
+    monkeypatch.setattr(drawing_index, "invalidate_cached_answers",
+                        lambda source=None, drawing=None: invalidated.append(drawing))
+
+    assert index.sync_from_database() == {'indexed': 2, 'removed': 1}
+    assert sorted(invalidated) == ["공정1", "공정3", "공정4"]
+    assert index.index.sources.keys() == {"1", "2", "3"}
+    assert "FT102" in _query(index, "FT102", encode)[0]["content"]
+    assert index.sync_from_database() == {'indexed': 0, 'removed': 0}
@@ -0,0 +1,77 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import services.drawing_summary_service as drawing_summary_service
+from services.drawing_summary_service import DrawingSummaryCache, summarize_drawings
+
+
+def _response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _FakeGateway:
+    """도면명에 '고장'이 들어간 map 요청만 실패하는 비동기 LLM 세션"""
+
+    def __init__(self):
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @asynccontextmanager
+    async def async_session(self):
+        yield self
+
+    async def chat(self, messages, **params):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if "도면별 요약입니다" in prompt:
+                return _response("종합 요약")
+            if "고장" in prompt:
+                raise RuntimeError("stub overloaded")
+            return _response(f"요약 {len(self.prompts)}")
+        finally:
+            self.in_flight -= 1
+
+
+def _files(*names):
+    return [{"id": i, "name": name, "json_data": {"ocr": {"images": [{"fields": [{"inferText": f"FT-{100 + i}"}]}]}}}
+            for i, name in enumerate(names, 1)]
+
+
+@pytest.fixture(autouse=True)
+def summary_cache(monkeypatch):
+    cache = DrawingSummaryCache()
+    monkeypatch.setattr(drawing_summary_service, "get_summary_cache", lambda: cache)
+    return cache
+
+
+def test_partial_failure_reduces_successful_summaries(summary_cache):
+    gateway = _FakeGateway()
+    result = summarize_drawings(gateway, _files("공정1", "고장 도면", "공정3", "공정4"), "전체 요약", concurrency=2)
+
+    assert result["response"] == "종합 요약"
+    assert result["stats"]["summarized"] == 3 and result["stats"]["failed"] == 1
+    failed = [d for d in result["drawings"] if d["error"]]
+    assert [d["name"] for d in failed] == ["고장 도면"] and failed[0]["summary"] is None
+    assert gateway.max_in_flight <= 2
+
+    reduce_prompt = gateway.prompts[-1]
+    assert "공정1" in reduce_prompt and "공정4" in reduce_prompt and "고장 도면" not in reduce_prompt
+
+    # 성공한 요약만 캐시되어 다음 요청에서는 실패한 도면만 다시 호출
+    gateway.prompts.clear()
+    again = summarize_drawings(gateway, _files("공정1", "고장 도면", "공정3", "공정4"), "전체 요약", concurrency=2)
+    assert again["stats"]["cached"] == 3
+    assert len(gateway.prompts) == 2
+
+
+def test_all_failures_raise():
+    with pytest.raises(RuntimeError, match="모든 도면 요약에 실패"):
+        summarize_drawings(_FakeGateway(), _files("고장 1", "고장 2"), "전체 요약")
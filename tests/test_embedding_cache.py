@@ -0,0 +1,66 @@
+import numpy as np
+
+from utils.embedding_cache import ChunkEmbeddingCache
+
+TEXTS = ["FT-101 유량 전송기", "PV-201 압력 조절 밸브", "FT-101 유량 전송기"]
+
+
+class _Encoder:
+    """호출 기록을 남기는 인코더 - offset으로 모델/백엔드마다 다른 벡터를 냄"""
+
+    def __init__(self, offset=0.0, revision="rev-a"):
+        self.offset = offset
+        self.revision = revision
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False):
+        self.calls.append(list(texts))
+        vectors = np.array([[len(text), self.offset, 1.0] for text in texts], dtype=np.float32)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+class OnnxSentenceEncoder(_Encoder):
+    """encoder_backend가 타입 이름으로 구분하는 ONNX 인코더 대용"""
+
+    def __init__(self, offset=0.0, revision="rev-a", quantize=False):
+        super().__init__(offset, revision)
+        self.quantize = quantize
+
+
+def test_reuses_vectors_across_reopen(tmp_path):
+    encoder = _Encoder()
+    cache = ChunkEmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    first = cache.encode(encoder, "model-a", TEXTS)
+    assert encoder.calls == [TEXTS[:2]]  # 같은 호출 안의 중복도 한 번만 인코딩
+
+    reopened = ChunkEmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    np.testing.assert_array_equal(reopened.encode(encoder, "model-a", TEXTS), first)
+    assert len(encoder.calls) == 1 and reopened.stats()["hits"] == 3
+
+
+def test_namespaces_separate_model_revision_backend_and_normalization(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    base = cache.encode(_Encoder(), "model-a", TEXTS)
+
+    variants = [
+        (_Encoder(offset=1.0), "model-b", {}),
+        (_Encoder(offset=2.0, revision="rev-b"), "model-a", {}),
+        (OnnxSentenceEncoder(offset=3.0), "model-a", {}),
+        (OnnxSentenceEncoder(offset=4.0, quantize=True), "model-a", {}),
+        (_Encoder(), "model-a", {"normalize_embeddings": True}),
+    ]
+    namespaces = {cache.namespace(_Encoder(), "model-a")}
+    for encoder, model_name, kwargs in variants:
+        vectors = cache.encode(encoder, model_name, TEXTS, **kwargs)
+        assert encoder.calls == [TEXTS[:2]], "다른 네임스페이스의 벡터를 재사용함"
+        assert not np.array_equal(vectors, base)
+        namespaces.add(cache.namespace(encoder, model_name, kwargs.get("normalize_embeddings", False)))
+    assert len(namespaces) == len(variants) + 1
+
+    cache.clear(cache.namespace(OnnxSentenceEncoder(), "model-a"))
+    again = OnnxSentenceEncoder(offset=3.0)
+    cache.encode(again, "model-a", TEXTS)
+    assert again.calls == [TEXTS[:2]]
+    assert cache.encode(_Encoder(), "model-a", TEXTS).tolist() == base.tolist()
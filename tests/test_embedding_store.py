@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils.embedding_store import (
+    CURRENT_FILE, EMBEDDINGS_FILE, MANIFEST_FILE, KEEP_VERSIONS,
+    get_store_info, load_embedding_store, remove_embedding_store,
+    resolve_store_dir, save_embedding_store, store_exists
+)
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    chunks = ["첫 번째 청크", "FIC-101 유량 제어", ""]
+    save_embedding_store(str(tmp_path), chunks, _vectors(3), metadata=[{"page": i} for i in range(3)],
+                         model_name="test-model")
+
+    store = load_embedding_store(str(tmp_path))
+    assert list(store.chunks) == chunks
+    assert store.metadata == [{"page": 0}, {"page": 1}, {"page": 2}]
+    assert store.manifest["model_name"] == "test-model"
+    np.testing.assert_allclose(np.linalg.norm(store.embeddings, axis=1), 1.0, rtol=1e-5)
+    assert store.digest is not None
+
+
+def test_mapped_chunks_close_releases_handles(tmp_path):
+    save_embedding_store(str(tmp_path), ["FT-101", "PV-201"], _vectors(2))
+    with load_embedding_store(str(tmp_path)).chunks as chunks:
+        assert chunks[1] == "PV-201"
+    assert chunks.closed
+    chunks.close()
+
+    # 교체 직전에 시작된 검색이 닫힌 뒤 접근해도 다시 열어 읽음
+    assert chunks[0] == "FT-101" and not chunks.closed
+    chunks.close()
+
+
+def test_each_save_is_a_new_version_behind_current(tmp_path):
+    path = str(tmp_path)
+    save_embedding_store(path, ["a"], _vectors(1, seed=1))
+    first = load_embedding_store(path)
+
+    save_embedding_store(path, ["b", "c"], _vectors(2, seed=2))
+    second = load_embedding_store(path)
+
+    assert first.path != second.path
+    assert open(os.path.join(path, CURRENT_FILE), encoding="utf-8").read() == os.path.basename(second.path)
+    assert list(second.chunks) == ["b", "c"]
+    # 이전 버전을 열어둔 쪽은 그대로 같은 버전의 파일을 읽음
+    assert list(first.chunks) == ["a"] and first.embeddings.shape == (1, 8)
+
+
+def test_old_versions_are_pruned(tmp_path):
+    path = str(tmp_path)
+    for i in range(KEEP_VERSIONS + 3):
+        save_embedding_store(path, [f"chunk {i}"], _vectors(1, seed=i))
+    versions = [name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))]
+    assert len(versions) == KEEP_VERSIONS
+
+
+def test_failed_companion_keeps_previous_version(tmp_path):
+    path = str(tmp_path)
+    save_embedding_store(path, ["old"], _vectors(1))
+
+    def _fail(store_dir, digest):
+        raise RuntimeError("companion failed")
+
+    with pytest.raises(RuntimeError):
+        save_embedding_store(path, ["new"], _vectors(1, seed=3), companions=_fail)
+    assert list(load_embedding_store(path).chunks) == ["old"]
+
+
+def test_companions_see_manifest_digest(tmp_path):
+    seen = {}
+
+    def _companion(store_dir, digest):
+        seen["dir"], seen["digest"] = store_dir, digest
+        open(os.path.join(store_dir, "extra.bin"), "wb").write(b"x")
+
+    save_embedding_store(str(tmp_path), ["a"], _vectors(1), companions=_companion)
+    store = load_embedding_store(str(tmp_path))
+    assert seen == {"dir": store.path, "digest": store.digest}
+    assert "extra.bin" in get_store_info(str(tmp_path))["file_sizes"]
+
+
+def test_legacy_flat_store_is_read_and_replaced(tmp_path):
+    path = str(tmp_path)
+    save_embedding_store(path, ["legacy"], _vectors(1))
+    # 구버전 단일 디렉터리 저장소 재현
+    store_dir = resolve_store_dir(path)
+    for name in os.listdir(store_dir):
+        os.replace(os.path.join(store_dir, name), os.path.join(path, name))
+    os.rmdir(store_dir)
+    os.remove(os.path.join(path, CURRENT_FILE))
+
+    assert resolve_store_dir(path) == path
+    assert list(load_embedding_store(path).chunks) == ["legacy"]
+
+    save_embedding_store(path, ["migrated"], _vectors(1))
+    assert not os.path.exists(os.path.join(path, MANIFEST_FILE))
+    assert not os.path.exists(os.path.join(path, EMBEDDINGS_FILE))
+    assert list(load_embedding_store(path).chunks) == ["migrated"]
+
+
+def test_remove_embedding_store(tmp_path):
+    path = str(tmp_path)
+    save_embedding_store(path, ["a"], _vectors(1))
+    assert store_exists(path)
+    assert remove_embedding_store(path)
+    assert not store_exists(path)
+    assert load_embedding_store(path) is None
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+import utils.rag_system_kiwi as rag_system_kiwi
+from utils.rag_system_kiwi import RAGSystemWithKiwi, build_pid_kiwi
+
+SENTENCE = "FT-101 유량 전송기는 원료 유입 라인의 유량을 측정해 FC-101 조절기로 보낸다."
+
+
+def _documents(num_docs, sentences_per_doc=12, consumed=None):
+    for i in range(num_docs):
+        if consumed is not None:
+            consumed.append(i)
+        yield {"content": " ".join([SENTENCE] * sentences_per_doc), "page": i + 1, "source": "manual.pdf"}
+
+
+class _SentenceSplitter:
+    """마침표로 문장을 나누는 Kiwi 대용 - fail_after개 문서 뒤에 예외"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+
+    def split_into_sents(self, texts):
+        for i, text in enumerate(texts):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise RuntimeError("kiwi worker crashed")
+            yield [SimpleNamespace(text=s.strip() + ".") for s in text.split(".") if s.strip()]
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    monkeypatch.setattr(rag_system_kiwi, "get_query_cache", lambda: None)
+    return RAGSystemWithKiwi()
+
+
+def test_chunks_stream_before_all_documents_are_read(rag):
+    rag._kiwi = _SentenceSplitter()
+    consumed = []
+    chunks = rag.iter_chunks_with_kiwi(_documents(50, consumed=consumed))
+    first = next(chunks)
+    assert first["page"] == 1 and first["kiwi_sentence_split"]
+    assert len(consumed) < 50
+
+    rest = list(chunks)
+    assert [chunk["chunk_id"] for chunk in [first] + rest] == list(range(len(rest) + 1))
+    for chunk in [first] + rest:
+        assert 100 <= len(chunk["content"]) <= 400 + len(SENTENCE)
+
+
+def test_kiwi_failure_falls_back_only_for_remaining_documents(rag):
+    rag._kiwi = _SentenceSplitter(fail_after=2)
+    chunks = list(rag.iter_chunks_with_kiwi(_documents(4)))
+    by_page = {}
+    for chunk in chunks:
+        by_page.setdefault(chunk["page"], set()).add("kiwi" if chunk.get("kiwi_sentence_split") else "fallback")
+    assert by_page == {1: {"kiwi"}, 2: {"kiwi"}, 3: {"fallback"}, 4: {"fallback"}}
+
+
+def test_real_kiwi_keeps_page_metadata(rag):
+    rag._kiwi = build_pid_kiwi()
+    documents = list(_documents(3, sentences_per_doc=8))
+    chunks = rag.chunk_documents_with_kiwi(documents)
+    assert sorted({chunk["page"] for chunk in chunks}) == [1, 2, 3]
+    for chunk in chunks:
+        assert "FT-101" in chunk["content"] and chunk["source"] == "manual.pdf"
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.llm_gateway import LLMGateway
+from services.llm_stub_server import StubConfig, start_stub_server
+
+MESSAGES = [{"role": "user", "content": "FT-101의 역할은?"}]
+
+
+class FirstSlowConfig(StubConfig):
+    """첫 요청만 꼬리 지연 (헤징 요청이 이기는 상황 재현)"""
+
+    def __init__(self, slow_s: float, fast_s: float):
+        super().__init__(token_delay_ms=0.0)
+        self.slow_s = slow_s
+        self.fast_s = fast_s
+        self._served = 0
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            self._served += 1
+            return self.slow_s if self._served == 1 else self.fast_s
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def _start(config):
+        server, base_url = start_stub_server(config)
+        servers.append(server)
+        return server, base_url
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _wait_for_requests(server, expected: int, timeout: float = 5.0) -> int:
+    """스텁 서버가 expected개 요청에 응답할 때까지 대기 (동기 헤징의 진 요청은 취소되지 않음)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        served = server.RequestHandlerClass.stats.to_dict()["requests"]
+        if served >= expected or time.monotonic() > deadline:
+            return served
+        time.sleep(0.05)
+
+
+def test_sync_hedge_wins_over_slow_primary(stub):
+    server, base_url = stub(FirstSlowConfig(slow_s=1.5, fast_s=0.05))
+    gateway = LLMGateway("stub-key", base_url=base_url, hedge_after_s=0.2, max_sync_hedges=1)
+    try:
+        start = time.perf_counter()
+        response = gateway.chat(MESSAGES, max_tokens=8)
+        elapsed = time.perf_counter() - start
+        assert response.choices[0].message.content
+        assert elapsed < 1.0
+        stats = gateway.stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+        assert _wait_for_requests(server, 2) == 2
+    finally:
+        gateway.close()
+
+
+def test_sync_hedges_capped_while_losers_are_in_flight(stub):
+    server, base_url = stub(StubConfig(latency_ms=600, jitter_ms=0, token_delay_ms=0))
+    gateway = LLMGateway("stub-key", base_url=base_url, hedge_after_s=0.1, max_sync_hedges=1)
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            responses = list(executor.map(lambda _: gateway.chat(MESSAGES, max_tokens=8), range(3)))
+        assert all(r.choices[0].message.content for r in responses)
+        stats = gateway.stats()
+        assert stats["hedges"] == 1 and stats["hedges_skipped"] == 2
+        # 진 헤징 요청도 서버에서 끝까지 처리됨
+        assert _wait_for_requests(server, 4) == 4
+    finally:
+        gateway.close()
+
+
+def test_async_hedge_cancels_loser(stub):
+    server, base_url = stub(FirstSlowConfig(slow_s=1.5, fast_s=0.05))
+    gateway = LLMGateway("stub-key", base_url=base_url, hedge_after_s=0.2, max_sync_hedges=0)
+
+    async def _chat():
+        async with gateway.async_session() as llm:
+            return await llm.chat(MESSAGES, max_tokens=8)
+
+    try:
+        start = time.perf_counter()
+        response = asyncio.run(_chat())
+        assert response.choices[0].message.content
+        assert time.perf_counter() - start < 1.0
+        stats = gateway.stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    finally:
+        gateway.close()
+
+
+class FirstErrorConfig(StubConfig):
+    """첫 요청만 503 (응답 헤더 단계의 일시 오류 재현)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(latency_ms=0.0, jitter_ms=0.0, token_delay_ms=0.0, **kwargs)
+        self._served = 0
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            self._served += 1
+            self.error_rate = 1.0 if self._served == 1 else 0.0
+        return 0.0
+
+
+def test_stream_retries_before_first_token(stub):
+    server, base_url = stub(FirstErrorConfig())
+    gateway = LLMGateway("stub-key", base_url=base_url, backoff_base_s=0.01, hedge_after_s=None)
+    try:
+        text = "".join(gateway.stream_chat(MESSAGES, max_tokens=8))
+        assert text.startswith("질문")
+        assert gateway.stats()["retries"] == 1
+        assert server.RequestHandlerClass.stats.to_dict() == {"requests": 2, "errors": 1, "streams": 2}
+    finally:
+        gateway.close()
+
+
+def test_stream_does_not_retry_after_first_token(stub):
+    server, base_url = stub(StubConfig(latency_ms=0, jitter_ms=0, token_delay_ms=0, disconnect_after_tokens=3))
+    gateway = LLMGateway("stub-key", base_url=base_url, backoff_base_s=0.01, hedge_after_s=None)
+    received = []
+    try:
+        with pytest.raises(Exception):
+            for delta in gateway.stream_chat(MESSAGES, max_tokens=8):
+                received.append(delta)
+        # 이미 내보낸 토큰이 중복되지 않도록 다시 요청하지 않음
+        assert len(received) == 3
+        assert gateway.stats()["retries"] == 0
+        assert _wait_for_requests(server, 2, timeout=0.5) == 1
+    finally:
+        gateway.close()
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from utils.model_registry import ModelRegistry
+
+
+def test_concurrent_get_or_load_loads_each_key_once():
+    registry = ModelRegistry()
+    calls = []
+    start = threading.Barrier(8)
+
+    def _loader(key):
+        def _load():
+            calls.append(key)
+            time.sleep(0.05)  # 다른 스레드가 로드 도중에 같은 키를 요청하도록
+            return object()
+        return _load
+
+    results = {}
+
+    def _worker(i):
+        key = "encoder" if i % 2 else "kiwi"
+        start.wait()
+        results[i] = (key, registry.get_or_load(key, _loader(key)))
+
+    threads = [threading.Thread(target=_worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(calls) == ["encoder", "kiwi"]
+    for key in ("encoder", "kiwi"):
+        assert len({id(model) for k, model in results.values() if k == key}) == 1
+    assert {entry["key"] for entry in registry.memory_report()} == {"encoder", "kiwi"}
+
+
+def test_unload_allows_reload():
+    registry = ModelRegistry()
+    first = registry.get_or_load("kiwi", object)
+    assert registry.unload("kiwi") and not registry.is_loaded("kiwi")
+    assert registry.get_or_load("kiwi", object) is not first
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from config.user_config import ENCODER_ONNX_MIN_COSINE
+from utils.onnx_encoder import (
+    EXPORT_META_FILE,
+    ONNX_OPSET,
+    VERIFY_SENTENCES,
+    OnnxSentenceEncoder,
+    embedding_agreement,
+    model_cache_revision
+)
+
+REFERENCE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def _tiny_model_dir(path):
+    """네트워크 없이 만드는 작은 BERT SentenceTransformer"""
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list("abcdefghijklmnopqrstuvwxyz0123456789-?.,")
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(vocab), encoding="utf-8")
+    tokenizer = BertTokenizerFast(vocab_file=str(vocab_file))
+
+    bert_dir = path / "bert"
+    BertModel(BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2,
+                         num_attention_heads=2, intermediate_size=64)).save_pretrained(bert_dir)
+    tokenizer.save_pretrained(bert_dir)
+
+    transformer = models.Transformer(str(bert_dir), max_seq_length=64)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    model_dir = path / "tiny-st"
+    SentenceTransformer(modules=[transformer, pooling, models.Normalize()], device="cpu").save(str(model_dir))
+    return str(model_dir)
+
+
+def test_export_verified_once_and_reloaded_without_torch(tmp_path, monkeypatch):
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = _tiny_model_dir(tmp_path)
+    cache_dir = str(tmp_path / "onnx")
+    reference = SentenceTransformer(model_dir, device="cpu")
+
+    encoder = OnnxSentenceEncoder(model_dir, quantize=False, cache_dir=cache_dir, reference=reference)
+    revision = model_cache_revision(model_dir)
+    assert encoder.revision == revision
+    assert os.path.basename(encoder.model_dir) == f"{revision}-opset{ONNX_OPSET}"
+    assert os.path.exists(os.path.join(encoder.model_dir, EXPORT_META_FILE))
+    assert encoder.agreement >= ENCODER_ONNX_MIN_COSINE
+
+    # 검증이 끝난 내보내기는 torch 모델 없이 로드
+    monkeypatch.setattr(OnnxSentenceEncoder, "_load_reference",
+                        lambda self: pytest.fail("torch 모델을 다시 로드함"))
+    reloaded = OnnxSentenceEncoder(model_dir, quantize=False, cache_dir=cache_dir)
+    assert reloaded.model_path == encoder.model_path
+    assert reloaded.agreement == encoder.agreement
+    np.testing.assert_allclose(reloaded.encode(VERIFY_SENTENCES), encoder.encode(VERIFY_SENTENCES), atol=1e-6)
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_reference_model_within_tolerance(tmp_path, quantize):
+    """실제 모델의 torch 대비 코사인 유사도 (모델을 받을 수 없는 환경에서는 건너뜀)"""
+    from sentence_transformers import SentenceTransformer
+    try:
+        reference = SentenceTransformer(REFERENCE_MODEL, device="cpu")
+    except Exception as e:
+        pytest.skip(f"참조 모델을 불러올 수 없음: {e}")
+
+    encoder = OnnxSentenceEncoder(REFERENCE_MODEL, quantize=quantize, cache_dir=str(tmp_path), reference=reference)
+    assert embedding_agreement(reference, encoder, VERIFY_SENTENCES) >= ENCODER_ONNX_MIN_COSINE
+    assert encoder.agreement >= ENCODER_ONNX_MIN_COSINE
+
+
+@pytest.fixture
+def onnx_backend(tmp_path, monkeypatch):
+    """get_sentence_encoder가 임시 캐시 디렉터리와 새 레지스트리를 쓰도록"""
+    import config.user_config
+    import utils.model_registry as model_registry
+    import utils.onnx_encoder as onnx_encoder
+
+    cache_dir = str(tmp_path / "onnx")
+
+    class _TmpCacheEncoder(OnnxSentenceEncoder):
+        def __init__(self, model_name, **kwargs):
+            super().__init__(model_name, cache_dir=cache_dir, **kwargs)
+
+    monkeypatch.setattr(onnx_encoder, "OnnxSentenceEncoder", _TmpCacheEncoder)
+    monkeypatch.setattr(model_registry, "_registry", model_registry.ModelRegistry())
+    monkeypatch.setattr(config.user_config, "ENCODER_ONNX_THREADS", 1)
+    return _tiny_model_dir(tmp_path)
+
+
+def test_onnx_backend_used_when_agreement_meets_threshold(onnx_backend):
+    from utils.model_registry import get_sentence_encoder
+    assert isinstance(get_sentence_encoder(onnx_backend, backend="onnx"), OnnxSentenceEncoder)
+
+
+def test_falls_back_to_torch_below_min_cosine(onnx_backend, monkeypatch):
+    import config.user_config
+    from sentence_transformers import SentenceTransformer
+    from utils.model_registry import get_sentence_encoder
+
+    # 내보낸 모델의 검증 코사인이 기준에 못 미치면 기존 인덱스와 맞는 torch 인코더를 씀
+    monkeypatch.setattr(config.user_config, "ENCODER_ONNX_MIN_COSINE", 1.01)
+    encoder = get_sentence_encoder(onnx_backend, backend="onnx")
+    assert isinstance(encoder, SentenceTransformer)
+    assert get_sentence_encoder(onnx_backend, backend="onnx") is encoder
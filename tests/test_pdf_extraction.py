@@ -0,0 +1,68 @@
+import pytest
+
+import utils.pdf_extraction as pdf_extraction
+from utils.pdf_extraction import iter_pdf_documents
+
+
+def _write_pdf(path, page_texts):
+    """페이지마다 한 줄짜리 텍스트가 있는 최소 PDF"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET" if text else ""
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    body, offsets = b"%PDF-1.4\n", []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(body)
+    return str(path)
+
+
+@pytest.fixture
+def page_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "PDF_PAGE_CACHE_PATH", str(tmp_path / "pdf_page_cache.db"))
+    monkeypatch.setattr(pdf_extraction, "_page_cache", None)
+    return pdf_extraction.get_page_cache()
+
+
+def test_unchanged_pdf_is_read_from_page_cache(tmp_path, monkeypatch, page_cache):
+    pdf = _write_pdf(tmp_path / "manual.pdf", ["FT-101 flow transmitter", "", "PV-201 pressure valve"])
+    first = list(iter_pdf_documents(pdf, max_workers=1))
+    assert [doc["page"] for doc in first] == [1, 3]
+    assert "FT-101" in first[0]["original_text"]
+    assert len(page_cache.get_pages(pdf_extraction.file_sha256(pdf))) == 3  # 빈 페이지도 캐시
+
+    def _fail(*args):
+        raise AssertionError("캐시된 페이지를 다시 추출함")
+
+    monkeypatch.setattr(pdf_extraction, "_extract_page_range", _fail)
+    assert list(iter_pdf_documents(pdf, max_workers=1)) == first
+
+
+def test_changed_pdf_is_extracted_again(tmp_path, page_cache):
+    pdf = _write_pdf(tmp_path / "manual.pdf", ["FT-101 flow transmitter"])
+    list(iter_pdf_documents(pdf, max_workers=1))
+
+    _write_pdf(tmp_path / "manual.pdf", ["LIC-301 level controller"])
+    documents = list(iter_pdf_documents(pdf, max_workers=1))
+    assert "LIC-301" in documents[0]["original_text"]
+
+
+def test_parallel_extraction_keeps_page_order(tmp_path, monkeypatch, page_cache):
+    monkeypatch.setattr(pdf_extraction, "PDF_PARALLEL_MIN_PAGES", 1)
+    texts = [f"page {i} tag FT-{100 + i}" for i in range(12)]
+    pdf = _write_pdf(tmp_path / "manual.pdf", texts)
+    documents = list(iter_pdf_documents(pdf, max_workers=3))
+    assert [doc["page"] for doc in documents] == list(range(1, 13))
+    assert all(f"FT-{100 + i}" in doc["original_text"] for i, doc in enumerate(documents))
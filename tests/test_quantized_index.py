@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+import utils.ann_index as ann_index
+from utils.embedding_store import load_embedding_store
+from utils.quantized_index import QuantizedIndex
+from utils.rag_index import RAGIndex
+
+
+def _normalized(n, dim=16, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _no_training(monkeypatch):
+    """로드/압축 경로에서 스케일·코드북 재학습이 일어나면 실패"""
+    def _fail(self):
+        raise AssertionError("quantizer retrained")
+    monkeypatch.setattr(QuantizedIndex, "_build_int8", _fail)
+    monkeypatch.setattr(QuantizedIndex, "_build_pq", _fail)
+
+
+@pytest.mark.parametrize("kind", ["int8", "pq"])
+def test_save_and_load_without_retraining(tmp_path, monkeypatch, kind):
+    embeddings = _normalized(300)
+    index = QuantizedIndex(embeddings, normalized=True, kind=kind, rerank_candidates=20)
+    index.save(str(tmp_path))
+
+    _no_training(monkeypatch)
+    loaded = QuantizedIndex.load(str(tmp_path), embeddings, kind, rerank_candidates=20)
+    queries = _normalized(4, seed=1)
+    assert loaded.search(queries, 5)[1].tolist() == index.search(queries, 5)[1].tolist()
+    assert loaded.code_bytes == index.code_bytes
+
+
+def test_load_rejects_mismatched_rows(tmp_path):
+    embeddings = _normalized(50)
+    QuantizedIndex(embeddings, normalized=True, kind="int8").save(str(tmp_path))
+    with pytest.raises(ValueError):
+        QuantizedIndex.load(str(tmp_path), embeddings[:40], "int8")
+
+
+@pytest.mark.parametrize("kind", ["int8", "pq"])
+def test_compacted_reuses_codes(monkeypatch, kind):
+    embeddings = _normalized(300)
+    index = QuantizedIndex(embeddings, normalized=True, kind=kind, rerank_candidates=300)
+    keep = list(range(0, 300, 3))
+
+    _no_training(monkeypatch)
+    compacted = index.compacted(keep)
+    assert len(compacted) == len(keep)
+    if kind == "int8":
+        np.testing.assert_array_equal(compacted.codes, index.codes[keep])
+    else:
+        np.testing.assert_array_equal(compacted._pq_codes(), index._pq_codes()[keep])
+
+    # 압축 후 행 번호 i는 원래 keep[i] 행
+    scores, indices = compacted.search(embeddings[keep[7]], 1)
+    assert indices[0, 0].item() == 7 and scores[0, 0].item() == pytest.approx(1.0, abs=1e-5)
+
+
+def test_rag_index_reload_uses_stored_codes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_index, "EMBEDDING_QUANTIZATION", "int8")
+    vectors = {f"chunk {i}": v for i, v in enumerate(_normalized(40))}
+
+    def _encode(texts):
+        return np.stack([vectors[t] for t in texts])
+
+    index = RAGIndex(str(tmp_path), model_name="test-model")
+    index.upsert_source("a.pdf", [{"content": f"chunk {i}"} for i in range(30)], _encode)
+    index.save()
+    index.upsert_source("b.pdf", [{"content": f"chunk {i}"} for i in range(30, 40)], _encode)
+    index.save()
+
+    _no_training(monkeypatch)
+    reloaded = RAGIndex(str(tmp_path), model_name="test-model")
+    assert reloaded.load()
+    assert isinstance(reloaded.vector_index, QuantizedIndex) and len(reloaded.vector_index) == 40
+    assert reloaded.search(vectors["chunk 35"][None, :], top_k=1)[0][0]["content"] == "chunk 35"
+
+    # 압축도 기존 스케일을 그대로 사용
+    reloaded.remove_source("a.pdf")
+    reloaded.save()
+    assert len(reloaded.vector_index) == 10
+    store = load_embedding_store(str(tmp_path))
+    assert store.manifest["count"] == 10
+
+
+def test_blockwise_first_pass_matches_dense_scores():
+    embeddings = _normalized(300)
+    index = QuantizedIndex(embeddings, normalized=True, kind="int8", block_rows=32)
+    index.remove([0, 5, 77])
+    queries = _normalized(3, seed=2)
+
+    first = index._first_pass(queries, 20)
+    dense = (queries * index.scale) @ index.codes.astype(np.float32).T
+    dense[:, [0, 5, 77]] = -np.inf
+    for row, expected in zip(first, np.argsort(-dense, axis=1)[:, :20]):
+        assert set(row.tolist()) == set(expected.tolist())
+
+
+def test_rows_reads_base_and_added_rows_without_concatenating():
+    embeddings = _normalized(300)
+    extra = _normalized(5, seed=3)
+    index = QuantizedIndex(embeddings, normalized=True, kind="int8")
+    index.add(extra, normalized=True)
+    assert index._float_base is embeddings
+    assert not hasattr(index, "embeddings")
+
+    np.testing.assert_allclose(index.rows([302, 4, 299]), np.stack([extra[2], embeddings[4], embeddings[299]]))
+
+    # 압축해도 원본 행렬은 복사하지 않고 행 뷰로 참조
+    compacted = index.compacted([1, 2, 301])
+    np.testing.assert_allclose(compacted.rows([0, 2]), np.stack([embeddings[1], extra[1]]))
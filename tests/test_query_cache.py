@@ -0,0 +1,63 @@
+import numpy as np
+
+from utils.query_cache import QueryEmbeddingCache
+
+
+class FakeEncoder:
+    """SentenceTransformer.encode 대역 - 호출된 쿼리를 기록하고 고정 벡터 반환"""
+
+    def __init__(self, value: float, revision: str = "rev1"):
+        self.value = value
+        self.revision = revision
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.full((len(texts), 4), self.value, dtype=np.float32)
+
+
+class OnnxSentenceEncoder(FakeEncoder):
+    """encoder_backend()가 onnx로 판단하도록 클래스명만 맞춤"""
+    quantize = True
+
+
+def test_repeated_query_hits_cache():
+    cache = QueryEmbeddingCache(max_size=8)
+    encoder = FakeEncoder(1.0)
+    cache.encode(encoder, "model", "FT-101은 무엇인가요?")
+    cache.encode(encoder, "model", ["  FT-101은   무엇인가요? ", "새 질문"])
+
+    assert encoder.calls == [["FT-101은 무엇인가요?"], ["새 질문"]]
+    assert cache.stats()["hits"] == 1
+
+
+def test_backends_do_not_share_vectors(tmp_path):
+    disk_path = str(tmp_path / "query_cache.db")
+    torch_vector = QueryEmbeddingCache(disk_path=disk_path).encode(FakeEncoder(1.0), "model", "q")
+
+    # 재시작 후 ONNX 백엔드로 바꾸면 디스크에 남은 torch 벡터를 쓰지 않음
+    onnx_encoder = OnnxSentenceEncoder(2.0)
+    onnx_vector = QueryEmbeddingCache(disk_path=disk_path).encode(onnx_encoder, "model", "q")
+    assert onnx_encoder.calls == [["q"]]
+    assert float(torch_vector[0]) == 1.0 and float(onnx_vector[0]) == 2.0
+
+
+def test_model_revision_change_misses(tmp_path):
+    disk_path = str(tmp_path / "query_cache.db")
+    QueryEmbeddingCache(disk_path=disk_path).encode(FakeEncoder(1.0, revision="rev1"), "model", "q")
+
+    upgraded = FakeEncoder(3.0, revision="rev2")
+    vector = QueryEmbeddingCache(disk_path=disk_path).encode(upgraded, "model", "q")
+    assert upgraded.calls == [["q"]] and float(vector[0]) == 3.0
+
+    same = FakeEncoder(9.0, revision="rev2")
+    vector = QueryEmbeddingCache(disk_path=disk_path).encode(same, "model", "q")
+    assert same.calls == [] and float(vector[0]) == 3.0
+
+
+def test_normalized_output_is_separate_namespace():
+    cache = QueryEmbeddingCache()
+    encoder = FakeEncoder(1.0)
+    cache.encode(encoder, "model", "q")
+    cache.encode(encoder, "model", "q", normalize_embeddings=True)
+    assert len(encoder.calls) == 2
@@ -0,0 +1,236 @@
+import numpy as np
+import pytest
+
+from utils.bm25_index import BM25Index, reciprocal_rank_fusion
+from utils.embedding_store import content_hash
+from utils.rag_index import RAGIndex
+
+class CountingEncoder:
+    def __init__(self, encode):
+        self.encode = encode
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return self.encode(texts)
+
+
+def _tokenize(texts):
+    return [text.lower().split() for text in texts]
+
+
+def _chunks(*texts, page=1):
+    return [{"content": text, "page": page} for text in texts]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return RAGIndex(str(tmp_path), model_name="test-model", tokenizer=_tokenize)
+
+
+def _assert_aligned(index, encode):
+    """벡터/청크/메타데이터/BM25 행 번호가 모두 같은 청크를 가리키는지"""
+    assert len(index.vector_index) == len(index.chunks) == len(index.metadata) == len(index.bm25)
+    for row, (chunk, meta) in enumerate(zip(index.chunks, index.metadata)):
+        assert meta["hash"] == content_hash(chunk)
+        np.testing.assert_allclose(np.asarray(index.vector_index.embeddings[row]),
+                                   encode([chunk])[0] / np.linalg.norm(encode([chunk])[0]), rtol=1e-5)
+        assert bool(meta.get("deleted")) == (row in index.bm25.deleted)
+        for term in set(_tokenize([chunk])[0]):
+            assert index.bm25.has_term(row, term)
+    assert index.vector_index.alive_count == index.bm25.alive_count
+
+
+def test_upsert_adds_new_source(index, encode):
+    encoder = CountingEncoder(encode)
+    stats = index.upsert_source("a.pdf", _chunks("alpha one", "beta two"), encoder, file_hash="h1")
+
+    assert stats == {"added": 2, "removed": 0, "unchanged": 0}
+    assert encoder.encoded == ["alpha one", "beta two"]
+    assert len(index) == 2
+    assert index.is_source_current("a.pdf", "h1")
+    _assert_aligned(index, encode)
+
+
+def test_upsert_unchanged_chunks_are_not_reencoded(index, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one", "beta two"), encode, file_hash="h1")
+    encoder = CountingEncoder(encode)
+    stats = index.upsert_source("a.pdf", _chunks("alpha one", "beta two", "gamma three"), encoder, file_hash="h2")
+
+    assert stats == {"added": 1, "removed": 0, "unchanged": 2}
+    assert encoder.encoded == ["gamma three"]
+    assert not index.is_source_current("a.pdf", "h1")
+    _assert_aligned(index, encode)
+
+
+def test_upsert_duplicate_chunks_within_source_kept_once(index, encode):
+    stats = index.upsert_source("a.pdf", _chunks("same text", "same text"), encode)
+    assert stats["added"] == 1
+    assert len(index) == 1
+
+
+def test_upsert_changed_chunk_tombstones_old_row(index, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one", "beta two"), encode)
+    stats = index.upsert_source("a.pdf", _chunks("alpha one", "beta changed"), encode)
+
+    assert stats == {"added": 1, "removed": 1, "unchanged": 1}
+    assert len(index) == 2
+    assert index.tombstone_count == 1
+    assert index.metadata[1]["deleted"]
+    contents = [hit["content"] for hit in index.search(encode(["beta two"]), top_k=3)[0]]
+    assert "beta two" not in contents
+    _assert_aligned(index, encode)
+
+
+def test_upsert_does_not_touch_other_sources(index, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one"), encode)
+    index.upsert_source("b.pdf", _chunks("beta two"), encode)
+    stats = index.upsert_source("a.pdf", _chunks("alpha new"), encode)
+
+    assert stats["removed"] == 1
+    assert {hit["source"] for hit in index.search(encode(["beta two"]), top_k=5)[0]} == {"a.pdf", "b.pdf"}
+
+
+def test_remove_source(index, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one", "alpha two"), encode)
+    index.upsert_source("b.pdf", _chunks("beta two"), encode)
+
+    assert index.remove_source("a.pdf") == 2
+    assert index.remove_source("a.pdf") == 0
+    assert "a.pdf" not in index.sources
+    assert len(index) == 1
+    assert [hit["source"] for hit in index.search(encode(["alpha one"]), top_k=5)[0]] == ["b.pdf"]
+    assert [idx for idx, _ in index.bm25.search(["alpha"])] == []
+    _assert_aligned(index, encode)
+
+
+def test_compact_remaps_rows(index, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one", "alpha two"), encode)
+    index.upsert_source("b.pdf", _chunks("beta one", "beta two"), encode)
+    index.remove_source("a.pdf")
+
+    index.compact()
+
+    assert index.tombstone_count == 0
+    assert list(index.chunks) == ["beta one", "beta two"]
+    assert [meta["source"] for meta in index.metadata] == ["b.pdf", "b.pdf"]
+    hit = index.search(encode(["beta two"]), top_k=1)[0][0]
+    assert hit["index"] == 1 and hit["content"] == "beta two"
+    assert [idx for idx, _ in index.bm25.search(["two"])] == [1]
+    _assert_aligned(index, encode)
+
+
+def test_save_compacts_and_reloads(index, tmp_path, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one", "alpha two", "alpha three"), encode, file_hash="h1")
+    index.upsert_source("b.pdf", _chunks("beta one"), encode, file_hash="h2")
+    index.remove_source("a.pdf")
+    index.save()  # 삭제 비율 3/4 > COMPACT_RATIO → 압축 후 저장
+
+    reloaded = RAGIndex(str(tmp_path), model_name="test-model", tokenizer=_tokenize)
+    assert reloaded.load()
+    assert list(reloaded.chunks) == ["beta one"]
+    assert reloaded.tombstone_count == 0
+    assert reloaded.is_source_current("b.pdf", "h2")
+    _assert_aligned(reloaded, encode)
+
+
+def test_save_keeps_tombstones_below_ratio(index, tmp_path, encode):
+    index.upsert_source("a.pdf", _chunks(*[f"alpha {i}" for i in range(8)]), encode)
+    index.upsert_source("a.pdf", _chunks(*[f"alpha {i}" for i in range(7)]), encode)
+    index.save()
+
+    reloaded = RAGIndex(str(tmp_path), model_name="test-model", tokenizer=_tokenize)
+    assert reloaded.load()
+    assert len(reloaded) == 7 and reloaded.tombstone_count == 1
+    _assert_aligned(reloaded, encode)
+
+    # 다시 수집해도 저장된 청크는 재임베딩하지 않음
+    encoder = CountingEncoder(encode)
+    stats = reloaded.upsert_source("a.pdf", _chunks(*[f"alpha {i}" for i in range(7)]), encoder)
+    assert stats["added"] == 0 and encoder.encoded == []
+
+
+def test_load_rejects_other_model(index, tmp_path, encode):
+    index.upsert_source("a.pdf", _chunks("alpha one"), encode)
+    index.save()
+    assert not RAGIndex(str(tmp_path), model_name="other-model").load()
+
+
+def test_hybrid_search_finds_keyword_only_match(index, encode):
+    index.upsert_source("a.pdf", _chunks("pump trips on high pressure", "valve FV101 opens",
+                                         "tank level alarm"), encode)
+    hits = index.hybrid_search("FV101", encode(["unrelated query"])[0], top_k=3, candidates=3)
+
+    top = hits[0]
+    assert top["content"] == "valve FV101 opens"
+    assert top["bm25_score"] > 0 and top["tag_match"]
+    assert -1.0 <= top["score"] <= 1.0
+
+
+def test_bm25_incremental_add_remove_compact():
+    bm25 = BM25Index()
+    assert bm25.add([["pump", "pressure"], ["valve"], ["pump", "pump", "level"]]) == [0, 1, 2]
+    assert [idx for idx, _ in bm25.search(["pump"])] == [2, 0]
+
+    bm25.remove([2])
+    bm25.remove([2])  # 중복 삭제는 무시
+    assert bm25.alive_count == 2
+    assert [idx for idx, _ in bm25.search(["pump"])] == [0]
+
+    assert bm25.add([["pump"]]) == [3]
+    bm25.compact([0, 1, 3])
+    assert len(bm25) == 3 and bm25.deleted == set()
+    assert sorted(idx for idx, _ in bm25.search(["pump"])) == [0, 2]
+    assert not bm25.has_term(2, "level")
+
+
+def test_bm25_save_and_load(tmp_path):
+    bm25 = BM25Index()
+    bm25.add([["pump", "pressure"], ["valve"]])
+    bm25.remove([1])
+    bm25.save(str(tmp_path))
+
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.deleted == {1}
+    assert loaded.search(["pump"]) == bm25.search(["pump"])
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [idx for idx, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+@pytest.mark.parametrize("backend, quantization", [("exact", None), ("hnsw", None), ("ivfpq", None),
+                                                   ("auto", "int8"), ("auto", "pq")])
+def test_copy_updates_leave_original_untouched(tmp_path, monkeypatch, backend, quantization, encode):
+    import utils.ann_index as ann_index
+    monkeypatch.setattr(ann_index, "ANN_BACKEND", backend)
+    monkeypatch.setattr(ann_index, "EMBEDDING_QUANTIZATION", quantization)
+
+    index = RAGIndex(str(tmp_path), model_name="test-model", tokenizer=_tokenize)
+    index.upsert_source("a.pdf", _chunks(*[f"pump {i}" for i in range(1200)]), encode)
+    index.save()
+    query = encode(["pump 7"])
+    before = index.search(query, top_k=3)
+
+    clone = index.copy()
+    clone.upsert_source("a.pdf", _chunks(*[f"pump {i}" for i in range(8, 1200)]), encode)
+    clone.upsert_source("b.pdf", _chunks("valve FT-101"), encode)
+
+    # 원본은 삭제 표시/추가 행/게시 목록 모두 그대로
+    assert index.search(query, top_k=3) == before
+    assert len(index) == 1200 and index.sources.keys() == {"a.pdf"}
+    assert not index.bm25.search(["valve"])
+    assert all(not meta.get("deleted") for meta in index.metadata)
+
+    assert clone.search(query, top_k=1)[0][0]["content"] != "pump 7"
+    assert clone.hybrid_search("valve FT-101", encode(["valve FT-101"])[0], top_k=1)[0]["content"] == "valve FT-101"
+
+    # 저장하면 추가 행까지 인덱스 파일에 합쳐 기록
+    clone.save()
+    reloaded = RAGIndex(str(tmp_path), model_name="test-model", tokenizer=_tokenize)
+    assert reloaded.load() and len(reloaded) == 1193
+    assert reloaded.search(encode(["valve FT-101"]), top_k=1)[0][0]["content"] == "valve FT-101"
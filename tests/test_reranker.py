@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from utils.reranker import CrossEncoderReranker
+
+
+class _SlowCrossEncoder:
+    """청크 끝 숫자를 점수로 주는 느린 크로스 인코더 대용"""
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.pairs = []
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        time.sleep(self.delay_s)
+        self.pairs.extend(pairs)
+        return [int(content.split()[-1]) / 100 for _, content in pairs]
+
+
+@pytest.fixture
+def make_reranker(monkeypatch):
+    def _make(model, **kwargs):
+        monkeypatch.setattr(CrossEncoderReranker, "model", property(lambda self: model))
+        return CrossEncoderReranker(model_name="test-cross-encoder", **kwargs)
+    return _make
+
+
+def _hits(n):
+    return [{"content": f"FT-101 chunk {i}", "index": i} for i in range(n)]
+
+
+def test_budget_stops_scoring_and_keeps_fast_index_order(make_reranker):
+    model = _SlowCrossEncoder(delay_s=0.05)
+    reranker = make_reranker(model, max_candidates=8, latency_budget_ms=10, batch_size=2)
+
+    results = reranker.rerank("FT-101", _hits(20), top_k=8)
+    # 첫 배치 뒤 예산을 넘겨 나머지는 채점하지 않고 빠른 인덱스 순위 유지
+    assert len(model.pairs) == 2
+    assert [hit["index"] for hit in results] == [1, 0, 2, 3, 4, 5, 6, 7]
+    assert [hit["rerank_score"] for hit in results[2:]] == [None] * 6
+    assert reranker.stats()["budget_exceeded"] == 1
+
+
+def test_candidate_cap_and_score_cache(make_reranker):
+    model = _SlowCrossEncoder()
+    reranker = make_reranker(model, max_candidates=5, latency_budget_ms=1000, batch_size=2, cache_size=3)
+
+    results = reranker.rerank("FT-101", _hits(20), top_k=3)
+    assert len(model.pairs) == 5  # 후보 상한을 넘는 결과는 채점하지 않음
+    assert [hit["index"] for hit in results] == [4, 3, 2]
+
+    # LRU에 남은 최근 3개는 다시 채점하지 않음
+    reranker.rerank("  FT-101 ", _hits(20), top_k=3)
+    assert len(model.pairs) == 7
+    assert reranker.stats()["cache_hits"] == 3
@@ -0,0 +1,63 @@
+import json
+import os
+import zlib
+
+import numpy as np
+
+from utils.retrieval_benchmark import load_labelled_queries, resolve_relevant, run_benchmark
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "queries.json")
+
+# STREAM DOSE AI 중화 공정 설명 + 다른 도면의 방해 청크
+CHUNKS = [
+    "FT-101은 원료(Feed) 유입 라인의 유량 전송기로, 측정 유량을 FC-101 유량 조절기로 보낸다.",
+    "FC-101 유량 조절기는 FV-101 제어 밸브 개도를 조절해 원료 유량을 설정값으로 유지한다.",
+    "AT-102 pH 분석기는 Static Mixer 후단에서 중화 상태를 측정해 AC-102로 신호를 전달한다.",
+    "AC-102 분석 조절기는 Feedforward 신호와 AT-102 측정값을 결합해 AV-102 시약 주입 밸브를 제어한다.",
+    "AV-102는 Reagent(중화 시약) 공급 라인의 제어 밸브이며 시약 주입량을 결정한다.",
+    "AY-103 Characterizer는 유량 신호를 시약 요구량으로 변환하는 신호 특성화 블록이다.",
+    "Static Mixer는 원료와 시약을 배관 안에서 혼합해 Neutralizer로 보낸다.",
+    "Neutralizer Stage 1 탱크에서 1차 중화가 이루어지고 AT-104가 출구 pH를 감시한다.",
+    "Neutralizer Stage 2 탱크에서는 AC-105가 AV-105를 조절해 최종 pH를 맞춘다.",
+    "처리된 유체는 Discharge 라인으로 배출되며 AT-106이 배출수 pH를 최종 확인한다.",
+    "PT-201 압력 전송기는 증류탑 상부 압력을 측정한다.",
+    "LIC-301 액위 조절기는 리보일러 하부 액위를 유지한다.",
+    "TIC-401 온도 조절기는 열교환기 출구 온도를 제어한다.",
+    "PSV-501 안전 밸브는 Vapor Recovery 스키드의 과압을 방지한다.",
+    "도면 제목(TITLE)은 STREAM DOSE AI이며 작성일(DATE)은 2025.05.01이다.",
+]
+
+
+class _TrigramEncoder:
+    """문자 3-gram 해싱 인코더 (모델 없이 재현 가능한 임베딩)"""
+    dim = 512
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = f"  {text.lower()}  "
+            for i in range(len(text) - 2):
+                vectors[row, zlib.crc32(text[i:i + 3].encode("utf-8")) % self.dim] += 1.0
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_query_file_labels_resolve():
+    queries = load_labelled_queries(QUERIES_PATH)
+    assert any("FT-101" in q.query for q in queries)
+    assert all(rows for rows in resolve_relevant(queries, CHUNKS))
+
+
+def test_benchmark_reports_recall_and_mrr(tmp_path):
+    encoder = _TrigramEncoder()
+    output_path = str(tmp_path / "report.json")
+    report = run_benchmark(encoder.encode(CHUNKS), CHUNKS, load_labelled_queries(QUERIES_PATH), encoder,
+                           backends=("exact", "hnsw", "int8"), ks=(1, 5), output_path=output_path)
+
+    assert report["labelled_queries"] == report["queries"]
+    exact = report["backends"]["exact"]
+    assert exact["recall@5"] >= 0.9 and exact["mrr"] >= 0.7
+    for backend in ("hnsw", "int8"):
+        assert report["backends"][backend]["recall@5"] >= exact["recall@5"] - 0.1
+        assert report["backends"][backend]["p50_ms"] <= report["backends"][backend]["p99_ms"]
+    with open(output_path, encoding="utf-8") as f:
+        assert json.load(f)["backends"].keys() == report["backends"].keys()
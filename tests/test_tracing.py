@@ -0,0 +1,60 @@
+import pytest
+
+from utils.tracing import MetricsStore, Trace, percentile, span, traced
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(100, 0, -1)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 100) == 100.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([7.0], 95) == 7.0
+    assert percentile([], 50) == 0.0
+
+
+def test_metrics_store_window_and_cumulative_count():
+    store = MetricsStore(window=10)
+    for ms in range(1, 21):
+        store.record("rag_search", float(ms))
+
+    report = store.report()["rag_search"]
+    # 분위수는 최근 10개(11~20ms) 기준, count는 누적
+    assert report == {"count": 20, "p50_ms": 15.0, "p95_ms": 20.0, "last_ms": 20.0}
+
+    store.clear()
+    assert store.report() == {}
+
+
+def test_trace_records_nested_spans_and_errors():
+    store = MetricsStore()
+    trace = Trace("generate_response", store=store)
+
+    @traced("prompt")
+    def build_prompt():
+        return "prompt"
+
+    with trace.activate():
+        with span("llm", model="stub") as outer:
+            assert build_prompt() == "prompt"
+            outer.attrs["completion_tokens"] = 12
+        with pytest.raises(ValueError):
+            with span("rerank"):
+                raise ValueError("boom")
+    result = trace.finish()
+
+    assert [(s["name"], s["depth"]) for s in result["spans"]] == [("llm", 0), ("prompt", 1), ("rerank", 0)]
+    assert result["spans"][0]["attrs"] == {"model": "stub", "completion_tokens": 12}
+    assert result["spans"][2]["error"] == "ValueError"
+    assert set(store.report()) == {"llm", "prompt", "rerank", "generate_response"}
+    assert store.report()["generate_response"]["count"] == 1
+
+
+def test_span_without_active_trace_records_shared_metrics(monkeypatch):
+    import utils.tracing as tracing
+
+    store = MetricsStore()
+    monkeypatch.setattr(tracing, "_metrics_store", store)
+    with span("drawing_search"):
+        pass
+    assert store.report()["drawing_search"]["count"] == 1
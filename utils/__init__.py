@@ -5,6 +5,7 @@ Utils 패키지
 
 # RAG 시스템
 from .rag_system_kiwi import RAGSystemWithKiwi
+from .vector_index import VectorIndex
 
 # 자동 처리
 from .auto_processor import (
@@ -33,6 +34,7 @@ from .naver_ocr import (
 __all__ = [
     # RAG 시스템
     'RAGSystemWithKiwi',
+    'VectorIndex',
     
     # 자동 처리
     'process_uploaded_file_auto',
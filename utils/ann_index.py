@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+FAISS 기반 근사 최근접 이웃(ANN) 검색 백엔드
+
+VectorIndex(정확 검색, torch 행렬곱)와 같은 build/add/remove/search 인터페이스를 제공하며,
+코퍼스 크기에 따라 정확 검색 / HNSW / IVF-PQ 중 하나를 고른다.
+
+    청크 수 < ANN_HNSW_MIN_CHUNKS   → exact (VectorIndex)
+    청크 수 < ANN_IVFPQ_MIN_CHUNKS  → hnsw
+    그 이상                          → ivfpq (정규화된 원본 벡터로 후보 재정렬)
+
+HNSW 그래프, IVF-PQ 코드북, 양자화 코드(int8 스케일/PQ 코드북)는 구축 비용이 커서
+임베딩 저장소의 버전 디렉터리에 함께 저장하고, 행 수와 manifest 해시가 맞으면 다시 구축하지 않고 연다.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+import torch
+from loguru import logger
+
+from config.user_config import (
+    ANN_BACKEND, ANN_HNSW_MIN_CHUNKS, ANN_IVFPQ_MIN_CHUNKS,
+    EMBEDDING_QUANTIZATION, QUANTIZATION_RERANK_CANDIDATES
+)
+from utils.vector_index import (
+    FloatRows,
+    RowSubset,
+    VectorIndex,
+    _normalize,
+    _to_float_rows,
+    _to_tensor,
+    empty_topk,
+    merge_topk
+)
+from utils.quantized_index import QUANTIZATION_KINDS, QuantizedIndex
+
+ANN_KINDS = ("flat", "hnsw", "ivfpq")
+PERSISTED_KINDS = ("hnsw", "ivfpq") + QUANTIZATION_KINDS  # 구축 비용이 커서 디스크에 저장하는 종류
+
+ANN_INDEX_FILE = "ann.faiss"
+ANN_META_FILE = "ann.json"
+
+
+def choose_backend(num_vectors: int) -> str:
+    """코퍼스 크기에 맞는 검색 백엔드 선택"""
+    if num_vectors < ANN_HNSW_MIN_CHUNKS:
+        return "exact"
+    if num_vectors < ANN_IVFPQ_MIN_CHUNKS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def resolve_backend(num_vectors: int, backend: Optional[str] = None) -> str:
+    """create_vector_index가 만들 인덱스 종류 ('exact', 'flat', 'hnsw', 'ivfpq', 양자화면 'int8'/'pq')"""
+    backend = backend or ANN_BACKEND
+    if backend == "auto":
+        return EMBEDDING_QUANTIZATION or choose_backend(num_vectors)
+    return backend
+
+
+def index_backend(index) -> str:
+    """검색 인덱스 인스턴스의 종류 (resolve_backend와 같은 이름)"""
+    if isinstance(index, (FaissIndex, QuantizedIndex)):
+        return index.kind
+    return "exact"
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """서브벡터당 약 8차원이 되도록 dim의 약수 중 하나를 선택"""
+    target = max(1, dim // 8)
+    for m in range(target, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+class FaissIndex(FloatRows):
+    """FAISS 인덱스 래퍼 (VectorIndex와 동일한 검색 인터페이스)
+
+    float 원본은 전달받은 정규화 행렬(보통 mmap 저장소)을 그대로 참조하고 RAM에 따로 복사하지 않는다.
+    HNSW/Flat은 faiss가 계산한 내적을 그대로 점수로 쓰고, IVF-PQ 후보만 원본 행을 읽어
+    정확한 점수로 다시 매긴다. 삭제 표시된 행은 여유분을 더 가져온 뒤 걸러낸다.
+    """
+
+    def __init__(self, embeddings=None, normalized: bool = False, kind: str = "hnsw",
+                 hnsw_m: int = 32, ef_search: int = 64, nprobe: int = 16, rerank_factor: int = 4,
+                 block_rows: int = 65536):
+        """
+        Args:
+            embeddings: (N, D) 청크 임베딩 (정규화된 mmap 배열이면 그대로 참조)
+            normalized: 이미 L2 정규화된 임베딩이면 True
+            kind: 'flat', 'hnsw', 'ivfpq'
+            hnsw_m: HNSW 그래프 이웃 수
+            ef_search: HNSW 검색 시 탐색 폭
+            nprobe: IVF 검색 시 조사할 클러스터 수
+            rerank_factor: IVF-PQ 재정렬용 후보 배수
+            block_rows: 구축/정확 검색 시 한 번에 읽는 행 수
+        """
+        if kind not in ANN_KINDS:
+            raise ValueError(f"지원하지 않는 ANN 종류: {kind}")
+
+        self.kind = kind
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.block_rows = block_rows
+        self._float_base = None
+        self._float_extra = None
+        self.index = None
+        self._alive = None
+        if embeddings is not None:
+            self.build(embeddings, normalized=normalized)
+
+    @classmethod
+    def from_faiss(cls, index, embeddings, **kwargs) -> "FaissIndex":
+        """저장된 faiss 인덱스와 정규화된 임베딩(보통 mmap)으로 복원"""
+        if isinstance(faiss.downcast_index(index), faiss.IndexHNSWFlat):
+            kind = "hnsw"
+        elif isinstance(faiss.downcast_index(index), faiss.IndexIVFPQ):
+            kind = "ivfpq"
+        else:
+            kind = "flat"
+        restored = cls(kind=kind, **kwargs)
+        restored._float_base = _to_float_rows(embeddings, normalized=True)
+        restored.index = index
+        restored._apply_search_params()
+        return restored
+
+    def _create_index(self, num_vectors: int, dim: int):
+        if self.kind == "flat":
+            return faiss.IndexFlatIP(dim)
+        if self.kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = max(40, 2 * self.hnsw_m)
+            return index
+
+        # IVF-PQ: 클러스터당 학습 샘플이 충분하도록 nlist를 제한
+        nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8, faiss.METRIC_INNER_PRODUCT)
+
+        # 표본으로 학습 (전체 mmap을 메모리로 올리지 않음)
+        sample_size = min(num_vectors, max(65536, 64 * nlist))
+        sample_ids = np.sort(np.random.default_rng(0).choice(num_vectors, sample_size, replace=False))
+        index.train(np.ascontiguousarray(self._float_base[sample_ids], dtype=np.float32))
+        return index
+
+    def _apply_search_params(self):
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexHNSWFlat):
+            index.hnsw.efSearch = self.ef_search
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = min(self.nprobe, index.nlist)
+
+    def build(self, embeddings, normalized: bool = False) -> "FaissIndex":
+        """임베딩 행렬로 인덱스 구성 (원본은 블록 단위로 읽어 faiss에 추가)"""
+        self._float_base = _to_float_rows(embeddings, normalized)
+        self._float_extra = None
+        self._alive = None
+
+        start = time.perf_counter()
+        self.index = self._create_index(*self._float_base.shape)
+        for block in self._blocks(self._float_base):
+            self.index.add(np.ascontiguousarray(block))
+        self._apply_search_params()
+        logger.info(f"FAISS {self.kind} 인덱스 구축: {len(self)}개, {time.perf_counter() - start:.2f}초")
+        return self
+
+    def add(self, embeddings, normalized: bool = False) -> List[int]:
+        """임베딩 추가 - faiss 인덱스는 그대로 두고 저장 전까지 추가 행으로 정확 검색 (copy()와 공유 가능)"""
+        rows = np.ascontiguousarray(_to_float_rows(embeddings, normalized), dtype=np.float32)
+        if rows.shape[0] == 0:
+            return []
+        if self.index is None:
+            self.build(rows, normalized=True)
+            return list(range(rows.shape[0]))
+
+        start = len(self)
+        self._append_rows(rows)
+        return list(range(start, start + rows.shape[0]))
+
+    def search(self, query_embeddings, top_k: int = 5) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        쿼리 배치에 대한 근사 top-k 검색 (원본 행은 faiss, 추가 행은 정확 검색 후 합침)
+
+        Returns:
+            (scores, indices) - 각각 (Q, k) 텐서 (VectorIndex.search와 동일)
+        """
+        queries = _to_tensor(query_embeddings)
+        if queries.dim() == 1:
+            queries = queries.unsqueeze(0)
+
+        k = min(top_k, self.alive_count)
+        if k <= 0:
+            empty = torch.empty((queries.shape[0], 0))
+            return empty, empty.long()
+
+        queries = np.ascontiguousarray(_normalize(queries).numpy())
+        scores, candidates = self._search_base(queries, k)
+        if scores is None:
+            # 그래프/클러스터 탐색이 부족한 드문 경우 - 원본을 블록 단위로 읽어 정확 검색
+            scores, candidates = self._exact_topk(queries, k)
+        elif self._float_extra is not None:
+            scores, candidates = merge_topk(scores, candidates, *self._exact_topk(queries, k, extra_only=True), k)
+
+        order = np.argsort(-scores, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, order, axis=1).astype(np.float32)
+        return torch.from_numpy(top_scores), torch.from_numpy(np.take_along_axis(candidates, order, axis=1))
+
+    def _search_base(self, queries: np.ndarray, k: int) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """faiss로 원본 행 후보 검색 - 살아있는 후보가 모자라면 (None, None)"""
+        alive, alive_count = self._base_alive()
+        k = min(k, alive_count)
+        if k <= 0:
+            return empty_topk(len(queries))
+
+        dead = self.base_count - alive_count
+        fetch = k * (self.rerank_factor if self.kind == "ivfpq" else 1) + dead
+        distances, candidates = self.index.search(queries, min(fetch, self.base_count))
+        valid = candidates >= 0
+        if alive is not None:
+            valid &= alive[np.maximum(candidates, 0)]
+        if bool((valid.sum(axis=1) < k).any()):
+            return None, None
+
+        if self.kind == "ivfpq":
+            # PQ 근사 오차 제거 - 후보 행만 원본에서 읽어 정확한 점수로 재정렬
+            safe = np.maximum(candidates, 0)
+            unique_ids, inverse = np.unique(safe, return_inverse=True)
+            distances = np.einsum("qd,qkd->qk", queries, self.rows(unique_ids)[inverse.reshape(safe.shape)])
+        return np.where(valid, distances, -np.inf), candidates
+
+    def to_faiss(self):
+        """디스크 저장용 faiss 인덱스 (추가 행은 복제본에 합쳐 검색 중인 인덱스는 그대로 둠)"""
+        if self._float_extra is None:
+            return self.index
+        merged = faiss.clone_index(self.index)
+        merged.add(np.ascontiguousarray(self._float_extra, dtype=np.float32))
+        return merged
+
+
+def create_vector_index(embeddings=None, normalized: bool = False, backend: Optional[str] = None):
+    """
+    코퍼스 크기/설정에 맞는 검색 인덱스 생성
+
+    Args:
+        embeddings: (N, D) 임베딩 (None이면 빈 정확 검색 인덱스)
+        normalized: 이미 L2 정규화된 임베딩이면 True
+        backend: 'auto', 'exact', 'flat', 'hnsw', 'ivfpq' (None이면 ANN_BACKEND 설정)
+
+    Returns:
+        VectorIndex, FaissIndex 또는 QuantizedIndex (EMBEDDING_QUANTIZATION 설정 시)
+    """
+    backend = backend or ANN_BACKEND
+    if embeddings is None:
+        return VectorIndex()
+
+    if EMBEDDING_QUANTIZATION and backend == "auto":
+        # 양자화 코드로 1차 검색 후 mmap float 벡터로 재정렬 (float 행렬을 RAM에 올리지 않음)
+        try:
+            return QuantizedIndex(embeddings, normalized=normalized, kind=EMBEDDING_QUANTIZATION,
+                                  rerank_candidates=QUANTIZATION_RERANK_CANDIDATES)
+        except Exception as e:
+            logger.warning(f"{EMBEDDING_QUANTIZATION} 양자화 인덱스 구성 실패, 기본 백엔드 사용: {e}")
+
+    if backend == "auto":
+        backend = choose_backend(len(embeddings))
+    if backend == "exact":
+        return VectorIndex(embeddings, normalized=normalized)
+
+    try:
+        return FaissIndex(embeddings, normalized=normalized, kind=backend)
+    except Exception as e:
+        logger.warning(f"FAISS {backend} 인덱스 구성 실패, 정확 검색으로 대체: {e}")
+        return VectorIndex(embeddings, normalized=normalized)
+
+
+def to_faiss_index(index):
+    """검색 인덱스를 faiss 인덱스로 변환 (정확 검색은 IndexFlatIP)"""
+    if isinstance(index, FaissIndex):
+        return index.to_faiss()
+    flat = faiss.IndexFlatIP(index.dim)
+    if len(index):
+        flat.add(np.ascontiguousarray(index.embeddings.numpy(), dtype=np.float32))
+    return flat
+
+
+def from_faiss_index(faiss_index, embeddings, normalized: bool = False):
+    """저장된 faiss 인덱스 복원 (Flat이면 torch 정확 검색 사용)"""
+    if isinstance(faiss.downcast_index(faiss_index), faiss.IndexFlat):
+        return VectorIndex(embeddings, normalized=normalized)
+    return FaissIndex.from_faiss(faiss_index, _to_float_rows(embeddings, normalized))
+
+
+def save_vector_index(path: str, index, manifest_digest: str, backend: Optional[str] = None) -> bool:
+    """
+    구축 비용이 큰 인덱스를 임베딩 저장소 버전 디렉터리에 기록
+
+    Args:
+        path: 저장소 버전 디렉터리 (EmbeddingStore.path)
+        index: create_vector_index/load_vector_index로 만든 인덱스
+        manifest_digest: 같은 버전 manifest.json의 sha256
+        backend: create_vector_index와 같은 백엔드 설정 (None이면 ANN_BACKEND)
+
+    Returns:
+        기록 여부 (정확 검색이거나 현재 설정의 백엔드와 다르면 기록하지 않음)
+    """
+    kind = index_backend(index)
+    if kind not in PERSISTED_KINDS or kind != resolve_backend(len(index), backend):
+        return False
+
+    # 같은 버전을 여러 프로세스가 동시에 구축해도 서로의 임시 파일을 덮어쓰지 않도록 함
+    suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+    if isinstance(index, QuantizedIndex):
+        index.save(path)
+    else:
+        index_path = os.path.join(path, ANN_INDEX_FILE)
+        faiss.write_index(index.to_faiss(), f"{index_path}.{suffix}")
+        os.replace(f"{index_path}.{suffix}", index_path)
+
+    # 메타 파일을 마지막에 기록 - 메타가 가리키는 인덱스 파일은 완성된 상태
+    meta = {"backend": kind, "count": len(index), "manifest_sha256": manifest_digest}
+    meta_path = os.path.join(path, ANN_META_FILE)
+    with open(f"{meta_path}.{suffix}", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.{suffix}", meta_path)
+    return True
+
+
+def _read_index_meta(path: str) -> Optional[Dict]:
+    meta_path = os.path.join(path, ANN_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_vector_index(path: str, embeddings, manifest_digest: Optional[str], backend: Optional[str] = None):
+    """
+    저장소 버전 디렉터리의 인덱스를 열고, 없거나 저장소와 맞지 않을 때만 새로 구축해 기록
+
+    Args:
+        path: 저장소 버전 디렉터리 (EmbeddingStore.path)
+        embeddings: 저장소의 정규화된 (N, D) 임베딩 (mmap)
+        manifest_digest: 저장소 manifest.json의 sha256
+        backend: create_vector_index와 같은 백엔드 설정 (None이면 ANN_BACKEND)
+
+    Returns:
+        create_vector_index와 같은 종류의 검색 인덱스
+    """
+    count = len(embeddings)
+    kind = resolve_backend(count, backend)
+    if kind not in PERSISTED_KINDS or count == 0:
+        return create_vector_index(embeddings, normalized=True, backend=backend)
+
+    meta = _read_index_meta(path)
+    if meta == {"backend": kind, "count": count, "manifest_sha256": manifest_digest}:
+        try:
+            if kind in QUANTIZATION_KINDS:
+                index = QuantizedIndex.load(path, embeddings, kind,
+                                            rerank_candidates=QUANTIZATION_RERANK_CANDIDATES)
+            else:
+                index = from_faiss_index(faiss.read_index(os.path.join(path, ANN_INDEX_FILE)),
+                                         embeddings, normalized=True)
+            logger.info(f"저장된 {kind} 인덱스 로드: {count}개")
+            return index
+        except Exception as e:
+            logger.warning(f"저장된 {kind} 인덱스 로드 실패, 다시 구축합니다: {e}")
+
+    index = create_vector_index(embeddings, normalized=True, backend=backend)
+    if manifest_digest is not None:
+        try:
+            save_vector_index(path, index, manifest_digest, backend=backend)
+        except OSError as e:
+            logger.warning(f"{kind} 인덱스 저장 실패 (다음 로드 때 다시 구축): {e}")
+    return index
+
+
+def compact_vector_index(index, keep: List[int]):
+    """
+    keep 행만 남긴 검색 인덱스 (RAGIndex.compact용)
+
+    양자화 인덱스는 기존 스케일/코드북을 그대로 쓰고 코드만 골라내며,
+    그 밖의 인덱스(HNSW는 행 삭제 불가)는 남은 행으로 다시 구축한다.
+    FAISS 인덱스는 남은 행을 원본 mmap에서 블록 단위로 읽어 구축하므로 float 행렬을 복사하지 않는다.
+    """
+    if not keep:
+        return VectorIndex()
+    if isinstance(index, QuantizedIndex) and index.kind == resolve_backend(len(keep)):
+        return index.compacted(keep)
+    if isinstance(index, VectorIndex):
+        return create_vector_index(index.embeddings[keep], normalized=True)
+    return create_vector_index(RowSubset(index, keep), normalized=True)
+
+
+def benchmark_backends(embeddings, query_embeddings, top_k: int = 10,
+                       backends: Iterable[str] = ("flat", "hnsw", "ivfpq")) -> Dict[str, Dict]:
+    """
+    정확 검색 대비 ANN 백엔드의 recall@k와 지연시간 측정
+
+    Args:
+        embeddings: (N, D) 코퍼스 임베딩
+        query_embeddings: (Q, D) 쿼리 임베딩
+        top_k: 비교할 결과 수
+        backends: 측정할 백엔드 목록
+
+    Returns:
+        백엔드별 {'recall@k', 'p50_ms', 'p99_ms', 'build_s'}
+    """
+    queries = _to_tensor(query_embeddings)
+    if queries.dim() == 1:
+        queries = queries.unsqueeze(0)
+
+    def _measure(index) -> Tuple[torch.Tensor, List[float]]:
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, indices = index.search(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(indices[0])
+        return torch.stack(results), latencies
+
+    start = time.perf_counter()
+    exact = VectorIndex(embeddings)
+    exact_build = time.perf_counter() - start
+    truth, exact_latencies = _measure(exact)
+
+    report = {"exact": {
+        "recall@k": 1.0,
+        "p50_ms": float(np.percentile(exact_latencies, 50)),
+        "p99_ms": float(np.percentile(exact_latencies, 99)),
+        "build_s": exact_build
+    }}
+
+    for backend in backends:
+        start = time.perf_counter()
+        try:
+            index = FaissIndex(exact.embeddings, normalized=True, kind=backend)
+        except Exception as e:
+            # IVF-PQ는 코드북 학습에 최소 256개 이상의 벡터가 필요
+            logger.warning(f"{backend} 벤치마크 생략: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        found, latencies = _measure(index)
+
+        hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+        report[backend] = {
+            "recall@k": hits / truth.numel(),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "build_s": build_s
+        }
+    return report
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+의미 기반 답변 캐시
+
+"FT-101의 역할은?"처럼 표현만 다른 반복 질문에 gpt-4o-mini를 다시 호출하지 않도록
+(쿼리 임베딩 유사도, 답변에 사용한 컨텍스트 지문)으로 이전 답변을 찾는다.
+컨텍스트 지문은 RAG 청크 해시와 참조 도면 ID로 만들고, 질문의 계측기 태그가 다르면
+(FT-101 vs FT-102) 유사도가 높아도 적중으로 보지 않는다.
+
+무효화는 출처 단위로만 한다. 문서가 다시 수집되거나 삭제되면 그 문서의 청크를 쓴 답변을,
+도면에 새 버전이 저장되면 그 도면을 참조한 답변을 지운다. 관련 없는 답변은 그대로 두고
+TTL/LRU로만 밀려난다. (새로 수집된 청크가 검색되면 청크 해시가 달라져 지문으로 걸러진다)
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from config.user_config import ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS
+from utils.bm25_index import extract_tags
+
+
+def context_fingerprint(chunk_hashes: Iterable[str] = (), drawing_ids: Iterable = (), **options) -> str:
+    """답변에 사용한 컨텍스트의 지문 (순서 무관)"""
+    parts = [
+        "chunks:" + ",".join(sorted(str(h) for h in chunk_hashes)),
+        "drawings:" + ",".join(sorted(str(d) for d in drawing_ids)),
+        "options:" + ",".join(f"{k}={options[k]}" for k in sorted(options))
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    """캐시된 답변"""
+    vector: np.ndarray
+    fingerprint: str
+    tags: FrozenSet[str]
+    drawings: FrozenSet[str]
+    response: Dict
+    sources: FrozenSet[str] = frozenset()
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class AnswerCache:
+    """쿼리 임베딩 유사도 + 컨텍스트 지문 기반 답변 LRU 캐시 (TTL, 스레드 안전)"""
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        """
+        Args:
+            max_size: 최대 답변 수 (넘으면 가장 오래 쓰지 않은 답변부터 제거)
+            ttl_seconds: 답변 유효 시간
+            similarity_threshold: 적중으로 볼 최소 쿼리 코사인 유사도
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def _unit(query_embedding) -> np.ndarray:
+        if hasattr(query_embedding, "detach"):
+            query_embedding = query_embedding.detach().cpu().numpy()
+        vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, query: str, query_embedding, fingerprint: str) -> Optional[Dict]:
+        """
+        같은 컨텍스트로 답한 유사 질문의 답변 조회
+
+        Returns:
+            캐시된 응답 dict (cache_hit, cache_similarity 포함) 또는 None
+        """
+        vector = self._unit(query_embedding)
+        tags = frozenset(extract_tags(query))
+        with self._lock:
+            self._expire(time.time())
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in self._entries.items():
+                if entry.fingerprint != fingerprint or entry.tags != tags:
+                    continue
+                score = float(entry.vector @ vector)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            entry.hits += 1
+            self.hits += 1
+            return {**entry.response, "cache_hit": True, "cache_similarity": best_score}
+
+    def put(self, query: str, query_embedding, fingerprint: str, response: Dict,
+            drawings: Iterable[str] = (), sources: Iterable[str] = ()):
+        """
+        답변 저장
+
+        Args:
+            drawings: 답변에 참조한 도면명 (새 버전 저장 시 무효화 기준)
+            sources: 답변에 사용한 청크의 출처 문서 (재수집/삭제 시 무효화 기준)
+        """
+        entry = CachedAnswer(
+            vector=self._unit(query_embedding),
+            fingerprint=fingerprint,
+            tags=frozenset(extract_tags(query)),
+            drawings=frozenset(d for d in drawings if d),
+            response=dict(response),
+            sources=frozenset(s for s in sources if s),
+            created_at=time.time()
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _invalidate(self, predicate, label: str) -> int:
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if predicate(entry)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+        if stale:
+            logger.info(f"{label} 변경으로 캐시된 답변 {len(stale)}개 무효화")
+        return len(stale)
+
+    def invalidate_drawing(self, d_name: str) -> int:
+        """도면을 참조한 답변 제거 - 제거된 답변 수 반환"""
+        return self._invalidate(lambda entry: d_name in entry.drawings, f"도면 '{d_name}'")
+
+    def invalidate_source(self, source: str) -> int:
+        """문서의 청크를 사용한 답변 제거 - 제거된 답변 수 반환"""
+        return self._invalidate(lambda entry: source in entry.sources, f"문서 '{source}'")
+
+    def stats(self) -> Dict:
+        """적중/미스/무효화 통계"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidated": self.invalidated,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """프로세스 공용 답변 캐시"""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+
+def invalidate_cached_answers(source: Optional[str] = None, drawing: Optional[str] = None) -> int:
+    """
+    인덱스 갱신 후 호출 - 공용 캐시에서 해당 문서/도면을 쓴 답변만 제거
+
+    캐시를 쓰지 않는 프로세스에서 빈 캐시를 만들지 않도록, 공용 캐시가 있을 때만 동작한다.
+    """
+    cache = _answer_cache
+    if cache is None:
+        return 0
+    removed = 0
+    if source:
+        removed += cache.invalidate_source(source)
+    if drawing:
+        removed += cache.invalidate_drawing(drawing)
+    return removed
@@ -17,7 +17,7 @@ from io import BytesIO
 from utils.naver_ocr import process_image_with_ocr
 from services.merge_json import merge_ocr_and_detection_results
 from config.database_config import get_db_connection
-from config.user_config import USER_NAME
+from config.user_config import USER_NAME, DRAWING_INDEX_ENABLED
 
 def clean_filename(filename: str) -> str:
     """
@@ -326,6 +326,21 @@ def save_to_database(integrated_data: Dict, image_path: str, original_filename:
             'db_id': db_id
         })
         
+        # 새 버전이 저장된 도면을 참조한 캐시 답변 무효화
+        try:
+            from utils.answer_cache import get_answer_cache
+            get_answer_cache().invalidate_drawing(base_filename)
+        except Exception as e:
+            print(f"⚠️ 답변 캐시 무효화 실패: {e}")
+        
+        # 도면 검색 인덱스에 새 도면만 증분 반영 (실패해도 저장 결과에는 영향 없음)
+        if DRAWING_INDEX_ENABLED:
+            try:
+                from utils.drawing_index import get_drawing_index
+                get_drawing_index().upsert_drawing(db_id, base_filename, integrated_data)
+            except Exception as e:
+                print(f"⚠️ 도면 검색 인덱스 갱신 실패: {e}")
+        
     except Exception as e:
         result['error_message'] = f"데이터베이스 저장 오류: {str(e)}"
         if 'conn' in locals():
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Kiwi 형태소 기반 BM25 역색인과 하이브리드 순위 결합
+
+MiniLM 같은 밀집 임베딩은 FIC-101 같은 계측기 태그를 정확히 구분하지 못하므로,
+형태소/태그 토큰에 대한 BM25 점수를 함께 계산해 RRF(Reciprocal Rank Fusion)로 합친다.
+태그는 'FIC-101', 'FIC 101', 'FIC_101'을 모두 'FIC101' 하나의 토큰으로 정규화한다.
+
+태그 일치는 유사도 임계값 미달 청크도 통과시키고 답변 캐시 키를 나누므로 오탐이 비싸다.
+그래서 ISA 5.1식 대문자 접두어만 태그로 보고, 구분자가 없거나 공백인 표기는 더 엄격하게 본다
+('page 12', 'in 2023', 'DN 100', 'ISO 9001'은 태그가 아님).
+"""
+
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+BM25_FILE = "bm25.json"
+
+# 계측기 태그 (대문자 ISA 접두어 + 루프 번호, 접미 대문자 1자 허용)
+#   FT-101, P-101A, LIC_301  : 접두어 1~4자 + '-'/'_' + 숫자 2~4자리
+#   FIC101, FIC 101          : 접두어 2~4자 + (공백) + 숫자 3~4자리
+TAG_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9])"
+    r"(?:([A-Z]{1,4})[\-_](\d{2,4}[A-Z]?)|([A-Z]{2,4}) ?(\d{3,4}[A-Z]?))"
+    r"(?![A-Za-z0-9])"
+)
+
+# 태그처럼 보이지만 규격/배관 치수/문서 표기인 접두어
+NON_TAG_PREFIXES = frozenset({
+    "DN", "PN", "NPS", "SCH", "API", "ISO", "IEC", "ANSI", "ASME", "ASTM", "DIN", "JIS", "KS",
+    "REV", "NO", "FIG", "PAGE", "TAB", "SEC"
+})
+
+# BM25에 사용할 Kiwi 품사 (명사, 수사, 외국어/한자/숫자, 어근, 동사/형용사)
+KEEP_TAG_PREFIXES = ("NN", "NR", "SL", "SH", "SN", "XR", "VV", "VA")
+
+
+def _match_tag(match: re.Match) -> Optional[str]:
+    """TAG_PATTERN 매치를 정규화된 태그로 (규격/치수 접두어면 None)"""
+    letters = match.group(1) or match.group(3)
+    number = match.group(2) or match.group(4)
+    if letters in NON_TAG_PREFIXES:
+        return None
+    return f"{letters}{number}"
+
+
+def extract_tags(text: str) -> List[str]:
+    """텍스트에서 정규화된 계측기 태그 추출 (예: 'FIC-101' → 'FIC101')"""
+    return [tag for tag in map(_match_tag, TAG_PATTERN.finditer(text)) if tag]
+
+
+def normalize_tags(text: str) -> str:
+    """텍스트 내 계측기 태그 표기를 통일"""
+    return TAG_PATTERN.sub(lambda m: _match_tag(m) or m.group(0), text)
+
+
+def kiwi_tokenize(kiwi, texts: Sequence[str]) -> List[List[str]]:
+    """
+    BM25용 토큰화 - Kiwi 형태소 + 정규화된 태그 토큰
+
+    Args:
+        kiwi: kiwipiepy.Kiwi 인스턴스
+        texts: 텍스트 목록 (Kiwi 배치 분석으로 한 번에 처리)
+    """
+    normalized = [normalize_tags(text) for text in texts]
+    token_lists = []
+    for text, tokens in zip(normalized, kiwi.tokenize(normalized)):
+        terms = [token.form.lower() for token in tokens if token.tag.startswith(KEEP_TAG_PREFIXES)]
+        terms.extend(tag.lower() for tag in extract_tags(text))
+        token_lists.append(terms)
+    return token_lists
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    여러 순위 목록을 RRF로 결합
+
+    Args:
+        rankings: 문서 인덱스 순위 목록들 (앞쪽이 상위)
+        k: 순위 완화 상수 (클수록 하위 순위의 기여가 커짐)
+
+    Returns:
+        (문서 인덱스, RRF 점수) 목록 - 점수 내림차순
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """BM25 역색인 (행 번호는 벡터 인덱스와 동일하게 유지)
+
+    삭제는 벡터 인덱스처럼 삭제 표시만 하고, compact()에서 실제로 제거한다.
+    copy()한 사본과 원본은 단어별 게시 목록을 공유하고, add()가 건드리는 단어만 새로 복사한다.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: List[int] = []
+        self.deleted = set()
+        self._total_length = 0
+        self._owned_terms: Optional[set] = None  # None이면 모든 게시 목록을 단독 소유
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def alive_count(self) -> int:
+        return len(self.doc_lengths) - len(self.deleted)
+
+    def copy(self) -> "BM25Index":
+        """게시 목록을 공유하는 사본 (이후 어느 쪽도 공유 중인 게시 목록을 직접 고치지 않음)"""
+        clone = BM25Index(k1=self.k1, b=self.b)
+        clone.postings = dict(self.postings)
+        clone.doc_lengths = list(self.doc_lengths)
+        clone.deleted = set(self.deleted)
+        clone._total_length = self._total_length
+        clone._owned_terms = set()
+        self._owned_terms = set()
+        return clone
+
+    def _writable_postings(self, term: str) -> Dict[int, int]:
+        """term의 게시 목록 (다른 사본과 공유 중이면 먼저 복사)"""
+        docs = self.postings.get(term)
+        if docs is None or (self._owned_terms is not None and term not in self._owned_terms):
+            docs = self.postings[term] = dict(docs or {})
+            if self._owned_terms is not None:
+                self._owned_terms.add(term)
+        return docs
+
+    def add(self, token_lists: Iterable[List[str]]) -> List[int]:
+        """문서 추가 - 추가된 행 번호 반환"""
+        added = []
+        for tokens in token_lists:
+            doc_id = len(self.doc_lengths)
+            for term, tf in Counter(tokens).items():
+                self._writable_postings(term)[doc_id] = tf
+            self.doc_lengths.append(len(tokens))
+            self._total_length += len(tokens)
+            added.append(doc_id)
+        return added
+
+    def remove(self, indices: Iterable[int]):
+        """문서 삭제 표시"""
+        for idx in indices:
+            if idx not in self.deleted:
+                self.deleted.add(idx)
+                self._total_length -= self.doc_lengths[idx]
+
+    def compact(self, keep: Sequence[int]):
+        """keep 순서대로 행 번호를 다시 매기고 나머지 문서 제거"""
+        remap = {old: new for new, old in enumerate(keep)}
+        postings = {}
+        for term, docs in self.postings.items():
+            kept = {remap[d]: tf for d, tf in docs.items() if d in remap}
+            if kept:
+                postings[term] = kept
+        self.postings = postings
+        self._owned_terms = None
+        self.doc_lengths = [self.doc_lengths[i] for i in keep]
+        self.deleted = set()
+        self._total_length = sum(self.doc_lengths)
+
+    def search(self, query_tokens: List[str], top_k: int = 20) -> List[Tuple[int, float]]:
+        """
+        BM25 검색
+
+        Returns:
+            (행 번호, BM25 점수) 목록 - 점수 내림차순
+        """
+        num_docs = self.alive_count
+        if num_docs <= 0 or not query_tokens:
+            return []
+
+        avg_length = self._total_length / num_docs or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(query_tokens):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            df = sum(1 for d in docs if d not in self.deleted)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in docs.items():
+                if doc_id in self.deleted:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def has_term(self, doc_id: int, term: str) -> bool:
+        """문서에 토큰이 포함되어 있는지 (태그 일치 판정용)"""
+        return doc_id in self.postings.get(term, {})
+
+    def save(self, path: str):
+        """디렉터리에 JSON으로 저장 (임시 파일 후 교체)"""
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, BM25_FILE)
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "deleted": sorted(self.deleted),
+            "postings": {term: [[d, tf] for d, tf in docs.items()] for term, docs in self.postings.items()}
+        }
+        with open(f"{file_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(f"{file_path}.tmp", file_path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """저장된 역색인 로드 (없거나 손상되면 None)"""
+        file_path = os.path.join(path, BM25_FILE)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            index = cls(k1=data["k1"], b=data["b"])
+            index.doc_lengths = data["doc_lengths"]
+            index.postings = {term: {d: tf for d, tf in docs} for term, docs in data["postings"].items()}
+            index.deleted = set()
+            index._total_length = sum(index.doc_lengths)
+            index.remove(data.get("deleted", []))
+            return index
+        except Exception as e:
+            logger.warning(f"BM25 색인 로드 실패, 재구축 필요: {e}")
+            return None
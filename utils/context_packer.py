@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+토큰 예산 기반 LLM 컨텍스트 패킹
+
+선택된 도면의 OCR 문자열과 탐지 박스를 한 줄씩 모두 나열하면 프롬프트가 지나치게 커지므로,
+모델 토크나이저(tiktoken, 쓸 수 없으면 근사치)로 토큰을 세면서
+    - 반복되는 OCR 문자열은 "텍스트 ×개수"로 합치고
+    - 탐지 결과는 라벨별 개수와 대표 좌표로 묶고
+    - 질문에 나온 계측기 태그 → 상위 RAG 청크 → 나머지 순서로 예산을 채운 뒤
+빠진 항목을 보고한다.
+"""
+
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from loguru import logger
+
+from config.user_config import CONTEXT_PACKER_MODEL, CONTEXT_TOKEN_BUDGET
+from utils.bm25_index import extract_tags
+from utils.drawing_fields import extract_detections, extract_ocr_fields
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 우선순위 (작을수록 먼저 채움)
+PRIORITY_QUERY_TAG = 0      # 질문에 나온 태그와 그 도면 헤더
+PRIORITY_RAG_TOP = 1        # 상위 RAG 청크 / 도면 검색 결과
+PRIORITY_TAG = 2            # 질문과 무관한 계측기 태그
+PRIORITY_DETECTION = 3      # 라벨별 탐지 요약
+PRIORITY_TEXT = 4           # 일반 OCR 텍스트
+PRIORITY_STRUCTURE = 5      # JSON 구조 설명 등 부가 정보
+
+OCR_LINES_PER_ITEM = 20     # 일반 OCR 텍스트를 묶는 줄 수 (예산을 줄 단위보다 굵게 채움)
+DETECTION_SAMPLE_POSITIONS = 3
+
+_encodings = {}
+
+
+def _encoding(model: str):
+    """모델 토크나이저 (tiktoken이 없거나 인코딩 파일을 받을 수 없으면 None)"""
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # 오프라인 배포 등으로 BPE 파일을 받지 못하면 근사치 사용
+            logger.warning(f"tiktoken 인코딩 로드 실패, 토큰 수 근사치 사용: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = CONTEXT_PACKER_MODEL) -> int:
+    """모델 토크나이저 기준 토큰 수 (토크나이저를 쓸 수 없으면 보수적 근사: 2자당 1토큰)"""
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is None:
+        return math.ceil(len(text) / 2)
+    return len(encoding.encode(text))
+
+
+@dataclass
+class ContextItem:
+    """컨텍스트 한 항목"""
+    section: str
+    text: str
+    priority: float
+    key: str = ""
+
+
+@dataclass
+class PackedContext:
+    """패킹 결과"""
+    sections: Dict[str, str]
+    used_tokens: int
+    budget_tokens: int
+    included: List[ContextItem] = field(default_factory=list)
+    dropped: List[Dict] = field(default_factory=list)
+
+    def section(self, name: str) -> str:
+        return self.sections.get(name, "")
+
+    def report(self) -> Dict:
+        """디버그 표시용 요약"""
+        return {
+            "used_tokens": self.used_tokens,
+            "budget_tokens": self.budget_tokens,
+            "included_items": len(self.included),
+            "dropped_items": len(self.dropped),
+            "dropped_tokens": sum(d["tokens"] for d in self.dropped),
+            "dropped": self.dropped
+        }
+
+
+class ContextPacker:
+    """우선순위대로 토큰 예산을 채우는 컨텍스트 패커"""
+
+    def __init__(self, budget_tokens: int = CONTEXT_TOKEN_BUDGET, model: str = CONTEXT_PACKER_MODEL):
+        self.budget_tokens = budget_tokens
+        self.model = model
+
+    def pack(self, items: Sequence[ContextItem], headers: Optional[Dict[str, str]] = None) -> PackedContext:
+        """
+        항목을 우선순위 순으로 예산 안에 채우고 섹션별 텍스트로 조립
+
+        Args:
+            items: 컨텍스트 항목 (같은 우선순위는 입력 순서 유지)
+            headers: 섹션별 머리말 (해당 섹션에 항목이 하나라도 들어가면 포함되며 예산에 계산)
+        """
+        headers = headers or {}
+        used = 0
+        seen_texts = set()
+        opened_sections = set()
+        included, dropped = [], []
+
+        for order, item in sorted(enumerate(items), key=lambda pair: (pair[1].priority, pair[0])):
+            if item.text in seen_texts:
+                dropped.append({"section": item.section, "key": item.key, "tokens": 0, "reason": "duplicate"})
+                continue
+            cost = count_tokens(item.text + "\n", self.model)
+            if item.section not in opened_sections and headers.get(item.section):
+                cost += count_tokens(headers[item.section] + "\n", self.model)
+
+            if used + cost > self.budget_tokens:
+                dropped.append({"section": item.section, "key": item.key, "tokens": cost, "reason": "budget"})
+                continue
+
+            used += cost
+            seen_texts.add(item.text)
+            opened_sections.add(item.section)
+            included.append((order, item))
+
+        # 섹션 안에서는 원래 순서대로 출력 (도면별 묶음 유지)
+        lines_by_section: Dict[str, List[str]] = defaultdict(list)
+        for _, item in sorted(included, key=lambda pair: pair[0]):
+            lines_by_section[item.section].append(item.text)
+
+        sections = {}
+        for section, lines in lines_by_section.items():
+            header = headers.get(section)
+            sections[section] = "\n".join(([header] if header else []) + lines)
+
+        if dropped:
+            budget_drops = [d for d in dropped if d["reason"] == "budget"]
+            logger.info(f"컨텍스트 패킹: {used}/{self.budget_tokens} 토큰, "
+                        f"예산 초과 {len(budget_drops)}개 ({sum(d['tokens'] for d in budget_drops)} 토큰), "
+                        f"중복 {len(dropped) - len(budget_drops)}개 제외")
+        return PackedContext(sections=sections, used_tokens=used, budget_tokens=self.budget_tokens,
+                             included=[item for _, item in included], dropped=dropped)
+
+
+def drawing_context_items(section: str, index: int, file_name: str, file_id, json_data: Optional[Dict],
+                          query_tags: Iterable[str], image_path: Optional[str] = None) -> List[ContextItem]:
+    """
+    선택된 도면 하나의 OCR/탐지 결과를 압축된 컨텍스트 항목으로 변환
+
+    Args:
+        section: 항목이 들어갈 섹션명
+        index: 도면 번호 (1부터)
+        file_name, file_id: 도면명과 ID
+        json_data: 도면 통합 JSON
+        query_tags: 질문에 나온 정규화된 계측기 태그 (예: 'FT101')
+        image_path: 도면 이미지 경로
+    """
+    query_tags = set(query_tags)
+    key_prefix = f"{file_name}#{file_id}"
+    ocr_counts = Counter(text for text, _ in extract_ocr_fields(json_data or {}))
+    detections = extract_detections(json_data or {})
+
+    header = f"\n**📋 P&ID 도면 {index}: {file_name} (ID: {file_id})**"
+    header += f"\n- 📷 도면 이미지 경로: {image_path}" if image_path else "\n- 📷 도면 이미지: 없음"
+    if not json_data:
+        header += "\n- 📊 AI 탐지 데이터: 없음"
+    else:
+        header += f"\n- OCR 텍스트 {sum(ocr_counts.values())}개(고유 {len(ocr_counts)}개), 탐지 기호 {len(detections)}개"
+    items = [ContextItem(section, header, PRIORITY_QUERY_TAG, f"{key_prefix}:header")]
+
+    # OCR: 질문 태그 → 다른 태그 → 일반 텍스트 (반복 문자열은 개수로 합침)
+    def _line(text: str, count: int) -> str:
+        return f'  • "{text}"' + (f" ×{count}" if count > 1 else "")
+
+    query_tag_lines, tag_lines, text_lines = [], [], []
+    for text, count in ocr_counts.items():
+        tags = set(extract_tags(text))
+        if tags & query_tags:
+            query_tag_lines.append(_line(text, count))
+        elif tags:
+            tag_lines.append(_line(text, count))
+        else:
+            text_lines.append(_line(text, count))
+
+    if query_tag_lines:
+        items.append(ContextItem(section, "- 🎯 질문 관련 태그:\n" + "\n".join(query_tag_lines),
+                                 PRIORITY_QUERY_TAG, f"{key_prefix}:query-tags"))
+    if tag_lines:
+        items.append(ContextItem(section, "- 📝 계측기 태그:\n" + "\n".join(tag_lines),
+                                 PRIORITY_TAG, f"{key_prefix}:tags"))
+    for start in range(0, len(text_lines), OCR_LINES_PER_ITEM):
+        items.append(ContextItem(section, "- 📝 OCR 텍스트:\n" + "\n".join(text_lines[start:start + OCR_LINES_PER_ITEM]),
+                                 PRIORITY_TEXT + start / max(len(text_lines), 1), f"{key_prefix}:ocr[{start}]"))
+
+    # 탐지: 라벨별 개수와 대표 좌표
+    positions = defaultdict(list)
+    for label, center in detections:
+        positions[label].append(center)
+    if positions:
+        lines = []
+        for label, centers in sorted(positions.items(), key=lambda pair: -len(pair[1])):
+            samples = [f"({x:.0f}, {y:.0f})" for x, y in (c for c in centers if c)][:DETECTION_SAMPLE_POSITIONS]
+            lines.append(f"  • 🔧 {label} ×{len(centers)}" + (f" 예: {', '.join(samples)}" if samples else ""))
+        items.append(ContextItem(section, "- 🎯 객체 탐지 결과 (라벨별):\n" + "\n".join(lines),
+                                 PRIORITY_DETECTION, f"{key_prefix}:detections"))
+
+    if isinstance(json_data, dict):
+        items.append(ContextItem(section, f"- 📊 AI 탐지 데이터 구조: {', '.join(json_data.keys())}",
+                                 PRIORITY_STRUCTURE, f"{key_prefix}:structure"))
+    return items
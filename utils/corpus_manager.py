@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+문서별 샤드로 나눈 다중 문서 코퍼스 관리
+
+데이터 디렉터리의 문서마다 별도 RAGIndex 샤드(state/shards/<문서>)를 두어
+문서 추가/삭제가 다른 샤드에 영향을 주지 않도록 하고,
+검색은 모든 샤드를 병렬로 조회한 뒤 전역 top-k로 합친다.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from loguru import logger
+
+from config.user_config import CORPUS_EXTENSIONS, CORPUS_SEARCH_WORKERS, CORPUS_SHARD_DIR
+from utils.answer_cache import invalidate_cached_answers
+from utils.bm25_index import reciprocal_rank_fusion
+from utils.embedding_store import file_sha256, remove_embedding_store, store_exists
+from utils.rag_index import RAGIndex
+
+
+def shard_slug(source: str) -> str:
+    """문서명 → 샤드 디렉터리명 (파일시스템 안전 문자 + 이름 해시로 충돌 방지)"""
+    stem = re.sub(r"[^\w가-힣.-]+", "_", os.path.splitext(source)[0]).strip("_") or "doc"
+    return f"{stem[:60]}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]}"
+
+
+class CorpusManager:
+    """문서 하나당 RAGIndex 샤드 하나를 관리하는 코퍼스
+
+    샤드 목록은 갱신 시 새 딕셔너리로 교체하고, 문서 갱신은 새 RAGIndex 인스턴스에서 저장까지 마친 뒤
+    교체하므로 검색 중에 문서가 추가/삭제되어도 진행 중인 검색은 이전 샤드를 그대로 본다.
+    """
+
+    def __init__(self, shard_root: str = CORPUS_SHARD_DIR, model_name: Optional[str] = None,
+                 encode_fn: Optional[Callable[[List[str]], object]] = None,
+                 chunk_fn: Optional[Callable[[str, str], Iterable[Dict]]] = None,
+                 tokenizer: Optional[Callable[[List[str]], List[List[str]]]] = None,
+                 max_workers: int = CORPUS_SEARCH_WORKERS):
+        """
+        Args:
+            shard_root: 샤드 디렉터리 루트
+            model_name: 임베딩 모델명 (샤드 저장소와 다르면 해당 샤드 재구축)
+            encode_fn: 텍스트 목록 → (N, D) 임베딩
+            chunk_fn: (문서 경로, 파일 해시) → 청크 dict 목록 (content, page 등)
+            tokenizer: BM25용 배치 토크나이저
+            max_workers: 샤드 병렬 검색 스레드 수
+        """
+        self.shard_root = shard_root
+        self.model_name = model_name
+        self.encode_fn = encode_fn
+        self.chunk_fn = chunk_fn
+        self.tokenizer = tokenizer
+        self.shards: Dict[str, RAGIndex] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="corpus-search")
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards.values())
+
+    @property
+    def sources(self) -> List[str]:
+        return sorted(self.shards)
+
+    def _new_shard(self, source: str) -> RAGIndex:
+        return RAGIndex(os.path.join(self.shard_root, shard_slug(source)),
+                        model_name=self.model_name, tokenizer=self.tokenizer)
+
+    def load(self) -> int:
+        """저장된 샤드 로드 - 로드한 샤드 수 반환"""
+        shards = {}
+        if os.path.isdir(self.shard_root):
+            for name in sorted(os.listdir(self.shard_root)):
+                path = os.path.join(self.shard_root, name)
+                if not store_exists(path):
+                    continue
+                shard = RAGIndex(path, model_name=self.model_name, tokenizer=self.tokenizer)
+                if not shard.load() or not shard.sources:
+                    logger.warning(f"샤드 로드 실패 또는 출처 정보 없음, 건너뜀: {path}")
+                    continue
+                for source in shard.sources:
+                    shards[source] = shard
+        with self._lock:
+            previous, self.shards = self.shards, shards
+        for shard in set(previous.values()) - set(shards.values()):
+            shard.close()
+        logger.info(f"코퍼스 샤드 로드: {len(shards)}개 문서, {len(self)}개 청크")
+        return len(shards)
+
+    def add_document(self, path: str) -> Dict:
+        """
+        문서 하나를 자기 샤드에 증분 반영 (다른 샤드는 건드리지 않음)
+
+        Returns:
+            {'added', 'removed', 'unchanged'} 청크 수 (변경 없으면 'skipped': True)
+        """
+        source = os.path.basename(path)
+        file_hash = file_sha256(path)
+        live = self.shards.get(source)
+
+        if live is not None and live.is_source_current(source, file_hash):
+            logger.info(f"변경 없는 문서, 수집 생략: {source}")
+            return {'added': 0, 'removed': 0, 'unchanged': live.sources[source].get('chunk_count', 0), 'skipped': True}
+
+        chunk_dicts = list(self.chunk_fn(path, file_hash))
+        if not chunk_dicts:
+            raise ValueError(f"문서 텍스트 추출 실패: {path}")
+
+        # 검색 중인 샤드는 건드리지 않고 저장소에서 새 인스턴스를 열어 갱신/저장한 뒤 교체
+        with self._write_lock:
+            shard = self._new_shard(source)
+            shard.load()
+            stats = shard.upsert_source(source, chunk_dicts, self.encode_fn, file_hash=file_hash)
+            shard.save()
+            with self._lock:
+                previous = self.shards.get(source)
+                self.shards = {**self.shards, source: shard}
+            if previous is not None:
+                previous.close()
+        invalidate_cached_answers(source=source)
+        return stats
+
+    def drop_document(self, source: str) -> bool:
+        """문서 샤드 삭제"""
+        with self._write_lock:
+            with self._lock:
+                shard = self.shards.get(source)
+                if shard is None:
+                    return False
+                self.shards = {s: index for s, index in self.shards.items() if s != source}
+            shard.close()
+            remove_embedding_store(shard.path)
+            shutil.rmtree(shard.path, ignore_errors=True)
+        invalidate_cached_answers(source=source)
+        logger.info(f"코퍼스에서 문서 제거: {source}")
+        return True
+
+    def sync(self, data_dir: str, extensions: Sequence[str] = CORPUS_EXTENSIONS) -> Dict[str, Dict]:
+        """
+        데이터 디렉터리와 샤드를 맞춤 - 새/변경 문서는 수집하고 사라진 문서의 샤드는 삭제
+
+        Returns:
+            문서별 수집 통계 (실패한 문서는 {'error': 메시지}, 삭제된 문서는 {'dropped': True})
+        """
+        if not self.shards:
+            self.load()
+
+        paths = {}
+        if os.path.isdir(data_dir):
+            for name in sorted(os.listdir(data_dir)):
+                if name.lower().endswith(tuple(extensions)):
+                    paths[name] = os.path.join(data_dir, name)
+
+        results = {}
+        for source, path in paths.items():
+            try:
+                results[source] = self.add_document(path)
+            except Exception as e:
+                logger.error(f"문서 수집 실패 ({source}): {e}")
+                results[source] = {'error': str(e)}
+
+        for source in set(self.shards) - set(paths):
+            if self.drop_document(source):
+                results[source] = {'dropped': True}
+        return results
+
+    def _map_shards(self, fn: Callable[[RAGIndex], List]) -> List:
+        """모든 샤드에 fn을 병렬 적용 (샤드가 하나면 현재 스레드에서 실행)"""
+        shards = list(self.shards.values())
+        if len(shards) <= 1:
+            return [fn(shard) for shard in shards]
+        return list(self._executor.map(fn, shards))
+
+    def search(self, query_embeddings, top_k: int = 5) -> List[List[Dict]]:
+        """
+        쿼리 배치 밀집 검색 - 샤드별 top-k를 코사인 유사도로 합쳐 전역 top-k
+
+        Returns:
+            쿼리별 결과 목록 (RAGIndex.search와 같은 필드, index는 샤드 내 행 번호)
+        """
+        per_shard = self._map_shards(lambda shard: shard.search(query_embeddings, top_k) if len(shard) else [])
+        merged = []
+        for hits_per_query in zip(*[results for results in per_shard if results]):
+            hits = [hit for hits in hits_per_query for hit in hits]
+            merged.append(sorted(hits, key=lambda hit: hit["score"], reverse=True)[:top_k])
+        return merged
+
+    def hybrid_search(self, query: str, query_embedding, top_k: int = 5,
+                      candidates: int = 20, rrf_k: int = 60) -> List[Dict]:
+        """
+        샤드 병렬 하이브리드 검색
+
+        샤드 안의 RRF 순위는 샤드끼리 비교할 수 없으므로, 샤드별 후보를 모은 뒤 RRF를
+        다시 계산한다. 밀집 순위는 코사인 유사도가 샤드와 무관하므로 전역으로 정렬하고,
+        BM25 점수는 샤드마다 IDF·평균 문서 길이가 달라 비교할 수 없으므로
+        샤드별 BM25 순위를 번갈아 끼워(round-robin) 전역 희소 순위로 쓴다.
+        """
+        per_shard = self._map_shards(
+            lambda shard: shard.hybrid_search(query, query_embedding, candidates, candidates, rrf_k) if len(shard) else []
+        )
+        hits = [hit for shard_hits in per_shard for hit in shard_hits]
+        if not hits:
+            return []
+
+        dense_ranking = sorted(range(len(hits)), key=lambda i: hits[i]["score"], reverse=True)[:candidates]
+
+        shard_rankings, offset = [], 0
+        for shard_hits in per_shard:
+            ranked = sorted((offset + i for i, hit in enumerate(shard_hits) if hit.get("bm25_rank") is not None),
+                            key=lambda i: hits[i]["bm25_rank"])
+            shard_rankings.append(ranked)
+            offset += len(shard_hits)
+        sparse_ranking = [i for tier in zip_longest(*shard_rankings) for i in tier if i is not None][:candidates]
+
+        merged = []
+        for i, rrf_score in reciprocal_rank_fusion([dense_ranking, sparse_ranking], k=rrf_k)[:top_k]:
+            hit = dict(hits[i])
+            hit["rrf_score"] = rrf_score
+            merged.append(hit)
+        return merged
+
+    def shard_report(self) -> List[Dict]:
+        """문서별 샤드 정보"""
+        return [
+            {
+                "source": source,
+                "path": shard.path,
+                "chunks": len(shard),
+                "updated_at": shard.sources.get(source, {}).get("updated_at")
+            }
+            for source, shard in sorted(self.shards.items())
+        ]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+도면 json_data 필드 추출
+
+domyun.json_data의 OCR 텍스트와 객체 탐지 결과를 (텍스트/라벨, 중심 좌표) 목록으로 꺼낸다.
+도면 인덱스, 컨텍스트 패커, 챗봇이 같은 규칙을 쓰도록 모아 둔 순수 함수 모듈이며
+DB/임베딩 스택에 의존하지 않는다.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+def _center(points: List[Dict]) -> Optional[Tuple[float, float]]:
+    xs = [p.get("x", 0) for p in points]
+    ys = [p.get("y", 0) for p in points]
+    if not xs:
+        return None
+    return sum(xs) / len(xs), sum(ys) / len(ys)
+
+
+def extract_ocr_fields(json_data: Dict) -> List[Tuple[str, Optional[Tuple[float, float]]]]:
+    """OCR 텍스트와 중심 좌표 목록 ('ocr' 또는 구버전 'ocr_data' 구조)"""
+    ocr_data = json_data.get("ocr") or json_data.get("ocr_data") or {}
+    fields = []
+    for image in ocr_data.get("images", []) if isinstance(ocr_data, dict) else []:
+        for field in image.get("fields", []):
+            text = (field.get("inferText") or "").strip()
+            if text:
+                vertices = field.get("boundingPoly", {}).get("vertices", [])
+                fields.append((text, _center(vertices)))
+    return fields
+
+
+def extract_detections(json_data: Dict) -> List[Tuple[str, Optional[Tuple[float, float]]]]:
+    """탐지 기호 라벨과 중심 좌표 목록 (detection_data / detecting / boxes 구조)"""
+    boxes = []
+    if isinstance(json_data.get("detection_data"), dict):
+        boxes = json_data["detection_data"].get("detections", [])
+    elif isinstance(json_data.get("detecting"), dict):
+        detecting = json_data["detecting"]
+        data = detecting.get("data")
+        boxes = data.get("boxes", []) if isinstance(data, dict) else detecting.get("detections", [])
+    elif isinstance(json_data.get("boxes"), list):
+        boxes = json_data["boxes"]
+
+    detections = []
+    for box in boxes if isinstance(boxes, list) else []:
+        if not isinstance(box, dict):
+            continue
+        bbox = box.get("boundingBox", box)
+        center = None
+        if all(k in bbox for k in ("x", "y")):
+            center = (bbox["x"] + bbox.get("width", 0) / 2, bbox["y"] + bbox.get("height", 0) / 2)
+        detections.append((str(box.get("label", "Unknown")), center))
+    return detections
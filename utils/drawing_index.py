@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+등록 도면 검색 인덱스
+
+domyun.json_data의 OCR 텍스트/계측기 태그/객체 탐지 결과를 도면별 요약 청크로 만들어
+별도 RAGIndex(state/drawing_index)에 임베딩한다. 도면 하나가 출처 하나(d_id)이며,
+save_to_database가 새 레코드를 넣을 때마다 해당 도면만 증분 반영한다.
+
+갱신은 메모리의 인덱스 사본에만 반영하고, 저장소 기록은 DRAWING_INDEX_SAVE_DELAY_S 동안
+모아서 한 번에 한다. 도면 인덱스는 domyun 테이블에서 다시 만들 수 있으므로, 기록 전에
+프로세스가 끝나도 다음 sync_from_database가 json_data 해시를 비교해 빠진 도면을 채운다.
+
+청크 구성:
+    - 도면 요약: 도면명, 태그 목록, OCR 텍스트, 탐지 기호 개수
+    - 태그 주변: 태그마다 도면상 가장 가까운 OCR 텍스트/탐지 기호
+      ("리보일러 근처 PT-201" 같은 위치 질문을 태그 단위로 찾기 위함)
+"""
+
+import os
+import json
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+import torch
+from loguru import logger
+
+from config.database_config import get_db_connection
+from config.user_config import (
+    DRAWING_INDEX_MODEL,
+    DRAWING_INDEX_PATH,
+    DRAWING_INDEX_SAVE_DELAY_S,
+    DRAWING_NEIGHBORS
+)
+from utils.answer_cache import invalidate_cached_answers
+from utils.bm25_index import extract_tags, kiwi_tokenize
+from utils.embedding_cache import encode_chunks
+from utils.drawing_fields import extract_detections, extract_ocr_fields
+from utils.embedding_store import content_hash
+from utils.model_registry import get_registry, get_sentence_encoder
+from utils.rag_index import RAGIndex
+
+# 요약 청크에 넣을 최대 OCR 텍스트 수 (임베딩 모델 입력 길이 제한)
+MAX_SUMMARY_TEXTS = 200
+
+
+def build_drawing_chunks(d_id: int, d_name: str, json_data: Dict,
+                         neighbors: int = DRAWING_NEIGHBORS) -> List[Dict]:
+    """
+    도면 JSON → 검색용 청크 목록
+
+    Returns:
+        {'content', 'd_id', 'd_name', 'kind'('summary'|'tag'), 'tag'} 목록
+    """
+    ocr_fields = extract_ocr_fields(json_data)
+    detections = extract_detections(json_data)
+    if not ocr_fields and not detections:
+        return []
+
+    texts = list(dict.fromkeys(text for text, _ in ocr_fields))
+    tags = list(dict.fromkeys(tag for text in texts for tag in extract_tags(text)))
+    label_counts = Counter(label for label, _ in detections)
+
+    summary = [f"도면 {d_name}"]
+    if tags:
+        summary.append(f"계측기 태그: {', '.join(tags)}")
+    if texts:
+        summary.append(f"도면 텍스트: {', '.join(texts[:MAX_SUMMARY_TEXTS])}")
+    if label_counts:
+        summary.append("탐지 기호: " + ", ".join(f"{label} {count}개" for label, count in label_counts.most_common()))
+    chunks = [{"content": "\n".join(summary), "d_id": d_id, "d_name": d_name, "kind": "summary", "tag": None}]
+
+    # 위치가 있는 요소끼리 거리 기준으로 태그 주변 청크 생성
+    located = [(text, center, "text") for text, center in ocr_fields if center] + \
+              [(label, center, "symbol") for label, center in detections if center]
+    seen_tags = set()
+    for text, center in ocr_fields:
+        text_tags = [tag for tag in extract_tags(text) if tag not in seen_tags]
+        if not text_tags or not center:
+            continue
+        seen_tags.update(text_tags)
+        nearest = sorted(
+            (item for item in located if item[1] is not center),
+            key=lambda item: math.dist(center, item[1])
+        )[:neighbors]
+        nearby_texts = [name for name, _, kind in nearest if kind == "text"]
+        nearby_symbols = [name for name, _, kind in nearest if kind == "symbol"]
+        lines = [f"도면 {d_name}의 {text} ({', '.join(text_tags)}) 주변"]
+        if nearby_texts:
+            lines.append(f"인접 텍스트: {', '.join(nearby_texts)}")
+        if nearby_symbols:
+            lines.append(f"인접 기호: {', '.join(nearby_symbols)}")
+        chunks.append({"content": "\n".join(lines), "d_id": d_id, "d_name": d_name,
+                       "kind": "tag", "tag": text_tags[0]})
+    return chunks
+
+
+def _kiwi_tokenizer(texts: List[str]) -> List[List[str]]:
+    """P&ID 사용자 사전 Kiwi로 BM25 토큰화 (공용 Kiwi 재사용)"""
+    from utils.rag_system_kiwi import build_pid_kiwi
+    return kiwi_tokenize(get_registry().get_or_load("kiwi:pid", build_pid_kiwi), texts)
+
+
+class DrawingIndex:
+    """도면(d_id)별 요약 청크 검색 인덱스 (스레드 안전)
+
+    갱신은 잠금 안에서 현재 인덱스의 사본(RAGIndex.copy)에 반영한 뒤 self.index를 교체하므로,
+    검색은 잠금 없이 시작 시점의 인덱스 하나를 끝까지 사용한다. 사본은 행 데이터를 공유하므로
+    도면 하나를 올리는 비용은 전체 도면 수가 아니라 그 도면의 청크 수에 비례한다.
+    """
+
+    def __init__(self, path: str = DRAWING_INDEX_PATH, model_name: str = DRAWING_INDEX_MODEL,
+                 save_delay_s: float = DRAWING_INDEX_SAVE_DELAY_S):
+        """
+        Args:
+            path: 임베딩 저장소 디렉터리
+            model_name: 임베딩 모델명
+            save_delay_s: 갱신 후 저장까지 기다리는 시간 (0이면 갱신할 때마다 바로 저장)
+        """
+        self.path = path
+        self.model_name = model_name
+        self.save_delay_s = save_delay_s
+        self.encoder = get_sentence_encoder(model_name)
+        self.index = RAGIndex(path, model_name=model_name, tokenizer=_kiwi_tokenizer)
+        self._lock = threading.Lock()
+        self._synced = False
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        if self.index.load():
+            logger.info(f"도면 검색 인덱스 로드: 도면 {len(self.index.sources)}개, {len(self.index)}개 청크")
+
+    def __len__(self) -> int:
+        return len(self.index.sources)
+
+    def _encode(self, texts: List[str]) -> torch.Tensor:
+        return torch.from_numpy(encode_chunks(self.encoder, self.model_name, texts))
+
+    def _publish(self, index: RAGIndex):
+        """갱신한 사본을 검색 대상으로 교체하고 저장 예약 (self._lock 안에서 호출)"""
+        self.index = index
+        self._dirty = True
+        if self.save_delay_s <= 0:
+            self._save_locked()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay_s, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """예약된 저장을 바로 수행 (저장할 변경이 없으면 아무것도 하지 않음)"""
+        with self._lock:
+            try:
+                self._save_locked()
+            except Exception as e:
+                logger.error(f"도면 인덱스 저장 실패 (다음 갱신 때 다시 시도): {e}")
+
+    def _save_locked(self):
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        if not self._dirty:
+            return
+        # 저장 시 압축/재로드가 검색 중인 인덱스를 바꾸지 않도록 사본을 저장한 뒤 교체
+        index = self.index.copy()
+        index.save()
+        previous, self.index = self.index, index
+        previous.close()
+        self._dirty = False
+
+    def _upsert(self, index: RAGIndex, d_id: int, d_name: str, json_data) -> Dict:
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        source = str(d_id)
+        data_hash = content_hash(json.dumps(json_data, ensure_ascii=False, sort_keys=True))
+        if index.is_source_current(source, data_hash):
+            return {'added': 0, 'removed': 0, 'unchanged': index.sources[source].get('chunk_count', 0), 'skipped': True}
+
+        chunks = build_drawing_chunks(d_id, d_name, json_data or {})
+        if not chunks:
+            logger.info(f"도면 {d_name}(ID {d_id})에 색인할 OCR/탐지 데이터가 없습니다")
+            if source in index.sources:
+                index.remove_source(source)
+                return {'added': 0, 'removed': 1, 'unchanged': 0}
+            return {'added': 0, 'removed': 0, 'unchanged': 0, 'skipped': True}
+        return index.upsert_source(source, chunks, self._encode, file_hash=data_hash)
+
+    def upsert_drawing(self, d_id: int, d_name: str, json_data) -> Dict:
+        """
+        도면 하나를 증분 반영 (저장은 save_delay_s 뒤에 모아서)
+
+        Returns:
+            {'added', 'removed', 'unchanged'} 청크 수 (변경 없으면 'skipped': True)
+        """
+        with self._lock:
+            index = self.index.copy()
+            stats = self._upsert(index, d_id, d_name, json_data)
+            if not stats.get('skipped'):
+                self._publish(index)
+            return stats
+
+    def remove_drawing(self, d_id: int) -> int:
+        """도면 청크 삭제 - 삭제된 청크 수 반환"""
+        with self._lock:
+            if str(d_id) not in self.index.sources:
+                return 0
+            index = self.index.copy()
+            removed = index.remove_source(str(d_id))
+            if removed:
+                self._publish(index)
+            return removed
+
+    def sync_from_database(self) -> Dict:
+        """
+        domyun 테이블과 인덱스를 맞춤
+
+        모든 행의 json_data 해시를 색인 당시 해시와 비교해 새 도면과 내용이 바뀐 도면만
+        다시 색인하고, 테이블에서 사라진 도면은 제거한다.
+
+        Returns:
+            {'indexed', 'removed'} 도면 수
+        """
+        conn = get_db_connection()
+        if not conn:
+            logger.error("데이터베이스 연결 실패 - 도면 인덱스 동기화 생략")
+            return {'indexed': 0, 'removed': 0}
+
+        try:
+            with self._lock:
+                index = self.index.copy()
+                db_ids = set()
+                changed_names = set()
+                indexed = 0
+
+                # 서버 측 커서로 나눠 읽어 json_data 전체를 한 번에 메모리에 올리지 않음
+                cursor = conn.cursor(name="drawing_index_sync")
+                cursor.execute("SELECT d_id, d_name, json_data FROM domyun")
+                while True:
+                    rows = cursor.fetchmany(100)
+                    if not rows:
+                        break
+                    for d_id, d_name, json_data in rows:
+                        db_ids.add(d_id)
+                        try:
+                            if not self._upsert(index, d_id, d_name, json_data).get('skipped'):
+                                indexed += 1
+                                changed_names.add(d_name)
+                        except Exception as e:
+                            logger.warning(f"도면 색인 실패 (ID {d_id}): {e}")
+                cursor.close()
+
+                stale = {int(source) for source in index.sources} - db_ids
+                stale_sources = {str(d_id) for d_id in stale}
+                changed_names.update(meta.get("d_name") for meta in index.metadata
+                                     if meta.get("source") in stale_sources and not meta.get("deleted"))
+                for source in stale_sources:
+                    index.remove_source(source)
+
+                if indexed or stale:
+                    self._publish(index)
+        finally:
+            conn.close()
+
+        # 다른 프로세스에서 바뀐 도면을 참조한 답변 무효화 (이 프로세스의 저장은 save_to_database가 처리)
+        for d_name in changed_names:
+            invalidate_cached_answers(drawing=d_name)
+
+        self._synced = True
+        logger.info(f"도면 인덱스 동기화: 신규/변경 {indexed}개, 삭제 {len(stale)}개 (전체 {len(self)}개)")
+        return {'indexed': indexed, 'removed': len(stale)}
+
+    def ensure_synced(self):
+        """프로세스에서 처음 한 번만 데이터베이스와 동기화"""
+        if not self._synced:
+            self.sync_from_database()
+
+    def search(self, query: str, query_embedding, top_k: int = 3, candidates: int = 30) -> List[Dict]:
+        """
+        질문과 관련된 도면 검색 (도면별로 가장 잘 맞는 청크 하나만 남김)
+
+        Returns:
+            {'d_id', 'd_name', 'score', 'rrf_score', 'tag_match', 'content', 'kind'} 목록
+        """
+        index = self.index  # 검색 도중 갱신으로 교체되어도 같은 인덱스를 끝까지 사용
+        if len(index) == 0:
+            return []
+
+        hits = index.hybrid_search(query, query_embedding, top_k=candidates, candidates=candidates)
+        drawings = {}
+        for hit in hits:
+            meta = index.metadata[hit["index"]]
+            d_id = meta.get("d_id")
+            if d_id in drawings:
+                drawings[d_id]["tag_match"] = drawings[d_id]["tag_match"] or hit["tag_match"]
+                continue
+            drawings[d_id] = {
+                "d_id": d_id,
+                "d_name": meta.get("d_name"),
+                "score": hit["score"],
+                "rrf_score": hit["rrf_score"],
+                "tag_match": hit["tag_match"],
+                "content": hit["content"],
+                "kind": meta.get("kind")
+            }
+        return list(drawings.values())[:top_k]
+
+
+def get_drawing_index() -> DrawingIndex:
+    """프로세스 공용 도면 검색 인덱스"""
+    return get_registry().get_or_load(
+        f"drawing-index:{os.path.abspath(DRAWING_INDEX_PATH)}:{DRAWING_INDEX_MODEL}",
+        DrawingIndex
+    )
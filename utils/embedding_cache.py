@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+내용 주소 기반 청크 임베딩 캐시
+
+챗봇, optimized_embedding.py, rag_openai_chatbot.py, Kiwi RAG 시스템이 같은 청크를
+각자 다시 임베딩하지 않도록 (모델명, 모델 리비전, 인코더 백엔드, 청크 sha256)을 키로
+벡터를 SQLite에 보관한다. 재구축이나 청크 분할 실험을 해도 텍스트가 같은 청크는 다시 인코딩하지 않는다.
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from config.user_config import EMBEDDING_CACHE_PATH
+from utils.embedding_store import content_hash
+from utils.vector_kv_store import VectorKVStore
+
+
+def model_revision(encoder) -> str:
+    """인코더 가중치 리비전 (허브 커밋 해시, 없으면 'local')"""
+    revision = getattr(encoder, "revision", None)
+    if revision:
+        return revision
+    try:
+        config = encoder[0].auto_model.config
+        return getattr(config, "_commit_hash", None) or "local"
+    except Exception:
+        return "local"
+
+
+def encoder_backend(encoder) -> str:
+    """같은 모델이라도 백엔드별 수치 차이가 있어 네임스페이스를 분리"""
+    if type(encoder).__name__ == "OnnxSentenceEncoder":
+        return "onnx-int8" if getattr(encoder, "quantize", False) else "onnx"
+    return "torch"
+
+
+def encoder_namespace(encoder, model_name: str, normalize: bool = False) -> str:
+    """캐시 네임스페이스 '모델명@리비전:백엔드' (정규화 출력이면 ':norm')"""
+    namespace = f"{model_name}@{model_revision(encoder)}:{encoder_backend(encoder)}"
+    return f"{namespace}:norm" if normalize else namespace
+
+
+class ChunkEmbeddingCache:
+    """청크 텍스트 sha256 → 임베딩 캐시"""
+
+    def __init__(self, db_path: str):
+        self.store = VectorKVStore(db_path, table="chunk_embeddings")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def namespace(self, encoder, model_name: str, normalize: bool = False) -> str:
+        return encoder_namespace(encoder, model_name, normalize)
+
+    def encode(self, encoder, model_name: str, texts: List[str], **encode_kwargs) -> np.ndarray:
+        """
+        캐시를 거쳐 청크 임베딩 생성 - 처음 보는 텍스트만 한 번 인코딩
+
+        Args:
+            encoder: SentenceTransformer 등 encode()를 가진 모델
+            model_name: 모델명
+            texts: 청크 텍스트 목록
+            encode_kwargs: encoder.encode에 전달할 추가 인자
+
+        Returns:
+            (N, D) float32 배열 (입력 순서 유지)
+        """
+        texts = list(texts)
+        namespace = self.namespace(encoder, model_name, encode_kwargs.get("normalize_embeddings", False))
+        hashes = [content_hash(text) for text in texts]
+        found = self.store.get_many(namespace, hashes)
+
+        # 같은 호출 안의 중복 텍스트도 한 번만 인코딩
+        missing: Dict[str, str] = {}
+        for text, digest in zip(texts, hashes):
+            if digest not in found and digest not in missing:
+                missing[digest] = text
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            logger.info(f"청크 임베딩 캐시: {len(texts) - len(missing)}개 재사용, {len(missing)}개 인코딩")
+            encode_kwargs.setdefault("convert_to_numpy", True)
+            encoded = encoder.encode(list(missing.values()), **encode_kwargs)
+            if hasattr(encoded, "detach"):
+                encoded = encoded.detach().cpu().numpy()
+            new_vectors = dict(zip(missing.keys(), np.asarray(encoded, dtype=np.float32)))
+            self.store.put_many(namespace, new_vectors)
+            found.update(new_vectors)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[digest] for digest in hashes]).astype(np.float32, copy=False)
+
+    def stats(self) -> Dict:
+        """적중/미스 통계"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "stored": self.store.count()
+            }
+
+    def clear(self, namespace: Optional[str] = None):
+        """전체 또는 네임스페이스 단위 삭제"""
+        self.store.clear(namespace)
+
+
+_embedding_cache: Optional[ChunkEmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[ChunkEmbeddingCache]:
+    """프로세스 공용 청크 임베딩 캐시 (EMBEDDING_CACHE_PATH가 None이거나 열 수 없으면 None)"""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            try:
+                _embedding_cache = ChunkEmbeddingCache(EMBEDDING_CACHE_PATH)
+            except Exception as e:
+                logger.warning(f"청크 임베딩 캐시 비활성화: {e}")
+                return None
+        return _embedding_cache
+
+
+def encode_chunks(encoder, model_name: str, texts: List[str], **encode_kwargs) -> np.ndarray:
+    """캐시가 있으면 캐시를 거쳐, 없으면 바로 인코딩 ((N, D) float32 배열)"""
+    cache = get_embedding_cache()
+    if cache is not None:
+        return cache.encode(encoder, model_name, texts, **encode_kwargs)
+    encode_kwargs.setdefault("convert_to_numpy", True)
+    return np.asarray(encoder.encode(list(texts), **encode_kwargs), dtype=np.float32)
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+메모리 매핑 기반 임베딩 저장소
+
+state/state.pkl(청크 리스트 + torch 텐서 pickle)을 대체하는 디스크 포맷.
+각 프로세스가 전체를 역직렬화하지 않고 읽기 전용 mmap으로 열기 때문에
+시작 비용이 거의 없고, 여러 Streamlit 워커가 같은 페이지 캐시를 공유한다.
+
+저장할 때마다 새 버전 디렉터리에 모든 파일을 기록한 뒤 CURRENT 포인터 파일 하나만
+원자적으로 교체한다. 읽는 쪽은 CURRENT가 가리키는 버전만 열기 때문에 새 embeddings.npy와
+이전 chunks.bin/metadata.json이 섞인 저장소를 볼 수 없다. 이전 버전은 다른 프로세스가 아직
+열고 있을 수 있으므로 KEEP_VERSIONS개까지 남겨둔다.
+
+디렉터리 구성:
+    CURRENT                     현재 버전 디렉터리 이름
+    store-v<시각>-<id>/
+        manifest.json           포맷 버전, 청크 수, 차원, dtype, 모델명
+        embeddings.npy          (N, D) L2 정규화된 float32/float16 행렬
+        chunks.bin              UTF-8 청크 텍스트를 이어붙인 바이트열
+        chunk_offsets.npy       (N + 1,) int64 바이트 오프셋
+        metadata.json           청크별 메타데이터 (페이지, 출처 등)
+        (bm25.json, ann.faiss 등 같은 버전에 딸린 인덱스 파일)
+
+CURRENT가 없고 manifest.json이 바로 아래 있으면 구버전(단일 디렉터리) 저장소로 읽는다.
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import pickle
+import shutil
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+STORE_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunk_offsets.npy"
+METADATA_FILE = "metadata.json"
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "store-v"
+KEEP_VERSIONS = 2
+SAVE_BLOCK_ROWS = 65536  # 임베딩을 정규화해 기록할 때 한 번에 읽는 행 수
+
+
+class MappedChunks(Sequence):
+    """chunks.bin을 mmap으로 열어 필요한 청크만 디코딩하는 읽기 전용 시퀀스
+
+    인덱스를 교체할 때 close()로 mmap과 파일 핸들을 바로 돌려준다. 교체 직전에 시작된 검색이
+    닫힌 뒤에 접근하면 다시 열어 읽고, 그 핸들은 객체가 수거될 때 닫힌다.
+    """
+
+    def __init__(self, chunks_path: str, offsets: np.ndarray):
+        self.path = chunks_path
+        self.offsets = offsets
+        self._file = None
+        self._buffer = None
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        if os.path.getsize(self.path) > 0:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = b""
+
+    def close(self):
+        """mmap과 파일 핸들 해제 (여러 번 호출해도 됨)"""
+        with self._lock:
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.close()
+            if self._file is not None:
+                self._file.close()
+            self._buffer = self._file = None
+
+    @property
+    def closed(self) -> bool:
+        return self._buffer is None
+
+    def __enter__(self) -> "MappedChunks":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        with self._lock:
+            if self._buffer is None:
+                self._open()
+            data = self._buffer[start:end]
+        return data.decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+@dataclass
+class EmbeddingStore:
+    """로드된 임베딩 저장소 (path는 실제 파일이 있는 버전 디렉터리)"""
+    path: str
+    chunks: Sequence[str]
+    embeddings: np.ndarray
+    metadata: List[Dict] = field(default_factory=list)
+    manifest: Dict = field(default_factory=dict)
+    digest: Optional[str] = None  # manifest.json의 sha256 (딸린 인덱스 파일의 유효성 확인용)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+def _to_numpy(embeddings) -> np.ndarray:
+    """torch 텐서/리스트를 float32 numpy 배열로 변환"""
+    if hasattr(embeddings, "detach"):
+        embeddings = embeddings.detach().cpu().numpy()
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _embedding_segments(embeddings) -> List:
+    """(N, D) 행렬 또는 행렬 조각 목록을 조각 목록으로 (mmap/행 뷰는 복사하지 않고 그대로 둠)"""
+    if isinstance(embeddings, (list, tuple)) and embeddings \
+            and all(getattr(segment, "ndim", 0) == 2 for segment in embeddings):
+        return list(embeddings)
+    if getattr(embeddings, "ndim", 0) == 2:
+        return [embeddings]
+    matrix = _to_numpy(embeddings)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    return [matrix]
+
+
+def _write_embeddings(file_path: str, segments: List, count: int, dim: int, dtype: str):
+    """조각을 블록 단위로 정규화해 .npy로 기록 (전체 행렬을 한 번에 메모리에 올리지 않음)"""
+    if count == 0:
+        np.save(file_path, np.zeros((0, dim), dtype=dtype))
+        return
+    out = np.lib.format.open_memmap(file_path, mode="w+", dtype=dtype, shape=(count, dim))
+    position = 0
+    for segment in segments:
+        for start in range(0, len(segment), SAVE_BLOCK_ROWS):
+            block = _to_numpy(segment[start:start + SAVE_BLOCK_ROWS])
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            out[position:position + len(block)] = block / np.maximum(norms, 1e-12)
+            position += len(block)
+    out.flush()
+    del out
+
+
+def _atomic_write(path: str, write_fn, binary: bool = True):
+    """임시 파일에 기록 후 교체하여 읽는 쪽(다른 프로세스의 mmap 포함)이 깨진 파일을 보지 않도록 함"""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with (open(tmp_path, "wb") if binary else open(tmp_path, "w", encoding="utf-8")) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def content_hash(text: str) -> str:
+    """청크 텍스트의 sha256 (증분 갱신 및 캐시 키)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """파일 내용의 sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resolve_store_dir(path: str) -> Optional[str]:
+    """CURRENT가 가리키는 버전 디렉터리 (구버전 단일 디렉터리 저장소면 path, 없으면 None)"""
+    current_path = os.path.join(path, CURRENT_FILE)
+    if os.path.exists(current_path):
+        try:
+            with open(current_path, "r", encoding="utf-8") as f:
+                version_dir = os.path.join(path, f.read().strip())
+        except FileNotFoundError:
+            return None
+        return version_dir if os.path.exists(os.path.join(version_dir, MANIFEST_FILE)) else None
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return path
+    return None
+
+
+def store_exists(path: str) -> bool:
+    """저장소 존재 여부"""
+    return resolve_store_dir(path) is not None
+
+
+def _version_dirs(path: str) -> List[str]:
+    """버전 디렉터리 이름 목록 (오래된 순)"""
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if name.startswith(VERSION_PREFIX) and os.path.isdir(os.path.join(path, name)))
+
+
+def _switch_current(path: str, version_name: str):
+    """CURRENT 포인터를 원자적으로 교체하고 오래된 버전과 구버전 단일 디렉터리 파일 정리"""
+    _atomic_write(os.path.join(path, CURRENT_FILE), lambda f: f.write(version_name), binary=False)
+
+    # 현재보다 오래된 버전 중 최근 KEEP_VERSIONS - 1개는 열려 있을 수 있어 남겨둠
+    # (현재보다 새로운 이름은 다른 저장이 진행 중인 디렉터리이므로 건드리지 않음)
+    older = [name for name in _version_dirs(path) if name < version_name]
+    for name in older[:max(0, len(older) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    for name in (MANIFEST_FILE, EMBEDDINGS_FILE, CHUNKS_FILE, OFFSETS_FILE, METADATA_FILE):
+        legacy_path = os.path.join(path, name)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+
+def save_embedding_store(path: str, chunks: Sequence[str], embeddings,
+                         metadata: Optional[List[Dict]] = None,
+                         model_name: Optional[str] = None,
+                         dtype: str = "float32",
+                         extra: Optional[Dict] = None,
+                         companions: Optional[Callable[[str, str], None]] = None) -> Dict:
+    """
+    청크와 임베딩을 새 버전 디렉터리에 저장한 뒤 CURRENT를 교체
+
+    Args:
+        path: 저장 디렉터리
+        chunks: 청크 텍스트 목록
+        embeddings: (N, D) 임베딩 또는 이어붙일 (n, D) 조각 목록 (저장 시 L2 정규화됨)
+        metadata: 청크별 메타데이터
+        model_name: 임베딩 모델명
+        dtype: 'float32' 또는 'float16'
+        extra: manifest에 함께 기록할 추가 정보
+        companions: (버전 디렉터리, manifest sha256)를 받아 같은 버전에 딸린 파일
+            (BM25 역색인, ANN 인덱스 등)을 기록하는 함수 - CURRENT 교체 전에 호출
+
+    Returns:
+        기록된 manifest
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"지원하지 않는 dtype: {dtype}")
+
+    os.makedirs(path, exist_ok=True)
+
+    segments = _embedding_segments(embeddings)
+    count = sum(len(segment) for segment in segments)
+    dim = int(segments[0].shape[1]) if segments else 0
+    if len(chunks) != count:
+        raise ValueError(f"청크 수({len(chunks)})와 임베딩 수({count})가 다릅니다")
+
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+    version_name = f"{VERSION_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    version_dir = os.path.join(path, version_name)
+    os.makedirs(version_dir)
+
+    # 버전 디렉터리는 CURRENT가 가리키기 전까지 아무도 읽지 않으므로 바로 기록
+    # 로드 측에서 복사 없이 바로 검색하도록 정규화된 벡터를 저장
+    _write_embeddings(os.path.join(version_dir, EMBEDDINGS_FILE), segments, count, dim, dtype)
+    np.save(os.path.join(version_dir, OFFSETS_FILE), offsets)
+    with open(os.path.join(version_dir, CHUNKS_FILE), "wb") as f:
+        f.writelines(encoded)
+    with open(os.path.join(version_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(metadata or [], f, ensure_ascii=False, default=str)
+
+    manifest = {
+        "format_version": STORE_FORMAT_VERSION,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "normalized": True,
+        "model_name": model_name,
+        "version": version_name,
+        "created_at": datetime.now().isoformat(),
+    }
+    if extra:
+        manifest.update(extra)
+
+    manifest_path = os.path.join(version_dir, MANIFEST_FILE)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    try:
+        if companions is not None:
+            companions(version_dir, file_sha256(manifest_path))
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    # CURRENT 교체가 유일한 커밋 지점 - 이전까지 읽는 쪽은 이전 버전 전체를 봄
+    _switch_current(path, version_name)
+
+    logger.info(f"임베딩 저장소 저장 완료: {path} ({manifest['count']}개, {dtype})")
+    return manifest
+
+
+def load_embedding_store(path: str, mmap_mode: Optional[str] = "r") -> Optional[EmbeddingStore]:
+    """
+    mmap 저장소 로드
+
+    Args:
+        path: 저장 디렉터리
+        mmap_mode: np.load mmap 모드 (None이면 메모리로 전부 읽음)
+
+    Returns:
+        EmbeddingStore 또는 None (저장소가 없는 경우)
+    """
+    # 버전을 확인한 직후 다른 프로세스가 두 번 저장해 그 버전이 정리된 경우 한 번 더 시도
+    for attempt in range(2):
+        store_dir = resolve_store_dir(path)
+        if store_dir is None:
+            return None
+        try:
+            return _load_store_dir(store_dir, mmap_mode)
+        except FileNotFoundError:
+            if attempt:
+                raise
+    return None
+
+
+def _load_store_dir(store_dir: str, mmap_mode: Optional[str]) -> Optional[EmbeddingStore]:
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != STORE_FORMAT_VERSION:
+        logger.warning(f"임베딩 저장소 포맷 버전 불일치: {manifest.get('format_version')}")
+        return None
+
+    embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(store_dir, OFFSETS_FILE))
+    chunks = MappedChunks(os.path.join(store_dir, CHUNKS_FILE), offsets)
+
+    metadata = []
+    metadata_path = os.path.join(store_dir, METADATA_FILE)
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+    if len(chunks) != embeddings.shape[0]:
+        logger.error(f"임베딩 저장소 손상: 청크 {len(chunks)}개, 임베딩 {embeddings.shape[0]}개")
+        return None
+
+    return EmbeddingStore(path=store_dir, chunks=chunks, embeddings=embeddings,
+                          metadata=metadata, manifest=manifest, digest=file_sha256(manifest_path))
+
+
+def migrate_pickle_state(state_file: str, path: str,
+                         model_name: Optional[str] = None) -> Optional[EmbeddingStore]:
+    """구버전 state.pkl을 mmap 저장소로 변환 후 로드"""
+    if not os.path.exists(state_file):
+        return None
+
+    logger.info(f"구버전 상태 파일 변환 중: {state_file} → {path}")
+    with open(state_file, "rb") as f:
+        data = pickle.load(f)
+
+    save_embedding_store(path, data["chunks"], data["embeddings"], model_name=model_name)
+    logger.info(f"변환 완료 - 더 이상 필요하지 않은 파일: {state_file}")
+    return load_embedding_store(path)
+
+
+def remove_embedding_store(path: str) -> bool:
+    """저장소 삭제 (CURRENT부터 지워 반쯤 지워진 저장소가 로드되지 않도록 함)"""
+    removed = False
+    for name in (CURRENT_FILE, MANIFEST_FILE, EMBEDDINGS_FILE, CHUNKS_FILE, OFFSETS_FILE, METADATA_FILE):
+        file_path = os.path.join(path, name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            removed = True
+    for name in _version_dirs(path):
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        removed = True
+    return removed
+
+
+def get_store_info(path: str) -> Optional[Dict]:
+    """현재 버전의 manifest와 파일 크기 정보"""
+    store_dir = resolve_store_dir(path)
+    if store_dir is None:
+        return None
+
+    with open(os.path.join(store_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        info = json.load(f)
+
+    names = (EMBEDDINGS_FILE, CHUNKS_FILE, OFFSETS_FILE, METADATA_FILE) if store_dir == path \
+        else sorted(os.listdir(store_dir))
+    info["file_sizes"] = {
+        name: os.path.getsize(os.path.join(store_dir, name))
+        for name in names
+        if os.path.isfile(os.path.join(store_dir, name))
+    }
+    return info
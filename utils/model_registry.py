@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+프로세스 공용 모델 레지스트리
+
+Streamlit 세션마다 SentenceTransformer와 Kiwi를 새로 올리지 않도록
+모델을 키별로 한 번만 지연 로드하고, 모든 세션에 같은 참조를 나눠준다.
+각 모델의 로드 시간과 메모리 사용량(파라미터 크기, 로드 전후 RSS 증가량)을 기록한다.
+"""
+
+import os
+import time
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+def current_rss_bytes() -> int:
+    """현재 프로세스의 상주 메모리(RSS) 바이트"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # /proc이 없는 환경(macOS 등) - 최대 RSS로 대체
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _parameter_bytes(model: Any) -> Optional[int]:
+    """torch 모듈이면 파라미터/버퍼 크기 합계"""
+    if not hasattr(model, "parameters"):
+        return None
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        if hasattr(model, "buffers"):
+            total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return total
+    except Exception:
+        return None
+
+
+@dataclass
+class ModelEntry:
+    """레지스트리에 올라간 모델 정보"""
+    key: str
+    model: Any
+    load_seconds: float
+    rss_delta_bytes: int
+    param_bytes: Optional[int] = None
+    loaded_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def to_dict(self) -> Dict:
+        return {
+            "key": self.key,
+            "type": type(self.model).__name__,
+            "load_seconds": round(self.load_seconds, 3),
+            "rss_delta_mb": round(self.rss_delta_bytes / 1024 / 1024, 1),
+            "param_mb": round(self.param_bytes / 1024 / 1024, 1) if self.param_bytes is not None else None,
+            "loaded_at": self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """키별 지연 로드 + 공유 참조 레지스트리 (스레드 안전)
+
+    서로 다른 키는 동시에 로드할 수 있고, 같은 키는 한 스레드만 로드한다.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        키에 해당하는 모델을 반환하고, 없으면 loader로 한 번만 로드
+
+        Args:
+            key: 모델 식별자 (예: 'sentence-encoder:torch:jhgan/ko-sroberta-multitask')
+            loader: 인자 없는 로드 함수
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry.model
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry.model
+
+            logger.info(f"공용 모델 로드 중: {key}")
+            rss_before = current_rss_bytes()
+            start = time.perf_counter()
+            model = loader()
+            entry = ModelEntry(
+                key=key,
+                model=model,
+                load_seconds=time.perf_counter() - start,
+                rss_delta_bytes=max(0, current_rss_bytes() - rss_before),
+                param_bytes=_parameter_bytes(model)
+            )
+            with self._lock:
+                self._entries[key] = entry
+            logger.info(f"공용 모델 로드 완료: {key} ({entry.load_seconds:.2f}초, "
+                        f"RSS +{entry.rss_delta_bytes / 1024 / 1024:.1f}MB)")
+            return model
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._entries
+
+    def unload(self, key: str) -> bool:
+        """모델 참조 해제 (이미 나눠준 참조는 각 세션이 놓을 때 회수됨)"""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def memory_report(self) -> List[Dict]:
+        """로드된 모델별 로드 시간/메모리 사용량"""
+        with self._lock:
+            return [entry.to_dict() for entry in self._entries.values()]
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """프로세스 공용 레지스트리"""
+    return _registry
+
+
+def get_sentence_encoder(model_name: str, backend: Optional[str] = None):
+    """
+    공유 문장 인코더
+
+    Args:
+        model_name: SentenceTransformer 모델명
+        backend: 'torch', 'onnx', 'onnx-int8' (None이면 ENCODER_BACKEND 설정)
+
+    ONNX 백엔드는 내보내기/양자화 시점에 한 번 검증해 둔 torch 대비 최소 코사인 유사도가
+    ENCODER_ONNX_MIN_COSINE 미만이거나 로드에 실패하면 기존 인덱스와의 호환을 위해 torch 인코더로
+    대체한다. 이미 내보내고 검증한 모델은 torch 모델을 로드하지 않는다.
+    """
+    from config.user_config import ENCODER_BACKEND, ENCODER_ONNX_MIN_COSINE, ENCODER_ONNX_THREADS
+    backend = backend or ENCODER_BACKEND
+
+    def _load_torch():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    def _load():
+        if backend == "torch":
+            return _load_torch()
+
+        try:
+            from utils.onnx_encoder import OnnxSentenceEncoder
+            onnx_encoder = OnnxSentenceEncoder(model_name, quantize=backend == "onnx-int8",
+                                               intra_op_threads=ENCODER_ONNX_THREADS)
+        except Exception as e:
+            logger.warning(f"{backend} 인코더 로드 실패, torch 사용: {e}")
+            return _load_torch()
+
+        if onnx_encoder.agreement < ENCODER_ONNX_MIN_COSINE:
+            logger.warning(f"{backend} 인코더 코사인 유사도 {onnx_encoder.agreement:.4f} < "
+                           f"{ENCODER_ONNX_MIN_COSINE}, torch 사용")
+            return _load_torch()
+        logger.info(f"{backend} 인코더 사용: {model_name} (torch 대비 최소 코사인 {onnx_encoder.agreement:.4f})")
+        return onnx_encoder
+
+    return _registry.get_or_load(f"sentence-encoder:{backend}:{model_name}", _load)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime 문장 인코더 (CPU, 선택적 int8 동적 양자화)
+
+GPU가 없는 서버에서 매 턴 쿼리 인코딩 지연을 줄이기 위해 SentenceTransformer의
+트랜스포머 본체를 ONNX로 내보내고, 풀링/정규화는 원래 파이프라인 설정을 그대로 따른다.
+기존 인덱스(torch로 만든 임베딩)와 호환되는지는 내보내기/양자화 시점에 한 번만
+코사인 유사도로 검증해 export.json에 기록하고, 이후 로드에서는 torch 모델을 올리지 않는다.
+내보내기 경로에 모델 리비전과 opset이 들어가 모델이 바뀌면 새로 내보낸다.
+
+    state/onnx/<모델명>/<리비전>-opset<N>/model.onnx        fp32 내보내기
+    state/onnx/<모델명>/<리비전>-opset<N>/model.int8.onnx   동적 int8 양자화
+    state/onnx/<모델명>/<리비전>-opset<N>/export.json       풀링 설정, 파일별 torch 대비 최소 코사인
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import torch
+from loguru import logger
+
+ONNX_CACHE_DIR = "./state/onnx"
+ONNX_OPSET = 14
+EXPORT_META_FILE = "export.json"
+
+# 허용 오차 검증 및 벤치마크용 P&ID 문장
+VERIFY_SENTENCES = [
+    "FT-101은 원료 공급 라인의 유량을 측정하는 유량 전송기입니다.",
+    "압력 조절 밸브 PV-201은 반응기 압력을 일정하게 유지합니다.",
+    "비상정지 시스템은 고압 알람 발생 시 펌프를 트립시킵니다.",
+    "LIC-301은 저장 탱크의 액위를 제어합니다.",
+    "What is the role of the flow controller FIC-101?",
+    "시약 주입 방법",
+    "온도 측정 방법",
+    "안전장치 작동원리"
+]
+
+
+def _mean_pooling(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., None].astype(np.float32)
+    return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class _KeywordForward(torch.nn.Module):
+    """위치 인자로 받은 입력을 이름으로 넘기고 last_hidden_state만 반환 (내보내기용)"""
+
+    def __init__(self, model: torch.nn.Module, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)), return_dict=True).last_hidden_state
+
+
+def model_cache_revision(model_name: str) -> Optional[str]:
+    """
+    torch 모델을 올리지 않고 알 수 있는 모델 리비전
+
+    로컬 디렉터리는 파일 이름/크기/수정 시각의 해시, 허브 모델은 로컬 캐시에 받아둔
+    스냅샷 커밋 해시. 알 수 없으면 None (모델을 로드해 확인해야 함).
+    """
+    if os.path.isdir(model_name):
+        digest = hashlib.sha256()
+        for root, _, files in sorted(os.walk(model_name)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f"{os.path.relpath(os.path.join(root, name), model_name)}:"
+                              f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return f"local-{digest.hexdigest()[:12]}"
+
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return None
+    candidates = [model_name] if "/" in model_name else [model_name, f"sentence-transformers/{model_name}"]
+    for repo_id in candidates:
+        config_path = try_to_load_from_cache(repo_id, "config.json")
+        if isinstance(config_path, str):
+            # .../snapshots/<커밋 해시>/config.json
+            return os.path.basename(os.path.dirname(config_path))
+    return None
+
+
+def _reference_revision(reference) -> str:
+    return getattr(reference[0].auto_model.config, "_commit_hash", None) or "local"
+
+
+def export_dir(model_name: str, revision: str, cache_dir: str = ONNX_CACHE_DIR, opset: int = ONNX_OPSET) -> str:
+    """모델 리비전/opset별 내보내기 디렉터리"""
+    return os.path.join(cache_dir, model_name.strip("/").replace("/", "__"), f"{revision}-opset{opset}")
+
+
+class OnnxSentenceEncoder:
+    """SentenceTransformer.encode와 호환되는 ONNX Runtime 인코더"""
+
+    def __init__(self, model_name: str, quantize: bool = True,
+                 intra_op_threads: Optional[int] = None, cache_dir: str = ONNX_CACHE_DIR,
+                 reference=None):
+        """
+        Args:
+            model_name: SentenceTransformer 모델명
+            quantize: int8 동적 양자화 모델 사용 여부
+            intra_op_threads: 연산 내부 스레드 수 (None이면 물리 코어 수 추정)
+            cache_dir: 내보낸 ONNX 모델 저장 위치
+            reference: 이미 로드한 SentenceTransformer (내보내기/검증이 필요할 때만 사용,
+                없으면 그때 새로 로드)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.revision = model_cache_revision(model_name)
+        if self.revision is None:
+            reference = reference if reference is not None else self._load_reference()
+            self.revision = _reference_revision(reference)
+        self.model_dir = export_dir(model_name, self.revision, cache_dir)
+        model_file = "model.int8.onnx" if quantize else "model.onnx"
+
+        meta = self._read_meta()
+        needs_verify = meta is None or model_file not in meta.get("agreement", {})
+        if needs_verify:
+            # 내보내기/양자화와 검증은 모델 리비전마다 한 번만 (torch 모델은 이때만 필요)
+            if reference is None:
+                reference = self._load_reference()
+            if meta is None:
+                meta = self._export(reference)
+            model_path = os.path.join(self.model_dir, "model.onnx")
+            if quantize:
+                model_path = self._quantize(model_path)
+
+        # 토크나이저/풀링 설정은 내보낼 때 원래 파이프라인에서 저장해둔 것을 사용
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self.max_seq_length = meta["max_seq_length"]
+        self.pooling_mode = meta["pooling_mode"]
+        self.normalize = meta["normalize"]
+
+        model_path = os.path.join(self.model_dir, model_file)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or max(1, (os.cpu_count() or 2) // 2)
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.model_path = model_path
+
+        if needs_verify:
+            meta.setdefault("agreement", {})[model_file] = embedding_agreement(reference, self)
+            self._write_meta(meta)
+        self.agreement: float = meta["agreement"][model_file]
+        logger.info(f"ONNX 인코더 준비: {model_path} (스레드 {options.intra_op_num_threads}, "
+                    f"torch 대비 최소 코사인 {self.agreement:.4f})")
+
+    def _load_reference(self):
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name, device="cpu")
+
+    def _read_meta(self) -> Optional[Dict]:
+        meta_path = os.path.join(self.model_dir, EXPORT_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta: Dict):
+        meta_path = os.path.join(self.model_dir, EXPORT_META_FILE)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _export(self, reference) -> Dict:
+        """트랜스포머 본체를 ONNX로 내보내고 토크나이저와 풀링 설정 저장"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        model_path = os.path.join(self.model_dir, "model.onnx")
+        transformer = reference[0].auto_model.eval()
+        sample = reference.tokenizer(["샘플 문장"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        logger.info(f"ONNX 내보내기 중: {self.model_name} ({self.revision}, opset {ONNX_OPSET})")
+        with torch.no_grad():
+            torch.onnx.export(
+                _KeywordForward(transformer, input_names),
+                tuple(sample[name] for name in input_names),
+                f"{model_path}.tmp",
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET,
+                dynamo=False
+            )
+        os.replace(f"{model_path}.tmp", model_path)
+        reference.tokenizer.save_pretrained(self.model_dir)
+
+        pooling_mode, normalize = "mean", False
+        for module in reference:
+            name = type(module).__name__
+            if name == "Pooling" and getattr(module, "pooling_mode_cls_token", False):
+                pooling_mode = "cls"
+            elif name == "Normalize":
+                normalize = True
+        return {
+            "model_name": self.model_name,
+            "revision": self.revision,
+            "opset": ONNX_OPSET,
+            "max_seq_length": reference.max_seq_length,
+            "pooling_mode": pooling_mode,
+            "normalize": normalize,
+            "agreement": {}
+        }
+
+    def _quantize(self, model_path: str) -> str:
+        """가중치 int8 동적 양자화 (이미 있으면 재사용)"""
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(self.model_dir, "model.int8.onnx")
+        if not os.path.exists(quantized_path):
+            logger.info(f"ONNX int8 동적 양자화 중: {self.model_name}")
+            quantize_dynamic(model_path, f"{quantized_path}.tmp", weight_type=QuantType.QInt8)
+            os.replace(f"{quantized_path}.tmp", quantized_path)
+        return quantized_path
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_tensor: bool = False, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: Optional[bool] = None,
+               device: Optional[str] = None, **kwargs):
+        """
+        SentenceTransformer.encode와 같은 형태로 임베딩 생성
+
+        Returns:
+            단일 문장이면 (D,), 목록이면 (N, D) - convert_to_tensor면 torch 텐서
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        # 길이가 비슷한 문장끼리 묶어 패딩 낭비를 줄이고 원래 순서로 복원
+        order = np.argsort([-len(text) for text in texts])
+        outputs = np.zeros((len(texts), 0), dtype=np.float32)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batch = [texts[i] for i in order[start:start + batch_size]]
+            features = self.tokenizer(batch, padding=True, truncation=True,
+                                      max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: features[name].astype(np.int64) for name in self.input_names if name in features}
+            token_embeddings = self.session.run(None, feeds)[0]
+            if self.pooling_mode == "cls":
+                batches.append(token_embeddings[:, 0])
+            else:
+                batches.append(_mean_pooling(token_embeddings, features["attention_mask"]))
+
+        if batches:
+            pooled = np.concatenate(batches).astype(np.float32)
+            outputs = np.empty_like(pooled)
+            outputs[order] = pooled
+
+        if self.normalize or normalize_embeddings:
+            outputs = outputs / np.clip(np.linalg.norm(outputs, axis=1, keepdims=True), 1e-12, None)
+
+        result = outputs[0] if single else outputs
+        if convert_to_tensor:
+            return torch.from_numpy(np.ascontiguousarray(result))
+        return result
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.encode("차원 확인").shape[-1])
+
+
+def embedding_agreement(reference, candidate, sentences: List[str] = VERIFY_SENTENCES) -> float:
+    """두 인코더 임베딩의 최소 코사인 유사도 (같은 문장 기준)"""
+    expected = np.asarray(reference.encode(sentences, convert_to_numpy=True), dtype=np.float32)
+    actual = np.asarray(candidate.encode(sentences, convert_to_numpy=True), dtype=np.float32)
+    expected /= np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual /= np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    return float((expected * actual).sum(axis=1).min())
+
+
+def benchmark_encoders(encoders: Dict[str, object], sentences: List[str] = VERIFY_SENTENCES,
+                       repeats: int = 20, batch_size: int = 32) -> Dict[str, Dict]:
+    """
+    인코더별 단일 쿼리 지연시간과 배치 처리량 비교
+
+    Returns:
+        인코더별 {'p50_ms', 'p95_ms', 'throughput_per_s', 'min_cosine_vs_first'}
+    """
+    report = {}
+    reference = None
+    for name, encoder in encoders.items():
+        encoder.encode(sentences[:1])  # 워밍업
+
+        latencies = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            encoder.encode(sentences[i % len(sentences)])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        batch = sentences * max(1, 256 // len(sentences))
+        start = time.perf_counter()
+        encoder.encode(batch, batch_size=batch_size)
+        throughput = len(batch) / (time.perf_counter() - start)
+
+        report[name] = {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "throughput_per_s": throughput,
+            "min_cosine_vs_first": 1.0 if reference is None else embedding_agreement(reference, encoder, sentences)
+        }
+        if reference is None:
+            reference = encoder
+    return report
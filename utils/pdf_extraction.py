@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+병렬 PDF 텍스트 추출 + 페이지 캐시
+
+수백 페이지 운전 매뉴얼을 페이지 구간별로 프로세스 풀에서 나눠 추출하고,
+(PDF sha256, 페이지 번호) 단위로 결과를 SQLite에 캐시한다.
+바뀌지 않은 PDF를 다시 수집하면 페이지 텍스트를 다시 추출하지 않고 캐시에서 바로 읽는다.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from PyPDF2 import PdfReader
+
+from config.user_config import PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGE_CACHE_PATH
+from utils.embedding_store import file_sha256
+
+
+def clean_page_text(text: str) -> str:
+    """기본 텍스트 정리 (공백 정리, 문장부호 .!? 외 특수문자 제거)"""
+    text = re.sub(r'\s+', ' ', text).strip()
+    cleaned_text = re.sub(r'[^\w\s가-힣.!?]', ' ', text)
+    return re.sub(r'\s+', ' ', cleaned_text).strip()
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str, str]]:
+    """
+    페이지 구간 추출 (프로세스 풀 워커 - 모듈 최상위 함수여야 pickle 가능)
+
+    Returns:
+        (페이지 번호(1부터), 원본 텍스트, 정리된 텍스트) 목록
+    """
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_index in range(start, end):
+        text = reader.pages[page_index].extract_text() or ""
+        pages.append((page_index + 1, text, clean_page_text(text) if text.strip() else ""))
+    return pages
+
+
+class PdfPageCache:
+    """(PDF 해시, 페이지) → 추출 텍스트 캐시"""
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pdf_pages ("
+            "pdf_hash TEXT NOT NULL, page INTEGER NOT NULL, original TEXT NOT NULL, content TEXT NOT NULL, "
+            "PRIMARY KEY (pdf_hash, page))"
+        )
+        self._conn.commit()
+
+    def get_pages(self, pdf_hash: str) -> Dict[int, Tuple[str, str]]:
+        """캐시된 페이지 {페이지 번호: (원본, 정리된 텍스트)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, original, content FROM pdf_pages WHERE pdf_hash = ?", (pdf_hash,)
+            ).fetchall()
+        return {page: (original, content) for page, original, content in rows}
+
+    def put_pages(self, pdf_hash: str, pages: List[Tuple[int, str, str]]):
+        """추출 결과 저장 (빈 페이지도 저장해 다시 추출하지 않음)"""
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pdf_pages (pdf_hash, page, original, content) VALUES (?, ?, ?, ?)",
+                    [(pdf_hash, page, original, content) for page, original, content in pages]
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"PDF 페이지 캐시 기록 실패: {e}")
+
+
+_page_cache: Optional[PdfPageCache] = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> Optional[PdfPageCache]:
+    """프로세스 공용 페이지 캐시 (PDF_PAGE_CACHE_PATH가 None이면 비활성)"""
+    global _page_cache
+    if not PDF_PAGE_CACHE_PATH:
+        return None
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PdfPageCache(PDF_PAGE_CACHE_PATH)
+        return _page_cache
+
+
+def _page_ranges(pages: List[int], num_ranges: int) -> List[Tuple[int, int]]:
+    """추출할 페이지 인덱스(0부터)를 연속 구간으로 나눔"""
+    ranges = []
+    size = max(1, -(-len(pages) // num_ranges))
+    for i in range(0, len(pages), size):
+        batch = pages[i:i + size]
+        # 캐시로 중간이 비는 경우 구간을 연속된 부분으로 다시 자름
+        start = prev = batch[0]
+        for page in batch[1:]:
+            if page != prev + 1:
+                ranges.append((start, prev + 1))
+                start = page
+            prev = page
+        ranges.append((start, prev + 1))
+    return ranges
+
+
+def iter_pdf_documents(pdf_path: str, file_hash: Optional[str] = None,
+                       max_workers: Optional[int] = None, use_cache: bool = True) -> Iterator[Dict]:
+    """
+    PDF 페이지 문서를 페이지 순서대로 스트리밍
+
+    Args:
+        pdf_path: PDF 경로
+        file_hash: 미리 계산한 파일 sha256 (없으면 계산)
+        max_workers: 프로세스 수 (None이면 PDF_EXTRACT_WORKERS 또는 CPU 수)
+        use_cache: 페이지 캐시 사용 여부
+
+    Yields:
+        {'content', 'page', 'source', 'original_text'} - 텍스트가 없는 페이지는 생략
+    """
+    source = os.path.basename(pdf_path)
+    cache = get_page_cache() if use_cache else None
+    pdf_hash = file_hash or (file_sha256(pdf_path) if cache else None)
+
+    cached = cache.get_pages(pdf_hash) if cache else {}
+    num_pages = len(PdfReader(pdf_path).pages)
+    missing = [i for i in range(num_pages) if i + 1 not in cached]
+    logger.info(f"PDF 텍스트 추출: {source} ({num_pages}페이지, 캐시 {num_pages - len(missing)}페이지)")
+
+    def _document(page: int, original: str, content: str) -> Optional[Dict]:
+        if not original.strip():
+            return None
+        return {'content': content, 'page': page, 'source': source, 'original_text': original}
+
+    workers = max_workers or PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+    next_page = 1
+    pending: Dict[int, Tuple[str, str]] = dict(cached)
+
+    def _drain() -> Iterator[Dict]:
+        nonlocal next_page
+        while next_page in pending:
+            document = _document(next_page, *pending.pop(next_page))
+            next_page += 1
+            if document:
+                yield document
+
+    if not missing:
+        yield from _drain()
+        return
+
+    if workers <= 1 or len(missing) < PDF_PARALLEL_MIN_PAGES:
+        # 작은 PDF는 프로세스 생성 비용이 더 크므로 현재 프로세스에서 8페이지씩 추출
+        for start, end in _page_ranges(missing, -(-len(missing) // 8)):
+            extracted = _extract_page_range(pdf_path, start, end)
+            if cache:
+                cache.put_pages(pdf_hash, extracted)
+            pending.update({page: (original, content) for page, original, content in extracted})
+            yield from _drain()
+        return
+
+    # 워커당 여러 구간을 주어 느린 페이지가 몰려도 고르게 분산
+    ranges = _page_ranges(missing, workers * 4)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        futures = [executor.submit(_extract_page_range, pdf_path, start, end) for start, end in ranges]
+        for future in as_completed(futures):
+            extracted = future.result()
+            if cache:
+                cache.put_pages(pdf_hash, extracted)
+            pending.update({page: (original, content) for page, original, content in extracted})
+            yield from _drain()
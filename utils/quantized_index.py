@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+양자화 임베딩 인덱스 (int8 스칼라 양자화 / PQ) + 정확 재정렬
+
+1차 점수는 메모리에 올린 압축 코드로 계산하고, 상위 후보 수백 개만
+mmap 저장소의 float 벡터를 읽어 정확한 코사인 유사도로 다시 매긴다.
+float 행렬 전체는 RAM에 올리지 않으므로(페이지 캐시만 사용) 작은 앱 노드에서도
+여러 플랜트 문서를 담을 수 있다.
+
+    int8: 차원별 대칭 스케일, 벡터당 D바이트 (float32 대비 1/4)
+    pq:   faiss IndexPQ, 벡터당 M바이트 (384차원 기준 48바이트, 1/32)
+
+스케일/코드북과 코드는 임베딩 저장소의 버전 디렉터리에 함께 저장해(save/load) 재시작할 때
+다시 학습하지 않고, 압축(compacted)할 때도 기존 코드에서 남길 행만 골라낸다.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+import torch
+from loguru import logger
+
+from utils.vector_index import (
+    FloatRows,
+    VectorIndex,
+    _normalize,
+    _to_float_rows,
+    _to_tensor,
+    empty_topk,
+    merge_topk
+)
+
+QUANTIZATION_KINDS = ("int8", "pq")
+
+QUANT_CODES_FILE = "quant_codes.npy"
+QUANT_SCALE_FILE = "quant_scale.npy"
+QUANT_PQ_FILE = "quant_pq.faiss"
+
+
+class QuantizedIndex(FloatRows):
+    """압축 코드로 1차 검색 후 float 벡터로 재정렬하는 인덱스
+
+    VectorIndex와 같은 build/add/remove/search 인터페이스를 가진다.
+    float 원본은 전달받은 배열(보통 mmap 저장소)을 그대로 참조하고,
+    add()로 추가된 행만 메모리에 따로 보관한다.
+    """
+
+    def __init__(self, embeddings=None, normalized: bool = False, kind: str = "int8",
+                 rerank_candidates: int = 200, pq_m: Optional[int] = None, block_rows: int = 65536):
+        """
+        Args:
+            embeddings: (N, D) 임베딩 (정규화된 mmap 배열이면 그대로 참조)
+            normalized: 이미 L2 정규화된 임베딩이면 True
+            kind: 'int8' 또는 'pq'
+            rerank_candidates: float 벡터로 재정렬할 1차 후보 수
+            pq_m: PQ 서브벡터 수 (None이면 서브벡터당 약 8차원)
+            block_rows: int8 1차 점수 계산 시 한 번에 복원할 행 수
+        """
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"지원하지 않는 양자화 종류: {kind}")
+
+        self.kind = kind
+        self.rerank_candidates = rerank_candidates
+        self.pq_m = pq_m
+        self.block_rows = block_rows
+        self._float_base = None
+        self._float_extra = None
+        self.codes: Optional[np.ndarray] = None  # int8 코드
+        self.scale: Optional[np.ndarray] = None  # int8 차원별 스케일
+        self.pq = None  # faiss IndexPQ
+        self._alive = None
+        if embeddings is not None:
+            self.build(embeddings, normalized=normalized)
+
+    # ------------------------------------------------------------------
+    # 구성
+    # ------------------------------------------------------------------
+    def build(self, embeddings, normalized: bool = False) -> "QuantizedIndex":
+        """임베딩을 양자화해 인덱스 구성"""
+        start = time.perf_counter()
+        self._float_base = _to_float_rows(embeddings, normalized)
+        self._float_extra = None
+        self._alive = None
+        self.codes, self.scale, self.pq = None, None, None
+
+        if self.kind == "pq" and len(self._float_base) < 256:
+            # PQ 코드북(8비트 = 256개 중심) 학습에 필요한 벡터 수 미달
+            logger.warning(f"PQ 학습 데이터 부족({len(self._float_base)}개), int8 양자화로 대체")
+            self.kind = "int8"
+
+        if self.kind == "int8":
+            self._build_int8()
+        else:
+            self._build_pq()
+
+        logger.info(f"{self.kind} 양자화 인덱스 구축: {len(self)}개, {time.perf_counter() - start:.2f}초, "
+                    f"코드 {self.code_bytes / 1024 / 1024:.1f}MB (float {self.float_bytes / 1024 / 1024:.1f}MB)")
+        return self
+
+    def _build_int8(self):
+        max_abs = np.zeros(self._float_base.shape[1], dtype=np.float32)
+        for block in self._blocks(self._float_base):
+            np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+        self.scale = np.maximum(max_abs, 1e-12) / 127.0
+        self.codes = np.concatenate([self._quantize_int8(block) for block in self._blocks(self._float_base)]) \
+            if len(self._float_base) else np.zeros((0, self._float_base.shape[1]), dtype=np.int8)
+
+    def _quantize_int8(self, block: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(block / self.scale), -127, 127).astype(np.int8)
+
+    def _build_pq(self):
+        dim = self._float_base.shape[1]
+        m = self.pq_m
+        if m is None:
+            m = max(1, dim // 8)
+            while dim % m:
+                m -= 1
+        self.pq = faiss.IndexPQ(dim, m, 8, faiss.METRIC_INNER_PRODUCT)
+
+        # 코드북은 표본으로 학습 (전체 mmap을 메모리로 올리지 않음)
+        sample_size = min(len(self._float_base), 65536)
+        sample_ids = np.sort(np.random.default_rng(0).choice(len(self._float_base), sample_size, replace=False))
+        self.pq.train(np.ascontiguousarray(self._float_base[sample_ids], dtype=np.float32))
+        for block in self._blocks(self._float_base):
+            self.pq.add(np.ascontiguousarray(block))
+
+    def _pq_codes(self) -> np.ndarray:
+        """PQ 코드 (ntotal, code_size) uint8"""
+        return faiss.vector_to_array(self.pq.codes).reshape(self.pq.ntotal, self.pq.code_size)
+
+    def compacted(self, keep: Sequence[int]) -> "QuantizedIndex":
+        """keep 행(오름차순)만 남긴 새 인덱스
+
+        스케일/코드북은 다시 학습하지 않고, float 원본은 mmap을 복사하지 않는 행 뷰로 둔다.
+        """
+        keep = np.asarray(keep, dtype=np.int64)
+        base_keep = keep[keep < self.base_count]
+        result = QuantizedIndex(kind=self.kind, rerank_candidates=self.rerank_candidates,
+                                pq_m=self.pq_m, block_rows=self.block_rows)
+        result._float_base, result._float_extra = self._subset_rows(keep)
+        if self.kind == "int8":
+            result.scale = self.scale
+            result.codes = np.asarray(self.codes)[base_keep]
+        else:
+            result.pq = faiss.clone_index(self.pq)
+            result.pq.reset()
+            result.pq.add_sa_codes(np.ascontiguousarray(self._pq_codes()[base_keep]))
+        return result
+
+    def save(self, path: str):
+        """압축 코드를 디렉터리에 기록 (int8: 코드 + 스케일, pq: 학습된 IndexPQ)
+
+        마지막 로드 이후 추가된 행도 기존 스케일/코드북으로 양자화해 함께 기록한다.
+        """
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        if self.kind == "int8":
+            codes = self.codes
+            if self._float_extra is not None:
+                codes = np.concatenate([codes, self._quantize_int8(self._float_extra)])
+            for name, array in ((QUANT_SCALE_FILE, self.scale), (QUANT_CODES_FILE, codes)):
+                file_path = os.path.join(path, name)
+                with open(f"{file_path}.{suffix}", "wb") as f:
+                    np.save(f, np.asarray(array))
+                os.replace(f"{file_path}.{suffix}", file_path)
+        else:
+            pq = self.pq
+            if self._float_extra is not None:
+                pq = faiss.clone_index(self.pq)
+                pq.add(np.ascontiguousarray(self._float_extra))
+            file_path = os.path.join(path, QUANT_PQ_FILE)
+            faiss.write_index(pq, f"{file_path}.{suffix}")
+            os.replace(f"{file_path}.{suffix}", file_path)
+
+    @classmethod
+    def load(cls, path: str, embeddings, kind: str, **kwargs) -> "QuantizedIndex":
+        """
+        save()로 기록한 코드와 정규화된 float 원본(보통 mmap 저장소)으로 복원
+
+        int8 코드는 mmap으로 열어 여러 워커 프로세스가 같은 페이지 캐시를 공유한다.
+        """
+        index = cls(kind=kind, **kwargs)
+        index._float_base = _to_float_rows(embeddings, normalized=True)
+        if kind == "int8":
+            index.scale = np.load(os.path.join(path, QUANT_SCALE_FILE))
+            index.codes = np.load(os.path.join(path, QUANT_CODES_FILE), mmap_mode="r")
+            count = len(index.codes)
+        else:
+            index.pq = faiss.read_index(os.path.join(path, QUANT_PQ_FILE))
+            count = index.pq.ntotal
+        if count != len(index._float_base):
+            raise ValueError(f"양자화 코드 수({count})와 임베딩 수({len(index._float_base)})가 다릅니다")
+        return index
+
+    def add(self, embeddings, normalized: bool = False) -> List[int]:
+        """임베딩 추가 - 코드는 그대로 두고 저장 전까지 추가 행으로 정확 검색 (copy()와 공유 가능)"""
+        rows = np.asarray(_to_float_rows(embeddings, normalized), dtype=np.float32)
+        if rows.shape[0] == 0:
+            return []
+        if self._float_base is None:
+            self.build(rows, normalized=True)
+            return list(range(rows.shape[0]))
+
+        start = len(self)
+        self._append_rows(rows)
+        return list(range(start, start + rows.shape[0]))
+
+    # ------------------------------------------------------------------
+    # 정보
+    # ------------------------------------------------------------------
+    @property
+    def code_bytes(self) -> int:
+        """메모리에 상주하는 압축 코드 크기"""
+        if self.kind == "int8":
+            return 0 if self.codes is None else self.codes.nbytes + self.scale.nbytes
+        return 0 if self.pq is None else self.pq.ntotal * self.pq.code_size
+
+    @property
+    def float_bytes(self) -> int:
+        """같은 벡터를 float32로 메모리에 올렸을 때의 크기"""
+        return len(self) * self.dim * 4
+
+    # ------------------------------------------------------------------
+    # 검색
+    # ------------------------------------------------------------------
+    def _first_pass(self, queries: np.ndarray, candidates: int) -> np.ndarray:
+        """압축 코드로 원본 행의 1차 후보 추출 - (Q, candidates) 행 번호 (모자라면 -1)"""
+        alive, alive_count = self._base_alive()
+        if self.kind == "pq":
+            dead = self.base_count - alive_count
+            _, ids = self.pq.search(np.ascontiguousarray(queries), min(candidates + dead, self.base_count))
+            result = np.full((len(queries), candidates), -1, dtype=np.int64)
+            for q, row in enumerate(ids):
+                row = row[row >= 0]
+                if alive is not None:
+                    row = row[alive[row]]
+                result[q, :min(candidates, len(row))] = row[:candidates]
+            return result
+
+        # 블록마다 상위 후보만 남겨 (Q, N) 점수 행렬을 만들지 않음
+        scaled = queries * self.scale
+        best_scores, best_ids = empty_topk(len(queries))
+        for start in range(0, len(self.codes), self.block_rows):
+            block = np.asarray(self.codes[start:start + self.block_rows]).astype(np.float32)
+            scores = scaled @ block.T
+            if alive is not None:
+                scores[:, ~alive[start:start + len(block)]] = -np.inf
+            best_scores, best_ids = merge_topk(best_scores, best_ids, scores,
+                                               np.arange(start, start + len(block)), candidates)
+        return np.where(np.isfinite(best_scores), best_ids, -1)
+
+    def search(self, query_embeddings, top_k: int = 5) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        1차 양자화 점수 → float 재정렬 top-k 검색
+
+        Returns:
+            (scores, indices) - 각각 (Q, k) 텐서, 점수는 정확한 코사인 유사도
+        """
+        queries = _to_tensor(query_embeddings)
+        if queries.dim() == 1:
+            queries = queries.unsqueeze(0)
+
+        k = min(top_k, self.alive_count)
+        if k <= 0:
+            empty = torch.empty((queries.shape[0], 0))
+            return empty, empty.long()
+
+        queries = _normalize(queries).numpy()
+        candidates = min(max(self.rerank_candidates, k), self._base_alive()[1])
+        if candidates > 0:
+            first = self._first_pass(queries, candidates)
+
+            # 쿼리 배치 전체 후보를 한 번에 읽어 재정렬
+            unique_ids, inverse = np.unique(np.where(first >= 0, first, 0), return_inverse=True)
+            rows = self.rows(unique_ids)
+            exact = np.einsum("qd,qkd->qk", queries, rows[inverse.reshape(first.shape)])
+            exact[first < 0] = -np.inf
+        else:
+            exact, first = empty_topk(len(queries))
+        if self._float_extra is not None:
+            # 저장 전 추가 행은 float 그대로 정확 검색
+            exact, first = merge_topk(exact, first, *self._exact_topk(queries, k, extra_only=True), k)
+
+        order = np.argsort(-exact, axis=1)[:, :k]
+        scores = np.take_along_axis(exact, order, axis=1)
+        indices = np.take_along_axis(first, order, axis=1)
+        return torch.from_numpy(scores.astype(np.float32)), torch.from_numpy(indices.astype(np.int64))
+
+
+def quantization_report(embeddings, query_embeddings, top_k: int = 10,
+                        kinds: Iterable[str] = QUANTIZATION_KINDS,
+                        rerank_candidates: int = 200) -> Dict[str, Dict]:
+    """
+    양자화 방식별 메모리 절감량과 recall 손실 측정 (정확 검색 기준)
+
+    Returns:
+        방식별 {'code_mb', 'float_mb', 'memory_saved', 'recall@k_first_pass', 'recall@k_reranked', 'p50_ms'}
+    """
+    queries = _to_tensor(query_embeddings)
+    if queries.dim() == 1:
+        queries = queries.unsqueeze(0)
+    queries = _normalize(queries)
+    exact = VectorIndex(embeddings)
+    _, truth = exact.search(queries, top_k)
+    truth_sets = [set(row) for row in truth.tolist()]
+
+    def _recall(indices: torch.Tensor) -> float:
+        hits = sum(len(set(row) & expected) for row, expected in zip(indices.tolist(), truth_sets))
+        return hits / max(1, sum(len(s) for s in truth_sets))
+
+    report = {}
+    for kind in kinds:
+        index = QuantizedIndex(exact.embeddings.numpy(), normalized=True, kind=kind,
+                               rerank_candidates=rerank_candidates)
+        if index.kind != kind:
+            continue
+
+        # 재정렬 후보를 k개로 제한하면 1차 양자화 점수만의 순위와 같음
+        index.rerank_candidates = top_k
+        _, first_pass = index.search(queries, top_k)
+        index.rerank_candidates = rerank_candidates
+
+        latencies = []
+        reranked = []
+        for query in queries:
+            start = time.perf_counter()
+            _, indices = index.search(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            reranked.append(indices[0])
+
+        report[kind] = {
+            "code_mb": index.code_bytes / 1024 / 1024,
+            "float_mb": index.float_bytes / 1024 / 1024,
+            "memory_saved": 1 - index.code_bytes / max(1, index.float_bytes),
+            "recall@k_first_pass": _recall(first_pass),
+            "recall@k_reranked": _recall(torch.stack(reranked)),
+            "p50_ms": float(np.percentile(latencies, 50))
+        }
+    return report
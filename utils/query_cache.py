@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+쿼리 임베딩 LRU 캐시
+
+빠른 분석 버튼처럼 같은 질문이 반복되면 SentenceTransformer 순전파를 건너뛴다.
+키는 (인코더 네임스페이스, 정규화된 쿼리 텍스트)이며, 선택적으로 SQLite 디스크 계층을 둔다.
+네임스페이스는 청크 임베딩 캐시와 같은 '모델명@리비전:백엔드' 형식이라 ENCODER_BACKEND를
+torch/onnx로 바꾸거나 모델 리비전이 바뀌면 디스크에 남은 다른 인코더의 벡터를 쓰지 않는다.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from loguru import logger
+
+from config.user_config import QUERY_CACHE_SIZE, QUERY_CACHE_PATH
+from utils.embedding_cache import encoder_namespace
+from utils.vector_kv_store import VectorKVStore
+
+
+def normalize_query(text: str) -> str:
+    """캐시 키용 쿼리 정규화 (유니코드 NFC + 공백 정리)"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+class QueryEmbeddingCache:
+    """인코더(모델/리비전/백엔드)별로 분리된 쿼리 임베딩 LRU 캐시 (스레드 안전)"""
+
+    def __init__(self, max_size: int = 1024, disk_path: Optional[str] = None):
+        """
+        Args:
+            max_size: 메모리에 유지할 최대 쿼리 수
+            disk_path: SQLite 캐시 파일 경로 (None이면 메모리 전용)
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = VectorKVStore(disk_path, table="query_embeddings")
+            except Exception as e:
+                logger.warning(f"쿼리 캐시 디스크 계층 비활성화: {e}")
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, namespace: str, query: str) -> Optional[np.ndarray]:
+        """캐시된 임베딩 조회 (메모리 → 디스크 순)"""
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                return vector
+
+        if self._disk is not None:
+            vector = self._disk.get(namespace, key[1])
+            if vector is not None:
+                with self._lock:
+                    self._remember(key, vector)
+                return vector
+        return None
+
+    def put(self, namespace: str, query: str, embedding):
+        """임베딩 저장"""
+        if hasattr(embedding, "detach"):
+            embedding = embedding.detach().cpu().numpy()
+        vector = np.asarray(embedding, dtype=np.float32)
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            self._remember(key, vector)
+        if self._disk is not None:
+            self._disk.put(namespace, key[1], vector)
+
+    def encode(self, encoder, model_name: str, queries: Union[str, List[str]], **encode_kwargs) -> torch.Tensor:
+        """
+        캐시를 거쳐 쿼리 임베딩 생성 - 미스난 쿼리만 한 배치로 인코딩
+
+        Args:
+            encoder: SentenceTransformer 등 encode()를 가진 모델
+            model_name: 모델명 (리비전/백엔드와 함께 캐시 네임스페이스가 됨)
+            queries: 쿼리 하나 또는 목록
+            encode_kwargs: encoder.encode에 전달할 추가 인자
+
+        Returns:
+            단일 쿼리면 (D,), 목록이면 (Q, D) float32 텐서
+        """
+        single = isinstance(queries, str)
+        query_list = [queries] if single else list(queries)
+
+        namespace = encoder_namespace(encoder, model_name, encode_kwargs.get("normalize_embeddings", False))
+        vectors: List[Optional[np.ndarray]] = [self.get(namespace, q) for q in query_list]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        with self._lock:
+            self.hits += len(query_list) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            encode_kwargs.setdefault("convert_to_numpy", True)
+            encoded = encoder.encode([query_list[i] for i in missing], **encode_kwargs)
+            if hasattr(encoded, "detach"):
+                encoded = encoded.detach().cpu().numpy()
+            for i, vector in zip(missing, np.asarray(encoded, dtype=np.float32)):
+                vectors[i] = vector
+                self.put(namespace, query_list[i], vector)
+
+        # 캐시 항목이 호출 측에서 변경되지 않도록 복사본으로 반환
+        result = torch.tensor(np.stack(vectors), dtype=torch.float32)
+        return result[0] if single else result
+
+    def stats(self) -> Dict:
+        """적중/미스 통계"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "disk_backed": self._disk is not None
+            }
+
+    def clear(self):
+        """메모리/디스크 캐시와 통계 초기화"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """프로세스 공용 쿼리 임베딩 캐시"""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingCache(max_size=QUERY_CACHE_SIZE, disk_path=QUERY_CACHE_PATH)
+        return _query_cache
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+청크 해시 기반 증분 RAG 인덱스
+"""
+
+import os
+import copy
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from utils.embedding_store import (
+    content_hash,
+    load_embedding_store,
+    migrate_pickle_state,
+    save_embedding_store
+)
+from utils.ann_index import compact_vector_index, load_vector_index, save_vector_index
+from utils.bm25_index import BM25Index, extract_tags, reciprocal_rank_fusion
+from utils.vector_index import VectorIndex, _normalize, _to_tensor
+
+
+class RAGIndex:
+    """출처(PDF)별 청크를 해시로 관리하는 증분 갱신 RAG 인덱스
+
+    같은 출처를 다시 수집하면 새로 생기거나 바뀐 청크만 임베딩하고,
+    사라진 청크는 삭제 표시(tombstone)만 한 뒤 인덱스를 제자리에서 갱신한다.
+    삭제 표시 비율이 COMPACT_RATIO를 넘으면 저장 시 압축한다.
+    토크나이저가 주어지면 같은 행 번호로 BM25 역색인을 함께 유지한다.
+    copy()로 만든 사본은 행 데이터를 공유하므로, 검색 중인 인덱스를 건드리지 않고
+    바뀐 부분만큼의 비용으로 갱신본을 만들 수 있다.
+    """
+
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, path: str, model_name: Optional[str] = None,
+                 tokenizer: Optional[Callable[[List[str]], List[List[str]]]] = None):
+        """
+        Args:
+            path: 임베딩 저장소 디렉터리
+            model_name: 임베딩 모델명 (저장소와 다르면 재구축)
+            tokenizer: BM25용 배치 토크나이저 (None이면 밀집 검색만 사용)
+        """
+        self.path = path
+        self.model_name = model_name
+        self.tokenizer = tokenizer
+        self.bm25 = BM25Index()
+        self.chunks = []
+        self.metadata: List[Dict] = []
+        self.sources: Dict[str, Dict] = {}
+        self.vector_index = VectorIndex()
+
+    def __len__(self) -> int:
+        return self.vector_index.alive_count
+
+    @property
+    def tombstone_count(self) -> int:
+        return len(self.vector_index) - self.vector_index.alive_count
+
+    def copy(self) -> "RAGIndex":
+        """갱신용 사본 - 임베딩/코드/게시 목록은 공유하고 바뀌는 목록·삭제 표시만 따로 가짐
+
+        청크별 메타데이터 dict는 갱신 시 새 dict로 교체하므로 공유해도 원본이 바뀌지 않는다.
+        """
+        clone = copy.copy(self)
+        clone.chunks = list(self.chunks) if isinstance(self.chunks, list) else self.chunks
+        clone.metadata = list(self.metadata)
+        clone.sources = dict(self.sources)
+        clone.vector_index = self.vector_index.copy()
+        clone.bm25 = self.bm25.copy()
+        return clone
+
+    def load(self) -> bool:
+        """저장소 로드 (구버전 state.pkl은 변환). 저장소가 없으면 False"""
+        store = load_embedding_store(self.path)
+        if store is None:
+            store = migrate_pickle_state(os.path.join(self.path, "state.pkl"), self.path,
+                                         model_name=self.model_name)
+        if store is None:
+            return False
+
+        stored_model = store.manifest.get("model_name")
+        if self.model_name and stored_model and stored_model != self.model_name:
+            logger.warning(f"임베딩 모델 불일치 ({stored_model} != {self.model_name}), 인덱스를 재구축합니다")
+            return False
+
+        metadata = store.metadata
+        if len(metadata) != len(store.chunks):
+            # 해시 정보가 없는 구버전 저장소 - 출처 미상(None)으로 두고 다음 수집 시 재사용
+            metadata = [{"hash": content_hash(chunk), "source": None} for chunk in store.chunks]
+
+        self.chunks = store.chunks
+        self.metadata = metadata
+        self.sources = store.manifest.get("sources", {})
+        self.vector_index = load_vector_index(store.path, store.embeddings, store.digest)
+        deleted = [i for i, meta in enumerate(metadata) if meta.get("deleted")]
+        self.vector_index.remove(deleted)
+
+        self.bm25 = BM25Index.load(store.path)
+        if self.bm25 is None or len(self.bm25) != len(self.chunks):
+            # 역색인이 없거나 저장소와 어긋나면 청크로 다시 구성
+            self.bm25 = BM25Index()
+            self.bm25.add(self._tokenize(list(self.chunks)))
+            self.bm25.remove(deleted)
+        return True
+
+    def close(self):
+        """교체되어 더는 쓰지 않는 인덱스의 청크 파일 핸들 해제 (이후 검색이 오면 다시 연다)"""
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+
+    def save(self):
+        """저장소에 기록 후 mmap으로 다시 열어 메모리를 페이지 캐시로 돌려줌"""
+        if len(self.vector_index) and self.tombstone_count > self.COMPACT_RATIO * len(self.vector_index):
+            self.compact()
+
+        save_embedding_store(
+            self.path,
+            self.chunks,
+            self.vector_index.row_segments() if len(self.vector_index) else [],
+            metadata=self.metadata,
+            model_name=self.model_name,
+            extra={"sources": self.sources},
+            companions=self._save_companions
+        )
+        self.load()
+
+    def _save_companions(self, store_dir: str, manifest_digest: str):
+        """저장소와 같은 버전 디렉터리에 BM25 역색인과 ANN 인덱스 기록 (CURRENT 교체와 함께 공개됨)
+
+        메모리의 ANN 인덱스에 증분 추가된 행까지 그대로 저장하므로 다시 로드할 때 구축하지 않는다.
+        """
+        if self.tokenizer is not None:
+            self.bm25.save(store_dir)
+        save_vector_index(store_dir, self.vector_index, manifest_digest)
+
+    def compact(self):
+        """삭제 표시된 청크를 실제로 제거"""
+        keep = [i for i, meta in enumerate(self.metadata) if not meta.get("deleted")]
+        removed = len(self.metadata) - len(keep)
+
+        self.chunks = [self.chunks[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.vector_index = compact_vector_index(self.vector_index, keep)
+        self.bm25.compact(keep)
+        logger.info(f"RAG 인덱스 압축: 삭제 표시 청크 {removed}개 제거")
+
+    def is_source_current(self, source: str, file_hash: Optional[str]) -> bool:
+        """출처 파일이 마지막 수집 이후 바뀌지 않았는지 확인"""
+        return file_hash is not None and self.sources.get(source, {}).get("file_hash") == file_hash
+
+    def upsert_source(self, source: str, chunk_dicts: Iterable[Dict],
+                      encode_fn: Callable[[List[str]], object],
+                      file_hash: Optional[str] = None) -> Dict:
+        """
+        출처 하나의 청크 목록으로 인덱스를 증분 갱신
+
+        Args:
+            source: 출처 이름 (예: PDF 파일명)
+            chunk_dicts: chunk_documents_with_kiwi 결과 (content, page 등)
+            encode_fn: 텍스트 목록 → (N, D) 임베딩
+            file_hash: 출처 파일 해시 (변경 여부 판단용)
+
+        Returns:
+            {'added', 'removed', 'unchanged'} 청크 수
+        """
+        # 출처 내 동일 청크는 하나만 유지
+        incoming: Dict[str, Dict] = {}
+        for chunk in chunk_dicts:
+            incoming.setdefault(content_hash(chunk["content"]), chunk)
+
+        # 이 출처(또는 출처 미상인 구버전 청크)의 살아있는 청크
+        existing: Dict[str, int] = {}
+        for i, meta in enumerate(self.metadata):
+            if not meta.get("deleted") and meta.get("source") in (source, None):
+                existing.setdefault(meta["hash"], i)
+
+        removed = [i for h, i in existing.items() if h not in incoming]
+        for i in removed:
+            self.metadata[i] = {**self.metadata[i], "deleted": True}
+        self.vector_index.remove(removed)
+        self.bm25.remove(removed)
+
+        for h, i in existing.items():
+            if h in incoming:
+                self.metadata[i] = self._chunk_metadata(incoming[h], h, source)
+
+        new_hashes = [h for h in incoming if h not in existing]
+        if new_hashes:
+            texts = [incoming[h]["content"] for h in new_hashes]
+            logger.info(f"[{source}] 신규/변경 청크 {len(texts)}개 임베딩 중...")
+            self.vector_index.add(encode_fn(texts))
+            self.bm25.add(self._tokenize(texts))
+            if not isinstance(self.chunks, list):
+                self.chunks = list(self.chunks)
+            self.chunks.extend(texts)
+            self.metadata.extend(self._chunk_metadata(incoming[h], h, source) for h in new_hashes)
+
+        self.sources[source] = {
+            "file_hash": file_hash,
+            "chunk_count": len(incoming),
+            "updated_at": datetime.now().isoformat()
+        }
+
+        stats = {
+            "added": len(new_hashes),
+            "removed": len(removed),
+            "unchanged": len(incoming) - len(new_hashes)
+        }
+        logger.info(f"[{source}] 증분 갱신: 추가 {stats['added']}, 삭제 {stats['removed']}, 유지 {stats['unchanged']}")
+        return stats
+
+    def remove_source(self, source: str) -> int:
+        """출처의 모든 청크를 삭제 표시"""
+        removed = [i for i, meta in enumerate(self.metadata)
+                   if meta.get("source") == source and not meta.get("deleted")]
+        for i in removed:
+            self.metadata[i] = {**self.metadata[i], "deleted": True}
+        self.vector_index.remove(removed)
+        self.bm25.remove(removed)
+        self.sources.pop(source, None)
+        return len(removed)
+
+    def search(self, query_embeddings, top_k: int = 5) -> List[List[Dict]]:
+        """
+        쿼리 배치 검색
+
+        Returns:
+            쿼리별 결과 목록 - 각 결과는 index, content, score, page, source, hash
+        """
+        scores, indices = self.vector_index.search(query_embeddings, top_k)
+        return [
+            [self._hit(idx, score) for idx, score in zip(row_indices, row_scores)]
+            for row_scores, row_indices in zip(scores.tolist(), indices.tolist())
+        ]
+
+    def hybrid_search(self, query: str, query_embedding, top_k: int = 5,
+                      candidates: int = 20, rrf_k: int = 60) -> List[Dict]:
+        """
+        밀집 검색 + BM25 결과를 RRF로 결합한 단일 쿼리 검색
+
+        Args:
+            query: 쿼리 텍스트 (BM25/태그 매칭용)
+            query_embedding: (D,) 쿼리 임베딩
+            top_k: 반환할 결과 수
+            candidates: 각 검색기에서 가져올 후보 수
+            rrf_k: RRF 순위 완화 상수
+
+        Returns:
+            결과 목록 - search()의 필드에 더해 rrf_score, bm25_score, bm25_rank, tag_match
+            (score는 항상 밀집 코사인 유사도, bm25_rank는 BM25 후보가 아니면 None)
+        """
+        scores, indices = self.vector_index.search(query_embedding, candidates)
+        dense = dict(zip(indices[0].tolist(), scores[0].tolist()))
+
+        sparse = {}
+        if self.tokenizer is not None and self.bm25.alive_count:
+            sparse = dict(self.bm25.search(self._tokenize([query])[0], candidates))
+
+        fused = reciprocal_rank_fusion([list(dense), list(sparse)], k=rrf_k)[:top_k]
+        if not fused:
+            return []
+
+        # BM25에서만 나온 후보는 코사인 유사도를 직접 계산
+        missing = [idx for idx, _ in fused if idx not in dense]
+        if missing:
+            query_vector = _normalize(_to_tensor(query_embedding).flatten())
+            rows = _to_tensor(self.vector_index.rows(missing))
+            for idx, score in zip(missing, (rows @ query_vector).tolist()):
+                dense[idx] = score
+
+        sparse_rank = {idx: rank for rank, idx in enumerate(sparse)}
+        query_tags = [tag.lower() for tag in extract_tags(query)]
+        hits = []
+        for idx, rrf_score in fused:
+            hit = self._hit(idx, dense[idx])
+            hit["rrf_score"] = rrf_score
+            hit["bm25_score"] = sparse.get(idx, 0.0)
+            hit["bm25_rank"] = sparse_rank.get(idx)
+            hit["tag_match"] = any(self.bm25.has_term(idx, tag) for tag in query_tags)
+            hits.append(hit)
+        return hits
+
+    def _tokenize(self, texts: List[str]) -> List[List[str]]:
+        """BM25 토큰화 (토크나이저가 없으면 빈 문서로 두어 행 번호만 맞춤)"""
+        if self.tokenizer is None or not texts:
+            return [[] for _ in texts]
+        return self.tokenizer(texts)
+
+    def _hit(self, idx: int, score: float) -> Dict:
+        meta = self.metadata[idx]
+        return {
+            "index": idx,
+            "content": self.chunks[idx],
+            "score": score,
+            "page": meta.get("page"),
+            "source": meta.get("source"),
+            "hash": meta.get("hash")
+        }
+
+    @staticmethod
+    def _chunk_metadata(chunk: Dict, chunk_hash: str, source: str) -> Dict:
+        meta = {k: v for k, v in chunk.items() if k != "content"}
+        meta.update({"hash": chunk_hash, "source": source})
+        return meta
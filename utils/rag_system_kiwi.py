@@ -2,14 +2,40 @@ import os
 import pickle
 import faiss
 import numpy as np
-from typing import List, Dict, Tuple, Optional
-from sentence_transformers import SentenceTransformer
-from PyPDF2 import PdfReader
-import streamlit as st
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator
 from loguru import logger
 import re
+import itertools
+from collections import deque
 from kiwipiepy import Kiwi
 import torch
+from utils.vector_index import VectorIndex
+from utils.ann_index import create_vector_index, to_faiss_index, from_faiss_index
+from utils.bm25_index import BM25Index, kiwi_tokenize, reciprocal_rank_fusion
+from utils.query_cache import get_query_cache
+from utils.embedding_cache import encode_chunks
+from utils.model_registry import get_registry, get_sentence_encoder
+from utils.pdf_extraction import clean_page_text, iter_pdf_documents
+from config.user_config import KIWI_NUM_WORKERS
+
+KIWI_USER_DICT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "config", "kiwi_user_dict.txt")
+
+
+def build_pid_kiwi(dict_path: str = KIWI_USER_DICT_PATH) -> Kiwi:
+    """
+    P&ID 사용자 사전을 불러온 Kiwi 생성
+
+    단어별 add_user_word 호출 대신 사전 파일(단어<TAB>품사<TAB>점수)을 한 번에 로드한다.
+    """
+    kiwi = Kiwi(num_workers=KIWI_NUM_WORKERS)
+    try:
+        added = kiwi.load_user_dictionary(dict_path)
+        logger.info(f"P&ID 사용자 사전 로드 완료: {dict_path} ({added}개)")
+    except Exception as e:
+        logger.warning(f"Kiwi 사용자 사전 파일 로드 실패: {e}")
+    return kiwi
+
 
 class RAGSystemWithKiwi:
     """Kiwi 형태소 분석기를 통합한 고급 RAG 시스템"""
@@ -23,6 +49,7 @@ class RAGSystemWithKiwi:
         """
         self.model_name = model_name
         self.embedding_model = None
+        self.query_cache = get_query_cache()
         self.index = None
         self.texts = []
         self.metadata = []
@@ -31,12 +58,13 @@ class RAGSystemWithKiwi:
         
         # PyTorch 기반 임베딩 저장 (코사인 유사도용)
         self.torch_embeddings = None
+        self.vector_index = None
         
-        # Kiwi 형태소 분석기 초기화
-        self.kiwi = Kiwi()
+        # Kiwi 형태소 기반 BM25 역색인 (태그 정확 매칭용)
+        self.bm25_index = None
         
-        # P&ID 전문 용어를 Kiwi 사용자 사전에 추가
-        self._add_technical_terms_to_kiwi()
+        # Kiwi 형태소 분석기 (첫 사용 시 지연 생성 - kiwi 속성 참고)
+        self._kiwi = None
         
         # P&ID 전문 용어 사전
         self.technical_terms = {
@@ -57,66 +85,26 @@ class RAGSystemWithKiwi:
             'SCADA': '감시 제어 및 데이터 취득 (Supervisory Control and Data Acquisition)'
         }
     
-    def _add_technical_terms_to_kiwi(self):
-        """P&ID 전문 용어를 Kiwi 사용자 사전에 추가"""
-        try:
-            # P&ID 계측기기 태그들
-            pid_tags = [
-                'FT', 'FC', 'FV', 'AT', 'AC', 'PT', 'PC', 'TT', 'TC', 'LT', 'LC',
-                'FIC', 'PIC', 'TIC', 'LIC', 'AIC', 'FRC', 'PRC', 'TRC', 'LRC',
-                'FSL', 'FSH', 'PSL', 'PSH', 'TSL', 'TSH', 'LSL', 'LSH',
-                'PSHH', 'PSLL', 'TSHH', 'TSLL', 'LSHH', 'LSLL'
-            ]
-            
-            # 기술 용어들
-            technical_words = [
-                '배관', '계장', '다이어그램', '전송기', '조절기', '밸브', '센서',
-                '압력', '온도', '유량', '액위', '분석기', '제어', '시스템',
-                '안전장치', '비상정지', '인터록', '알람', '트립', '셧다운',
-                '공정', '플랜트', '설비', '운전', '정비', '점검', '교정'
-            ]
-            
-            # 사용자 사전에 추가
-            for tag in pid_tags:
-                self.kiwi.add_user_word(tag, 'NNP', 10.0)  # 고유명사로 추가
-            
-            for word in technical_words:
-                self.kiwi.add_user_word(word, 'NNG', 5.0)  # 일반명사로 추가
-                
-            logger.info("P&ID 전문 용어를 Kiwi 사용자 사전에 추가 완료")
-            
-        except Exception as e:
-            logger.warning(f"Kiwi 사용자 사전 추가 실패: {e}")
+    @property
+    def kiwi(self) -> Kiwi:
+        """Kiwi 형태소 분석기 - 처음 토큰화할 때 생성 (P&ID 사용자 사전 포함, 프로세스 공용)"""
+        if self._kiwi is None:
+            self._kiwi = get_registry().get_or_load("kiwi:pid", build_pid_kiwi)
+        return self._kiwi
     
-    @st.cache_resource
-    def load_embedding_model(_self):
-        """임베딩 모델 로드 (캐싱)"""
+    def load_embedding_model(self):
+        """임베딩 모델 로드 (프로세스 공용 레지스트리에서 공유)"""
         try:
-            logger.info(f"임베딩 모델 로드 중: {_self.model_name}")
-            return SentenceTransformer(_self.model_name)
+            return get_sentence_encoder(self.model_name)
         except Exception as e:
             logger.error(f"임베딩 모델 로드 실패: {e}")
-            return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+            return get_sentence_encoder("sentence-transformers/all-MiniLM-L6-v2")
     
     def extract_text_from_pdf(self, pdf_path: str) -> List[Dict]:
-        """PDF에서 텍스트 추출"""
+        """PDF에서 텍스트 추출 (페이지 병렬 + 페이지 캐시)"""
         try:
             logger.info(f"PDF 텍스트 추출 시작: {pdf_path}")
-            reader = PdfReader(pdf_path)
-            documents = []
-            
-            for page_num, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text.strip():
-                    # 기본 텍스트 정리만 수행 (형태소 분석 제외)
-                    cleaned_text = self._basic_text_cleaning(text)
-                    documents.append({
-                        'content': cleaned_text,
-                        'page': page_num + 1,
-                        'source': os.path.basename(pdf_path),
-                        'original_text': text  # 원본 텍스트도 보존
-                    })
-            
+            documents = list(self.iter_pdf_documents(pdf_path))
             logger.info(f"총 {len(documents)}개 페이지에서 텍스트 추출 완료")
             return documents
             
@@ -124,29 +112,22 @@ class RAGSystemWithKiwi:
             logger.error(f"PDF 텍스트 추출 실패: {e}")
             return []
     
+    def iter_pdf_documents(self, pdf_path: str, file_hash: Optional[str] = None) -> Iterator[Dict]:
+        """
+        PDF 페이지 문서를 페이지 순서대로 스트리밍 (청킹에 바로 연결)
+        
+        각 문서는 content(기본 정리된 텍스트), page, source, original_text를 가진다.
+        """
+        return iter_pdf_documents(pdf_path, file_hash=file_hash)
+    
     def _basic_text_cleaning(self, text: str) -> str:
         """기본 텍스트 정리 (형태소 분석 없이)"""
-        print(f"\n=== Kiwi 기본 정리 시작 ===")
-        print(f"원본 텍스트 (처음 100자): {text[:100]}...")
-        print(f"원본 텍스트 길이: {len(text)}")
-        
-        # 1. 기본 정리
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        print(f"기본 정리 후 길이: {len(text)}")
+        cleaned_text = clean_page_text(text)
         
-        # 2. 특수문자 정리 (문장부호 .!? 보존)
-        cleaned_text = re.sub(r'[^\w\s가-힣.!?]', ' ', text)
-        cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
-        
-        print(f"특수문자 제거 후 길이: {len(cleaned_text)}")
-        print(f"처리된 텍스트 (처음 100자): {cleaned_text[:100]}...")
-        print(f"압축 비율: {len(cleaned_text)/len(text) if len(text) > 0 else 0:.2f}")
-        
-        # P&ID 관련 태그 찾기
+        logger.debug(f"Kiwi 기본 정리: {len(text)}자 → {len(cleaned_text)}자 "
+                     f"(압축 비율 {len(cleaned_text)/len(text) if len(text) > 0 else 0:.2f})")
         pid_tags = re.findall(r'\b[A-Z]{1,3}-?\d*\b', cleaned_text)
-        print(f"발견된 P&ID 태그들: {pid_tags}")
-        print(f"=== Kiwi 기본 정리 완료 ===\n")
+        logger.debug(f"발견된 P&ID 태그들: {pid_tags}")
         
         return cleaned_text
     
@@ -207,121 +188,86 @@ class RAGSystemWithKiwi:
         text = text.strip()
         return text
     
-    def chunk_documents_with_kiwi(self, documents: List[Dict], chunk_size: int = 3, overlap: int = 0) -> List[Dict]:
+    def chunk_documents_with_kiwi(self, documents: Iterable[Dict], chunk_size: int = 3, overlap: int = 0) -> List[Dict]:
         """Kiwi 문장 분할 기반 청킹 (형태소 분석 제외)"""
-        print(f"\n=== Kiwi 문장 분할 청킹 시작 ===")
-        print(f"전체 문서 수: {len(documents)}")
-        print(f"청크 크기: {chunk_size}줄, 오버랩: {overlap}줄")
+        chunks = list(self.iter_chunks_with_kiwi(documents))
+        logger.info(f"총 {len(chunks)}개 Kiwi 문장분할 청크 생성 완료")
+        return chunks
+    
+    def iter_chunks_with_kiwi(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Kiwi 문장 분할 기반 스트리밍 청킹
+        
+        모든 문서를 한 번의 Kiwi 배치 호출(멀티 워커)로 문장 분할하고, 청크를
+        page/source 메타데이터와 함께 하나씩 내보낸다. 문서 스트림 전체를 메모리에 올리지 않는다.
+        Kiwi 분할이 실패하면 남은 문서는 정규식 문장 분할로 처리한다.
+        """
+        chunk_ids = itertools.count()
+        doc_iter = iter(documents)
+        pending = deque()  # Kiwi에 넘겼지만 아직 결과를 받지 않은 문서 (입력 순서 유지)
         
-        chunks = []
+        def _texts():
+            for doc in doc_iter:
+                pending.append(doc)
+                yield self.clean_text_for_sentence_split(doc['content'])
         
-        for doc_idx, doc in enumerate(documents):
-            text = doc['content']
-            
-            print(f"\n문서 {doc_idx + 1} (페이지 {doc['page']}): {len(text)}자")
+        try:
+            for sentence_objs in self.kiwi.split_into_sents(_texts()):
+                doc = pending.popleft()
+                yield from self._pack_sentences([s.text for s in sentence_objs], doc, chunk_ids, 'kiwi_sentence_split')
+        except Exception as e:
+            logger.warning(f"Kiwi 문장 분할 실패, 기본 청킹 사용: {e}")
             
-            try:
-                # Kiwi를 사용한 문장 분할만 수행
-                cleaned_text = self.clean_text_for_sentence_split(text)
-                sentence_objs = self.kiwi.split_into_sents(cleaned_text)
-                sentences = [s.text for s in sentence_objs]
-                
-                print(f"  Kiwi 문장 분할: {len(sentences)}개 문장")
-                
-                # 의미 기반 청킹 (200-400자)
-                doc_chunks = 0
-                current_chunk = ""
-                
-                for sent in sentences:
-                    if len(current_chunk + sent) < 400:
-                        current_chunk += sent + " "
-                    else:
-                        if len(current_chunk) >= 200:
-                            chunks.append({
-                                'content': current_chunk.strip(),
-                                'page': doc['page'],
-                                'source': doc['source'],
-                                'chunk_id': len(chunks),
-                                'sentence_count': len(current_chunk.split('.')),
-                                'kiwi_sentence_split': True
-                            })
-                            doc_chunks += 1
-                            current_chunk = sent + " "
-                        else:
-                            current_chunk += sent + " "
-                
-                # 마지막 청크 처리
-                if current_chunk and len(current_chunk) >= 100:
-                    chunks.append({
-                        'content': current_chunk.strip(),
-                        'page': doc['page'],
-                        'source': doc['source'],
-                        'chunk_id': len(chunks),
-                        'sentence_count': len(current_chunk.split('.')),
-                        'kiwi_sentence_split': True
-                    })
-                    doc_chunks += 1
-                
-                if doc_chunks <= 3:  # 처음 3개 청크만 상세 출력
-                    for i, chunk in enumerate([c for c in chunks if c['page'] == doc['page']][:3], 1):
-                        print(f"  → 청크 {i}: {len(chunk['content'])}자")
-                        print(f"    내용: {chunk['content'][:80]}...")
-                
-                print(f"  → 총 {doc_chunks}개 Kiwi 문장분할 청크 생성")
-                        
-            except Exception as e:
-                print(f"  Kiwi 문장 분할 실패: {e}, 기본 청킹 사용")
-                logger.warning(f"Kiwi 문장 분할 실패, 기본 청킹 사용: {e}")
-                
-                # 기본 문장 분할로 폴백
-                cleaned_text = self.clean_text_for_sentence_split(text)
+            # 기본 문장 분할로 폴백 (아직 처리하지 않은 문서부터)
+            for doc in itertools.chain(list(pending), doc_iter):
+                cleaned_text = self.clean_text_for_sentence_split(doc['content'])
                 sentences = re.split(r'(?<=[.!?]) +', cleaned_text.strip())
-                
-                doc_chunks = 0
-                current_chunk = ""
-                
-                for sent in sentences:
-                    if len(current_chunk + sent) < 400:
-                        current_chunk += sent + " "
-                    else:
-                        if len(current_chunk) >= 200:
-                            chunks.append({
-                                'content': current_chunk.strip(),
-                                'page': doc['page'],
-                                'source': doc['source'],
-                                'chunk_id': len(chunks),
-                                'sentence_count': len(current_chunk.split('.')),
-                                'fallback': True
-                            })
-                            doc_chunks += 1
-                            current_chunk = sent + " "
-                        else:
-                            current_chunk += sent + " "
-                
-                if current_chunk and len(current_chunk) >= 100:
-                    chunks.append({
-                        'content': current_chunk.strip(),
-                        'page': doc['page'],
-                        'source': doc['source'],
-                        'chunk_id': len(chunks),
-                        'sentence_count': len(current_chunk.split('.')),
-                        'fallback': True
-                    })
-                    doc_chunks += 1
-                
-                print(f"  → 폴백으로 {doc_chunks}개 청크 생성")
+                yield from self._pack_sentences(sentences, doc, chunk_ids, 'fallback')
+    
+    @staticmethod
+    def _pack_sentences(sentences: List[str], doc: Dict, chunk_ids: Iterator[int], split_flag: str,
+                        max_chars: int = 400, min_chars: int = 200, min_last_chars: int = 100) -> Iterator[Dict]:
+        """
+        문장을 200~400자 청크로 묶기 (문자열을 매번 다시 만들지 않고 길이만 누적)
         
-        print(f"\n총 {len(chunks)}개 Kiwi 문장분할 청크 생성 완료")
-        print(f"=== Kiwi 문장 분할 청킹 완료 ===\n")
-        return chunks
+        청크 길이는 '문장 + 공백' 단위로 계산한다.
+        """
+        parts: List[str] = []
+        length = 0
+        
+        def _chunk() -> Dict:
+            content = ' '.join(parts).strip()
+            return {
+                'content': content,
+                'page': doc['page'],
+                'source': doc['source'],
+                'chunk_id': next(chunk_ids),
+                'sentence_count': content.count('.') + 1,
+                split_flag: True
+            }
+        
+        for sent in sentences:
+            if length + len(sent) >= max_chars and length >= min_chars:
+                yield _chunk()
+                parts, length = [], 0
+            parts.append(sent)
+            length += len(sent) + 1
+        
+        # 마지막 청크 처리
+        if parts and length >= min_last_chars:
+            yield _chunk()
+    
+    def tokenize_for_bm25(self, texts: List[str]) -> List[List[str]]:
+        """BM25용 토큰화 (Kiwi 형태소 + 정규화된 계측기 태그)"""
+        return kiwi_tokenize(self.kiwi, texts)
     
     def create_embeddings(self, texts: List[str]) -> np.ndarray:
-        """텍스트 임베딩 생성"""
+        """텍스트 임베딩 생성 (이미 계산된 텍스트는 임베딩 캐시에서 재사용)"""
         if self.embedding_model is None:
             self.embedding_model = self.load_embedding_model()
         
         logger.info(f"{len(texts)}개 텍스트 임베딩 생성 중...")
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True)
+        embeddings = encode_chunks(self.embedding_model, self.model_name, texts, show_progress_bar=True)
         return embeddings
     
     def retrieve_relevant_chunks(self, query: str, chunks: List[str] = None, embeddings: torch.Tensor = None, top_k: int = 5) -> str:
@@ -354,20 +300,28 @@ class RAGSystemWithKiwi:
             # 쿼리 기본 정리 (형태소 분석 제외)
             processed_query = self._basic_text_cleaning(query)
             
-            # 입력된 질문을 임베딩합니다
-            query_embedding = self.embedding_model.encode(processed_query, convert_to_tensor=True, device='cpu')
-            
-            # 쿼리 임베딩을 정규화합니다
-            query_embedding = query_embedding / torch.norm(query_embedding)
+            # 입력된 질문을 임베딩합니다 (반복 질문은 캐시에서 재사용)
+            query_embedding = self.query_cache.encode(self.embedding_model, self.model_name, processed_query, device='cpu')
             
-            # 모든 청크 임베딩을 정규화합니다
-            embeddings = embeddings.cpu() / torch.norm(embeddings.cpu(), dim=1, keepdim=True)
-            
-            # 각 청크 임베딩과 쿼리 임베딩 간의 유사도를 계산합니다
-            similarities = torch.matmul(embeddings, query_embedding)
+            # 저장된 임베딩은 미리 정규화된 인덱스를 재사용하고, 외부 임베딩만 새로 감쌉니다
+            if embeddings is self.torch_embeddings:
+                if self.vector_index is None:
+                    self.vector_index = create_vector_index(self.torch_embeddings)
+                index = self.vector_index
+            else:
+                index = VectorIndex(embeddings)
             
             # 가장 유사한 청크 N개의 인덱스를 추출합니다
-            top_k_indices = torch.topk(similarities, min(top_k, len(similarities))).indices.tolist()
+            if chunks is self.texts and self.bm25_index is not None:
+                # 저장된 DB는 BM25 결과와 RRF로 결합해 태그 질의도 정확히 찾음
+                candidates = max(top_k * 4, 20)
+                _, dense_indices = index.search(query_embedding, candidates)
+                sparse_hits = self.bm25_index.search(self.tokenize_for_bm25([query])[0], candidates)
+                fused = reciprocal_rank_fusion([dense_indices[0].tolist(), [i for i, _ in sparse_hits]])
+                top_k_indices = [i for i, _ in fused[:top_k]]
+            else:
+                _, top_k_indices = index.search(query_embedding, top_k)
+                top_k_indices = top_k_indices[0].tolist()
             
             # 해당 인덱스에 해당하는 청크들을 반환합니다
             relevant_chunks = [chunks[i] for i in top_k_indices]
@@ -401,14 +355,15 @@ class RAGSystemWithKiwi:
             
             # PyTorch 텐서로 변환 및 저장
             self.torch_embeddings = torch.tensor(embeddings, dtype=torch.float32)
-            print(f"Kiwi PyTorch 임베딩 생성: {self.torch_embeddings.shape}")
             
-            # FAISS 인덱스 생성 (기존 호환성 유지)
-            self.index = faiss.IndexFlatIP(embeddings.shape[1])
+            # 코퍼스 크기에 맞는 검색 백엔드 (소규모: 정확 검색, 대규모: HNSW/IVF-PQ)
+            self.vector_index = create_vector_index(self.torch_embeddings)
+            self.index = to_faiss_index(self.vector_index)
+            print(f"Kiwi PyTorch 임베딩 생성: {self.torch_embeddings.shape} ({type(self.vector_index).__name__})")
             
-            # 임베딩 정규화
-            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-            self.index.add(embeddings.astype('float32'))
+            # BM25 역색인 (임베딩과 같은 행 번호)
+            self.bm25_index = BM25Index()
+            self.bm25_index.add(self.tokenize_for_bm25(texts))
             
             # 데이터 저장
             self.texts = texts
@@ -438,6 +393,10 @@ class RAGSystemWithKiwi:
         # 메타데이터 저장
         with open(f"{self.vector_db_path}/metadata.pkl", 'wb') as f:
             pickle.dump({'texts': self.texts, 'metadata': self.metadata}, f)
+        
+        # BM25 역색인 저장
+        if self.bm25_index is not None:
+            self.bm25_index.save(self.vector_db_path)
     
     def load_vector_database(self) -> bool:
         """저장된 벡터 데이터베이스 로드 (PyTorch 임베딩 포함)"""
@@ -452,6 +411,7 @@ class RAGSystemWithKiwi:
             torch_path = f"{self.vector_db_path}/torch_embeddings.pt"
             if os.path.exists(torch_path):
                 self.torch_embeddings = torch.load(torch_path)
+                self.vector_index = from_faiss_index(self.index, self.torch_embeddings)
                 print(f"Kiwi PyTorch 임베딩 로드: {self.torch_embeddings.shape}")
             
             # 메타데이터 로드
@@ -460,6 +420,12 @@ class RAGSystemWithKiwi:
                 self.texts = data['texts']
                 self.metadata = data['metadata']
             
+            # BM25 역색인 로드 (없으면 청크로 재구성)
+            self.bm25_index = BM25Index.load(self.vector_db_path)
+            if self.bm25_index is None or len(self.bm25_index) != len(self.texts):
+                self.bm25_index = BM25Index()
+                self.bm25_index.add(self.tokenize_for_bm25(self.texts))
+            
             logger.info("Kiwi 기반 벡터 데이터베이스 로드 완료 (PyTorch 포함)")
             return True
             
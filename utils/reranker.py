@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+크로스 인코더 재정렬
+
+빠른 인덱스(밀집 + BM25)에서 넓게 뽑은 후보를 CPU 크로스 인코더로 다시 채점해
+LLM에 보낼 청크를 더 적고 정확하게 고른다.
+후보 수와 지연시간 예산을 넘지 않도록 빠른 인덱스 순위대로 배치 채점하다가
+예산을 넘으면 멈추고, (쿼리, 청크) 점수는 LRU로 캐시한다.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.user_config import (
+    RERANK_CACHE_SIZE,
+    RERANK_CANDIDATES,
+    RERANK_LATENCY_BUDGET_MS,
+    RERANK_MODEL
+)
+from utils.embedding_store import content_hash
+from utils.model_registry import get_registry
+from utils.query_cache import normalize_query
+
+
+class CrossEncoderReranker:
+    """후보 수/지연시간 예산이 있는 크로스 인코더 재정렬기 (스레드 안전)"""
+
+    def __init__(self, model_name: str = RERANK_MODEL, max_candidates: int = RERANK_CANDIDATES,
+                 latency_budget_ms: float = RERANK_LATENCY_BUDGET_MS, batch_size: int = 16,
+                 cache_size: int = RERANK_CACHE_SIZE, max_length: int = 256):
+        """
+        Args:
+            model_name: sentence-transformers CrossEncoder 모델명
+            max_candidates: 채점할 최대 후보 수
+            latency_budget_ms: 재정렬 한 번의 채점 시간 예산 (넘으면 남은 후보는 원래 순위 유지)
+            batch_size: 크로스 인코더 배치 크기 (예산 확인 단위)
+            cache_size: (쿼리, 청크) 점수 캐시 크기
+            max_length: 쿼리+청크 최대 토큰 수
+        """
+        self.model_name = model_name
+        self.max_candidates = max_candidates
+        self.latency_budget_ms = latency_budget_ms
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_length = max_length
+
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.scored = 0
+        self.budget_exceeded = 0
+
+    @property
+    def model(self):
+        """공용 크로스 인코더 (처음 사용할 때 로드)"""
+        def _load():
+            from sentence_transformers import CrossEncoder
+            return CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return get_registry().get_or_load(f"cross-encoder:{self.model_name}", _load)
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _remember(self, items: Dict[Tuple[str, str], float]):
+        with self._lock:
+            for key, score in items.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def rerank(self, query: str, hits: List[Dict], top_k: int = 3,
+               content_key: str = "content") -> List[Dict]:
+        """
+        빠른 인덱스 결과 재정렬
+
+        Args:
+            query: 사용자 질문
+            hits: 빠른 인덱스 결과 (앞쪽이 상위)
+            top_k: 반환할 결과 수
+            content_key: 청크 텍스트 필드명
+
+        Returns:
+            rerank_score(0~1)가 추가된 결과 - 채점된 후보는 점수순, 예산 초과로 채점하지 못한
+            후보는 그 뒤에 원래 순위대로 (rerank_score None)
+        """
+        candidates = [dict(hit) for hit in hits[:self.max_candidates]]
+        if not candidates:
+            return []
+
+        query_key = normalize_query(query)
+        keys = [(query_key, content_hash(hit[content_key])) for hit in candidates]
+        for hit, key in zip(candidates, keys):
+            hit["rerank_score"] = self._cached(key)
+
+        pending = [i for i, hit in enumerate(candidates) if hit["rerank_score"] is None]
+        with self._lock:
+            self.calls += 1
+            self.cache_hits += len(candidates) - len(pending)
+
+        start = time.perf_counter()
+        for batch_start in range(0, len(pending), self.batch_size):
+            if (time.perf_counter() - start) * 1000 > self.latency_budget_ms:
+                with self._lock:
+                    self.budget_exceeded += 1
+                logger.debug(f"재정렬 예산 초과: {len(pending) - batch_start}개 후보는 원래 순위 유지")
+                break
+            batch = pending[batch_start:batch_start + self.batch_size]
+            scores = self.model.predict([(query, candidates[i][content_key]) for i in batch],
+                                        batch_size=self.batch_size, show_progress_bar=False)
+            new_scores = {}
+            for i, score in zip(batch, scores):
+                candidates[i]["rerank_score"] = float(score)
+                new_scores[keys[i]] = float(score)
+            self._remember(new_scores)
+            with self._lock:
+                self.scored += len(batch)
+
+        scored = sorted((hit for hit in candidates if hit["rerank_score"] is not None),
+                        key=lambda hit: hit["rerank_score"], reverse=True)
+        unscored = [hit for hit in candidates if hit["rerank_score"] is None]
+        return (scored + unscored)[:top_k]
+
+    def stats(self) -> Dict:
+        """호출/캐시/예산 초과 통계"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "scored": self.scored,
+                "cache_hits": self.cache_hits,
+                "budget_exceeded": self.budget_exceeded,
+                "cache_size": len(self._scores)
+            }
+
+
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """프로세스 공용 재정렬기 (점수 캐시 공유)"""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker()
+        return _reranker
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+라벨 쿼리셋 기반 검색 벤치마크
+
+쿼리 → 정답 청크 목록이 달린 쿼리셋으로 검색 백엔드(exact, flat, hnsw, ivfpq, int8, pq)를
+같은 조건에서 비교하고 결과를 JSON으로 남겨 인덱싱 변경 전후를 근거로 판단할 수 있게 한다.
+
+측정 항목: recall@k, MRR, 쿼리별 지연시간 p50/p95/p99, 구축 시간, 인덱스 크기, 최대 RSS
+
+기본 쿼리셋은 benchmarks/queries.json (STREAM DOSE AI 도면의 계기 태그/공정 질의).
+
+쿼리셋 JSON 형식 (정답은 청크 sha256 또는 청크에 포함된 문자열로 지정):
+    [
+        {"query": "FT-101의 역할은?", "relevant": ["<청크 sha256>", ...]},
+        {"query": "시약 주입 방법", "relevant_contains": ["시약 주입"]}
+    ]
+
+실행:
+    python -m utils.retrieval_benchmark --queries benchmarks/queries.json --store ./state \\
+        --backends exact,hnsw,int8 --top-k 1,5,10
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from loguru import logger
+
+from utils.ann_index import ANN_KINDS, FaissIndex
+from utils.embedding_store import content_hash, load_embedding_store
+from utils.model_registry import current_rss_bytes
+from utils.quantized_index import QuantizedIndex
+from utils.vector_index import VectorIndex
+
+BENCHMARK_BACKENDS = ("exact",) + ANN_KINDS + ("int8", "pq")
+BENCHMARK_OUTPUT_DIR = "./state/benchmarks"
+
+
+@dataclass
+class LabelledQuery:
+    """정답 청크가 지정된 쿼리"""
+    query: str
+    relevant: Set[str] = field(default_factory=set)
+    relevant_contains: List[str] = field(default_factory=list)
+
+
+def load_labelled_queries(path: str) -> List[LabelledQuery]:
+    """쿼리셋 JSON 로드"""
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [
+        LabelledQuery(
+            query=item["query"],
+            relevant=set(item.get("relevant", [])),
+            relevant_contains=list(item.get("relevant_contains", []))
+        )
+        for item in items
+    ]
+
+
+def resolve_relevant(queries: Sequence[LabelledQuery], chunks: Sequence[str]) -> List[Set[int]]:
+    """쿼리별 정답 청크 행 번호 (정답이 코퍼스에 없는 쿼리는 빈 집합)"""
+    rows_by_hash: Dict[str, List[int]] = {}
+    for i, chunk in enumerate(chunks):
+        rows_by_hash.setdefault(content_hash(chunk), []).append(i)
+
+    resolved = []
+    for labelled in queries:
+        rows = {row for h in labelled.relevant for row in rows_by_hash.get(h, [])}
+        if labelled.relevant_contains:
+            rows.update(i for i, chunk in enumerate(chunks)
+                        if any(text in chunk for text in labelled.relevant_contains))
+        resolved.append(rows)
+    return resolved
+
+
+class _PeakRssSampler:
+    """구축/검색 중 RSS를 주기적으로 읽어 최댓값 기록"""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self) -> "_PeakRssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def build_index(backend: str, embeddings):
+    """백엔드 이름으로 정규화된 임베딩 인덱스 구성"""
+    if backend == "exact":
+        return VectorIndex(embeddings, normalized=True)
+    if backend in ANN_KINDS:
+        return FaissIndex(embeddings, normalized=True, kind=backend)
+    if backend in ("int8", "pq"):
+        return QuantizedIndex(embeddings, normalized=True, kind=backend)
+    raise ValueError(f"알 수 없는 백엔드: {backend}")
+
+
+def index_size_bytes(index) -> int:
+    """검색에 메모리로 올라가는 인덱스 크기 (mmap float 재정렬 벡터 제외)"""
+    if isinstance(index, QuantizedIndex):
+        return index.code_bytes
+    if isinstance(index, FaissIndex):
+        import faiss
+        return int(faiss.serialize_index(index.index).nbytes)
+    return index.embeddings.numel() * index.embeddings.element_size()
+
+
+def retrieval_metrics(results: Sequence[Sequence[int]], relevant: Sequence[Set[int]],
+                      ks: Sequence[int]) -> Dict[str, float]:
+    """
+    recall@k와 MRR (정답이 없는 쿼리는 제외)
+
+    Args:
+        results: 쿼리별 검색 결과 행 번호 (상위 순)
+        relevant: 쿼리별 정답 행 번호
+        ks: recall을 계산할 k 목록
+    """
+    pairs = [(list(found), rows) for found, rows in zip(results, relevant) if rows]
+    metrics = {}
+    for k in ks:
+        metrics[f"recall@{k}"] = float(np.mean([len(set(found[:k]) & rows) / len(rows) for found, rows in pairs])) if pairs else 0.0
+
+    reciprocal_ranks = []
+    for found, rows in pairs:
+        rank = next((i + 1 for i, idx in enumerate(found) if idx in rows), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    metrics["mrr"] = float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0
+    return metrics
+
+
+def run_benchmark(embeddings, chunks: Sequence[str], queries: Sequence[LabelledQuery], encoder,
+                  backends: Iterable[str] = BENCHMARK_BACKENDS, ks: Sequence[int] = (1, 5, 10),
+                  model_name: Optional[str] = None, output_path: Optional[str] = None) -> Dict:
+    """
+    라벨 쿼리셋으로 백엔드별 검색 품질/지연시간/메모리 측정
+
+    Args:
+        embeddings: (N, D) 정규화된 코퍼스 임베딩 (mmap 가능)
+        chunks: 청크 텍스트 (정답 해석용, embeddings와 같은 순서)
+        queries: 라벨 쿼리셋
+        encoder: 쿼리 인코더 (encode()를 가진 모델)
+        backends: 측정할 백엔드 목록
+        ks: recall@k의 k 목록
+        model_name: 보고서에 기록할 임베딩 모델명
+        output_path: 결과 JSON 경로 (None이면 state/benchmarks/retrieval_<시각>.json)
+
+    Returns:
+        {'created_at', 'model_name', 'corpus', 'queries', 'ks', 'backends': {이름: 측정값}}
+    """
+    relevant = resolve_relevant(queries, chunks)
+    unlabelled = sum(1 for rows in relevant if not rows)
+    if unlabelled:
+        logger.warning(f"정답 청크를 찾지 못한 쿼리 {unlabelled}개는 품질 지표에서 제외")
+
+    query_vectors = np.asarray(encoder.encode([q.query for q in queries], convert_to_numpy=True,
+                                              normalize_embeddings=True), dtype=np.float32)
+    max_k = max(ks)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "model_name": model_name,
+        "corpus": {"chunks": len(chunks), "dim": int(np.asarray(embeddings[:1]).shape[-1])},
+        "queries": len(queries),
+        "labelled_queries": len(queries) - unlabelled,
+        "ks": list(ks),
+        "backends": {}
+    }
+
+    for backend in backends:
+        rss_before = current_rss_bytes()
+        try:
+            with _PeakRssSampler() as sampler:
+                start = time.perf_counter()
+                index = build_index(backend, embeddings)
+                build_s = time.perf_counter() - start
+
+                latencies, results = [], []
+                index.search(query_vectors[0], max_k)  # 워밍업
+                for vector in query_vectors:
+                    start = time.perf_counter()
+                    _, indices = index.search(vector, max_k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    results.append(indices[0].tolist())
+        except Exception as e:
+            # IVF-PQ/PQ는 코드북 학습에 최소 256개 이상의 벡터가 필요
+            logger.warning(f"{backend} 벤치마크 생략: {e}")
+            report["backends"][backend] = {"error": str(e)}
+            continue
+
+        result = retrieval_metrics(results, relevant, ks)
+        result.update({
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "build_s": build_s,
+            "index_mb": index_size_bytes(index) / 1024 / 1024,
+            "peak_rss_mb": sampler.peak / 1024 / 1024,
+            "rss_delta_mb": max(0, sampler.peak - rss_before) / 1024 / 1024
+        })
+        report["backends"][backend] = result
+        del index
+
+    write_benchmark_report(report, output_path)
+    return report
+
+
+def write_benchmark_report(report: Dict, output_path: Optional[str] = None) -> str:
+    """결과 JSON 저장 - 저장 경로 반환"""
+    if output_path is None:
+        output_path = os.path.join(BENCHMARK_OUTPUT_DIR, f"retrieval_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"검색 벤치마크 결과 저장: {output_path}")
+    return output_path
+
+
+def format_report(report: Dict) -> str:
+    """콘솔 출력용 표"""
+    ks = report["ks"]
+    header = f"{'백엔드':<8} " + " ".join(f"{f'R@{k}':>7}" for k in ks) + \
+             f" {'MRR':>6} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'구축s':>7} {'크기MB':>8} {'RSS MB':>8}"
+    lines = [header]
+    for backend, result in report["backends"].items():
+        if "error" in result:
+            lines.append(f"{backend:<8} 생략: {result['error']}")
+            continue
+        lines.append(
+            f"{backend:<8} " + " ".join(f"{result[f'recall@{k}']:>7.3f}" for k in ks) +
+            f" {result['mrr']:>6.3f} {result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f} {result['p99_ms']:>7.2f}"
+            f" {result['build_s']:>7.2f} {result['index_mb']:>8.2f} {result['peak_rss_mb']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="라벨 쿼리셋 기반 검색 벤치마크")
+    parser.add_argument("--queries", required=True, help="라벨 쿼리셋 JSON")
+    parser.add_argument("--store", default="./state", help="mmap 임베딩 저장소 디렉터리")
+    parser.add_argument("--backends", default=",".join(BENCHMARK_BACKENDS))
+    parser.add_argument("--top-k", default="1,5,10")
+    parser.add_argument("--model", default=None, help="쿼리 인코더 (기본: 저장소에 기록된 모델)")
+    parser.add_argument("--output", default=None, help="결과 JSON 경로")
+    args = parser.parse_args()
+
+    store = load_embedding_store(args.store)
+    if store is None:
+        raise SystemExit(f"임베딩 저장소가 없습니다: {args.store}")
+
+    from utils.model_registry import get_sentence_encoder
+    model_name = args.model or store.manifest.get("model_name")
+    report = run_benchmark(
+        store.embeddings, store.chunks, load_labelled_queries(args.queries),
+        get_sentence_encoder(model_name),
+        backends=[b.strip() for b in args.backends.split(",") if b.strip()],
+        ks=[int(k) for k in args.top_k.split(",")],
+        model_name=model_name,
+        output_path=args.output
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
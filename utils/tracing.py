@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+챗 파이프라인 단계별 지연 추적
+
+느린 답변이 어디서 시간을 썼는지 보기 위해 generate_response의 단계(선택 파일 컨텍스트,
+쿼리 유형 감지, RAG 검색, 도면 검색, 답변 캐시, 컨텍스트 패킹, 프롬프트 조립, LLM 호출)를
+span으로 감싸 소요 시간과 토큰 수/캐시 적중 같은 속성을 기록한다.
+    - Trace: 요청 하나의 span 목록 (응답 dict의 'trace'로 디버그 화면에 표시)
+    - span()/traced(): 현재 활성 Trace에 span 추가 (없으면 지표만 기록)
+    - MetricsStore: 단계별 최근 N개 소요 시간으로 p50/p95 보고 (프로세스 공용)
+"""
+
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+METRICS_WINDOW = 500
+
+
+def percentile(values: List[float], q: float) -> float:
+    """최근접 순위 백분위수 (q: 0~100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class MetricsStore:
+    """단계별 최근 소요 시간 저장소 (스레드 안전)"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._durations: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration_ms: float):
+        with self._lock:
+            self._durations.setdefault(stage, deque(maxlen=self.window)).append(duration_ms)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def report(self) -> Dict[str, Dict]:
+        """단계별 {'count', 'p50_ms', 'p95_ms', 'last_ms'} (count는 누적, 분위수는 최근 window개 기준)"""
+        with self._lock:
+            snapshot = {stage: list(durations) for stage, durations in self._durations.items()}
+            counts = dict(self._counts)
+        return {
+            stage: {
+                "count": counts[stage],
+                "p50_ms": round(percentile(durations, 50), 1),
+                "p95_ms": round(percentile(durations, 95), 1),
+                "last_ms": round(durations[-1], 1)
+            }
+            for stage, durations in snapshot.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+
+
+_metrics_store: Optional[MetricsStore] = None
+_metrics_store_lock = threading.Lock()
+
+
+def get_metrics_store() -> MetricsStore:
+    """프로세스 공용 지표 저장소 (세션 간 공유)"""
+    global _metrics_store
+    with _metrics_store_lock:
+        if _metrics_store is None:
+            _metrics_store = MetricsStore()
+        return _metrics_store
+
+
+@dataclass
+class Span:
+    """단계 하나의 소요 시간과 속성 (토큰 수, 캐시 적중 등)"""
+    name: str
+    depth: int = 0
+    duration_ms: float = 0.0
+    attrs: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "depth": self.depth, "ms": round(self.duration_ms, 1),
+                "attrs": self.attrs, "error": self.error}
+
+
+class Trace:
+    """요청 하나의 span 모음"""
+
+    def __init__(self, name: str, store: Optional[MetricsStore] = None):
+        self.name = name
+        self.store = store or get_metrics_store()
+        self.spans: List[Span] = []
+        self._depth = 0
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        """
+        단계 측정 - 블록 안에서 span.attrs에 속성을 추가할 수 있음
+
+            with trace.span("llm", model="gpt-4o-mini") as s:
+                ...
+                s.attrs["completion_tokens"] = 120
+        """
+        current = Span(name=name, depth=self._depth, attrs=dict(attrs))
+        self.spans.append(current)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            current.error = type(e).__name__
+            raise
+        finally:
+            self._depth -= 1
+            current.duration_ms = (time.perf_counter() - start) * 1000
+            self.store.record(name, current.duration_ms)
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        """블록 안에서 span()/traced()가 이 Trace에 기록되도록 설정"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def finish(self) -> Dict:
+        """전체 소요 시간을 지표에 기록하고 디버그 표시용 dict 반환"""
+        total_ms = self.total_ms
+        self.store.record(self.name, total_ms)
+        return {"name": self.name, "total_ms": round(total_ms, 1), "spans": [s.to_dict() for s in self.spans]}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """현재 활성 Trace에 span 기록 (활성 Trace가 없으면 지표 저장소에만 기록)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace.span(name, **attrs) as current:
+            yield current
+        return
+
+    current = Span(name=name, attrs=dict(attrs))
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        get_metrics_store().record(name, (time.perf_counter() - start) * 1000)
+
+
+def traced(name: str) -> Callable:
+    """함수 호출 전체를 span으로 감싸는 데코레이터"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+정규화된 임베딩 기반 벡터 검색 인덱스
+"""
+
+import copy
+import warnings
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+
+def _to_tensor(embeddings: Union[np.ndarray, torch.Tensor, list]) -> torch.Tensor:
+    """임베딩을 CPU float32 텐서로 변환"""
+    if isinstance(embeddings, torch.Tensor):
+        return embeddings.detach().to(device='cpu', dtype=torch.float32)
+    array = np.asarray(embeddings, dtype=np.float32)
+    if not array.flags.writeable:
+        # 읽기 전용 mmap(float32)은 복사 없이 공유 - 인덱스는 임베딩을 수정하지 않음
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return torch.from_numpy(array)
+    return torch.from_numpy(array)
+
+
+def _normalize(matrix: torch.Tensor) -> torch.Tensor:
+    """마지막 축 기준 L2 정규화"""
+    return matrix / torch.norm(matrix, dim=-1, keepdim=True).clamp_min(1e-12)
+
+
+class VectorIndex:
+    """코사인 유사도 검색용 벡터 인덱스
+
+    청크 임베딩은 빌드/로드 시점에 한 번만 정규화해 보관하고,
+    검색은 쿼리 배치 전체에 대해 한 번의 행렬곱과 한 번의 top-k로 처리한다.
+    """
+
+    def __init__(self, embeddings=None, normalized: bool = False):
+        """
+        Args:
+            embeddings: (N, D) 청크 임베딩 (numpy 배열 또는 torch 텐서)
+            normalized: 이미 L2 정규화된 임베딩이면 True
+        """
+        self.embeddings = None
+        self._alive = None  # None이면 모든 행이 유효 (삭제 표시가 생길 때만 마스크 생성)
+        if embeddings is not None:
+            self.build(embeddings, normalized=normalized)
+
+    def build(self, embeddings, normalized: bool = False) -> "VectorIndex":
+        """임베딩 행렬로 인덱스 구성 (정규화는 여기서 한 번만 수행)"""
+        matrix = _to_tensor(embeddings)
+        if matrix.dim() == 1:
+            matrix = matrix.unsqueeze(0)
+        if not normalized:
+            matrix = _normalize(matrix)
+        self.embeddings = matrix.contiguous()
+        self._alive = None
+        return self
+
+    def add(self, embeddings, normalized: bool = False) -> List[int]:
+        """
+        임베딩 추가 (기존 행은 다시 정규화하지 않음)
+
+        Returns:
+            추가된 행의 인덱스 목록
+        """
+        matrix = _to_tensor(embeddings)
+        if matrix.dim() == 1:
+            matrix = matrix.unsqueeze(0)
+        if matrix.shape[0] == 0:
+            return []
+        if not normalized:
+            matrix = _normalize(matrix)
+
+        start = len(self)
+        if self.embeddings is None:
+            self.embeddings = matrix.contiguous()
+        else:
+            self.embeddings = torch.cat([self.embeddings, matrix]).contiguous()
+        if self._alive is not None:
+            self._alive = torch.cat([self._alive, torch.ones(matrix.shape[0], dtype=torch.bool)])
+        return list(range(start, start + matrix.shape[0]))
+
+    def remove(self, indices: Iterable[int]):
+        """행 삭제 표시 (tombstone) - 행 번호는 유지되고 검색에서만 제외됨"""
+        indices = list(indices)
+        if not indices:
+            return
+        if self._alive is None:
+            self._alive = torch.ones(len(self), dtype=torch.bool)
+        self._alive[torch.tensor(indices, dtype=torch.long)] = False
+
+    def __len__(self) -> int:
+        return 0 if self.embeddings is None else self.embeddings.shape[0]
+
+    @property
+    def alive_count(self) -> int:
+        """삭제 표시되지 않은 행 수"""
+        return len(self) if self._alive is None else int(self._alive.sum())
+
+    @property
+    def dim(self) -> int:
+        return 0 if self.embeddings is None else self.embeddings.shape[1]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self), self.dim)
+
+    def copy(self) -> "VectorIndex":
+        """임베딩 행렬은 공유하고 삭제 표시만 따로 갖는 사본 (add()는 새 행렬을 만들므로 원본은 그대로)"""
+        clone = copy.copy(self)
+        clone._alive = None if self._alive is None else self._alive.clone()
+        return clone
+
+    def rows(self, indices) -> np.ndarray:
+        """지정한 행의 정규화된 벡터"""
+        return self.embeddings[torch.as_tensor(indices, dtype=torch.long)].numpy()
+
+    def row_segments(self) -> List:
+        """저장용 float 행 조각 목록"""
+        return [] if self.embeddings is None else [self.embeddings]
+
+    def search(self, query_embeddings, top_k: int = 5) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        쿼리 배치에 대한 top-k 검색
+
+        Args:
+            query_embeddings: (D,) 또는 (Q, D) 쿼리 임베딩
+            top_k: 쿼리당 반환할 결과 수
+
+        Returns:
+            (scores, indices) - 각각 (Q, k) 텐서, 점수는 코사인 유사도
+        """
+        queries = _to_tensor(query_embeddings)
+        if queries.dim() == 1:
+            queries = queries.unsqueeze(0)
+
+        k = min(top_k, self.alive_count)
+        if k <= 0:
+            empty = torch.empty((queries.shape[0], 0))
+            return empty, empty.long()
+
+        queries = _normalize(queries)
+        similarities = torch.matmul(queries, self.embeddings.T)
+        if self._alive is not None:
+            similarities[:, ~self._alive] = float('-inf')
+        scores, indices = torch.topk(similarities, k, dim=1)
+        return scores, indices
+
+
+def as_vector_index(embeddings, normalized: bool = False) -> VectorIndex:
+    """VectorIndex는 그대로, 원시 임베딩은 인덱스로 감싸서 반환"""
+    if isinstance(embeddings, VectorIndex):
+        return embeddings
+    return VectorIndex(embeddings, normalized=normalized)
+
+
+def _to_float_rows(embeddings, normalized: bool):
+    """정규화된 float 행렬 (이미 정규화된 numpy/mmap/RowSubset은 복사하지 않음)"""
+    if normalized and isinstance(embeddings, (np.ndarray, RowSubset)):
+        return embeddings if embeddings.ndim == 2 else embeddings.reshape(1, -1)
+    matrix = _to_tensor(embeddings)
+    if matrix.dim() == 1:
+        matrix = matrix.unsqueeze(0)
+    if not normalized:
+        matrix = _normalize(matrix)
+    return matrix.numpy()
+
+
+def merge_topk(best_scores: np.ndarray, best_ids: np.ndarray,
+               scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """지금까지의 (Q, n) 상위 결과에 (Q, m) 블록 결과를 합쳐 점수 상위 k개만 남김 (정렬하지 않음)
+
+    블록마다 호출하면 (Q, N) 점수 행렬 전체를 만들지 않고 top-k를 구할 수 있다.
+    """
+    scores = np.concatenate([best_scores, scores], axis=1)
+    ids = np.concatenate([best_ids, np.broadcast_to(ids, scores[:, best_scores.shape[1]:].shape)], axis=1)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, ids = np.take_along_axis(scores, part, axis=1), np.take_along_axis(ids, part, axis=1)
+    return scores, ids
+
+
+def empty_topk(num_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """merge_topk 시작값"""
+    return np.empty((num_queries, 0), dtype=np.float32), np.empty((num_queries, 0), dtype=np.int64)
+
+
+class RowSubset:
+    """행렬(또는 rows()를 가진 인덱스)에서 고른 행만 보이는 읽기 전용 뷰
+
+    압축(compact)할 때 mmap float 행을 RAM으로 복사하지 않고 남길 행 번호만 들고 있다가,
+    저장/재정렬/구축에서 필요한 블록만 읽는다. 행 번호 배열이나 슬라이스로만 접근한다.
+    """
+
+    ndim = 2
+
+    def __init__(self, matrix, indices):
+        self.matrix = matrix
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self.indices), self.matrix.shape[1])
+
+    def __getitem__(self, key) -> np.ndarray:
+        ids = self.indices[key]
+        rows = self.matrix.rows(ids) if hasattr(self.matrix, "rows") else self.matrix[ids]
+        return np.asarray(rows, dtype=np.float32)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+
+class FloatRows:
+    """정규화된 float 원본 행 (보통 mmap 저장소) + add()로 추가된 메모리 행
+
+    FaissIndex/QuantizedIndex가 공유하는 부분. 원본 행렬은 전달받은 배열을 그대로 참조하고
+    재정렬/저장/압축에 필요한 행만 읽으므로 float 행렬 전체를 RAM에 올리지 않는다.
+    추가 행은 faiss 그래프/압축 코드에 넣지 않고 저장 전까지 정확 검색하며, 저장할 때 합친다.
+    """
+
+    _float_base = None
+    _float_extra: Optional[np.ndarray] = None
+    _alive: Optional[torch.Tensor] = None
+    block_rows = 65536
+
+    def __len__(self) -> int:
+        if self._float_base is None:
+            return 0
+        return len(self._float_base) + (0 if self._float_extra is None else len(self._float_extra))
+
+    @property
+    def alive_count(self) -> int:
+        return len(self) if self._alive is None else int(self._alive.sum())
+
+    @property
+    def dim(self) -> int:
+        return 0 if self._float_base is None else self._float_base.shape[1]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self), self.dim)
+
+    @property
+    def base_count(self) -> int:
+        """원본(마지막 구축/로드 시점) 행 수 - 그 뒤에 추가된 행은 저장 전까지 정확 검색"""
+        return 0 if self._float_base is None else len(self._float_base)
+
+    def copy(self):
+        """원본 행과 압축 코드/그래프는 공유하고 추가 행·삭제 표시만 따로 갖는 사본
+
+        add()는 추가 행 배열을 새로 만들고 faiss/양자화 코드는 건드리지 않으므로,
+        사본을 갱신해도 원본을 검색 중인 쪽에는 영향이 없다.
+        """
+        clone = copy.copy(self)
+        clone._alive = None if self._alive is None else self._alive.clone()
+        return clone
+
+    def rows(self, indices) -> np.ndarray:
+        """지정한 행의 float 벡터 (mmap 원본과 추가 행을 나눠 읽어 필요한 페이지만 접근)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        base_count = self.base_count
+        rows = np.empty((len(indices), self.dim), dtype=np.float32)
+        in_base = indices < base_count
+        if in_base.any():
+            # mmap은 정렬된 인덱스로 읽어야 순차 접근에 가까워짐
+            base_ids = indices[in_base]
+            order = np.argsort(base_ids)
+            gathered = np.asarray(self._float_base[base_ids[order]], dtype=np.float32)
+            rows[np.flatnonzero(in_base)[order]] = gathered
+        if (~in_base).any():
+            rows[~in_base] = self._float_extra[indices[~in_base] - base_count]
+        return rows
+
+    def row_segments(self) -> List:
+        """저장용 float 행 조각 목록 (원본, 추가 행) - save_embedding_store가 블록 단위로 기록"""
+        return [rows for rows in (self._float_base, self._float_extra) if rows is not None]
+
+    def remove(self, indices: Iterable[int]):
+        """행 삭제 표시"""
+        indices = list(indices)
+        if not indices:
+            return
+        if self._alive is None:
+            self._alive = torch.ones(len(self), dtype=torch.bool)
+        self._alive[torch.tensor(indices, dtype=torch.long)] = False
+
+    def _blocks(self, matrix) -> Iterable[np.ndarray]:
+        for start in range(0, len(matrix), self.block_rows):
+            yield np.asarray(matrix[start:start + self.block_rows], dtype=np.float32)
+
+    def _exact_topk(self, queries: np.ndarray, k: int, extra_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """원본/추가 행을 블록 단위로 읽어 정확한 top-k (정렬하지 않음, 삭제 행은 -inf)
+
+        extra_only이면 마지막 구축/로드 이후 추가된 행만 본다.
+        """
+        alive = None if self._alive is None else self._alive.numpy()
+        best_scores, best_ids = empty_topk(len(queries))
+        offset = self.base_count if extra_only else 0
+        segments = [self._float_extra] if extra_only else self.row_segments()
+        for segment in (s for s in segments if s is not None):
+            for block_start, block in zip(range(0, len(segment), self.block_rows), self._blocks(segment)):
+                start = offset + block_start
+                scores = queries @ block.T
+                if alive is not None:
+                    scores[:, ~alive[start:start + len(block)]] = -np.inf
+                best_scores, best_ids = merge_topk(best_scores, best_ids, scores,
+                                                   np.arange(start, start + len(block)), k)
+            offset += len(segment)
+        return best_scores, best_ids
+
+    def _append_rows(self, rows: np.ndarray):
+        """추가 행 기록 (원본 배열은 건드리지 않음)"""
+        self._float_extra = rows if self._float_extra is None else np.concatenate([self._float_extra, rows])
+        if self._alive is not None:
+            self._alive = torch.cat([self._alive, torch.ones(rows.shape[0], dtype=torch.bool)])
+
+    def _base_alive(self) -> Tuple[Optional[np.ndarray], int]:
+        """원본 행의 삭제 마스크(없으면 None)와 살아있는 원본 행 수"""
+        if self._alive is None:
+            return None, self.base_count
+        alive = self._alive.numpy()[:self.base_count]
+        return alive, int(alive.sum())
+
+    def _subset_rows(self, keep: np.ndarray):
+        """오름차순 keep 행만 남긴 (원본 뷰, 추가 행) - 압축용"""
+        base_count = self.base_count
+        in_base = keep < base_count
+        extra = self._float_extra[keep[~in_base] - base_count] if (~in_base).any() else None
+        return RowSubset(self._float_base, keep[in_base]), extra
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+SQLite 기반 벡터 키-값 저장소
+
+네임스페이스(예: 임베딩 모델명)와 문자열 키로 float32 벡터를 보관한다.
+쿼리/청크 임베딩 캐시의 디스크 계층으로 사용된다.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from loguru import logger
+
+
+class VectorKVStore:
+    """(namespace, key) → float32 벡터 저장소 (스레드 안전)"""
+
+    def __init__(self, db_path: str, table: str = "vectors"):
+        """
+        Args:
+            db_path: SQLite 파일 경로
+            table: 테이블명 (같은 파일에 여러 캐시를 둘 때 구분)
+        """
+        self.db_path = db_path
+        self.table = table
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[np.ndarray]:
+        """벡터 조회 (없으면 None)"""
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """여러 키를 한 번에 조회 - 존재하는 키만 반환"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite 바인딩 변수 제한을 넘지 않도록 나눠서 조회
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM {self.table} WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put(self, namespace: str, key: str, vector):
+        """벡터 저장 (이미 있으면 덮어씀)"""
+        self.put_many(namespace, {key: vector})
+
+    def put_many(self, namespace: str, items: Dict[str, object]):
+        """여러 벡터를 한 트랜잭션으로 저장"""
+        rows = [(namespace, key, np.asarray(vector, dtype=np.float32).tobytes())
+                for key, vector in items.items()]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (namespace, key, vector) VALUES (?, ?, ?)", rows
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            # 캐시 기록 실패는 검색 자체를 막지 않음
+            logger.warning(f"벡터 저장소 기록 실패 ({self.db_path}): {e}")
+
+    def count(self, namespace: Optional[str] = None) -> int:
+        """저장된 벡터 수"""
+        with self._lock:
+            if namespace is None:
+                row = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT COUNT(*) FROM {self.table} WHERE namespace = ?", (namespace,)
+                ).fetchone()
+        return int(row[0])
+
+    def clear(self, namespace: Optional[str] = None):
+        """전체 또는 네임스페이스 단위 삭제"""
+        with self._lock:
+            if namespace is None:
+                self._conn.execute(f"DELETE FROM {self.table}")
+            else:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()